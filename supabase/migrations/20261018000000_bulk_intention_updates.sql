@@ -0,0 +1,60 @@
+-- ============================================================================
+-- MIGRATION: Bulk Order Intention Updates
+--
+-- Set-based update of many order_intentions rows in one call, so batch
+-- aggregation tags every intention with its batch_id/aggregated_order_id
+-- in a single round-trip instead of one PATCH per intention.
+-- ============================================================================
+
+-- ============================================================================
+-- RPC: bulk_update_order_intentions
+--
+-- p_updates: JSON array of objects, one per intention:
+--   {id, status, status_message, batch_id, aggregated_order_id,
+--    filled_quantity, fill_price, fill_value}
+-- Only "id" is required; NULL/missing fields keep their current value.
+-- executed_at is stamped for filled / partially_filled rows.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION bulk_update_order_intentions(
+    p_updates JSONB
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE order_intentions o
+    SET status = COALESCE(u.status::order_intention_status, o.status),
+        status_message = COALESCE(u.status_message, o.status_message),
+        batch_id = COALESCE(u.batch_id, o.batch_id),
+        aggregated_order_id = COALESCE(u.aggregated_order_id, o.aggregated_order_id),
+        filled_quantity = COALESCE(u.filled_quantity, o.filled_quantity),
+        fill_price = COALESCE(u.fill_price, o.fill_price),
+        fill_value = COALESCE(u.fill_value, o.fill_value),
+        executed_at = CASE
+            WHEN u.status IN ('filled', 'partially_filled') THEN NOW()
+            ELSE o.executed_at
+        END,
+        updated_at = NOW()
+    FROM jsonb_to_recordset(p_updates) AS u(
+        id UUID,
+        status TEXT,
+        status_message TEXT,
+        batch_id UUID,
+        aggregated_order_id UUID,
+        filled_quantity DECIMAL,
+        fill_price DECIMAL,
+        fill_value DECIMAL
+    )
+    WHERE o.id = u.id;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'success', true,
+        'updated', v_updated
+    );
+END;
+$$;
@@ -0,0 +1,189 @@
+-- ============================================================================
+-- MIGRATION: Transactional Fill Application
+--
+-- Applies every fill allocation of an aggregated order to the users'
+-- virtual portfolios in one call and one transaction: cash, reserved cash,
+-- holdings (weighted average cost), transaction rows and the applied flag.
+-- Replaces 5-7 REST round-trips per user fill from the batch executor.
+-- ============================================================================
+
+-- ============================================================================
+-- RPC: apply_fill_allocations
+--
+-- Processes all not-yet-applied fill_allocations of p_aggregated_order_id,
+-- ordered by user so concurrent calls lock rows in the same order.
+--
+-- BUY:  cash -= total_cost
+--       reserved -= GREATEST(reserved_amount, total_cost)  (spent + released excess)
+--       holding upsert, avg_cost = (old_qty*old_cost + qty*price) / new_qty
+-- SELL: holding -= qty (row deleted at 0), cash += total_cost
+--
+-- Zero-quantity allocations only release the intention's reserved cash
+-- (BUY) and are marked applied.
+-- An allocation that cannot be applied (no portfolio / insufficient cash or
+-- shares) is skipped and reported; it stays applied_to_portfolio = FALSE so
+-- it can be retried. Every other allocation is still applied. Idempotent:
+-- already-applied rows are never touched again.
+--
+-- Returns: {success, applied, skipped: [{allocation_id, user_id, error}]}
+-- ============================================================================
+CREATE OR REPLACE FUNCTION apply_fill_allocations(
+    p_aggregated_order_id UUID
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_alloc RECORD;
+    v_portfolio virtual_portfolios%ROWTYPE;
+    v_holding virtual_holdings%ROWTYPE;
+    v_qty DECIMAL;
+    v_new_qty DECIMAL;
+    v_new_cash DECIMAL;
+    v_applied INTEGER := 0;
+    v_skipped JSONB := '[]'::jsonb;
+BEGIN
+    FOR v_alloc IN
+        SELECT fa.id, fa.user_id, fa.allocated_quantity, fa.fill_price, fa.total_cost,
+               oi.id AS intention_id, oi.symbol, oi.conid, oi.isin, oi.name, oi.side,
+               COALESCE(oi.reserved_amount, 0) AS reserved_amount,
+               oi.virtual_account_id
+        FROM fill_allocations fa
+        JOIN order_intentions oi ON oi.id = fa.order_intention_id
+        WHERE fa.aggregated_order_id = p_aggregated_order_id
+          AND NOT COALESCE(fa.applied_to_portfolio, FALSE)
+        ORDER BY fa.user_id, fa.id
+    LOOP
+        v_qty := v_alloc.allocated_quantity;
+
+        SELECT * INTO v_portfolio
+        FROM virtual_portfolios
+        WHERE user_id = v_alloc.user_id
+          AND virtual_account_id IS NOT DISTINCT FROM v_alloc.virtual_account_id
+        FOR UPDATE;
+
+        IF v_alloc.side = 'BUY' THEN
+            IF NOT FOUND THEN
+                v_skipped := v_skipped || jsonb_build_object(
+                    'allocation_id', v_alloc.id, 'user_id', v_alloc.user_id,
+                    'error', 'Portfolio not found');
+                CONTINUE;
+            END IF;
+
+            v_new_cash := v_portfolio.cash_balance - v_alloc.total_cost;
+            IF v_new_cash < 0 THEN
+                v_skipped := v_skipped || jsonb_build_object(
+                    'allocation_id', v_alloc.id, 'user_id', v_alloc.user_id,
+                    'error', format('Insufficient cash: have %s, need %s',
+                                    v_portfolio.cash_balance, v_alloc.total_cost));
+                CONTINUE;
+            END IF;
+
+            UPDATE virtual_portfolios
+            SET cash_balance = v_new_cash,
+                reserved_balance = GREATEST(
+                    0, reserved_balance - GREATEST(v_alloc.reserved_amount, v_alloc.total_cost)
+                ),
+                updated_at = NOW()
+            WHERE id = v_portfolio.id;
+
+            IF v_qty > 0 THEN
+                SELECT * INTO v_holding
+                FROM virtual_holdings
+                WHERE user_id = v_alloc.user_id
+                  AND virtual_account_id IS NOT DISTINCT FROM v_alloc.virtual_account_id
+                  AND symbol = v_alloc.symbol
+                FOR UPDATE;
+
+                IF FOUND THEN
+                    v_new_qty := v_holding.quantity + v_qty;
+                    UPDATE virtual_holdings
+                    SET quantity = v_new_qty,
+                        avg_cost_basis = (v_holding.quantity * v_holding.avg_cost_basis
+                                          + v_qty * v_alloc.fill_price) / v_new_qty,
+                        updated_at = NOW()
+                    WHERE id = v_holding.id;
+                ELSE
+                    INSERT INTO virtual_holdings (
+                        user_id, virtual_account_id, symbol, conid, isin, name,
+                        quantity, avg_cost_basis
+                    ) VALUES (
+                        v_alloc.user_id, v_alloc.virtual_account_id, v_alloc.symbol, v_alloc.conid,
+                        v_alloc.isin, v_alloc.name, v_qty, v_alloc.fill_price
+                    );
+                END IF;
+
+                INSERT INTO virtual_transactions (
+                    user_id, virtual_account_id, type, symbol, quantity, price, amount,
+                    balance_after, order_intention_id, fill_allocation_id, description
+                ) VALUES (
+                    v_alloc.user_id, v_alloc.virtual_account_id, 'buy', v_alloc.symbol, v_qty,
+                    v_alloc.fill_price, -v_alloc.total_cost, v_new_cash, v_alloc.intention_id,
+                    v_alloc.id, format('Buy %s %s @ %s', v_qty, v_alloc.symbol, v_alloc.fill_price)
+                );
+            END IF;
+
+        ELSIF v_alloc.side = 'SELL' AND v_qty > 0 THEN
+            SELECT * INTO v_holding
+            FROM virtual_holdings
+            WHERE user_id = v_alloc.user_id
+              AND virtual_account_id IS NOT DISTINCT FROM v_alloc.virtual_account_id
+              AND symbol = v_alloc.symbol
+            FOR UPDATE;
+
+            IF NOT FOUND OR v_holding.quantity < v_qty THEN
+                v_skipped := v_skipped || jsonb_build_object(
+                    'allocation_id', v_alloc.id, 'user_id', v_alloc.user_id,
+                    'error', format('Insufficient shares of %s: have %s, need %s',
+                                    v_alloc.symbol, COALESCE(v_holding.quantity, 0), v_qty));
+                CONTINUE;
+            END IF;
+
+            v_new_qty := v_holding.quantity - v_qty;
+            IF v_new_qty = 0 THEN
+                DELETE FROM virtual_holdings WHERE id = v_holding.id;
+            ELSE
+                UPDATE virtual_holdings
+                SET quantity = v_new_qty,
+                    updated_at = NOW()
+                WHERE id = v_holding.id;
+            END IF;
+
+            IF v_portfolio.id IS NULL THEN
+                INSERT INTO virtual_portfolios (user_id, virtual_account_id)
+                VALUES (v_alloc.user_id, v_alloc.virtual_account_id)
+                RETURNING * INTO v_portfolio;
+            END IF;
+
+            v_new_cash := v_portfolio.cash_balance + v_alloc.total_cost;
+            UPDATE virtual_portfolios
+            SET cash_balance = v_new_cash,
+                updated_at = NOW()
+            WHERE id = v_portfolio.id;
+
+            INSERT INTO virtual_transactions (
+                user_id, virtual_account_id, type, symbol, quantity, price, amount,
+                balance_after, order_intention_id, fill_allocation_id, description
+            ) VALUES (
+                v_alloc.user_id, v_alloc.virtual_account_id, 'sell', v_alloc.symbol, v_qty,
+                v_alloc.fill_price, v_alloc.total_cost, v_new_cash, v_alloc.intention_id,
+                v_alloc.id, format('Sell %s %s @ %s', v_qty, v_alloc.symbol, v_alloc.fill_price)
+            );
+        END IF;
+
+        UPDATE fill_allocations
+        SET applied_to_portfolio = TRUE,
+            applied_at = NOW()
+        WHERE id = v_alloc.id;
+
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    RETURN jsonb_build_object(
+        'success', true,
+        'applied', v_applied,
+        'skipped', v_skipped
+    );
+END;
+$$;
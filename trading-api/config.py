@@ -20,6 +20,16 @@ class Settings(BaseSettings):
     supabase_key: str = ""  # anon key for public access
     supabase_service_role_key: str = ""  # service role key for backend (bypasses RLS)
 
+    # ==========================================================================
+    # Supabase HTTP Pool (shared client, see services/supabase_client.py)
+    # ==========================================================================
+    supabase_http2: bool = True  # Multiplex requests over one connection (needs h2)
+    supabase_pool_max_connections: int = 50
+    supabase_pool_max_keepalive: int = 20
+    supabase_pool_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept
+    supabase_connect_timeout: float = 5.0
+    supabase_default_timeout: float = 10.0  # Used when a call doesn't pass its own timeout
+
     # ==========================================================================
     # TRADING MODE - CRITICAL SAFETY SETTING
     # ==========================================================================
@@ -52,6 +62,111 @@ class Settings(BaseSettings):
     ib_reconnect_delay_multiplier: float = 2.0  # Exponential backoff multiplier
     ib_reconnect_max_attempts: int = 0  # 0 = unlimited retries
 
+    # ==========================================================================
+    # Order Execution (batch + fill tracking)
+    # ==========================================================================
+    batch_concurrent_execution: bool = True  # Submit aggregated orders in parallel
+    batch_max_concurrent_orders: int = 10  # Orders in flight at once
+    ib_max_orders_per_second: float = 40.0  # IB caps API messages at 50/s
+    ib_order_ack_timeout: float = 0.5  # Max wait for IB to acknowledge an order
+    ib_fill_timeout: float = 30.0  # Max wait for a batch order to reach a terminal state
+    ib_cancel_timeout: float = 10.0  # Max wait for a cancelled batch order to reach a terminal state
+
+    # ==========================================================================
+    # Market Data Snapshots
+    # ==========================================================================
+    ib_snapshot_max_age: float = 30.0  # Serve from streaming cache if last tick is this recent
+    ib_snapshot_timeout: float = 2.0  # One deadline for all snapshot requests in a call
+
+    # ==========================================================================
+    # Tick Store (see services/tick_store.py)
+    # ==========================================================================
+    tick_store_capacity: int = 32768  # Rows per subscribed conid (36 B each, ~1.2 MB)
+    tick_store_min_interval: float = 1.0  # Ticks within this many seconds share one row
+
+    # ==========================================================================
+    # Market Data Stream (see services/market_data_stream.py)
+    # ==========================================================================
+    market_data_stream_max_rate: float = 4.0  # Max pushes per second per symbol
+    market_data_stream_max_clients: int = 5000  # WebSocket + SSE connections
+
+    # ==========================================================================
+    # Market Data Persistence (see services/market_data_persistence.py)
+    # ==========================================================================
+    market_data_persist_interval: float = 5.0  # Seconds between market_data_cache.json writes (if changed) / reload checks in bridge-mode workers
+
+    # ==========================================================================
+    # Market Data Lines (see services/market_data_lines.py)
+    # ==========================================================================
+    market_data_rebalance_interval: float = 30.0  # Seconds between line reassignments
+    market_data_demand_refresh_interval: float = 60.0  # Reload held / pending conids from Supabase
+    market_data_hit_half_life: float = 900.0  # Seconds for request demand to halve
+    market_data_line_hysteresis: float = 0.25  # Challenger must beat a line's score by 25%
+    market_data_line_min_dwell: float = 120.0  # Seconds before a new line can be evicted
+    market_data_max_evictions_per_minute: int = 10
+
+    # ==========================================================================
+    # IB Bridge (see services/ib_bridge.py)
+    # ==========================================================================
+    # Enabled: one `python -m services.ib_bridge` process owns the IB connection,
+    # API workers read quotes from its shared-memory board and send it orders
+    ib_bridge_enabled: bool = False
+    ib_bridge_socket: str = ""  # Unix socket for bridge requests ("" = data/ib_bridge.sock)
+    ib_bridge_board_name: str = "trading_api_quotes"  # Shared memory segment (/dev/shm/<name>)
+    ib_bridge_board_slots: int = 1024  # Quote slots (at least the market data line budget)
+    ib_bridge_poll_interval: float = 0.05  # Seconds between worker scans of the board for new ticks
+    ib_bridge_status_interval: float = 1.0  # Seconds between bridge heartbeats / worker status refreshes
+    ib_bridge_stale_after: float = 5.0  # Heartbeat age at which workers treat the bridge as down
+    ib_bridge_request_timeout: float = 10.0  # Seconds a worker waits for a bridge reply (plus any fill wait)
+
+    # ==========================================================================
+    # Fallback Price Provider (see services/price_provider.py)
+    # ==========================================================================
+    price_provider_base_url: str = "https://query1.finance.yahoo.com"
+    price_provider_timeout: float = 5.0
+    price_cache_ttl: float = 300.0  # Default freshness (indices ask for 30 s)
+    price_cache_stale_ttl: float = 3600.0  # Older entries are served while refreshing
+    price_cache_max_entries: int = 2048  # LRU bound
+    price_batch_size: int = 20  # Symbols per upstream request
+    price_batch_window: float = 0.02  # Seconds to collect symbols into one batch
+
+    # ==========================================================================
+    # Market Indices (see services/market_indices.py)
+    # ==========================================================================
+    indices_refresh_interval: float = 30.0  # Seconds between refreshes while an index's market is open
+    indices_closed_refresh_interval: float = 300.0  # ... and while it is closed
+
+    # ==========================================================================
+    # Customer Cache (see services/customer_cache.py)
+    # ==========================================================================
+    customer_cache_ttl: float = 60.0  # Seconds a customer + broker link stays cached
+    customer_cache_negative_ttl: float = 5.0  # Seconds an unknown customer ID stays cached
+    customer_cache_max_entries: int = 10000  # LRU bound
+
+    # ==========================================================================
+    # Community Store (see services/community_store.py)
+    # ==========================================================================
+    community_wal_fsync: Literal["always", "interval", "never"] = "interval"
+    community_wal_fsync_interval: float = 1.0  # Seconds between WAL fsyncs (interval policy)
+    community_compact_wal_entries: int = 10000  # Rewrite the JSON files after this many WAL entries
+    community_compact_interval: float = 300.0  # ... or after this many seconds with pending changes
+    community_wal_poll_interval: float = 0.02  # Max staleness of reads vs. other workers' writes
+
+    # ==========================================================================
+    # Safety Limits (see services/safety.py, services/safety_state.py)
+    # ==========================================================================
+    safety_state_backend: Literal["memory", "sqlite"] = "memory"  # sqlite: shared by all uvicorn workers
+    safety_state_path: str = ""  # SQLite file ("" = data/safety_state.db; a /dev/shm path keeps it in memory)
+    safety_lock_stripes: int = 64  # Per-customer in-process locks (customer_id % stripes)
+
+    # ==========================================================================
+    # Audit Log (see services/audit.py)
+    # ==========================================================================
+    audit_queue_size: int = 10000  # Rows buffered before new rows spill straight to disk
+    audit_batch_size: int = 200  # Rows per bulk insert into trade_audit_log
+    audit_flush_interval: float = 0.5  # Seconds a row waits for its batch to fill
+    audit_replay_interval: float = 30.0  # Seconds between replays of spilled rows
+
     # ==========================================================================
     # CORS
     # ==========================================================================
@@ -108,15 +108,37 @@ async def lifespan(app: FastAPI):
 
     Startup:
     - Validate settings (port vs trading mode)
-    - Connect to IB Gateway
-    - Start auto-reconnect
+    - Open shared Supabase HTTP client (connection pool)
+    - Start the audit log writer (replays rows spilled during outages)
+    - Load community store (portfolios, follows, snapshots, ...)
+    - Start market indices refresher
+    - Start market data push stream and cache persistence
+    - Connect to IB Gateway, fill market data lines by demand
+    - Start market data line rebalancing and auto-reconnect
+
+    With ib_bridge_enabled the IB connection, line management and cache
+    persistence live in the IB bridge process (services/ib_bridge.py);
+    this worker only attaches to it and follows the market data cache file.
 
     Shutdown:
+    - Stop line rebalancing
+    - End market data push streams, write the market data cache
+    - Stop market indices refresher, close the fallback price provider
     - Stop auto-reconnect
     - Disconnect from IB Gateway
+    - Compact and close community store
+    - Flush queued audit rows
+    - Close shared Supabase HTTP client
     """
     # Late import to avoid connection at module load
     from services.ib_client import get_ib_client, shutdown_ib_client
+    from services.supabase_client import init_supabase_client, close_supabase_client
+    from services.audit import start_audit_service, close_audit_service
+    from services.community_store import get_community_repository, close_community_repository
+    from services.market_data_stream import get_market_data_broadcaster, close_market_data_broadcaster
+    from services.market_data_persistence import get_market_data_persister, close_market_data_persister
+    from services.price_provider import close_price_provider
+    from services.market_indices import get_indices_refresher, close_indices_refresher
 
     settings = get_settings()
 
@@ -141,13 +163,38 @@ async def lifespan(app: FastAPI):
     if not port_ok:
         logger.warning(f"Configuration warning: {port_msg}")
 
-    logger.info(f"IB Gateway: {settings.ib_gateway_host}:{settings.ib_gateway_port}")
-    logger.info(f"Client ID: {settings.ib_client_id}")
-    logger.info(f"Auto-reconnect: {settings.ib_reconnect_enabled}")
+    # Shared Supabase client - all services reuse its pooled connections
+    await init_supabase_client()
+
+    # Audit rows are bulk-inserted by a background writer, off the request path
+    await start_audit_service()
+
+    # Community data is loaded once and persisted through its WAL
+    await get_community_repository().start()
+
+    # Market indices are refreshed in the background, /trading/indices serves the snapshot
+    await get_indices_refresher().start()
+
+    if settings.ib_bridge_enabled:
+        logger.info(f"IB bridge mode: quote board {settings.ib_bridge_board_name}, orders via the bridge socket")
+    else:
+        logger.info(f"IB Gateway: {settings.ib_gateway_host}:{settings.ib_gateway_port}")
+        logger.info(f"Client ID: {settings.ib_client_id}")
+        logger.info(f"Auto-reconnect: {settings.ib_reconnect_enabled}")
 
     # Get IB client (does NOT connect yet)
     ib_client = get_ib_client()
 
+    # Push ticker updates to WebSocket/SSE clients
+    get_market_data_broadcaster().start(ib_client)
+
+    # Persist the streaming cache (offline fallback) from one background task;
+    # in bridge mode the bridge process owns the file and workers reload it
+    if settings.ib_bridge_enabled:
+        await get_market_data_persister().follow()
+    else:
+        await get_market_data_persister().start(ib_client)
+
     # Connect to IB Gateway
     logger.info("Connecting to IB Gateway...")
     connected = await ib_client.connect()
@@ -170,12 +217,14 @@ async def lifespan(app: FastAPI):
             logger.info("=" * 60)
 
         # Pre-subscribe to market data so prices are available immediately
-        logger.info("Subscribing to market data on startup...")
-        try:
-            count = await ib_client.subscribe_all_etfs()
-            logger.info(f"Market data: subscribed to {count} ETFs")
-        except Exception as e:
-            logger.warning(f"Market data subscription failed (will retry on demand): {e}")
+        # (the bridge fills its own lines)
+        if not settings.ib_bridge_enabled:
+            logger.info("Subscribing to market data on startup...")
+            try:
+                count = await ib_client.subscribe_all_etfs()
+                logger.info(f"Market data: subscribed to {count} ETFs")
+            except Exception as e:
+                logger.warning(f"Market data subscription failed (will retry on demand): {e}")
     else:
         status = ib_client.get_status()
         logger.warning("=" * 60)
@@ -184,6 +233,9 @@ async def lifespan(app: FastAPI):
         logger.warning(f"Ensure IB Gateway is running on {settings.ib_gateway_host}:{settings.ib_gateway_port}")
         logger.warning("=" * 60)
 
+    # Keep the market data lines on the ETFs with the most demand
+    await ib_client.market_data_lines.start()
+
     # Start auto-reconnect (will retry in background if not connected)
     await ib_client.start_auto_reconnect()
 
@@ -194,7 +246,15 @@ async def lifespan(app: FastAPI):
     # ==========================================================================
     logger.info("=" * 60)
     logger.info("Shutting down Trading API...")
+    await ib_client.market_data_lines.close()
+    close_market_data_broadcaster()
+    await close_market_data_persister()
+    await close_indices_refresher()
+    await close_price_provider()
     await shutdown_ib_client()
+    await close_community_repository()
+    await close_audit_service()
+    await close_supabase_client()
     logger.info("Trading API shutdown complete")
     logger.info("=" * 60)
 
@@ -326,5 +386,8 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=settings.api_port,  # Always 8002
-        reload=True
+        reload=True,
+        # Market data stream frames are serialized once for all clients;
+        # per-connection deflate would redo the work for every socket
+        ws_per_message_deflate=False,
     )
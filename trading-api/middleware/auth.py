@@ -1,12 +1,13 @@
 """Authentication middleware for trading API with strict user isolation."""
-from fastapi import Header, HTTPException, Request, Depends
+from fastapi import Header, HTTPException, Query, Request, Depends
+from fastapi.requests import HTTPConnection
 from typing import Optional, Dict
 from models.schemas import UserContext, TradingStatus
 from services.supabase_service import get_supabase_service
+from services.customer_cache import get_customer_cache
 from services.ib_client import get_ib_client
 import logging
 import os
-import time
 
 logger = logging.getLogger(__name__)
 
@@ -16,22 +17,19 @@ LOCAL_DEV_MODE = os.environ.get("LOCAL_DEV_MODE", "").lower() == "true"
 # Auth bypass - set to False for production with user isolation
 AUTH_DISABLED = False
 
-# In-memory customer cache to avoid hitting Supabase on every request
-_customer_cache: Dict[int, dict] = {}  # customer_id -> {data, timestamp}
-CUSTOMER_CACHE_TTL = 60  # seconds
-
-
-def _get_cached_customer(customer_id: int) -> Optional[dict]:
-    """Get customer from cache if still valid."""
-    entry = _customer_cache.get(customer_id)
-    if entry and (time.time() - entry["timestamp"]) < CUSTOMER_CACHE_TTL:
-        return entry["data"]
-    return None
-
+async def _load_customer(customer_id: int) -> Optional[dict]:
+    """
+    Customer cache loader: {"customer", "broker_link"}, or None if the customer doesn't exist.
 
-def _set_cached_customer(customer_id: int, data: dict):
-    """Store customer in cache."""
-    _customer_cache[customer_id] = {"data": data, "timestamp": time.time()}
+    Raises on database errors so failures aren't cached.
+    """
+    db = get_supabase_service()
+    customer = await db.get_customer_by_id(customer_id, raise_errors=True)
+    if not customer:
+        return None
+    # broker_links table is often missing in dev mode - skip it there
+    broker_link = None if LOCAL_DEV_MODE else await db.get_active_broker_link(customer_id, raise_errors=True)
+    return {"customer": customer, "broker_link": broker_link}
 
 
 def get_dev_mode_linked_accounts() -> Dict[int, dict]:
@@ -47,7 +45,7 @@ def get_dev_mode_linked_accounts() -> Dict[int, dict]:
 
 
 async def get_current_user(
-    request: Request,
+    request: HTTPConnection,  # Request or WebSocket
     x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
     x_customer_email: Optional[str] = Header(None, alias="X-Customer-Email")
 ) -> UserContext:
@@ -156,19 +154,28 @@ async def get_current_user(
             detail="Database not configured. Cannot verify user."
         )
 
-    # Try cache first to avoid hitting Supabase on every request
-    customer = _get_cached_customer(customer_id)
-    if not customer:
-        customer = await db.get_customer_by_id(customer_id)
-        if customer:
-            _set_cached_customer(customer_id, customer)
+    # Customer + broker link from the cache (one shared Supabase load per customer on a miss)
+    cache = get_customer_cache()
+    try:
+        record = await cache.get(customer_id, _load_customer)
+    except Exception as e:
+        logger.error(f"Customer {customer_id} lookup failed: {type(e).__name__}: {e}")
+        if not LOCAL_DEV_MODE:
+            raise HTTPException(
+                status_code=503,
+                detail="Could not verify user. Please try again."
+            )
+        record = None
+
+    customer = record["customer"] if record else None
+    broker_link = record["broker_link"] if record else None
 
     if not customer:
         # In dev mode, don't block on Supabase timeouts
         if LOCAL_DEV_MODE:
             logger.warning(f"Dev mode: customer {customer_id} lookup failed, using fallback")
             customer = {"id": customer_id, "email": x_customer_email or "", "role": "customer", "trading_status": "approved"}
-            _set_cached_customer(customer_id, customer)
+            cache.set(customer_id, {"customer": customer, "broker_link": None})
         else:
             raise HTTPException(
                 status_code=401,
@@ -184,7 +191,6 @@ async def get_current_user(
         )
 
     # Get THIS user's broker link
-    broker_link = None
     ib_account_id = None
     broker_account_id = None
 
@@ -196,14 +202,10 @@ async def get_current_user(
             ib_account_id = linked.get("ib_account_id")
             logger.info(f"Dev mode: Using in-memory broker link for user {customer_id}: {ib_account_id}")
 
-    # If not found in dev mode, try database (skip in dev mode - broker_links table often missing)
-    if not ib_account_id and not LOCAL_DEV_MODE:
-        try:
-            broker_link = await db.get_active_broker_link(customer_id)
-            broker_account_id = broker_link.get("id") if broker_link else None
-            ib_account_id = broker_link.get("ib_account_id") if broker_link else None
-        except Exception as e:
-            raise
+    # If not found in dev mode, use the cached database link (not loaded in dev mode - broker_links table often missing)
+    if not ib_account_id and broker_link:
+        broker_account_id = broker_link.get("id")
+        ib_account_id = broker_link.get("ib_account_id")
 
     # In LOCAL_DEV_MODE, fall back to IB primary account if no broker link found
     if LOCAL_DEV_MODE and not ib_account_id:
@@ -232,6 +234,28 @@ async def get_current_user(
     )
 
 
+async def get_stream_user(
+    request: HTTPConnection,  # Request or WebSocket
+    customer_id: Optional[str] = Query(None, description="Customer ID (when the X-Customer-ID header can't be sent)"),
+    customer_email: Optional[str] = Query(None, description="Customer email (when the X-Customer-Email header can't be sent)"),
+    x_customer_id: Optional[str] = Header(None, alias="X-Customer-ID"),
+    x_customer_email: Optional[str] = Header(None, alias="X-Customer-Email")
+) -> UserContext:
+    """
+    get_current_user for WebSocket and SSE routes.
+
+    Browsers can't set headers on WebSocket or EventSource connections, so
+    the customer ID and email may also come as query parameters. They are
+    validated exactly like the headers (customer cache + email match);
+    headers win when both are present.
+    """
+    return await get_current_user(
+        request,
+        x_customer_id=x_customer_id or customer_id,
+        x_customer_email=x_customer_email or customer_email
+    )
+
+
 async def require_trading_approved(
     user: UserContext = Depends(get_current_user)
 ) -> UserContext:
@@ -48,6 +48,7 @@ class ExecuteBatchResponse(BaseModel):
     successful: int
     partial: int
     failed: int
+    intentions_not_updated: int = 0  # Filled at IB but still pending in order_intentions
     message: str
 
 
@@ -111,6 +112,7 @@ async def execute_batch(
             successful=result.get("successful", 0),
             partial=result.get("partial", 0),
             failed=result.get("failed", 0),
+            intentions_not_updated=result.get("intentions_not_updated", 0),
             message=f"Batch {batch_id} completed with status: {result['status']}"
         )
 
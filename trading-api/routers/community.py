@@ -10,23 +10,17 @@ Handles community operations:
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from enum import Enum
-import json
-import os
+import heapq
 import uuid
 
+from services.community_store import get_community_repository
+from services.etf_universe import ETFUniverse, get_etf_universe
+from services.market_data_persistence import get_market_data_snapshot
 
-router = APIRouter(prefix="/community", tags=["community"])
-
-# Data file paths
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-PORTFOLIOS_FILE = os.path.join(DATA_DIR, "community_portfolios.json")
-FOLLOWS_FILE = os.path.join(DATA_DIR, "portfolio_follows.json")
-SNAPSHOTS_FILE = os.path.join(DATA_DIR, "performance_snapshots.json")
-MARKET_DATA_FILE = os.path.join(DATA_DIR, "market_data_cache.json")
-TRADABILITY_FILE = os.path.join(DATA_DIR, "etf_tradability.json")
 
+router = APIRouter(prefix="/community", tags=["community"])
 
 # ============================================
 # Enums
@@ -204,6 +198,7 @@ class LeaderboardResponse(BaseModel):
     period: str
     entries: List[LeaderboardEntry]
     total: int
+    next_cursor: Optional[str] = None
     generated_at: str
 
 
@@ -231,121 +226,38 @@ class TrendingResponse(BaseModel):
 # Data Storage
 # ============================================
 
-def load_follows() -> dict:
-    """Load follows from JSON file."""
-    if not os.path.exists(FOLLOWS_FILE):
-        return {"follows": {}, "by_user": {}, "by_portfolio": {}, "last_updated": None}
-
-    try:
-        with open(FOLLOWS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading follows: {e}")
-        return {"follows": {}, "by_user": {}, "by_portfolio": {}, "last_updated": None}
-
-
-def save_follows(data: dict):
-    """Save follows to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(FOLLOWS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
-def load_portfolios() -> dict:
-    """Load portfolios from JSON file."""
-    if not os.path.exists(PORTFOLIOS_FILE):
-        return {"portfolios": {}, "last_updated": None}
-
-    try:
-        with open(PORTFOLIOS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading portfolios: {e}")
-        return {"portfolios": {}, "last_updated": None}
-
-
-def save_portfolios(data: dict):
-    """Save portfolios to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
 def generate_follow_id() -> str:
     """Generate a unique follow ID."""
     return f"follow-{uuid.uuid4().hex[:12]}"
 
 
-def load_snapshots() -> dict:
-    """Load snapshots from JSON file."""
-    if not os.path.exists(SNAPSHOTS_FILE):
-        return {"snapshots": {}, "by_portfolio": {}, "by_type": {}, "last_updated": None}
-
-    try:
-        with open(SNAPSHOTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading snapshots: {e}")
-        return {"snapshots": {}, "by_portfolio": {}, "by_type": {}, "last_updated": None}
-
-
-def save_snapshots(data: dict):
-    """Save snapshots to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(SNAPSHOTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
 def generate_snapshot_id() -> str:
     """Generate a unique snapshot ID."""
     return f"snap-{uuid.uuid4().hex[:12]}"
 
 
 def load_market_data() -> dict:
-    """Load market data cache for price lookups."""
-    if not os.path.exists(MARKET_DATA_FILE):
-        return {"data": {}, "timestamp": None}
-
-    try:
-        with open(MARKET_DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading market data: {e}")
-        return {"data": {}, "timestamp": None}
-
+    """Market data snapshot for price lookups: {"data": {conid: entry}, "timestamp"}. Do not mutate."""
+    return get_market_data_snapshot()
 
-def load_tradability() -> dict:
-    """Load ETF tradability data for ISIN to contract mapping."""
-    if not os.path.exists(TRADABILITY_FILE):
-        return {"etfs": {}}
 
-    try:
-        with open(TRADABILITY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading tradability: {e}")
-        return {"etfs": {}}
+def load_tradability() -> ETFUniverse:
+    """Get the shared ETF universe index for ISIN to contract mapping."""
+    return get_etf_universe()
 
 
-def get_price_for_isin(isin: str, market_data: dict, tradability: dict) -> float:
+def get_price_for_isin(isin: str, market_data: dict, tradability: Optional[ETFUniverse] = None) -> float:
     """
     Get the last known price for an ISIN.
-    Uses market data cache and tradability mapping.
+    Uses market data cache and the ETF universe ISIN index.
     Returns 0.0 if price not found.
     """
     # Get contract info for ISIN
-    etf_info = tradability.get("etfs", {}).get(isin)
+    etf_info = (tradability or get_etf_universe()).get_by_isin(isin)
     if not etf_info:
         return 0.0
 
-    contract = etf_info.get("contract", {})
-    conid = str(contract.get("conId", ""))
+    conid = str(etf_info.get("conid") or "")
 
     if not conid:
         return 0.0
@@ -387,9 +299,8 @@ async def follow_portfolio(
     - Cannot follow your own portfolio
     - One follow per user per portfolio (idempotent)
     """
-    # Load portfolio data
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -402,12 +313,8 @@ async def follow_portfolio(
     if portfolio.get("creator_id") == user_id:
         raise HTTPException(status_code=400, detail="Cannot follow your own portfolio")
 
-    # Load follows data
-    follows_data = load_follows()
-
     # Rule: Check if already following (idempotent)
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-    if portfolio_id in user_follows:
+    if repo.is_following(user_id, portfolio_id):
         return FollowResponse(
             success=True,
             message="Already following this portfolio",
@@ -416,35 +323,27 @@ async def follow_portfolio(
         )
 
     # Create follow record
-    follow_id = generate_follow_id()
-    now = datetime.utcnow().isoformat() + "Z"
-
     follow = {
-        "id": follow_id,
+        "id": generate_follow_id(),
         "follower_user_id": user_id,
         "portfolio_id": portfolio_id,
-        "created_at": now
+        "created_at": datetime.utcnow().isoformat() + "Z"
     }
 
-    # Update follows data
-    follows_data["follows"][follow_id] = follow
-
-    # Update by_user index
-    if user_id not in follows_data["by_user"]:
-        follows_data["by_user"][user_id] = []
-    follows_data["by_user"][user_id].append(portfolio_id)
-
-    # Update by_portfolio index
-    if portfolio_id not in follows_data["by_portfolio"]:
-        follows_data["by_portfolio"][portfolio_id] = []
-    follows_data["by_portfolio"][portfolio_id].append(user_id)
+    # Stores the follow and increments the followers count in one WAL entry
+    created, portfolio = repo.follow(user_id, portfolio_id, follow)
 
-    save_follows(follows_data)
+    # Deleted or followed by a concurrent request since the checks above
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
 
-    # Increment followers count on portfolio
-    portfolio["followers"] = portfolio.get("followers", 0) + 1
-    portfolio_data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(portfolio_data)
+    if not created:
+        return FollowResponse(
+            success=True,
+            message="Already following this portfolio",
+            is_following=True,
+            followers_count=portfolio.get("followers", 0)
+        )
 
     return FollowResponse(
         success=True,
@@ -462,19 +361,15 @@ async def unfollow_portfolio(
     """
     Unfollow a portfolio.
     """
-    # Load portfolio data
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+
+    # Removes the follow and decrements the followers count in one WAL entry
+    removed, portfolio = repo.unfollow(user_id, portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
 
-    # Load follows data
-    follows_data = load_follows()
-
-    # Check if following
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-    if portfolio_id not in user_follows:
+    if not removed:
         return FollowResponse(
             success=True,
             message="Not following this portfolio",
@@ -482,39 +377,6 @@ async def unfollow_portfolio(
             followers_count=portfolio.get("followers", 0)
         )
 
-    # Find and remove follow record
-    follow_id_to_remove = None
-    for follow_id, follow in follows_data["follows"].items():
-        if follow["follower_user_id"] == user_id and follow["portfolio_id"] == portfolio_id:
-            follow_id_to_remove = follow_id
-            break
-
-    if follow_id_to_remove:
-        del follows_data["follows"][follow_id_to_remove]
-
-    # Update by_user index
-    if user_id in follows_data["by_user"]:
-        follows_data["by_user"][user_id] = [
-            p for p in follows_data["by_user"][user_id] if p != portfolio_id
-        ]
-        if not follows_data["by_user"][user_id]:
-            del follows_data["by_user"][user_id]
-
-    # Update by_portfolio index
-    if portfolio_id in follows_data["by_portfolio"]:
-        follows_data["by_portfolio"][portfolio_id] = [
-            u for u in follows_data["by_portfolio"][portfolio_id] if u != user_id
-        ]
-        if not follows_data["by_portfolio"][portfolio_id]:
-            del follows_data["by_portfolio"][portfolio_id]
-
-    save_follows(follows_data)
-
-    # Decrement followers count on portfolio
-    portfolio["followers"] = max(0, portfolio.get("followers", 0) - 1)
-    portfolio_data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(portfolio_data)
-
     return FollowResponse(
         success=True,
         message="Successfully unfollowed portfolio",
@@ -532,21 +394,15 @@ async def get_follows(
 
     Returns portfolios sorted by follow date (most recent first).
     """
-    follows_data = load_follows()
-    portfolio_data = load_portfolios()
-
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
+    repo = get_community_repository()
 
     result = []
-    for portfolio_id in user_follows:
-        portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    for portfolio_id in repo.followed_portfolio_ids(user_id):
+        portfolio = repo.get_portfolio(portfolio_id)
         if portfolio:
-            # Find follow record to get created_at
-            followed_at = None
-            for follow in follows_data.get("follows", {}).values():
-                if follow["follower_user_id"] == user_id and follow["portfolio_id"] == portfolio_id:
-                    followed_at = follow["created_at"]
-                    break
+            # portfolios.py records followed_at, this router created_at
+            follow = repo.get_follow(user_id, portfolio_id) or {}
+            followed_at = follow.get("created_at") or follow.get("followed_at")
 
             result.append(FollowedPortfolio(
                 id=portfolio["id"],
@@ -578,12 +434,9 @@ async def get_follow_status(
     """
     Check if a user is following a specific portfolio.
     """
-    follows_data = load_follows()
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-
     return {
         "portfolio_id": portfolio_id,
-        "is_following": portfolio_id in user_follows
+        "is_following": get_community_repository().is_following(user_id, portfolio_id)
     }
 
 
@@ -605,8 +458,8 @@ async def update_portfolio_visibility(
     - When set to PUBLIC, published_at is set to current time
     - When set to PRIVATE, followers are NOT removed (they just can't see it)
     """
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -620,17 +473,15 @@ async def update_portfolio_visibility(
     new_visibility = request.visibility.value
 
     # Update visibility
-    portfolio["visibility"] = new_visibility
-    portfolio["updated_at"] = now
+    changes = {"visibility": new_visibility, "updated_at": now}
 
     # Set published_at when first made public
     published_at = portfolio.get("published_at")
     if new_visibility == "public" and old_visibility != "public":
-        portfolio["published_at"] = now
+        changes["published_at"] = now
         published_at = now
 
-    portfolio_data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(portfolio_data)
+    repo.update_portfolio(portfolio_id, changes)
 
     return VisibilityUpdateResponse(
         success=True,
@@ -653,11 +504,8 @@ async def get_public_portfolios(
 
     Only portfolios with visibility=PUBLIC are returned.
     """
-    portfolio_data = load_portfolios()
-    portfolios = list(portfolio_data.get("portfolios", {}).values())
-
-    # Filter to only public portfolios
-    public_portfolios = [p for p in portfolios if p.get("visibility") == "public"]
+    # Only public portfolios (indexed)
+    public_portfolios = get_community_repository().public_portfolios()
 
     # Search filter
     if search:
@@ -724,11 +572,8 @@ async def get_my_portfolios(
 
     Used for the "My Portfolios" section where users can manage visibility.
     """
-    portfolio_data = load_portfolios()
-    portfolios = list(portfolio_data.get("portfolios", {}).values())
-
-    # Filter to user's portfolios
-    my_portfolios = [p for p in portfolios if p.get("creator_id") == user_id]
+    # User's portfolios (indexed by creator)
+    my_portfolios = get_community_repository().portfolios_by_creator(user_id)
 
     # Sort by created_at descending
     my_portfolios.sort(key=lambda p: p.get("created_at") or "", reverse=True)
@@ -781,8 +626,8 @@ async def get_portfolio_snapshots(
     Snapshots are immutable historical records of portfolio value.
     """
     # Verify portfolio exists and is public
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -790,14 +635,9 @@ async def get_portfolio_snapshots(
     if portfolio.get("visibility") != "public":
         raise HTTPException(status_code=403, detail="Snapshots only available for public portfolios")
 
-    # Load snapshots
-    snapshots_data = load_snapshots()
-    portfolio_snapshot_ids = snapshots_data.get("by_portfolio", {}).get(portfolio_id, [])
-
     # Get snapshot records
     snapshots = []
-    for snap_id in portfolio_snapshot_ids:
-        snap = snapshots_data.get("snapshots", {}).get(snap_id)
+    for snap in repo.snapshots_for(portfolio_id):
         if snap:
             # Filter by period if specified
             if period is None or snap.get("period_type") == period.value:
@@ -835,152 +675,53 @@ async def get_portfolio_snapshots(
 # Leaderboard Endpoints
 # ============================================
 
-def get_period_days(period: LeaderboardPeriod) -> int:
-    """Get the number of days for a leaderboard period."""
-    if period == LeaderboardPeriod.ONE_MONTH:
-        return 30
-    elif period == LeaderboardPeriod.THREE_MONTHS:
-        return 90
-    elif period == LeaderboardPeriod.ONE_YEAR:
-        return 365
-    else:  # ALL_TIME
-        return 3650  # ~10 years, effectively all
-
-
-def calculate_period_return(
-    portfolio_id: str,
-    period: LeaderboardPeriod,
-    snapshots_data: dict
-) -> tuple:
-    """
-    Calculate the return for a portfolio over the specified period.
-
-    Returns: (return_pct, latest_value, snapshot_date) or (None, None, None) if not enough data
-    """
-    portfolio_snaps = snapshots_data.get("by_portfolio", {}).get(portfolio_id, [])
-
-    if not portfolio_snaps:
-        return None, None, None
-
-    # Get all snapshots for this portfolio
-    all_snaps = []
-    for snap_id in portfolio_snaps:
-        snap = snapshots_data.get("snapshots", {}).get(snap_id)
-        if snap:
-            all_snaps.append(snap)
-
-    if not all_snaps:
-        return None, None, None
-
-    # Sort by timestamp ascending
-    all_snaps.sort(key=lambda x: x.get("timestamp", ""))
-
-    # Get the latest snapshot
-    latest = all_snaps[-1]
-    latest_date = datetime.fromisoformat(latest["timestamp"].replace("Z", "+00:00"))
-    latest_value = latest.get("total_value", 0)
-
-    # For ALL_TIME, use cumulative return from first snapshot
-    if period == LeaderboardPeriod.ALL_TIME:
-        return_pct = latest.get("cumulative_return_pct", 0)
-        return return_pct, latest_value, latest["timestamp"]
-
-    # Find snapshot closest to period start
-    days = get_period_days(period)
-    target_date = latest_date - timedelta(days=days)
-
-    # Find the oldest snapshot within the period, or the first one if period is longer than history
-    start_snap = None
-    for snap in all_snaps:
-        snap_date = datetime.fromisoformat(snap["timestamp"].replace("Z", "+00:00"))
-        if snap_date >= target_date:
-            start_snap = snap
-            break
-
-    # If no snapshot found in period, use the first available
-    if not start_snap:
-        start_snap = all_snaps[0]
-
-    start_value = start_snap.get("total_value", 0)
-
-    if start_value <= 0:
-        return 0.0, latest_value, latest["timestamp"]
-
-    # Calculate period return
-    return_pct = ((latest_value - start_value) / start_value) * 100
-
-    return return_pct, latest_value, latest["timestamp"]
-
-
 @router.get("/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard(
     period: LeaderboardPeriod = Query(LeaderboardPeriod.ONE_MONTH, description="Time period for ranking"),
     limit: int = Query(20, ge=1, le=100, description="Maximum entries to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
 ):
     """
     Get the performance leaderboard for PUBLIC portfolios.
 
-    Rankings are based on return_pct over the specified period:
+    Rankings are based on return_pct over the specified period, measured
+    back from the portfolio's latest snapshot:
     - 1M: Last 30 days
     - 3M: Last 90 days
     - 1Y: Last 365 days
     - ALL: All-time (cumulative since first snapshot)
 
-    Only portfolios with snapshots are included.
+    Only portfolios with snapshots are included. The ranking is maintained
+    as snapshots are written; pass next_cursor to get the following page.
     """
     now = datetime.utcnow()
 
-    # Load data
-    portfolio_data = load_portfolios()
-    snapshots_data = load_snapshots()
-
-    # Get all public portfolios
-    public_portfolios = {
-        p["id"]: p for p in portfolio_data.get("portfolios", {}).values()
-        if p.get("visibility") == "public"
-    }
-
-    # Calculate returns for each portfolio
-    rankings = []
-    for portfolio_id, portfolio in public_portfolios.items():
-        return_pct, total_value, snapshot_date = calculate_period_return(
-            portfolio_id, period, snapshots_data
-        )
+    repo = get_community_repository()
+    try:
+        page = repo.leaderboard(f"return:{period.value}", limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if return_pct is not None:
-            rankings.append({
-                "portfolio_id": portfolio_id,
-                "portfolio_name": portfolio.get("name", "Unknown"),
-                "creator_id": portfolio.get("creator_id", ""),
-                "creator_name": portfolio.get("creator_name", "Unknown"),
-                "return_pct": return_pct,
-                "total_value": total_value or 0,
-                "followers": portfolio.get("followers", 0),
-                "snapshot_date": snapshot_date,
-            })
-
-    # Sort by return_pct descending
-    rankings.sort(key=lambda x: x["return_pct"], reverse=True)
-
-    # Apply limit and add ranks
     entries = []
-    for i, r in enumerate(rankings[:limit]):
+    for rank, portfolio, stats in page["entries"]:
+        return_pct, total_value, snapshot_date = stats["returns"][period.value]
         entries.append(LeaderboardEntry(
-            rank=i + 1,
-            portfolio_id=r["portfolio_id"],
-            portfolio_name=r["portfolio_name"],
-            creator_id=r["creator_id"],
-            creator_name=r["creator_name"],
-            return_pct=round(r["return_pct"], 2),
-            total_value=round(r["total_value"], 2),
-            followers=r["followers"],
-            snapshot_date=r["snapshot_date"],
+            rank=rank,
+            portfolio_id=portfolio["id"],
+            portfolio_name=portfolio.get("name", "Unknown"),
+            creator_id=portfolio.get("creator_id", ""),
+            creator_name=portfolio.get("creator_name", "Unknown"),
+            return_pct=round(return_pct, 2),
+            total_value=round(total_value or 0, 2),
+            followers=portfolio.get("followers", 0),
+            snapshot_date=snapshot_date,
         ))
 
     return LeaderboardResponse(
         period=period.value,
         entries=entries,
-        total=len(rankings),
+        total=page["total"],
+        next_cursor=page["next_cursor"],
         generated_at=now.isoformat() + "Z"
     )
 
@@ -997,28 +738,22 @@ async def get_trending_portfolios(
     """
     now = datetime.utcnow()
 
-    # Load data
-    portfolio_data = load_portfolios()
-    snapshots_data = load_snapshots()
+    repo = get_community_repository()
 
     # Get all public portfolios
-    public_portfolios = [
-        p for p in portfolio_data.get("portfolios", {}).values()
-        if p.get("visibility") == "public"
-    ]
+    public_portfolios = repo.public_portfolios()
 
-    # Sort by followers descending
-    public_portfolios.sort(key=lambda p: p.get("followers", 0), reverse=True)
+    # Top N by followers descending
+    top_portfolios = heapq.nlargest(limit, public_portfolios, key=lambda p: p.get("followers", 0))
 
     # Build response with recent return data
     result = []
-    for portfolio in public_portfolios[:limit]:
+    for portfolio in top_portfolios:
         portfolio_id = portfolio["id"]
 
-        # Try to get recent return from snapshots (1M period)
-        recent_return, total_value, _ = calculate_period_return(
-            portfolio_id, LeaderboardPeriod.ONE_MONTH, snapshots_data
-        )
+        # Recent return from the materialized 1M leaderboard, if it has snapshots
+        returns = repo.leaderboard_stats(portfolio_id).get("returns", {})
+        recent_return, total_value, _ = returns.get(LeaderboardPeriod.ONE_MONTH.value, (None, None, None))
 
         result.append(TrendingPortfolio(
             portfolio_id=portfolio_id,
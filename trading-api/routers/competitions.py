@@ -13,18 +13,12 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from enum import Enum
-import json
-import os
 import uuid
 
+from services.community_store import get_community_repository
 
-router = APIRouter(prefix="/competitions", tags=["competitions"])
 
-# Data file paths
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-COMPETITIONS_FILE = os.path.join(DATA_DIR, "competitions.json")
-PORTFOLIOS_FILE = os.path.join(DATA_DIR, "community_portfolios.json")
-SNAPSHOTS_FILE = os.path.join(DATA_DIR, "performance_snapshots.json")
+router = APIRouter(prefix="/competitions", tags=["competitions"])
 
 
 # ============================================
@@ -106,59 +100,18 @@ class CreateCompetitionRequest(BaseModel):
 # Data Operations
 # ============================================
 
-def load_competitions() -> dict:
-    """Load competitions from JSON file."""
-    if os.path.exists(COMPETITIONS_FILE):
-        try:
-            with open(COMPETITIONS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"competitions": {}}
-
-
-def save_competitions(data: dict):
-    """Save competitions to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    with open(COMPETITIONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
-def load_portfolios() -> dict:
-    """Load portfolios from JSON file."""
-    if os.path.exists(PORTFOLIOS_FILE):
-        try:
-            with open(PORTFOLIOS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"portfolios": {}}
-
-
-def load_snapshots() -> dict:
-    """Load performance snapshots."""
-    if os.path.exists(SNAPSHOTS_FILE):
-        try:
-            with open(SNAPSHOTS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"snapshots": {}}
-
-
 def get_portfolio_performance(portfolio_id: str, start_date: str, end_date: str) -> float:
     """
     Calculate portfolio performance between two dates.
 
     Returns return percentage as decimal (0.10 = 10%).
     """
-    snapshots_data = load_snapshots()
-    portfolio_snapshots = snapshots_data.get("snapshots", {}).get(portfolio_id, [])
+    repo = get_community_repository()
+    portfolio_snapshots = repo.snapshots_for(portfolio_id)
 
     if not portfolio_snapshots:
         # Try to use cached performance from portfolio
-        portfolios_data = load_portfolios()
-        portfolio = portfolios_data.get("portfolios", {}).get(portfolio_id)
+        portfolio = repo.get_portfolio(portfolio_id)
         if portfolio and portfolio.get("performance"):
             # Use year performance as fallback
             return portfolio["performance"].get("year", 0)
@@ -171,8 +124,9 @@ def get_portfolio_performance(portfolio_id: str, start_date: str, end_date: str)
     start_value = None
     end_value = None
 
-    for snapshot in sorted(portfolio_snapshots, key=lambda x: x.get("date", "")):
-        snap_date = datetime.fromisoformat(snapshot["date"].replace('Z', '+00:00'))
+    # Snapshots are sorted by timestamp, oldest first
+    for snapshot in portfolio_snapshots:
+        snap_date = datetime.fromisoformat(snapshot["timestamp"].replace('Z', '+00:00'))
 
         if snap_date <= start_dt:
             start_value = snapshot.get("total_value", 0)
@@ -218,12 +172,11 @@ async def list_competitions(
     """
     List all competitions, optionally filtered by status or type.
     """
-    data = load_competitions()
-    all_competitions = list(data.get("competitions", {}).values())
-
-    # Update statuses
-    for comp in all_competitions:
-        update_competition_status(comp)
+    # Statuses are derived from dates on copies; stored records are read-only
+    all_competitions = [
+        update_competition_status(dict(comp))
+        for comp in get_community_repository().list_competitions()
+    ]
 
     # Filter by status
     if status:
@@ -253,13 +206,10 @@ async def get_active_competition():
 
     Returns the most recent active competition.
     """
-    data = load_competitions()
-    all_competitions = list(data.get("competitions", {}).values())
-
     # Update statuses and find active ones
     active = []
-    for comp in all_competitions:
-        update_competition_status(comp)
+    for comp in get_community_repository().list_competitions():
+        comp = update_competition_status(dict(comp))
         if comp.get("status") == "active":
             active.append(comp)
 
@@ -276,13 +226,12 @@ async def get_competition(competition_id: str):
     """
     Get a specific competition by ID.
     """
-    data = load_competitions()
-    competition = data.get("competitions", {}).get(competition_id)
+    competition = get_community_repository().get_competition(competition_id)
 
     if not competition:
         raise HTTPException(status_code=404, detail="Competition not found")
 
-    update_competition_status(competition)
+    competition = update_competition_status(dict(competition))
     return Competition(**competition)
 
 
@@ -296,26 +245,18 @@ async def get_competition_standings(
 
     Returns portfolios ranked by performance during the competition period.
     """
-    data = load_competitions()
-    competition = data.get("competitions", {}).get(competition_id)
+    repo = get_community_repository()
+    competition = repo.get_competition(competition_id)
 
     if not competition:
         raise HTTPException(status_code=404, detail="Competition not found")
 
-    update_competition_status(competition)
-
-    # Get all public portfolios
-    portfolios_data = load_portfolios()
-    portfolios = portfolios_data.get("portfolios", {})
+    competition = update_competition_status(dict(competition))
 
-    public_portfolios = [
-        (pid, p) for pid, p in portfolios.items()
-        if p.get("visibility") == "public"
-    ]
-
-    # Calculate performance for each
+    # Calculate performance for each public portfolio
     standings = []
-    for portfolio_id, portfolio in public_portfolios:
+    for portfolio in repo.public_portfolios():
+        portfolio_id = portfolio["id"]
         return_pct = get_portfolio_performance(
             portfolio_id,
             competition["start_date"],
@@ -373,9 +314,7 @@ async def create_competition(request: CreateCompetitionRequest):
     update_competition_status(comp_dict)
 
     # Save
-    data = load_competitions()
-    data["competitions"][competition_id] = comp_dict
-    save_competitions(data)
+    get_community_repository().put_competition(comp_dict)
 
     return Competition(**comp_dict)
 
@@ -388,13 +327,13 @@ async def finalize_competition(competition_id: str):
     Awards badges to top 3 performers.
     This should only be called after the competition end date.
     """
-    data = load_competitions()
-    competition = data.get("competitions", {}).get(competition_id)
+    repo = get_community_repository()
+    competition = repo.get_competition(competition_id)
 
     if not competition:
         raise HTTPException(status_code=404, detail="Competition not found")
 
-    update_competition_status(competition)
+    competition = update_competition_status(dict(competition))
 
     if competition["status"] != "completed":
         raise HTTPException(
@@ -409,16 +348,9 @@ async def finalize_competition(competition_id: str):
         )
 
     # Get standings
-    portfolios_data = load_portfolios()
-    portfolios = portfolios_data.get("portfolios", {})
-
-    public_portfolios = [
-        (pid, p) for pid, p in portfolios.items()
-        if p.get("visibility") == "public"
-    ]
-
     standings = []
-    for portfolio_id, portfolio in public_portfolios:
+    for portfolio in repo.public_portfolios():
+        portfolio_id = portfolio["id"]
         return_pct = get_portfolio_performance(
             portfolio_id,
             competition["start_date"],
@@ -471,8 +403,7 @@ async def finalize_competition(competition_id: str):
     competition["status"] = "completed"
 
     # Save
-    data["competitions"][competition_id] = competition
-    save_competitions(data)
+    repo.put_competition(competition)
 
     # Send notifications to winners
     try:
@@ -509,16 +440,12 @@ def award_competition_badge(
 
     Adds badge to the portfolio's badges array.
     """
-    portfolios_data = load_portfolios()
-    portfolio = portfolios_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         return
 
-    # Initialize badges array if not exists
-    if "badges" not in portfolio:
-        portfolio["badges"] = []
-
     # Add badge
     badge = {
         "id": str(uuid.uuid4()),
@@ -529,10 +456,5 @@ def award_competition_badge(
         "awarded_at": datetime.utcnow().isoformat() + "Z"
     }
 
-    portfolio["badges"].append(badge)
-
-    # Save
-    portfolios_data["portfolios"][portfolio_id] = portfolio
-
-    with open(PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
-        json.dump(portfolios_data, f, indent=2, ensure_ascii=False)
+    # Save (new list: stored records are never modified in place)
+    repo.update_portfolio(portfolio_id, {"badges": portfolio.get("badges", []) + [badge]})
@@ -129,6 +129,65 @@ async def get_simple_status():
     }
 
 
+@router.get("/status/marketdata")
+async def get_market_data_status():
+    """
+    Market data line usage and hit/miss counters.
+
+    A hit is a market data request for an ETF that already had a streaming line.
+    """
+    ib_client = get_ib_client()
+    return {
+        "connected": ib_client.is_connected(),
+        **ib_client.market_data_lines.get_stats(),
+    }
+
+
+@router.get("/status/auth-cache")
+async def get_auth_cache_status():
+    """
+    Customer cache counters for the authentication hot path.
+
+    Hit rate, entries, in-flight loads and recent Supabase load latency.
+    """
+    from services.customer_cache import get_customer_cache
+
+    return get_customer_cache().get_stats()
+
+
+@router.get("/status/audit")
+async def get_audit_status():
+    """
+    Audit log writer counters.
+
+    Queue depth, rows and batches written, and rows spilled to disk while
+    the database was unreachable (and replayed since).
+    """
+    from services.audit import get_audit_service
+
+    return get_audit_service().get_stats()
+
+
+@router.get("/status/ib-bridge")
+async def get_ib_bridge_status():
+    """
+    IB bridge counters (bridge mode only).
+
+    Quote board usage and seqlock retries in this worker, requests sent to
+    the bridge, the bridge's own counters as of its last status reply, and
+    this worker's copy of the market data cache file.
+    """
+    from services.market_data_persistence import get_market_data_persister
+
+    if not get_settings().ib_bridge_enabled:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        **get_ib_client().get_stats(),
+        "market_data_cache": get_market_data_persister().get_stats(),
+    }
+
+
 @router.get("/ready", response_model=ReadinessResponse)
 async def check_readiness():
     """
@@ -1,49 +1,23 @@
-"""Streaming market data endpoints with offline caching."""
-from fastapi import APIRouter, Depends, HTTPException, Path, Query
+"""Streaming market data endpoints with offline caching (see services/market_data_persistence.py)."""
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
+import asyncio
 import json
-import os
 import logging
 
 from services.ib_client import get_ib_client
-from middleware.auth import require_trading_approved, get_current_user
+from services.etf_universe import get_etf_universe
+from services.market_data_stream import format_quote, get_market_data_broadcaster, safe_number
+from services.market_data_persistence import get_market_data_snapshot
+from middleware.auth import require_trading_approved, get_current_user, get_stream_user
 from models.schemas import UserContext
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/trading", tags=["Market Data"])
 
-# Cache file path
-CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-MARKET_DATA_CACHE_FILE = os.path.join(CACHE_DIR, "market_data_cache.json")
-
-
-def _save_cache(data: dict):
-    """Save market data to persistent cache."""
-    try:
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        cache = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": data
-        }
-        with open(MARKET_DATA_CACHE_FILE, "w") as f:
-            json.dump(cache, f, indent=2)
-    except Exception as e:
-        logger.warning(f"Failed to save market data cache: {e}")
-
-
-def _load_cache() -> Optional[dict]:
-    """Load market data from persistent cache."""
-    try:
-        if os.path.exists(MARKET_DATA_CACHE_FILE):
-            with open(MARKET_DATA_CACHE_FILE, "r") as f:
-                return json.load(f)
-    except Exception as e:
-        logger.warning(f"Failed to load market data cache: {e}")
-    return None
-
-
 class MarketDataResponse(BaseModel):
     """Market data for a single symbol."""
     conid: int
@@ -68,6 +42,26 @@ class AllMarketDataResponse(BaseModel):
     subscriptionCount: int
 
 
+class BarResponse(BaseModel):
+    """OHLCV bar built from the tick store."""
+    timestamp: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    ticks: int
+
+
+class BarsResponse(BaseModel):
+    """Intraday bars for a symbol."""
+    conid: int
+    symbol: str
+    interval: int
+    bars: list[BarResponse]
+    vwap: Optional[float] = None
+
+
 class SubscribeResponse(BaseModel):
     """Response for subscription requests."""
     success: bool
@@ -75,53 +69,10 @@ class SubscribeResponse(BaseModel):
     subscriptionCount: int
 
 
-def _safe_number(value, as_int=False):
-    """Return None if value is None, NaN, or Inf; otherwise return the value."""
-    import math
-    if value is None:
-        return None
-    try:
-        if math.isnan(value) or math.isinf(value):
-            return None
-    except (TypeError, ValueError):
-        return None
-    return int(value) if as_int else value
-
-
 def _format_market_data(data: Optional[dict], subscribed: bool = True) -> Optional[MarketDataResponse]:
     """Format market data dict into response model."""
-    if not data:
-        return None
-
-    bid = _safe_number(data.get("bid"))
-    ask = _safe_number(data.get("ask"))
-    last = _safe_number(data.get("last"))
-
-    # Calculate spread and mid price
-    spread = None
-    mid_price = None
-    if bid and ask and bid > 0 and ask > 0:
-        spread = round(ask - bid, 4)
-        mid_price = round((bid + ask) / 2, 4)
-    elif last and last > 0:
-        # Fallback to last price if no bid/ask
-        mid_price = last
-
-    return MarketDataResponse(
-        conid=data.get("conid", 0),
-        symbol=data.get("symbol", ""),
-        bid=bid,
-        ask=ask,
-        last=last,
-        bidSize=_safe_number(data.get("bidSize"), as_int=True),
-        askSize=_safe_number(data.get("askSize"), as_int=True),
-        volume=_safe_number(data.get("volume"), as_int=True),
-        spread=spread,
-        midPrice=mid_price,
-        timestamp=data.get("timestamp"),
-        delayed=data.get("delayed", False),
-        subscribed=subscribed,
-    )
+    quote = format_quote(data, subscribed=subscribed)
+    return MarketDataResponse(**quote) if quote else None
 
 
 @router.get("/marketdata/{symbol}", response_model=MarketDataResponse)
@@ -138,7 +89,7 @@ async def get_market_data_by_symbol(
 
     # If not connected, try to return cached data
     if not ib_client.is_connected():
-        cached = _load_cache()
+        cached = get_market_data_snapshot()
         if cached and cached.get("data"):
             for conid, data in cached["data"].items():
                 if data.get("symbol", "").upper() == symbol.upper():
@@ -154,7 +105,7 @@ async def get_market_data_by_symbol(
     except Exception as e:
         logger.warning(f"IB market data error for {symbol} (non-fatal): {e}")
         # Try cache fallback
-        cached = _load_cache()
+        cached = get_market_data_snapshot()
         if cached and cached.get("data"):
             for conid, cdata in cached["data"].items():
                 if cdata.get("symbol", "").upper() == symbol.upper():
@@ -174,6 +125,45 @@ async def get_market_data_by_symbol(
     return result
 
 
+@router.get("/marketdata/{symbol}/bars", response_model=BarsResponse)
+async def get_market_data_bars(
+    symbol: str = Path(..., description="ETF symbol (e.g., VUSA, IWDA)"),
+    interval: int = Query(60, ge=1, le=86400, description="Bar length in seconds"),
+    minutes: int = Query(390, ge=1, le=1440, description="Lookback window in minutes"),
+    user: UserContext = Depends(get_current_user)
+) -> BarsResponse:
+    """
+    Get OHLCV bars and VWAP for a subscribed symbol from the in-memory tick history.
+    Returns no bars if the symbol isn't subscribed or hasn't traded in the window.
+    """
+    etf = get_etf_universe().get_by_symbol(symbol)
+    if not etf:
+        raise HTTPException(status_code=404, detail=f"Symbol {symbol} not found")
+
+    tick_store = get_ib_client().tick_store
+    start = datetime.now().timestamp() - minutes * 60
+    bars = tick_store.bars(etf["conid"], interval, start=start)
+
+    return BarsResponse(
+        conid=etf["conid"],
+        symbol=etf["symbol"],
+        interval=interval,
+        bars=[
+            BarResponse(
+                timestamp=datetime.utcfromtimestamp(ts).isoformat() + "Z",
+                open=round(o, 4),
+                high=round(h, 4),
+                low=round(l, 4),
+                close=round(c, 4),
+                volume=int(v),
+                ticks=int(n),
+            )
+            for ts, o, h, l, c, v, n in bars.tolist()
+        ],
+        vwap=safe_number(tick_store.vwap(etf["conid"], start=start)),
+    )
+
+
 @router.get("/marketdata", response_model=AllMarketDataResponse)
 async def get_all_market_data(
     user: UserContext = Depends(get_current_user)
@@ -187,7 +177,7 @@ async def get_all_market_data(
 
     # If not connected, return cached data
     if not ib_client.is_connected():
-        cached = _load_cache()
+        cached = get_market_data_snapshot()
         if cached and cached.get("data"):
             results = []
             for conid, data in cached["data"].items():
@@ -232,9 +222,6 @@ async def get_all_market_data(
             subscriptionCount=count
         )
 
-    # Save to cache for offline use
-    _save_cache(all_data)
-
     return AllMarketDataResponse(
         data=results,
         timestamp=datetime.utcnow().isoformat(),
@@ -297,7 +284,10 @@ async def subscribe_market_data(
         raise HTTPException(status_code=404, detail=f"Symbol {symbol} not found in available ETFs")
 
     try:
-        success = await ib_client.subscribe_market_data(etf["conid"])
+        # Explicit requests still go through the line budget
+        lines = ib_client.market_data_lines
+        lines.record_request(etf["conid"])
+        success = await lines.acquire(etf["conid"])
     except Exception as e:
         logger.warning(f"Subscribe error for {symbol} (non-fatal): {e}")
         success = False
@@ -331,3 +321,116 @@ async def unsubscribe_market_data(
         message=f"Unsubscribed from {symbol} market data",
         subscriptionCount=len(ib_client.get_all_market_data())
     )
+
+
+# =============================================================================
+# Push Stream (WebSocket / SSE)
+# =============================================================================
+
+def _resolve_stream_symbols(symbols: Optional[Iterable[str]]) -> Optional[set[int]]:
+    """Conids for a symbol filter (None = all). Raises ValueError on unknown symbols."""
+    if symbols is None:
+        return None
+    universe = get_etf_universe()
+    conids, unknown = set(), []
+    for symbol in symbols:
+        symbol = symbol.strip()
+        if not symbol:
+            continue
+        etf = universe.get_by_symbol(symbol)
+        if etf and etf.get("conid"):
+            conids.add(etf["conid"])
+        else:
+            unknown.append(symbol)
+    if unknown:
+        raise ValueError(f"Unknown symbols: {', '.join(unknown)}")
+    return conids or None
+
+
+@router.websocket("/marketdata/stream")
+async def stream_market_data_ws(
+    websocket: WebSocket,
+    symbols: Optional[str] = Query(None, description="Comma-separated ETF symbols (default: all subscribed)"),
+    max_rate: float = Query(0, ge=0, description="Max messages per second for this connection (0 = server limit)"),
+    user: UserContext = Depends(get_stream_user)
+):
+    """
+    Push stream of market data over WebSocket.
+
+    Every message is a JSON array of MarketDataResponse objects, the latest
+    quote per symbol since the previous message (intermediate ticks are
+    conflated). The first message holds the current quotes. Send
+    {"symbols": ["IWDA", ...]} (or null for all) to change the filter.
+    """
+    broadcaster = get_market_data_broadcaster()
+    try:
+        conids = _resolve_stream_symbols(symbols.split(",") if symbols else None)
+        subscriber = broadcaster.subscribe(conids, max_rate, snapshot=get_ib_client().get_all_market_data())
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    except RuntimeError as e:
+        await websocket.close(code=1013, reason=str(e))
+        return
+
+    async def receive_filters():
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                    broadcaster.update_filter(subscriber, _resolve_stream_symbols(message.get("symbols")))
+                except (ValueError, AttributeError, TypeError) as e:
+                    await websocket.send_text(json.dumps({"error": str(e)}))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Ends the send loop below
+            broadcaster.unsubscribe(subscriber)
+
+    receiver = None
+    try:
+        await websocket.accept()
+        receiver = asyncio.create_task(receive_filters())
+        async for batch in broadcaster.stream(subscriber):
+            await websocket.send_text(f"[{','.join(batch)}]")
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        if receiver:
+            receiver.cancel()
+
+
+@router.get("/marketdata/stream/sse")
+async def stream_market_data_sse(
+    symbols: Optional[str] = Query(None, description="Comma-separated ETF symbols (default: all subscribed)"),
+    max_rate: float = Query(0, ge=0, description="Max events per second for this connection (0 = server limit)"),
+    user: UserContext = Depends(get_stream_user)
+) -> StreamingResponse:
+    """
+    Push stream of market data as Server-Sent Events.
+
+    Each "quotes" event carries a JSON array of MarketDataResponse objects,
+    the same payload as the WebSocket stream.
+    """
+    broadcaster = get_market_data_broadcaster()
+    try:
+        conids = _resolve_stream_symbols(symbols.split(",") if symbols else None)
+        subscriber = broadcaster.subscribe(conids, max_rate, snapshot=get_ib_client().get_all_market_data())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def events():
+        try:
+            async for batch in broadcaster.stream(subscriber):
+                yield f"event: quotes\ndata: [{','.join(batch)}]\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -12,16 +12,12 @@ from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
-import json
-import os
 import uuid
 
+from services.community_store import get_community_repository
 
-router = APIRouter(prefix="/notifications", tags=["notifications"])
 
-# Data file paths
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-NOTIFICATIONS_FILE = os.path.join(DATA_DIR, "notifications.json")
+router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 
 # ============================================
@@ -71,33 +67,14 @@ class MarkReadResponse(BaseModel):
 # Data Operations
 # ============================================
 
-def load_notifications() -> dict:
-    """Load notifications from JSON file."""
-    if os.path.exists(NOTIFICATIONS_FILE):
-        try:
-            with open(NOTIFICATIONS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"notifications": []}
-
-
-def save_notifications(data: dict):
-    """Save notifications to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    with open(NOTIFICATIONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
-def create_notification(
+def _build_notification(
     user_id: str,
     notification_type: NotificationType,
     title: str,
     message: str,
     data: Optional[dict] = None
 ) -> Notification:
-    """Create and save a new notification."""
-    notification = Notification(
+    return Notification(
         id=str(uuid.uuid4()),
         user_id=user_id,
         type=notification_type,
@@ -108,13 +85,38 @@ def create_notification(
         created_at=datetime.utcnow().isoformat()
     )
 
-    notifications_data = load_notifications()
-    notifications_data["notifications"].append(notification.dict())
-    save_notifications(notifications_data)
+
+def create_notification(
+    user_id: str,
+    notification_type: NotificationType,
+    title: str,
+    message: str,
+    data: Optional[dict] = None
+) -> Notification:
+    """Create and save a new notification."""
+    notification = _build_notification(user_id, notification_type, title, message, data)
+
+    get_community_repository().add_notifications([notification.dict()])
 
     return notification
 
 
+def create_notifications(
+    user_ids: List[str],
+    notification_type: NotificationType,
+    title: str,
+    message: str,
+    data: Optional[dict] = None
+) -> int:
+    """Create the same notification for many users, saved as one write."""
+    notifications = [
+        _build_notification(user_id, notification_type, title, message, data).dict()
+        for user_id in user_ids
+    ]
+
+    return get_community_repository().add_notifications(notifications)
+
+
 # ============================================
 # API Endpoints
 # ============================================
@@ -131,30 +133,14 @@ async def get_notifications(
 
     Returns notifications sorted by creation date (newest first).
     """
-    data = load_notifications()
-    all_notifications = data.get("notifications", [])
-
-    # Filter by user_id
-    user_notifications = [n for n in all_notifications if n.get("user_id") == user_id]
-
-    # Filter unread only if requested
-    if unread_only:
-        user_notifications = [n for n in user_notifications if not n.get("read", False)]
-
-    # Sort by created_at descending
-    user_notifications.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-
-    # Count unread
-    unread_count = sum(1 for n in user_notifications if not n.get("read", False))
-
-    # Apply pagination
-    total = len(user_notifications)
-    paginated = user_notifications[offset:offset + limit]
+    # One page from the user's inbox (newest first)
+    repo = get_community_repository()
+    paginated, total = repo.notifications_page(user_id, limit, offset, unread_only)
 
     return NotificationResponse(
         notifications=[Notification(**n) for n in paginated],
         total=total,
-        unread_count=unread_count
+        unread_count=repo.unread_count(user_id)
     )
 
 
@@ -165,15 +151,7 @@ async def get_unread_count(
     """
     Get the count of unread notifications for badge display.
     """
-    data = load_notifications()
-    all_notifications = data.get("notifications", [])
-
-    unread_count = sum(
-        1 for n in all_notifications
-        if n.get("user_id") == user_id and not n.get("read", False)
-    )
-
-    return UnreadCountResponse(unread_count=unread_count)
+    return UnreadCountResponse(unread_count=get_community_repository().unread_count(user_id))
 
 
 @router.post("/{notification_id}/read", response_model=MarkReadResponse)
@@ -184,27 +162,25 @@ async def mark_notification_read(
     """
     Mark a notification as read.
     """
-    data = load_notifications()
-    notifications = data.get("notifications", [])
+    repo = get_community_repository()
+    notification = repo.get_notification(notification_id)
 
-    for notification in notifications:
-        if notification.get("id") == notification_id:
-            # Verify ownership
-            if notification.get("user_id") != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail="Not authorized to modify this notification"
-                )
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
 
-            notification["read"] = True
-            save_notifications(data)
+    # Verify ownership
+    if notification.get("user_id") != user_id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to modify this notification"
+        )
 
-            return MarkReadResponse(
-                success=True,
-                message="Notification marked as read"
-            )
+    repo.update_notification(notification_id, {"read": True})
 
-    raise HTTPException(status_code=404, detail="Notification not found")
+    return MarkReadResponse(
+        success=True,
+        message="Notification marked as read"
+    )
 
 
 @router.post("/mark-all-read", response_model=MarkReadResponse)
@@ -214,17 +190,7 @@ async def mark_all_read(
     """
     Mark all notifications as read for a user.
     """
-    data = load_notifications()
-    notifications = data.get("notifications", [])
-
-    count = 0
-    for notification in notifications:
-        if notification.get("user_id") == user_id and not notification.get("read", False):
-            notification["read"] = True
-            count += 1
-
-    if count > 0:
-        save_notifications(data)
+    count = get_community_repository().mark_all_notifications_read(user_id)
 
     return MarkReadResponse(
         success=True,
@@ -240,27 +206,25 @@ async def delete_notification(
     """
     Delete a notification.
     """
-    data = load_notifications()
-    notifications = data.get("notifications", [])
+    repo = get_community_repository()
+    notification = repo.get_notification(notification_id)
 
-    for i, notification in enumerate(notifications):
-        if notification.get("id") == notification_id:
-            # Verify ownership
-            if notification.get("user_id") != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail="Not authorized to delete this notification"
-                )
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
 
-            notifications.pop(i)
-            save_notifications(data)
+    # Verify ownership
+    if notification.get("user_id") != user_id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to delete this notification"
+        )
 
-            return MarkReadResponse(
-                success=True,
-                message="Notification deleted"
-            )
+    repo.delete_notification(notification_id)
 
-    raise HTTPException(status_code=404, detail="Notification not found")
+    return MarkReadResponse(
+        success=True,
+        message="Notification deleted"
+    )
 
 
 # ============================================
@@ -273,39 +237,20 @@ def notify_portfolio_followers(portfolio_id: str, portfolio_name: str, change_me
 
     Called from portfolios.py when a portfolio is modified.
     """
-    from .portfolios import load_portfolios as load_portfolio_data
-
-    # Load follows
-    follows_file = os.path.join(DATA_DIR, "portfolio_follows.json")
-    if not os.path.exists(follows_file):
-        return
-
-    try:
-        with open(follows_file, "r", encoding="utf-8") as f:
-            follows_data = json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return
-
     # Find all followers of this portfolio
-    follows = follows_data.get("follows", [])
-    follower_ids = [
-        f["follower_user_id"]
-        for f in follows
-        if f.get("portfolio_id") == portfolio_id
-    ]
-
-    # Create notification for each follower
-    for user_id in follower_ids:
-        create_notification(
-            user_id=user_id,
-            notification_type=NotificationType.PORTFOLIO_UPDATED,
-            title=f"Portfolio bijgewerkt",
-            message=f"{portfolio_name}: {change_message}",
-            data={
-                "portfolio_id": portfolio_id,
-                "portfolio_name": portfolio_name
-            }
-        )
+    follower_ids = get_community_repository().follower_ids(portfolio_id)
+
+    # One notification per follower, saved together
+    create_notifications(
+        user_ids=follower_ids,
+        notification_type=NotificationType.PORTFOLIO_UPDATED,
+        title=f"Portfolio bijgewerkt",
+        message=f"{portfolio_name}: {change_message}",
+        data={
+            "portfolio_id": portfolio_id,
+            "portfolio_name": portfolio_name
+        }
+    )
 
 
 def notify_new_follower(portfolio_creator_id: str, follower_name: str, portfolio_name: str, portfolio_id: str):
@@ -8,7 +8,7 @@ from models.schemas import (
     UserContext, OrderSide
 )
 from middleware.auth import require_trading_approved, require_trading_owner, get_current_user, get_client_ip
-from services.ib_client import get_ib_client
+from services.ib_client import get_ib_client, order_outcome_unknown
 from services.audit import get_audit_service
 from services.safety import get_safety_service
 from config import get_settings, TradingMode
@@ -104,8 +104,8 @@ async def get_user_limits(
     settings = get_settings()
     safety = get_safety_service()
 
-    stats = safety.get_user_daily_stats(user.customer_id)
-    limits = safety.get_user_limits(user.customer_id)
+    stats = await safety.get_user_daily_stats(user.customer_id)
+    limits = await safety.get_user_limits(user.customer_id)
 
     return UserLimitsResponse(
         date=stats["date"],
@@ -363,18 +363,6 @@ async def place_order(
             }
         )
 
-    # ==========================================================================
-    # DOUBLE SUBMISSION PREVENTION
-    # ==========================================================================
-    await safety.mark_order_pending(
-        customer_id=user.customer_id,
-        ib_account_id=user.ib_account_id,
-        symbol=order.symbol,
-        side=order.side.value,
-        quantity=order.quantity,
-        order_type=order.order_type.value
-    )
-
     # ==========================================================================
     # Connection checks
     # ==========================================================================
@@ -402,7 +390,46 @@ async def place_order(
             detail=f"ETF with conid {order.conid} is not available for trading"
         )
 
+    # ==========================================================================
+    # DOUBLE SUBMISSION PREVENTION + daily limit reservation
+    # ==========================================================================
+    # Re-checks and claims the order atomically: a concurrent duplicate (in any
+    # worker) or an order past the daily limits is rejected here
+    claim = await safety.claim_order(
+        customer_id=user.customer_id,
+        ib_account_id=user.ib_account_id,
+        symbol=order.symbol,
+        side=order.side.value,
+        quantity=order.quantity,
+        order_type=order.order_type.value,
+        estimated_value=estimated_value,
+        is_live_mode=is_live
+    )
+
+    if not claim.allowed:
+        logger.warning(f"Order blocked by safety: {claim.reason}")
+        await audit.log_safety_block(
+            customer_id=user.customer_id,
+            ib_account_id=user.ib_account_id,
+            symbol=order.symbol,
+            side=order.side.value,
+            quantity=order.quantity,
+            reason=claim.reason,
+            trading_mode=trading_mode,
+            ip_address=client_ip
+        )
+        return OrderResponse(
+            success=False,
+            message=claim.reason,
+            details={
+                "error": "SAFETY_LIMIT_EXCEEDED",
+                "trading_mode": trading_mode,
+                "is_live": is_live
+            }
+        )
+
     request_payload = order.model_dump()
+    submitted = False
 
     try:
         # Place order via IB Gateway
@@ -415,9 +442,39 @@ async def place_order(
             limit_price=order.limit_price,
             stop_price=order.stop_price
         )
+        submitted = True
+
+        # Reply lost on the way back from IB: the order may be live, so keep the
+        # safety reservation and pending mark, and don't report a rejection
+        if order_outcome_unknown(result):
+            logger.error(f"Order outcome unknown - user={user.customer_id}: {result.get('message')}")
+            await audit.log_order_unknown(
+                customer_id=user.customer_id,
+                broker_account_id=user.broker_account_id,
+                ib_account_id=user.ib_account_id,
+                symbol=order.symbol,
+                side=order.side.value,
+                quantity=order.quantity,
+                order_type=order.order_type.value,
+                trading_mode=trading_mode,
+                error_message=result.get("message", "Order outcome unknown"),
+                request_payload=request_payload,
+                ip_address=client_ip
+            )
+            return OrderResponse(
+                success=False,
+                message="Order status unknown - it may have been placed. Check your orders before retrying.",
+                details={
+                    "error": "ORDER_STATUS_UNKNOWN",
+                    "order_ref": result.get("order_ref"),
+                    "trading_mode": trading_mode,
+                    "is_live": is_live
+                }
+            )
 
         # Check for errors
         if result.get("error"):
+            await safety.release_order(user.customer_id, estimated_value)
             await audit.log_order_error(
                 customer_id=user.customer_id,
                 broker_account_id=user.broker_account_id,
@@ -494,6 +551,8 @@ async def place_order(
 
     except Exception as e:
         logger.error(f"Error placing order: {e}")
+        if not submitted:
+            await safety.release_order(user.customer_id, estimated_value)
         await audit.log_order_error(
             customer_id=user.customer_id,
             broker_account_id=user.broker_account_id,
@@ -5,25 +5,19 @@ Handles CRUD operations for community-created model portfolios.
 Includes: Follow system, Performance snapshots, Leaderboards.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from enum import Enum
-import json
-import os
 import uuid
-import math
 
-router = APIRouter(prefix="/portfolios", tags=["portfolios"])
-
-# Data file paths
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-PORTFOLIOS_FILE = os.path.join(DATA_DIR, "community_portfolios.json")
-FOLLOWS_FILE = os.path.join(DATA_DIR, "portfolio_follows.json")
-SNAPSHOTS_FILE = os.path.join(DATA_DIR, "performance_snapshots.json")
-MARKET_DATA_FILE = os.path.join(DATA_DIR, "market_data_cache.json")
+from services.community_store import get_community_repository
+from services.etf_universe import get_etf_universe
+from services.market_data_persistence import get_market_data_snapshot
+from services.snapshot_valuation import reference_values, snapshot_returns, value_portfolios
 
+router = APIRouter(prefix="/portfolios", tags=["portfolios"])
 
 # ============================================
 # Models
@@ -180,109 +174,27 @@ class TrendingEntry(BaseModel):
 
 
 # ============================================
-# Data Storage
+# ID Generation
 # ============================================
 
-def load_portfolios() -> dict:
-    """Load portfolios from JSON file."""
-    if not os.path.exists(PORTFOLIOS_FILE):
-        return {"portfolios": {}, "last_updated": None}
-
-    try:
-        with open(PORTFOLIOS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading portfolios: {e}")
-        return {"portfolios": {}, "last_updated": None}
-
-
-def save_portfolios(data: dict):
-    """Save portfolios to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(PORTFOLIOS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
 def generate_portfolio_id() -> str:
     """Generate a unique portfolio ID."""
     return f"community-{uuid.uuid4().hex[:12]}"
 
 
-# ============================================
-# Follow Data Storage
-# ============================================
-
-def load_follows() -> dict:
-    """Load follows from JSON file."""
-    if not os.path.exists(FOLLOWS_FILE):
-        return {"follows": {}, "by_user": {}, "by_portfolio": {}, "last_updated": None}
-
-    try:
-        with open(FOLLOWS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading follows: {e}")
-        return {"follows": {}, "by_user": {}, "by_portfolio": {}, "last_updated": None}
-
-
-def save_follows(data: dict):
-    """Save follows to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(FOLLOWS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
 def generate_follow_id() -> str:
     """Generate a unique follow ID."""
     return f"follow-{uuid.uuid4().hex[:12]}"
 
 
-# ============================================
-# Snapshot Data Storage
-# ============================================
-
-def load_snapshots() -> dict:
-    """Load snapshots from JSON file."""
-    if not os.path.exists(SNAPSHOTS_FILE):
-        return {"snapshots": {}, "by_portfolio": {}, "by_type": {}, "last_updated": None}
-
-    try:
-        with open(SNAPSHOTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading snapshots: {e}")
-        return {"snapshots": {}, "by_portfolio": {}, "by_type": {}, "last_updated": None}
-
-
-def save_snapshots(data: dict):
-    """Save snapshots to JSON file."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    data["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    with open(SNAPSHOTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-
 def generate_snapshot_id() -> str:
     """Generate a unique snapshot ID."""
     return f"snapshot-{uuid.uuid4().hex[:12]}"
 
 
 def load_market_data() -> dict:
-    """Load market data cache for price lookups."""
-    if not os.path.exists(MARKET_DATA_FILE):
-        return {}
-
-    try:
-        with open(MARKET_DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading market data: {e}")
-        return {}
+    """Market data entries by conid for price lookups. Do not mutate."""
+    return get_market_data_snapshot().get("data", {})
 
 
 # ============================================
@@ -306,20 +218,20 @@ async def list_portfolios(
     - **search**: Search in name and description
     - **sort_by**: Sort field (created_at, performance, followers, likes)
     """
-    data = load_portfolios()
-    portfolios = list(data.get("portfolios", {}).values())
+    repo = get_community_repository()
+
+    # Start from the narrowest index: creator, public, or everything
+    if creator_id:
+        portfolios = repo.portfolios_by_creator(creator_id)
+    elif visibility is None or visibility == PortfolioVisibility.PUBLIC:
+        # By default, only show public portfolios unless filtering by creator
+        portfolios = repo.public_portfolios()
+    else:
+        portfolios = repo.list_portfolios()
 
     # Filter by visibility
     if visibility:
         portfolios = [p for p in portfolios if p.get("visibility") == visibility.value]
-    else:
-        # By default, only show public portfolios unless filtering by creator
-        if not creator_id:
-            portfolios = [p for p in portfolios if p.get("visibility") == "public"]
-
-    # Filter by creator
-    if creator_id:
-        portfolios = [p for p in portfolios if p.get("creator_id") == creator_id]
 
     # Search
     if search:
@@ -352,49 +264,49 @@ async def list_portfolios(
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
 async def get_leaderboard(
+    response: Response,
     period: str = Query("year", enum=["month", "quarter", "year", "all_time"]),
     limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
 ):
     """
     Get portfolio leaderboard ranked by performance.
 
     - **period**: Time period for performance ranking
     - **limit**: Maximum number of entries
+    - **cursor**: Continue after the previous page (X-Next-Cursor response header)
     """
-    data = load_portfolios()
-    portfolios = list(data.get("portfolios", {}).values())
-
-    # Only public portfolios
-    portfolios = [p for p in portfolios if p.get("visibility") == "public"]
-
-    # Get performance for period
-    period_key = "all_time" if period == "all_time" else period
-
-    # Sort by performance
-    portfolios.sort(
-        key=lambda p: p.get("performance", {}).get(period_key, 0),
-        reverse=True
-    )
+    page = _leaderboard_page(f"performance:{period}", limit, cursor, response)
 
     # Build leaderboard
     leaderboard = []
-    for i, p in enumerate(portfolios[:limit]):
+    for rank, p, _ in page["entries"]:
         leaderboard.append(LeaderboardEntry(
             portfolio_id=p["id"],
             portfolio_name=p["name"],
             creator_name=p["creator_name"],
-            performance=p.get("performance", {}).get(period_key, 0),
-            rank=i + 1,
+            performance=(p.get("performance") or {}).get(period, 0),
+            rank=rank,
         ))
 
     return leaderboard
 
 
+def _leaderboard_page(board: str, limit: int, cursor: Optional[str], response: Response) -> dict:
+    """Page of a materialized leaderboard; the next page's cursor goes in X-Next-Cursor."""
+    try:
+        page = get_community_repository().leaderboard(board, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page
+
+
 @router.get("/{portfolio_id}", response_model=CommunityPortfolio)
 async def get_portfolio(portfolio_id: str):
     """Get a specific portfolio by ID."""
-    data = load_portfolios()
-    portfolio = data.get("portfolios", {}).get(portfolio_id)
+    portfolio = get_community_repository().get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -447,9 +359,7 @@ async def create_portfolio(
     )
 
     # Save
-    data = load_portfolios()
-    data["portfolios"][portfolio_id] = portfolio.dict()
-    save_portfolios(data)
+    get_community_repository().put_portfolio(portfolio.dict())
 
     return portfolio
 
@@ -465,8 +375,8 @@ async def update_portfolio(
 
     Only the creator can update their portfolio.
     """
-    data = load_portfolios()
-    portfolio = data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -487,21 +397,21 @@ async def update_portfolio(
             raise HTTPException(status_code=400, detail="At least one holding is required")
 
     # Update fields
-    update_data = request.dict(exclude_unset=True)
-    for key, value in update_data.items():
+    changes = {}
+    for key in request.dict(exclude_unset=True):
+        value = getattr(request, key)
         if value is not None:
             if key == "holdings":
-                portfolio[key] = [h.dict() for h in value]
+                changes[key] = [h.dict() for h in value]
             elif key == "visibility":
-                portfolio[key] = value.value
+                changes[key] = value.value
             else:
-                portfolio[key] = value
+                changes[key] = value
 
-    portfolio["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    changes["updated_at"] = datetime.utcnow().isoformat() + "Z"
 
     # Save
-    data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(data)
+    portfolio = repo.update_portfolio(portfolio_id, changes)
 
     # Notify followers about the update (only for public portfolios)
     if portfolio.get("visibility") == "public":
@@ -533,8 +443,8 @@ async def delete_portfolio(
 
     Only the creator can delete their portfolio.
     """
-    data = load_portfolios()
-    portfolio = data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -544,8 +454,7 @@ async def delete_portfolio(
         raise HTTPException(status_code=403, detail="Not authorized to delete this portfolio")
 
     # Delete
-    del data["portfolios"][portfolio_id]
-    save_portfolios(data)
+    repo.delete_portfolio(portfolio_id)
 
     return {"message": "Portfolio deleted successfully"}
 
@@ -556,16 +465,14 @@ async def like_portfolio(
     user_id: str = Query(..., description="User ID"),
 ):
     """Like a portfolio."""
-    data = load_portfolios()
-    portfolio = data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
 
     # Increment likes
-    portfolio["likes"] = portfolio.get("likes", 0) + 1
-    data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(data)
+    portfolio = repo.update_portfolio(portfolio_id, {"likes": portfolio.get("likes", 0) + 1})
 
     return {"likes": portfolio["likes"]}
 
@@ -584,9 +491,8 @@ async def follow_portfolio(
     - Cannot follow your own portfolio
     - One follow per user per portfolio (no duplicates)
     """
-    # Load portfolio data
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    repo = get_community_repository()
+    portfolio = repo.get_portfolio(portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -599,12 +505,8 @@ async def follow_portfolio(
     if portfolio.get("creator_id") == user_id:
         raise HTTPException(status_code=400, detail="Cannot follow your own portfolio")
 
-    # Load follows data
-    follows_data = load_follows()
-
     # Rule: Check if already following (no duplicates)
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-    if portfolio_id in user_follows:
+    if repo.is_following(user_id, portfolio_id):
         return FollowResponse(
             success=True,
             followers_count=portfolio.get("followers", 0),
@@ -612,36 +514,16 @@ async def follow_portfolio(
         )
 
     # Create follow record
-    follow_id = generate_follow_id()
-    now = datetime.utcnow().isoformat() + "Z"
-
     follow = {
-        "id": follow_id,
+        "id": generate_follow_id(),
         "follower_user_id": user_id,
         "follower_email": user_email,
         "portfolio_id": portfolio_id,
-        "followed_at": now
+        "followed_at": datetime.utcnow().isoformat() + "Z"
     }
 
-    # Update follows data
-    follows_data["follows"][follow_id] = follow
-
-    # Update by_user index
-    if user_id not in follows_data["by_user"]:
-        follows_data["by_user"][user_id] = []
-    follows_data["by_user"][user_id].append(portfolio_id)
-
-    # Update by_portfolio index
-    if portfolio_id not in follows_data["by_portfolio"]:
-        follows_data["by_portfolio"][portfolio_id] = []
-    follows_data["by_portfolio"][portfolio_id].append(user_id)
-
-    save_follows(follows_data)
-
-    # Increment followers count on portfolio
-    portfolio["followers"] = portfolio.get("followers", 0) + 1
-    portfolio_data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(portfolio_data)
+    # Stores the follow and increments the followers count in one WAL entry
+    _, portfolio = repo.follow(user_id, portfolio_id, follow)
 
     return FollowResponse(
         success=True,
@@ -656,58 +538,19 @@ async def unfollow_portfolio(
     user_id: str = Query(..., description="User ID"),
 ):
     """Unfollow a portfolio."""
-    # Load portfolio data
-    portfolio_data = load_portfolios()
-    portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    # Removes the follow and decrements the followers count in one WAL entry
+    removed, portfolio = get_community_repository().unfollow(user_id, portfolio_id)
 
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
 
-    # Load follows data
-    follows_data = load_follows()
-
-    # Check if following
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-    if portfolio_id not in user_follows:
+    if not removed:
         return FollowResponse(
             success=True,
             followers_count=portfolio.get("followers", 0),
             is_following=False
         )
 
-    # Find and remove follow record
-    follow_id_to_remove = None
-    for follow_id, follow in follows_data["follows"].items():
-        if follow["follower_user_id"] == user_id and follow["portfolio_id"] == portfolio_id:
-            follow_id_to_remove = follow_id
-            break
-
-    if follow_id_to_remove:
-        del follows_data["follows"][follow_id_to_remove]
-
-    # Update by_user index
-    if user_id in follows_data["by_user"]:
-        follows_data["by_user"][user_id] = [
-            p for p in follows_data["by_user"][user_id] if p != portfolio_id
-        ]
-        if not follows_data["by_user"][user_id]:
-            del follows_data["by_user"][user_id]
-
-    # Update by_portfolio index
-    if portfolio_id in follows_data["by_portfolio"]:
-        follows_data["by_portfolio"][portfolio_id] = [
-            u for u in follows_data["by_portfolio"][portfolio_id] if u != user_id
-        ]
-        if not follows_data["by_portfolio"][portfolio_id]:
-            del follows_data["by_portfolio"][portfolio_id]
-
-    save_follows(follows_data)
-
-    # Decrement followers count on portfolio
-    portfolio["followers"] = max(0, portfolio.get("followers", 0) - 1)
-    portfolio_data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(portfolio_data)
-
     return FollowResponse(
         success=True,
         followers_count=portfolio["followers"],
@@ -721,11 +564,8 @@ async def check_is_following(
     user_id: str = Query(..., description="User ID"),
 ):
     """Check if user is following a portfolio."""
-    follows_data = load_follows()
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
-
     return {
-        "is_following": portfolio_id in user_follows,
+        "is_following": get_community_repository().is_following(user_id, portfolio_id),
         "portfolio_id": portfolio_id
     }
 
@@ -745,18 +585,14 @@ async def update_performance(
     if admin_key != "admin-performance-update-key":
         raise HTTPException(status_code=403, detail="Invalid admin key")
 
-    data = load_portfolios()
-    portfolio = data.get("portfolios", {}).get(portfolio_id)
-
-    if not portfolio:
+    repo = get_community_repository()
+    if not repo.get_portfolio(portfolio_id):
         raise HTTPException(status_code=404, detail="Portfolio not found")
 
     # Update performance
-    portfolio["performance"] = performance.dict()
-    portfolio["performance"]["updated_at"] = datetime.utcnow().isoformat() + "Z"
-
-    data["portfolios"][portfolio_id] = portfolio
-    save_portfolios(data)
+    repo.update_portfolio(portfolio_id, {
+        "performance": {**performance.dict(), "updated_at": datetime.utcnow().isoformat() + "Z"},
+    })
 
     return {"message": "Performance updated successfully"}
 
@@ -770,21 +606,15 @@ async def get_followed_portfolios(
     user_id: str = Query(..., description="User ID"),
 ):
     """Get all portfolios followed by a user."""
-    follows_data = load_follows()
-    portfolio_data = load_portfolios()
-
-    user_follows = follows_data.get("by_user", {}).get(user_id, [])
+    repo = get_community_repository()
 
     result = []
-    for portfolio_id in user_follows:
-        portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+    for portfolio_id in repo.followed_portfolio_ids(user_id):
+        portfolio = repo.get_portfolio(portfolio_id)
         if portfolio:
-            # Find follow record to get followed_at
-            followed_at = None
-            for follow in follows_data.get("follows", {}).values():
-                if follow["follower_user_id"] == user_id and follow["portfolio_id"] == portfolio_id:
-                    followed_at = follow["followed_at"]
-                    break
+            # community.py records created_at, this router followed_at
+            follow = repo.get_follow(user_id, portfolio_id) or {}
+            followed_at = follow.get("followed_at") or follow.get("created_at")
 
             result.append(FollowedPortfolioResponse(
                 portfolio=CommunityPortfolio(**portfolio),
@@ -815,102 +645,50 @@ async def create_snapshots(
     if admin_key != "admin-performance-update-key":
         raise HTTPException(status_code=403, detail="Invalid admin key")
 
-    portfolio_data = load_portfolios()
-    snapshots_data = load_snapshots()
-    market_data = load_market_data()
+    repo = get_community_repository()
+    universe = get_etf_universe()
 
     now = datetime.utcnow().isoformat() + "Z"
-    created_count = 0
-
-    # Get all public portfolios
-    public_portfolios = [
-        (pid, p) for pid, p in portfolio_data.get("portfolios", {}).items()
-        if p.get("visibility") == "public"
-    ]
-
-    for portfolio_id, portfolio in public_portfolios:
-        # Calculate portfolio value from holdings
-        total_value = 0.0
-        holdings_snapshot = []
-
-        for holding in portfolio.get("holdings", []):
-            isin = holding.get("isin", "")
-            weight = holding.get("weight", 0)
-
-            # Look up price from market data (by ISIN or symbol)
-            price = 0.0
-            for _, md in market_data.items():
-                if md.get("isin") == isin or md.get("symbol") == holding.get("symbol"):
-                    price = md.get("last", md.get("bid", 0)) or 0
-                    break
-
-            # Assume base investment of 10000 for value calculation
-            holding_value = 10000 * (weight / 100)
-            total_value += holding_value
-
-            holdings_snapshot.append({
-                "isin": isin,
-                "weight": weight,
-                "price": price,
-                "name": holding.get("name", "")
-            })
-
-        # Get previous snapshot for return calculation
-        portfolio_snapshots = snapshots_data.get("by_portfolio", {}).get(portfolio_id, [])
-        same_type_snapshots = [
-            snapshots_data["snapshots"][sid]
-            for sid in portfolio_snapshots
-            if snapshots_data["snapshots"].get(sid, {}).get("snapshot_type") == snapshot_type.value
-        ]
 
-        # Sort by timestamp
-        same_type_snapshots.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-
-        return_pct = 0.0
-        return_abs = 0.0
-        cumulative_return_pct = 0.0
-
-        if same_type_snapshots:
-            prev = same_type_snapshots[0]
-            prev_value = prev.get("total_value", 10000)
-            if prev_value > 0:
-                return_pct = ((total_value - prev_value) / prev_value) * 100
-                return_abs = total_value - prev_value
-                # Cumulative is based on first snapshot ever
-                first_value = 10000  # Base value
-                cumulative_return_pct = ((total_value - first_value) / first_value) * 100
-
-        # Create snapshot record
-        snapshot_id = generate_snapshot_id()
-        snapshot = {
-            "id": snapshot_id,
-            "portfolio_id": portfolio_id,
+    # Value all public portfolios in one pass
+    public_portfolios = repo.public_portfolios()
+    valuation = value_portfolios(
+        public_portfolios,
+        lambda isin: (universe.get_by_isin(isin) or {}).get("conid"),
+        load_market_data(),
+    )
+
+    # Returns vs the previous snapshot of this type and the first snapshot ever
+    return_pct, return_abs, cumulative_return_pct = snapshot_returns(
+        valuation.nav,
+        reference_values([repo.latest_snapshot(p["id"], snapshot_type.value) for p in public_portfolios]),
+        reference_values([repo.first_snapshot(p["id"]) for p in public_portfolios]),
+    )
+
+    new_snapshots = []
+    for portfolio, holdings, total_value, ret_pct, ret_abs, cum_pct in zip(
+        public_portfolios,
+        valuation.holdings_snapshots(public_portfolios, with_value=False),
+        valuation.nav.tolist(),
+        return_pct.tolist(),
+        return_abs.tolist(),
+        cumulative_return_pct.tolist(),
+    ):
+        new_snapshots.append({
+            "id": generate_snapshot_id(),
+            "portfolio_id": portfolio["id"],
             "timestamp": now,
             "snapshot_type": snapshot_type.value,
             "total_value": total_value,
             "holdings_value": total_value,
-            "return_pct": round(return_pct, 4),
-            "return_abs": round(return_abs, 2),
-            "cumulative_return_pct": round(cumulative_return_pct, 4),
-            "holdings_snapshot": holdings_snapshot
-        }
-
-        # Store snapshot
-        snapshots_data["snapshots"][snapshot_id] = snapshot
-
-        # Update by_portfolio index
-        if portfolio_id not in snapshots_data["by_portfolio"]:
-            snapshots_data["by_portfolio"][portfolio_id] = []
-        snapshots_data["by_portfolio"][portfolio_id].append(snapshot_id)
-
-        # Update by_type index
-        if snapshot_type.value not in snapshots_data["by_type"]:
-            snapshots_data["by_type"][snapshot_type.value] = []
-        snapshots_data["by_type"][snapshot_type.value].append(snapshot_id)
+            "return_pct": round(ret_pct, 4),
+            "return_abs": round(ret_abs, 2),
+            "cumulative_return_pct": round(cum_pct, 4),
+            "holdings_snapshot": holdings,
+        })
 
-        created_count += 1
-
-    save_snapshots(snapshots_data)
+    # Store all snapshots as one WAL entry
+    created_count = repo.add_snapshots(new_snapshots)
 
     return {
         "message": f"Created {created_count} snapshots",
@@ -926,16 +704,12 @@ async def get_portfolio_snapshots(
     limit: int = Query(12, ge=1, le=100, description="Maximum snapshots to return"),
 ):
     """Get performance snapshot history for a portfolio."""
-    snapshots_data = load_snapshots()
-
-    portfolio_snapshot_ids = snapshots_data.get("by_portfolio", {}).get(portfolio_id, [])
+    repo = get_community_repository()
 
     snapshots = []
-    for sid in portfolio_snapshot_ids:
-        snapshot = snapshots_data.get("snapshots", {}).get(sid)
-        if snapshot:
-            if snapshot_type is None or snapshot.get("snapshot_type") == snapshot_type.value:
-                snapshots.append(PerformanceSnapshotRecord(**snapshot))
+    for snapshot in repo.snapshots_for(portfolio_id):
+        if snapshot_type is None or snapshot.get("snapshot_type") == snapshot_type.value:
+            snapshots.append(PerformanceSnapshotRecord(**snapshot))
 
     # Sort by timestamp descending
     snapshots.sort(key=lambda x: x.timestamp, reverse=True)
@@ -954,8 +728,10 @@ async def get_portfolio_snapshots(
 
 @router.get("/leaderboard/enhanced", response_model=List[EnhancedLeaderboardEntry])
 async def get_enhanced_leaderboard(
+    response: Response,
     period: str = Query("year", enum=["month", "quarter", "year", "all_time"]),
     limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
 ):
     """
     Get enhanced portfolio leaderboard with volatility tiebreaker.
@@ -963,16 +739,10 @@ async def get_enhanced_leaderboard(
     Ranking:
     1. Primary: % return (descending)
     2. Tiebreaker: Volatility (ascending - lower is better)
-    """
-    portfolio_data = load_portfolios()
-    snapshots_data = load_snapshots()
-
-    # Get public portfolios
-    public_portfolios = [
-        (pid, p) for pid, p in portfolio_data.get("portfolios", {}).items()
-        if p.get("visibility") == "public"
-    ]
 
+    Volatility is the std of daily snapshot returns within the period,
+    counted back from the portfolio's latest snapshot.
+    """
     # Calculate period bounds
     now = datetime.utcnow()
     if period == "month":
@@ -986,51 +756,25 @@ async def get_enhanced_leaderboard(
 
     period_end = now.isoformat() + "Z"
 
-    entries = []
-    for portfolio_id, portfolio in public_portfolios:
-        # Get performance from stored data
-        perf = portfolio.get("performance", {})
-        period_key = "all_time" if period == "all_time" else period
-        return_pct = perf.get(period_key, 0)
-
-        # Calculate volatility from daily snapshots if available
-        volatility = 0.0
-        portfolio_snapshots = snapshots_data.get("by_portfolio", {}).get(portfolio_id, [])
-        daily_returns = []
-
-        for sid in portfolio_snapshots:
-            snapshot = snapshots_data.get("snapshots", {}).get(sid)
-            if snapshot and snapshot.get("snapshot_type") == "daily":
-                if snapshot.get("timestamp", "") >= period_start:
-                    daily_returns.append(snapshot.get("return_pct", 0))
-
-        if len(daily_returns) > 1:
-            mean_return = sum(daily_returns) / len(daily_returns)
-            variance = sum((r - mean_return) ** 2 for r in daily_returns) / len(daily_returns)
-            volatility = math.sqrt(variance)
+    page = _leaderboard_page(f"enhanced:{period}", limit, cursor, response)
 
+    entries = []
+    for rank, portfolio, stats in page["entries"]:
         entries.append(EnhancedLeaderboardEntry(
-            rank=0,  # Will be set after sorting
-            portfolio_id=portfolio_id,
+            rank=rank,
+            portfolio_id=portfolio["id"],
             portfolio_name=portfolio.get("name", ""),
             creator_id=portfolio.get("creator_id", ""),
             creator_name=portfolio.get("creator_name", ""),
-            return_pct=return_pct,
-            volatility=volatility,
+            return_pct=(portfolio.get("performance") or {}).get(period, 0),
+            volatility=stats.get("volatility", {}).get(period, 0.0),
             follower_count=portfolio.get("followers", 0),
             period=period,
             period_start=period_start,
             period_end=period_end
         ))
 
-    # Sort by return_pct descending, then volatility ascending (tiebreaker)
-    entries.sort(key=lambda e: (-e.return_pct, e.volatility))
-
-    # Assign ranks
-    for i, entry in enumerate(entries[:limit]):
-        entry.rank = i + 1
-
-    return entries[:limit]
+    return entries
 
 
 @router.get("/trending", response_model=List[TrendingEntry])
@@ -1043,22 +787,21 @@ async def get_trending_portfolios(
 
     This looks at follow activity in the specified time period.
     """
-    follows_data = load_follows()
-    portfolio_data = load_portfolios()
+    repo = get_community_repository()
 
     cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat() + "Z"
 
     # Count recent follows per portfolio
     recent_follows = {}
-    for follow in follows_data.get("follows", {}).values():
-        if follow.get("followed_at", "") >= cutoff:
+    for follow in repo.iter_follows():
+        if (follow.get("followed_at") or follow.get("created_at") or "") >= cutoff:
             pid = follow["portfolio_id"]
             recent_follows[pid] = recent_follows.get(pid, 0) + 1
 
     # Get portfolio details
     entries = []
     for portfolio_id, new_follower_count in recent_follows.items():
-        portfolio = portfolio_data.get("portfolios", {}).get(portfolio_id)
+        portfolio = repo.get_portfolio(portfolio_id)
         if portfolio and portfolio.get("visibility") == "public":
             entries.append(TrendingEntry(
                 portfolio_id=portfolio_id,
@@ -113,17 +113,32 @@ async def get_tradability_stats(
 
 @router.post("/tradability/reload")
 async def reload_tradability_data(
+    full: bool = Query(False, description="Reload everything instead of applying the last run's diff"),
     user: UserContext = Depends(get_current_user)
 ) -> dict:
     """
     Reload tradability data from file.
 
-    Use this after running the check_etf_tradability.py script.
+    Use this after running the check_etf_tradability.py script. When the
+    run's diff starts from the loaded data only its changes are applied;
+    otherwise (or with full=true) everything is reloaded. Either way the
+    shared ETF universe index is swapped in atomically, so IBClient and the
+    pricing helpers pick up the new data on their next lookup.
     """
     service = get_tradability_service()
-    service.reload()
+    if full:
+        service.reload()
+        mode = "full"
+    else:
+        mode = service.refresh()
+    messages = {
+        "full": "Tradability data reloaded",
+        "diff": "Tradability changes applied",
+        "current": "Tradability data already up to date",
+    }
     return {
         "success": True,
-        "message": "Tradability data reloaded",
+        "message": messages[mode],
+        "mode": mode,
         "stats": service.get_stats(),
     }
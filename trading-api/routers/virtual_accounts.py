@@ -34,60 +34,15 @@ from services.virtual_portfolio_service import get_virtual_portfolio_service
 from services.cash_allocation_service import get_cash_allocation_service, CashAllocationError
 from services.platform_capital_service import get_platform_capital_service
 from services.ib_client import get_ib_client
-import httpx
-import time
+from services.etf_universe import get_etf_universe
+from services.supabase_client import supabase_client
+from services.price_provider import get_price_provider, yahoo_symbol
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/virtual-accounts", tags=["Virtual Accounts"])
 
-# Yahoo Finance price cache for fallback when IB has no data
-_yahoo_price_cache: dict = {}  # symbol -> {price, timestamp}
-YAHOO_CACHE_TTL = 300  # 5 minutes
-
-# Mapping: IB symbol -> Yahoo Finance symbol (for ETFs where they differ)
-YAHOO_SYMBOL_MAP = {
-    "VUAA": "VUAA.DE",
-    "CAC": "CAC.PA",
-    "IWDA": "IWDA.AS",
-    "EMIM": "EMIM.AS",
-    "SXRS": "SXRS.DE",
-    "IWDP": "IWDP.AS",
-    "VWCE": "VWCE.DE",
-    "SXR8": "SXR8.DE",
-    "VFEM": "VFEM.AS",
-    "IMEU": "IMEU.AS",
-}
-
-
-async def _get_yahoo_price(symbol: str) -> Optional[float]:
-    """Fetch last price from Yahoo Finance as fallback."""
-    cached = _yahoo_price_cache.get(symbol)
-    if cached and (time.time() - cached["timestamp"]) < YAHOO_CACHE_TTL:
-        return cached["price"]
-
-    yahoo_sym = YAHOO_SYMBOL_MAP.get(symbol, f"{symbol}.AS")
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            res = await client.get(
-                f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_sym}",
-                params={"interval": "1d", "range": "1d"},
-                headers={"User-Agent": "Mozilla/5.0"}
-            )
-            if res.status_code == 200:
-                data = res.json()
-                result = data.get("chart", {}).get("result", [])
-                if result:
-                    price = result[0].get("meta", {}).get("regularMarketPrice")
-                    if price and price > 0:
-                        _yahoo_price_cache[symbol] = {"price": price, "timestamp": time.time()}
-                        return price
-    except Exception as e:
-        logger.debug(f"Yahoo Finance fallback failed for {symbol}: {e}")
-    return None
-
-
 # =============================================================================
 # HELPERS
 # =============================================================================
@@ -101,12 +56,16 @@ async def _compute_portfolio_value(holdings: list, market_data: dict) -> tuple:
     total_market_value = 0.0
     total_unrealized_pnl = 0.0
 
-    # Build symbol→data index for O(1) lookup by symbol
-    symbol_index = {}
-    for cid, data in market_data.items():
-        sym = data.get("symbol")
-        if sym:
-            symbol_index[sym] = data
+    universe = get_etf_universe()
+
+    def _lookup(conid, symbol) -> Optional[dict]:
+        # O(1): by conid (int or str key), else resolve the symbol to its conid
+        data = market_data.get(conid) or market_data.get(str(conid))
+        if not data:
+            etf = universe.get_by_symbol(symbol)
+            if etf:
+                data = market_data.get(etf["conid"]) or market_data.get(str(etf["conid"]))
+        return data
 
     # Collect Yahoo fallback tasks for symbols missing IB data
     yahoo_needed = []
@@ -114,8 +73,7 @@ async def _compute_portfolio_value(holdings: list, market_data: dict) -> tuple:
         symbol = h["symbol"]
         conid = h["conid"]
 
-        # O(1) lookup: first by conid (int key), then by symbol
-        data = market_data.get(conid) or market_data.get(str(conid)) or symbol_index.get(symbol)
+        data = _lookup(conid, symbol)
         last_price = None
         if data:
             last_price = data.get("last") or data.get("bid")
@@ -126,12 +84,15 @@ async def _compute_portfolio_value(holdings: list, market_data: dict) -> tuple:
     # Batch-fetch Yahoo prices for missing symbols
     yahoo_prices = {}
     if yahoo_needed:
-        import asyncio as _aio
-        symbols_to_fetch = list(set(sym for sym, _ in yahoo_needed))
-        results = await _aio.gather(*[_get_yahoo_price(s) for s in symbols_to_fetch], return_exceptions=True)
-        for sym, price in zip(symbols_to_fetch, results):
-            if isinstance(price, (int, float)) and price > 0:
-                yahoo_prices[sym] = price
+        symbols_to_fetch = {sym: yahoo_symbol(sym) for sym, _ in yahoo_needed}
+        try:
+            prices = await get_price_provider().get_prices(symbols_to_fetch.values())
+        except Exception as e:
+            logger.debug(f"Yahoo Finance fallback failed: {e}")
+            prices = {}
+        for sym, yahoo_sym in symbols_to_fetch.items():
+            if prices.get(yahoo_sym):
+                yahoo_prices[sym] = prices[yahoo_sym]
 
     for h in holdings:
         symbol = h["symbol"]
@@ -139,7 +100,7 @@ async def _compute_portfolio_value(holdings: list, market_data: dict) -> tuple:
         qty = float(h["quantity"])
         avg_cost = float(h["avg_cost_basis"])
 
-        data = market_data.get(conid) or market_data.get(str(conid)) or symbol_index.get(symbol)
+        data = _lookup(conid, symbol)
         last_price = None
         if data:
             last_price = data.get("last") or data.get("bid")
@@ -244,8 +205,7 @@ async def get_my_default_account(
 
     # Fast path: query accounts directly without fetching holdings
     try:
-        import httpx as _httpx
-        async with _httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{service.base_url}/virtual_accounts",
                 headers=service.headers,
@@ -337,7 +297,7 @@ async def get_cash_overview(
     all_holdings = {}  # account_id -> [holdings]
     if account_ids:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 h_response = await client.get(
                     f"{portfolio_service.base_url}/virtual_holdings",
                     headers=portfolio_service.headers,
@@ -420,7 +380,7 @@ async def _resolve_user_account(user_id: int) -> dict:
     """Resolve a user_id to their active virtual account."""
     service = get_virtual_account_service()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{service.base_url}/virtual_accounts",
                 headers=service.headers,
@@ -778,7 +738,7 @@ async def get_admin_account_positions(
     # Fetch account
     account_service = get_virtual_account_service()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{account_service.base_url}/virtual_accounts",
                 headers=account_service.headers,
@@ -973,7 +933,7 @@ async def get_account_positions(
     # Lightweight ownership check: query account row directly (no holdings sub-query)
     account_service = get_virtual_account_service()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{account_service.base_url}/virtual_accounts",
                 headers=account_service.headers,
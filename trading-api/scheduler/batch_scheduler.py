@@ -110,7 +110,8 @@ class BatchScheduler:
                 f"Batch {batch_id} completed: status={result['status']}, "
                 f"orders={result.get('orders_executed', 0)}, "
                 f"successful={result.get('successful', 0)}, "
-                f"failed={result.get('failed', 0)}"
+                f"failed={result.get('failed', 0)}, "
+                f"intentions_not_updated={result.get('intentions_not_updated', 0)}"
             )
 
         except Exception as e:
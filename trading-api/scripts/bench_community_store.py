@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Community store benchmark: per-request JSON files vs CommunityRepository.
+
+Generates a synthetic data directory (portfolios, follows, snapshots) in a
+temp dir and measures:
+- legacy:     one follow the old way (load portfolios + follows JSON, add the
+              follow, json.dump both files with indent=2)
+- startup:    CommunityRepository.load() of the same files
+- follow:     POST /community/follow + DELETE round-trips through the router
+              (WAL append, fsync policy applied)
+- reads:      follow status, followed portfolios of a user
+- leaderboard /community/leaderboard (first and next page),
+              /portfolios/leaderboard(/enhanced), trending, and a batch of
+              new snapshots re-ranking their portfolios
+- notify:     fan-out to a portfolio's followers (one write per follower vs
+              one batched write), unread count and a notification page
+- compaction: rewriting the JSON files from the WAL
+
+Usage:
+    python scripts/bench_community_store.py [--portfolios 100000] [--follows 1000000]
+        [--fsync interval] [--ops 2000] [--skip-legacy]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.community_store as community_store
+from services.community_store import CommunityRepository, COLLECTION_FILES
+
+
+def _write_json(path: Path, data: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def generate_data(data_dir: Path, n_portfolios: int, n_follows: int, n_users: int, seed: int = 1):
+    """Write synthetic community JSON files in the routers' formats."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    portfolios = {}
+    for i in range(n_portfolios):
+        pid = f"community-{i:012x}"
+        portfolios[pid] = {
+            "id": pid,
+            "name": f"Portfolio {i}",
+            "description": "Synthetic benchmark portfolio",
+            "creator_id": f"user-{rng.randrange(n_users)}",
+            "creator_name": "Bench",
+            "visibility": "public" if rng.random() < 0.6 else "private",
+            "holdings": [{"isin": "IE00B4L5Y983", "name": "iShares Core MSCI World", "weight": 100}],
+            "risk_level": rng.randint(1, 5),
+            "performance": {"month": rng.uniform(-5, 5), "quarter": 0.0, "year": rng.uniform(-20, 30), "all_time": 0.0},
+            "followers": 0,
+            "likes": 0,
+            "tags": [],
+            "created_at": (now - timedelta(days=rng.randrange(365))).isoformat() + "Z",
+            "published_at": None,
+        }
+    public_ids = [pid for pid, p in portfolios.items() if p["visibility"] == "public"]
+
+    follows = {}
+    seen = set()
+    while len(follows) < n_follows:
+        user_id = f"user-{rng.randrange(n_users)}"
+        pid = public_ids[rng.randrange(len(public_ids))]
+        if (user_id, pid) in seen:
+            continue
+        seen.add((user_id, pid))
+        fid = f"follow-{len(follows):012x}"
+        follows[fid] = {
+            "id": fid,
+            "follower_user_id": user_id,
+            "portfolio_id": pid,
+            "created_at": (now - timedelta(minutes=rng.randrange(500_000))).isoformat() + "Z",
+        }
+        portfolios[pid]["followers"] += 1
+
+    # Two daily snapshots per public portfolio, 30 days apart
+    snapshots = {}
+    for pid in public_ids:
+        value = 10000.0
+        for days_ago in (35, 5):
+            sid = f"snap-{len(snapshots):012x}"
+            value *= 1 + rng.uniform(-0.05, 0.08)
+            snapshots[sid] = {
+                "id": sid,
+                "portfolio_id": pid,
+                "timestamp": (now - timedelta(days=days_ago)).isoformat() + "Z",
+                "period_type": "daily",
+                "total_value": round(value, 2),
+                "cash": 0.0,
+                "return_pct": 0.0,
+                "return_abs": 0.0,
+                "cumulative_return_pct": round((value - 10000) / 100, 4),
+                "holdings_snapshot": [],
+            }
+
+    by_user, by_portfolio = {}, {}
+    for f in follows.values():
+        by_user.setdefault(f["follower_user_id"], []).append(f["portfolio_id"])
+        by_portfolio.setdefault(f["portfolio_id"], []).append(f["follower_user_id"])
+
+    _write_json(data_dir / COLLECTION_FILES["portfolios"], {"portfolios": portfolios, "last_updated": None})
+    _write_json(data_dir / COLLECTION_FILES["follows"], {
+        "follows": follows, "by_user": by_user, "by_portfolio": by_portfolio, "last_updated": None,
+    })
+    _write_json(data_dir / COLLECTION_FILES["snapshots"], {
+        "snapshots": snapshots, "by_portfolio": {}, "by_type": {}, "last_updated": None,
+    })
+    _write_json(data_dir / COLLECTION_FILES["competitions"], {"competitions": {}})
+    _write_json(data_dir / COLLECTION_FILES["notifications"], {"notifications": []})
+    return public_ids
+
+
+def legacy_follow(data_dir: Path, user_id: str, portfolio_id: str) -> None:
+    """The pre-repository follow path: full JSON load + rewrite of two files."""
+    portfolios_file = data_dir / COLLECTION_FILES["portfolios"]
+    follows_file = data_dir / COLLECTION_FILES["follows"]
+    with open(portfolios_file, "r", encoding="utf-8") as f:
+        portfolio_data = json.load(f)
+    with open(follows_file, "r", encoding="utf-8") as f:
+        follows_data = json.load(f)
+
+    fid = f"follow-legacy-{time.time_ns()}"
+    follows_data["follows"][fid] = {
+        "id": fid, "follower_user_id": user_id, "portfolio_id": portfolio_id,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+    }
+    follows_data["by_user"].setdefault(user_id, []).append(portfolio_id)
+    follows_data["by_portfolio"].setdefault(portfolio_id, []).append(user_id)
+    _write_json(follows_file, follows_data)
+
+    portfolio_data["portfolios"][portfolio_id]["followers"] += 1
+    _write_json(portfolios_file, portfolio_data)
+
+
+def _percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+    return f"p50 {p50:>9.1f} us   p99 {p99:>9.1f} us"
+
+
+async def bench_repository(repo: CommunityRepository, public_ids: list, n_users: int, n_ops: int):
+    from fastapi import Response
+    from routers import community, portfolios
+    from routers.community import LeaderboardPeriod
+
+    rng = random.Random(2)
+    pairs = [(f"bench-user-{rng.randrange(n_users)}", rng.choice(public_ids)) for _ in range(n_ops)]
+
+    follow, unfollow = [], []
+    for user_id, pid in pairs:
+        start = time.perf_counter()
+        await community.follow_portfolio(portfolio_id=pid, user_id=user_id)
+        follow.append(time.perf_counter() - start)
+    for user_id, pid in pairs:
+        start = time.perf_counter()
+        await community.unfollow_portfolio(portfolio_id=pid, user_id=user_id)
+        unfollow.append(time.perf_counter() - start)
+    print(f"{'follow':>22}: {_percentiles(follow)}")
+    print(f"{'unfollow':>22}: {_percentiles(unfollow)}")
+
+    status, followed = [], []
+    users = [f"user-{rng.randrange(n_users)}" for _ in range(n_ops)]
+    for user_id in users:
+        start = time.perf_counter()
+        await community.get_follow_status(portfolio_id=public_ids[0], user_id=user_id)
+        status.append(time.perf_counter() - start)
+    for user_id in users[:200]:
+        start = time.perf_counter()
+        await community.get_follows(user_id=user_id)
+        followed.append(time.perf_counter() - start)
+    print(f"{'follow status':>22}: {_percentiles(status)}")
+    print(f"{'followed portfolios':>22}: {_percentiles(followed)}")
+
+    first = await community.get_leaderboard(period=LeaderboardPeriod.ONE_MONTH, limit=20, cursor=None)
+    for label, call in (
+        ("community leaderboard", lambda: community.get_leaderboard(period=LeaderboardPeriod.ONE_MONTH, limit=20, cursor=None)),
+        ("leaderboard next page", lambda: community.get_leaderboard(period=LeaderboardPeriod.ONE_MONTH, limit=20, cursor=first.next_cursor)),
+        ("portfolios leaderboard", lambda: portfolios.get_leaderboard(Response(), period="year", limit=10, cursor=None)),
+        ("enhanced leaderboard", lambda: portfolios.get_enhanced_leaderboard(Response(), period="year", limit=10, cursor=None)),
+        ("community trending", lambda: community.get_trending_portfolios(limit=20)),
+    ):
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+        print(f"{label:>22}: {_percentiles(samples)}")
+
+    now = datetime.utcnow().isoformat() + "Z"
+    batch = [{
+        "id": f"bench-snap-{i}", "portfolio_id": pid, "timestamp": now, "snapshot_type": "daily",
+        "total_value": rng.uniform(8000, 12000), "return_pct": rng.uniform(-2, 2), "cumulative_return_pct": 0.0,
+    } for i, pid in enumerate(rng.sample(public_ids, min(1000, len(public_ids))))]
+    start = time.perf_counter()
+    repo.add_snapshots(batch)
+    print(f"{'add snapshots':>22}: {(time.perf_counter() - start) * 1000:>9.1f} ms ({len(batch)} portfolios re-ranked)")
+
+    from routers import notifications
+    from routers.notifications import NotificationType
+
+    pid = max(public_ids, key=lambda p: len(repo.follower_ids(p)))
+    followers = repo.follower_ids(pid)
+    start = time.perf_counter()
+    for user_id in followers:
+        notifications.create_notification(user_id, NotificationType.PORTFOLIO_UPDATED, "bench", "per follower")
+    print(f"{'notify one by one':>22}: {(time.perf_counter() - start) * 1000:>9.1f} ms ({len(followers)} followers)")
+    start = time.perf_counter()
+    notifications.notify_portfolio_followers(pid, "bench", "batched")
+    print(f"{'notify followers':>22}: {(time.perf_counter() - start) * 1000:>9.1f} ms ({len(followers)} followers)")
+
+    unread, page = [], []
+    for user_id in followers[:n_ops]:
+        start = time.perf_counter()
+        await notifications.get_unread_count(user_id=user_id)
+        unread.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await notifications.get_notifications(user_id=user_id, limit=20, offset=0, unread_only=False)
+        page.append(time.perf_counter() - start)
+    print(f"{'unread count':>22}: {_percentiles(unread)}")
+    print(f"{'notifications page':>22}: {_percentiles(page)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Community store benchmark")
+    parser.add_argument("--portfolios", type=int, default=100_000)
+    parser.add_argument("--follows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--ops", type=int, default=2_000)
+    parser.add_argument("--fsync", choices=["always", "interval", "never"], default="interval")
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the (slow) per-request JSON rewrite")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        start = time.perf_counter()
+        public_ids = generate_data(data_dir, args.portfolios, args.follows, args.users)
+        size_mb = sum(p.stat().st_size for p in data_dir.glob("*.json")) / 1e6
+        print(f"Generated {args.portfolios} portfolios ({len(public_ids)} public), {args.follows} follows, "
+              f"{2 * len(public_ids)} snapshots: {size_mb:.0f} MB JSON in {time.perf_counter() - start:.1f} s")
+
+        if not args.skip_legacy:
+            start = time.perf_counter()
+            legacy_follow(data_dir, "legacy-user", public_ids[0])
+            print(f"{'legacy follow':>22}: {(time.perf_counter() - start) * 1000:>9.0f} ms (load + rewrite 2 files)")
+
+        repo = CommunityRepository(data_dir, fsync=args.fsync)
+        start = time.perf_counter()
+        repo.load()
+        print(f"{'repository load':>22}: {(time.perf_counter() - start) * 1000:>9.0f} ms (fsync={args.fsync})")
+        community_store._community_repository = repo
+
+        asyncio.run(bench_repository(repo, public_ids, args.users, args.ops))
+
+        start = time.perf_counter()
+        repo.compact()
+        print(f"{'compaction':>22}: {(time.perf_counter() - start) * 1000:>9.0f} ms")
+        repo.close_sync()
+
+
+if __name__ == "__main__":
+    main()
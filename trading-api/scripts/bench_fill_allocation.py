@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark and property checks for the pro-rata fill allocator.
+
+Times services.fill_allocator.allocate_pro_rata on large aggregated orders
+(default 100,000 intentions, target < 1 s) and runs randomized checks:
+- allocations sum to min(filled_quantity, total requested)
+- nobody is allocated more than they requested, nor a negative amount
+- every allocation is within one share of its exact pro-rata share
+- the result is deterministic for the same input
+
+Usage:
+    python scripts/bench_fill_allocation.py [--intentions 100000] [--trials 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.fill_allocator import allocate_pro_rata
+
+
+def check_properties(requested: np.ndarray, filled: int, alloc: np.ndarray):
+    total = int(requested.sum())
+    expected_total = min(max(filled, 0), total)
+
+    assert alloc.shape == requested.shape, "shape mismatch"
+    assert int(alloc.sum()) == expected_total, f"sum {int(alloc.sum())} != {expected_total}"
+    assert (alloc >= 0).all(), "negative allocation"
+    assert (alloc <= requested).all(), "allocation exceeds request"
+    if total:
+        exact = requested * (expected_total / total)
+        assert (np.abs(alloc - exact) < 1.0 + 1e-9).all(), "allocation off by more than one share"
+    assert np.array_equal(alloc, allocate_pro_rata(requested, filled)), "non-deterministic"
+
+
+def run_property_checks(trials: int, seed: int):
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        n = int(rng.integers(1, 2_000))
+        requested = rng.integers(0, 500, size=n)
+        total = int(requested.sum())
+        filled = int(rng.integers(-5, total + 10))
+        check_properties(requested, filled, allocate_pro_rata(requested, filled))
+
+    # Edge cases: single user, all-equal requests (pure tie-break), zero requests
+    for requested, filled in (
+        (np.array([7]), 3),
+        (np.full(1_000, 3), 1_001),
+        (np.array([0, 0, 5]), 2),
+        (np.array([1, 1, 1]), 2),
+    ):
+        check_properties(requested, filled, allocate_pro_rata(requested, filled))
+
+    # Ties favor smaller orders, then input order
+    assert allocate_pro_rata([1, 1, 1], 2).tolist() == [1, 1, 0]
+    print(f"property checks: {trials} random orders + edge cases OK")
+
+
+def run_benchmark(n: int, repeats: int, seed: int):
+    rng = np.random.default_rng(seed)
+    requested = rng.integers(1, 100, size=n)
+    filled = int(requested.sum() * 0.73)
+
+    # Building the input list from intention dicts is part of the real cost
+    intentions = [{"quantity": int(q)} for q in requested]
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        req = np.fromiter((i["quantity"] for i in intentions), dtype=np.int64, count=len(intentions))
+        alloc = allocate_pro_rata(req, filled)
+        timings.append(time.perf_counter() - start)
+
+    check_properties(requested, filled, alloc)
+    best = min(timings)
+    print(
+        f"allocate {n:,} intentions ({filled:,} shares filled): "
+        f"best {best * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms "
+        f"[{'OK' if best < 1.0 else 'SLOW'}: target < 1000 ms]"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill allocation benchmark + property checks")
+    parser.add_argument("--intentions", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--trials", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    run_property_checks(args.trials, args.seed)
+    run_benchmark(args.intentions, args.repeats, args.seed)
+
+
+if __name__ == "__main__":
+    main()
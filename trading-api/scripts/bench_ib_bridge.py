@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+IB bridge benchmark against the simulated gateway (scripts/ib_stub.py).
+
+Starts the bridge process (services/ib_bridge.run_bridge with FakeIB) and
+--workers API-worker processes using IBBridgeClient, the way uvicorn
+workers would with IB_BRIDGE_ENABLED=true.
+
+Scenarios:
+    quotes  While the gateway ticks every line every --tick-ms, each worker
+            reads quotes for --seconds: get_market_data (one conid) and
+            get_all_market_data (whole board) through the client, and
+            QuoteBoard.read_all (raw board). Reports reads/s per worker,
+            seqlock retries and inconsistent quotes (a quote mixing two
+            ticks; must be 0), plus the same quote over the bridge socket
+            for comparison.
+    orders  Each worker places --orders market orders, --concurrency at a
+            time, waiting for fills with streamed fill callbacks: latency
+            p50/p99, orders filled, fills relayed and duplicate order IDs
+            (must be 0).
+
+Usage:
+    python scripts/bench_ib_bridge.py [quotes|orders|all] [--workers 4] [--seconds 3] [--orders 200]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _configure(tmp: str, args) -> None:
+    """Settings for the bridge and workers (inherited by spawned processes)."""
+    os.environ.update({
+        "IB_BRIDGE_ENABLED": "true",
+        "IB_BRIDGE_SOCKET": str(Path(tmp) / "ib_bridge.sock"),
+        "IB_BRIDGE_BOARD_NAME": f"bench_quotes_{os.getpid()}",
+        "IB_BRIDGE_POLL_INTERVAL": "0.01",
+        "IB_BRIDGE_STATUS_INTERVAL": "0.5",
+        "IB_RECONNECT_ENABLED": "false",
+        "IB_ORDER_ACK_TIMEOUT": "2.0",
+        "LOG_ORDERS": "false",
+        "TICK_STORE_CAPACITY": "1024",
+        # Line demand lookups fail fast instead of reaching Supabase
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "BENCH_TMP": tmp,
+        "BENCH_TICK_MS": str(args.tick_ms),
+    })
+
+
+def _quiet_logging() -> None:
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+
+
+# =============================================================================
+# Bridge process
+# =============================================================================
+
+def bridge_main() -> None:
+    _quiet_logging()
+    import services.market_data_persistence as persistence
+    from services.ib_bridge import run_bridge
+    from ib_stub import FakeIB
+
+    # Keep the bench away from data/market_data_cache.json
+    persistence._persister = persistence.MarketDataPersister(path=Path(os.environ["BENCH_TMP"]) / "market_data_cache.json")
+    factory = partial(FakeIB, latency_ms=2.0, jitter_ms=0.0, tick_interval=float(os.environ["BENCH_TICK_MS"]) / 1000.0)
+    asyncio.run(run_bridge(ib_factory=factory))
+
+
+def wait_for_bridge(lines: int, timeout: float = 60.0) -> None:
+    """Block until the bridge is connected and has published `lines` quotes."""
+    from config import get_settings
+    from services.quote_board import QuoteBoard
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            board = QuoteBoard.attach(get_settings().ib_bridge_board_name)
+        except (FileNotFoundError, ValueError):
+            time.sleep(0.1)
+            continue
+        try:
+            while time.monotonic() < deadline:
+                status = board.status()
+                if status and status["connected"] and len(board.read_all()) >= lines:
+                    return
+                time.sleep(0.1)
+        finally:
+            board.close()
+    raise TimeoutError("bridge did not come up")
+
+
+# =============================================================================
+# Worker processes
+# =============================================================================
+
+def _consistent(entry: dict) -> bool:
+    # FakeIB tick n: bid n, ask n + 1, last n + 0.5, sizes n, volume 100 n
+    n = entry["bid"]
+    return (entry["ask"] == n + 1 and entry["last"] == n + 0.5 and entry["bidSize"] == n
+            and entry["askSize"] == n and entry["volume"] == 100 * n)
+
+
+async def quotes_worker(seconds: float) -> dict:
+    from services.ib_bridge import IBBridgeClient
+
+    client = IBBridgeClient()
+    await client.connect()
+    conids = list(client.get_all_market_data())
+    board = client._board
+    stats = {"single": 0, "all": 0, "raw": 0, "inconsistent": 0, "quotes_checked": 0}
+
+    async def timed(kind: str, read, budget: float):
+        deadline = time.perf_counter() + budget
+        while time.perf_counter() < deadline:
+            for _ in range(200):
+                quotes = read()
+                stats[kind] += 1
+                for entry in quotes:
+                    stats["quotes_checked"] += 1
+                    if not _consistent(entry):
+                        stats["inconsistent"] += 1
+            await asyncio.sleep(0)  # Let the watch task run, as between requests
+
+    third = seconds / 3
+    i = iter(range(1 << 62))
+    await timed("single", lambda: [client.get_market_data(conids[next(i) % len(conids)])], third)
+    await timed("all", lambda: client.get_all_market_data().values(), third)
+    await timed("raw", lambda: board.read_all().values(), third)
+
+    # Same quote over the bridge socket
+    symbol = client.get_market_data(conids[0])["symbol"]
+    start = time.perf_counter()
+    rpc = 0
+    while time.perf_counter() - start < 0.5:
+        await client.get_market_data_for_symbol(symbol)
+        rpc += 1
+    stats["rpc_us"] = (time.perf_counter() - start) / rpc * 1e6
+    stats.update(per_s={k: stats[k] / third for k in ("single", "all", "raw")},
+                 retries=board.retries, failed_reads=board.failed_reads, conids=len(conids))
+    await client.disconnect()
+    return stats
+
+
+async def orders_worker(worker: int, orders: int, concurrency: int) -> dict:
+    from services.ib_bridge import IBBridgeClient
+
+    client = IBBridgeClient()
+    await client.connect()
+    account = client.get_primary_account()
+    conids = list(client.get_all_market_data())
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, order_ids, fills = [], [], []
+    filled = 0
+
+    async def one(n: int):
+        nonlocal filled
+        async with semaphore:
+            start = time.perf_counter()
+            result = await client.place_order(
+                account_id=account, conid=conids[(worker * orders + n) % len(conids)], side="BUY",
+                quantity=10, wait_for_fill=True, fill_timeout=10.0,
+                on_fill=lambda trade, fill: fills.append(fill.execution.shares),
+            )
+            latencies.append(time.perf_counter() - start)
+            if not result.get("error"):
+                order_ids.append(result["order_id"])
+                if result["status"] == "Filled" and result["details"]["filled"] == 10:
+                    filled += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(orders)))
+    elapsed = time.perf_counter() - start
+    await client.disconnect()
+    return {"latencies": latencies, "order_ids": order_ids, "filled": filled,
+            "fills": len(fills), "fill_shares": sum(fills), "elapsed": elapsed}
+
+
+def worker_main(scenario: str, worker: int, args, results) -> None:
+    _quiet_logging()
+    if scenario == "quotes":
+        results.put(asyncio.run(quotes_worker(args.seconds)))
+    else:
+        results.put(asyncio.run(orders_worker(worker, args.orders, args.concurrency)))
+
+
+def run_workers(ctx, scenario: str, args) -> list[dict]:
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker_main, args=(scenario, w, args, results)) for w in range(args.workers)]
+    for p in procs:
+        p.start()
+    out = [results.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+# =============================================================================
+# Report
+# =============================================================================
+
+def report_quotes(results: list[dict], args) -> None:
+    print(f"quotes: {args.workers} workers reading for {args.seconds:g} s, "
+          f"{results[0]['conids']} lines ticking every {args.tick_ms:g} ms")
+    for kind, label in (("single", "get_market_data"), ("all", "get_all_market_data"), ("raw", "board.read_all")):
+        rates = [r["per_s"][kind] for r in results]
+        print(f"  {label:<22} {statistics.mean(rates):>12,.0f} reads/s per worker "
+              f"({1e6 / statistics.mean(rates):7.1f} us/read)")
+    print(f"  {'bridge socket (RPC)':<22} {statistics.mean(r['rpc_us'] for r in results):12.1f} us/read")
+    print(f"  quotes checked {sum(r['quotes_checked'] for r in results):,}, "
+          f"inconsistent {sum(r['inconsistent'] for r in results)}, "
+          f"seqlock retries {sum(r['retries'] for r in results)}, "
+          f"failed reads {sum(r['failed_reads'] for r in results)}")
+
+
+def report_orders(results: list[dict], args) -> None:
+    latencies = sorted(l for r in results for l in r["latencies"])
+    order_ids = [o for r in results for o in r["order_ids"]]
+    total = args.workers * args.orders
+    elapsed = max(r["elapsed"] for r in results)
+    print(f"orders: {args.workers} workers x {args.orders} orders, {args.concurrency} in flight per worker")
+    print(f"  {total / elapsed:,.0f} orders/s, latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print(f"  filled {sum(r['filled'] for r in results)}/{total}, fills relayed {sum(r['fills'] for r in results)} "
+          f"({sum(r['fill_shares'] for r in results):,.0f} shares), "
+          f"duplicate order IDs {len(order_ids) - len(set(order_ids))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IB bridge benchmark")
+    parser.add_argument("scenario", nargs="?", choices=["quotes", "orders", "all"], default="all")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--tick-ms", type=float, default=10.0)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure(tmp, args)
+        from services.ib_client import IBClient
+
+        bridge = ctx.Process(target=bridge_main)
+        bridge.start()
+        try:
+            start = time.perf_counter()
+            wait_for_bridge(IBClient.MAX_SUBSCRIPTIONS)
+            print(f"bridge up with {IBClient.MAX_SUBSCRIPTIONS} lines in {time.perf_counter() - start:.1f} s "
+                  f"(1 IB connection for {args.workers} workers)")
+            if args.scenario in ("quotes", "all"):
+                report_quotes(run_workers(ctx, "quotes", args), args)
+            if args.scenario in ("orders", "all"):
+                report_orders(run_workers(ctx, "orders", args), args)
+        finally:
+            os.kill(bridge.pid, signal.SIGTERM)
+            bridge.join(timeout=30)
+            print(f"bridge exited with code {bridge.exitcode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Fallback price provider benchmark against a local Yahoo Finance stub.
+
+Scenarios (all run in order):
+    batch    Price a portfolio of --symbols ETFs: one request per symbol with
+             a fresh httpx.AsyncClient (old pattern) vs PriceProvider.
+    burst    --callers concurrent requests for the same symbols on a cold
+             cache: single-flight should keep upstream at one fetch each.
+    stale    Entries past max_age are served immediately while the refresh
+             runs in the background, including while the upstream fails.
+    bound    More symbols than max_entries: the cache stays bounded.
+
+Usage:
+    python scripts/bench_price_provider.py [--symbols 60] [--callers 500] [--latency-ms 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from yahoo_stub import YahooStub
+from services.price_provider import PriceProvider
+
+
+def _report(label: str, elapsed: float, stub: YahooStub, extra: str = ""):
+    print(
+        f"  {label:<30} {elapsed * 1000:9.1f} ms  "
+        f"{stub.requests:6d} requests  {stub.connections:5d} connections  {extra}"
+    )
+
+
+async def _old_pattern(stub: YahooStub, symbol: str):
+    # What routers/virtual_accounts._get_yahoo_price used to do per symbol
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        res = await client.get(
+            f"{stub.base_url}/v8/finance/chart/{symbol}",
+            params={"interval": "1d", "range": "1d"},
+        )
+        data = res.json()
+        result = data.get("chart", {}).get("result", [])
+        return result[0]["meta"]["regularMarketPrice"] if result else None
+
+
+async def bench_batch(stub: YahooStub, symbols: list):
+    print(f"batch: price {len(symbols)} symbols, stub latency {stub.latency * 1000:.0f} ms")
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    prices = await asyncio.gather(*(_old_pattern(stub, s) for s in symbols))
+    _report("per-symbol AsyncClient", time.perf_counter() - start, stub, f"{sum(1 for p in prices if p)} priced")
+
+    provider = PriceProvider(base_url=stub.base_url)
+    stub.reset_counters()
+    start = time.perf_counter()
+    prices = await provider.get_prices(symbols)
+    _report("PriceProvider (cold)", time.perf_counter() - start, stub, f"{len(prices)} priced")
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    prices = await provider.get_prices(symbols)
+    _report("PriceProvider (warm)", time.perf_counter() - start, stub, f"{len(prices)} priced")
+    await provider.close()
+
+
+async def bench_burst(stub: YahooStub, symbols: list, callers: int):
+    print(f"burst: {callers} concurrent callers, {len(symbols)} symbols each, cold cache")
+    provider = PriceProvider(base_url=stub.base_url)
+    stub.reset_counters()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(provider.get_prices(symbols) for _ in range(callers)))
+    stats = provider.get_stats()
+    _report(
+        "PriceProvider", time.perf_counter() - start, stub,
+        f"{stub.symbols_requested} symbols fetched, {stats['coalesced']} coalesced, "
+        f"{min(len(r) for r in results)} min priced",
+    )
+    await provider.close()
+
+
+async def bench_stale(stub: YahooStub, symbols: list):
+    print("stale: max_age 0 (every entry stale), upstream latency applies to refreshes only")
+    provider = PriceProvider(base_url=stub.base_url)
+    await provider.get_prices(symbols)
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    prices = await provider.get_prices(symbols, max_age=0)
+    _report("stale read", time.perf_counter() - start, stub, f"{len(prices)} priced")
+    await asyncio.sleep(stub.latency + 0.2)
+    _report("  after background refresh", 0.0, stub, f"stale_hits {provider.get_stats()['stale_hits']}")
+
+    stub.fail = True
+    stub.reset_counters()
+    start = time.perf_counter()
+    prices = await provider.get_prices(symbols, max_age=0)
+    await asyncio.sleep(stub.latency + 0.2)
+    _report("stale read, upstream failing", time.perf_counter() - start, stub,
+            f"{len(prices)} priced, {provider.get_stats()['upstream_errors']} upstream errors")
+    stub.fail = False
+    await provider.close()
+
+
+async def bench_bound(stub: YahooStub, symbols: list):
+    max_entries = max(1, len(symbols) // 4)
+    print(f"bound: {len(symbols)} symbols through a {max_entries}-entry cache")
+    provider = PriceProvider(base_url=stub.base_url, max_entries=max_entries)
+    stub.reset_counters()
+    start = time.perf_counter()
+    await provider.get_prices(symbols)
+    stats = provider.get_stats()
+    _report("PriceProvider", time.perf_counter() - start, stub,
+            f"{stats['entries']} entries, {stats['evictions']} evictions")
+    await provider.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fallback price provider benchmark")
+    parser.add_argument("--symbols", type=int, default=60)
+    parser.add_argument("--callers", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    stub = YahooStub(latency_ms=args.latency_ms)
+    symbols = [f"ETF{i:03d}.AS" for i in range(args.symbols)]
+    stub.prices = {symbol: 100.0 for symbol in symbols}
+    await stub.start()
+
+    await bench_batch(stub, symbols)
+    await bench_burst(stub, symbols, args.callers)
+    await bench_stale(stub, symbols)
+    await bench_bound(stub, symbols)
+
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+SafetyService contention and multi-worker benchmark.
+
+Scenarios:
+    contention  --customers customers, each placing orders from --flows
+                concurrent requests (check -> claim -> simulated broker
+                round-trip -> record). One lock stripe (the old
+                global lock) vs per-customer stripes, for the memory and
+                SQLite backends: orders/s and check latency.
+    workers     --workers processes sharing one SQLite state file place
+                orders for the same customers: every increment must land
+                in the shared daily stats, and a customer's daily order
+                limit must stop all workers, not each one separately.
+                Each worker also submits the same order at once: exactly
+                one claim may win across all workers.
+
+Usage:
+    python scripts/bench_safety.py contention [--customers 200] [--flows 4] [--orders 10]
+    python scripts/bench_safety.py workers [--workers 4] [--orders 500]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.safety import SafetyService, UserSafetyLimits
+from services.safety_state import MemorySafetyState, SQLiteSafetyState
+
+LIMITS = UserSafetyLimits(max_daily_orders=1_000_000, max_daily_exposure=1e12)
+
+
+async def place_order(service: SafetyService, customer_id: int, n: int, broker_ms: float) -> tuple[bool, float]:
+    """One order through the safety flow of POST /trading/orders. Returns (placed, check seconds)."""
+    args = (customer_id, f"U{customer_id}", f"ETF{n}", "BUY", 1, "MKT")
+    start = time.perf_counter()
+    result = await service.check_order_safety(*args, estimated_value=10.0, is_live_mode=False)
+    checked = time.perf_counter() - start
+    if not result.allowed:
+        return False, checked
+    claim = await service.claim_order(*args, estimated_value=10.0, is_live_mode=False)
+    if not claim.allowed:
+        return False, checked
+    await asyncio.sleep(broker_ms / 1000)
+    await service.record_order_executed(*args, order_id=f"{customer_id}-{n}", estimated_value=10.0)
+    return True, checked
+
+
+async def run_contention(service: SafetyService, customers: int, flows: int, orders: int, broker_ms: float):
+    for customer_id in range(customers):
+        await service.set_user_limits(customer_id, LIMITS)
+    latencies = []
+
+    async def flow(customer_id: int, f: int):
+        for i in range(orders):
+            _, checked = await place_order(service, customer_id, f * orders + i, broker_ms)
+            latencies.append(checked)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(flow(c, f) for c in range(customers) for f in range(flows)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def bench_contention(args):
+    total = args.customers * args.flows * args.orders
+    print(f"contention: {args.customers} customers x {args.flows} concurrent requests x {args.orders} orders "
+          f"({total} orders), broker round-trip {args.broker_ms:g} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("memory", "sqlite"):
+            for stripes in (1, 64):
+                state = (MemorySafetyState() if backend == "memory"
+                         else SQLiteSafetyState(Path(tmp) / f"safety_{stripes}.db"))
+                service = SafetyService(state=state, lock_stripes=stripes)
+                rate, p50, p99 = asyncio.run(run_contention(service, args.customers, args.flows, args.orders, args.broker_ms))
+                label = f"{backend}, {'global lock' if stripes == 1 else f'{stripes} stripes'}"
+                print(f"  {label:<24} {rate:9.0f} orders/s   check p50 {p50 * 1e3:7.2f} ms   p99 {p99 * 1e3:7.2f} ms")
+
+
+def _worker(path: str, worker: int, customers: int, orders: int, limited: int, barrier) -> tuple[int, int]:
+    service = SafetyService(state=SQLiteSafetyState(Path(path)))
+    barrier.wait()
+
+    async def run() -> tuple[int, int]:
+        # The same order from every worker at once (a double submission)
+        duplicate = (1, "U1", "DUP", "BUY", 1, "MKT")
+        claim = await service.claim_order(*duplicate, estimated_value=10.0, is_live_mode=False)
+        placed = 0
+        for i in range(orders):
+            customer_id = i % customers
+            ok, _ = await place_order(service, customer_id, worker * orders + i, 0.0)
+            placed += ok and customer_id == limited
+        return placed, int(claim.allowed)
+    return asyncio.run(run())
+
+
+def bench_workers(args):
+    customers, limit = 10, 20
+    print(f"workers: {args.workers} processes x {args.orders} orders over {customers} customers, shared SQLite state; "
+          f"customer 0 has a daily limit of {limit} orders")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "safety.db")
+        setup = SQLiteSafetyState(Path(path))
+        for customer_id in range(customers):
+            setup.set_limits(customer_id, LIMITS)
+        setup.set_limits(0, UserSafetyLimits(max_daily_orders=limit, max_daily_exposure=1e12))
+
+        barrier = multiprocessing.Manager().Barrier(args.workers)
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(
+                _worker, [(path, w, customers, args.orders, 0, barrier) for w in range(args.workers)]
+            )
+        placed_limited = [placed for placed, _ in results]
+        duplicate_claims = sum(claimed for _, claimed in results)
+        elapsed = time.perf_counter() - start
+
+        stats = {c: setup.get_daily_stats(c).order_count for c in range(customers)}
+        # Customer 1's duplicate order is reserved (claimed) but never recorded
+        unlimited = sum(count for c, count in stats.items() if c != 0) - duplicate_claims
+        expected = sum(1 for w in range(args.workers) for i in range(args.orders) if i % customers != 0)
+        print(f"  {args.workers * args.orders / elapsed:9.0f} orders/s across workers")
+        print(f"  shared daily stats: {unlimited} of {expected} unlimited orders recorded "
+              f"({'no lost increments' if unlimited == expected else 'LOST INCREMENTS'})")
+        print(f"  limited customer:   {sum(placed_limited)} orders placed across workers "
+              f"(limit {limit}; per-process state would allow {limit * args.workers})")
+        print(f"  duplicate order:    claimed by {duplicate_claims} of {args.workers} workers submitting it at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SafetyService benchmark")
+    parser.add_argument("scenario", choices=["contention", "workers"])
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--flows", type=int, default=4)
+    parser.add_argument("--orders", type=int, help="Orders per request (contention, default 10) or per worker (workers, default 500)")
+    parser.add_argument("--broker-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.scenario == "contention":
+        args.orders = args.orders or 10
+        bench_contention(args)
+    else:
+        args.orders = args.orders or 500
+        bench_workers(args)
+
+
+if __name__ == "__main__":
+    main()
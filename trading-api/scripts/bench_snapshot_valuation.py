@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Snapshot valuation benchmark: per-holding loops vs the vectorized engine.
+
+Generates --portfolios public portfolios (1-8 holdings over --instruments
+ISINs, two earlier snapshots each) in a temp community store and times one
+daily snapshot run:
+- legacy endpoint: the old POST /portfolios/snapshots/create loop - a linear
+                   scan over the market data per holding; timed on
+                   --legacy-sample portfolios and extrapolated
+- legacy script:   the old generate_snapshots.create_snapshot per portfolio
+                   (dict lookups, snapshot history copied per portfolio)
+- engine:          services/snapshot_valuation over all portfolios, split
+                   into valuation + returns and building the records
+
+Usage:
+    python scripts/bench_snapshot_valuation.py [--portfolios 100000] [--instruments 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.community_store import CommunityRepository
+from services.snapshot_valuation import (
+    BASE_INVESTMENT, quote_price, reference_values, snapshot_returns, value_portfolios,
+)
+
+
+def generate(repo: CommunityRepository, n_portfolios: int, n_instruments: int, seed: int = 1):
+    rng = random.Random(seed)
+    isins = [f"IE{i:010d}" for i in range(n_instruments)]
+    tradability = {"etfs": {isin: {"contract": {"conId": 100000 + i}} for i, isin in enumerate(isins)}}
+    market_data = {"data": {
+        str(100000 + i): {"isin": isin, "symbol": f"ETF{i}", "last": round(rng.uniform(5, 500), 2)}
+        for i, isin in enumerate(isins)
+    }}
+
+    portfolios, snapshots = [], []
+    now = datetime.utcnow()
+    for i in range(n_portfolios):
+        k = rng.randint(1, 8)
+        weights = [100 / k] * k
+        holdings = [{"isin": isin, "name": isin, "weight": w} for isin, w in zip(rng.sample(isins, k), weights)]
+        portfolio = {"id": f"community-{i:012x}", "name": f"Portfolio {i}", "visibility": "public", "holdings": holdings}
+        portfolios.append(portfolio)
+        for days_ago in (35, 5):
+            snapshots.append({
+                "id": f"snap-{len(snapshots):012x}", "portfolio_id": portfolio["id"],
+                "timestamp": (now - timedelta(days=days_ago)).isoformat() + "Z", "period_type": "daily",
+                "total_value": round(rng.uniform(9000, 11000), 2),
+            })
+
+    for portfolio in portfolios:
+        repo.put_portfolio(portfolio)
+    repo.add_snapshots(snapshots)
+    return portfolios, market_data, tradability
+
+
+def legacy_endpoint(portfolio: dict, market_data: dict, repo: CommunityRepository) -> dict:
+    # What POST /portfolios/snapshots/create did per portfolio
+    total_value = 0.0
+    holdings_snapshot = []
+    for holding in portfolio.get("holdings", []):
+        isin = holding.get("isin", "")
+        weight = holding.get("weight", 0)
+        price = 0.0
+        for _, md in market_data.items():
+            if md.get("isin") == isin or md.get("symbol") == holding.get("symbol"):
+                price = md.get("last", md.get("bid", 0)) or 0
+                break
+        total_value += BASE_INVESTMENT * (weight / 100)
+        holdings_snapshot.append({"isin": isin, "weight": weight, "price": price, "name": holding.get("name", "")})
+    same_type = repo.snapshots_for(portfolio["id"], "daily")
+    return_pct = 0.0
+    if same_type:
+        prev_value = same_type[-1].get("total_value", BASE_INVESTMENT)
+        if prev_value > 0:
+            return_pct = (total_value - prev_value) / prev_value * 100
+    return {"total_value": total_value, "return_pct": return_pct, "holdings_snapshot": holdings_snapshot}
+
+
+def legacy_script(portfolio: dict, market_data: dict, tradability: dict, repo: CommunityRepository) -> dict:
+    # What generate_snapshots.create_snapshot did per portfolio
+    holdings_snapshot = []
+    total_value = 0.0
+    for holding in portfolio.get("holdings", []):
+        conid = str(tradability["etfs"].get(holding["isin"], {}).get("contract", {}).get("conId", ""))
+        price = quote_price(market_data["data"].get(conid, {}))
+        value = BASE_INVESTMENT * (holding["weight"] / 100)
+        holdings_snapshot.append({"isin": holding["isin"], "name": holding["name"], "weight": holding["weight"],
+                                  "price": price, "value": round(value, 2)})
+        total_value += value
+    total_value = round(total_value, 2)
+    matching = repo.snapshots_for(portfolio["id"], "daily")
+    first = repo.snapshots_for(portfolio["id"])[0]
+    prev_value = matching[-1].get("total_value", BASE_INVESTMENT) if matching else 0
+    return {
+        "total_value": total_value,
+        "return_pct": (total_value - prev_value) / prev_value * 100 if prev_value > 0 else 0.0,
+        "cumulative_return_pct": (total_value - first["total_value"]) / first["total_value"] * 100,
+        "holdings_snapshot": holdings_snapshot,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot valuation benchmark")
+    parser.add_argument("--portfolios", type=int, default=100_000)
+    parser.add_argument("--instruments", type=int, default=2_000)
+    parser.add_argument("--legacy-sample", type=int, default=200, help="Portfolios timed for the legacy endpoint loop")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = CommunityRepository(tmp, fsync="never")
+        repo.load()
+        start = time.perf_counter()
+        portfolios, market_data, tradability = generate(repo, args.portfolios, args.instruments)
+        holdings = sum(len(p["holdings"]) for p in portfolios)
+        print(f"Generated {len(portfolios)} portfolios, {holdings} holdings over {args.instruments} instruments "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        sample = portfolios[:args.legacy_sample]
+        start = time.perf_counter()
+        for portfolio in sample:
+            legacy_endpoint(portfolio, market_data["data"], repo)
+        per_portfolio = (time.perf_counter() - start) / len(sample)
+        print(f"{'legacy endpoint':>18}: {per_portfolio * len(portfolios):>9.2f} s "
+              f"(extrapolated from {len(sample)} portfolios)")
+
+        start = time.perf_counter()
+        legacy = [legacy_script(p, market_data, tradability, repo) for p in portfolios]
+        print(f"{'legacy script':>18}: {time.perf_counter() - start:>9.2f} s")
+
+        etfs = tradability["etfs"]
+        start = time.perf_counter()
+        valuation = value_portfolios(
+            portfolios,
+            lambda isin: ((etfs.get(isin) or {}).get("contract") or {}).get("conId"),
+            market_data["data"],
+        )
+        total_values = np.array([round(v, 2) for v in valuation.nav.tolist()])
+        return_pct, return_abs, cumulative = snapshot_returns(
+            total_values,
+            reference_values([repo.latest_snapshot(p["id"], "daily") for p in portfolios]),
+            reference_values([repo.first_snapshot(p["id"]) for p in portfolios]),
+        )
+        valued = time.perf_counter() - start
+        records = valuation.holdings_snapshots(portfolios)
+        total = time.perf_counter() - start
+        print(f"{'engine':>18}: {total:>9.2f} s (valuation + returns {valued:.2f} s, "
+              f"holdings records {total - valued:.2f} s)")
+
+        assert np.allclose(total_values, [r["total_value"] for r in legacy])
+        assert np.allclose(return_pct, [r["return_pct"] for r in legacy])
+        assert np.allclose(cumulative, [r["cumulative_return_pct"] for r in legacy])
+        assert records == [r["holdings_snapshot"] for r in legacy]
+        print(f"{'':>18}  engine results match the legacy script")
+        repo.close_sync()
+
+
+if __name__ == "__main__":
+    main()
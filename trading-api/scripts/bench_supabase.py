@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Supabase access-pattern benchmarks against a local PostgREST stub.
+
+Scenarios:
+    pool       Sequential PostgREST calls: fresh httpx.AsyncClient per call
+               (old pattern) vs the shared pooled client.
+    aggregate  BatchExecutionService.aggregate_orders as pending intentions
+               grow from 100 to 50,000 (round-trips and wall time).
+    audit      Concurrent log_quote_request calls: time spent on the request
+               path with the old inline POST per row vs the buffered writer,
+               then a database outage (rows spilled to disk, replayed once
+               it is back).
+
+Usage:
+    python scripts/bench_supabase.py pool [--requests 2000] [--latency-ms 1]
+    python scripts/bench_supabase.py aggregate [--latency-ms 1]
+    python scripts/bench_supabase.py audit [--requests 2000] [--latency-ms 1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from postgrest_stub import PostgRESTStub
+
+
+def _point_settings_at(stub: PostgRESTStub):
+    """Route every service at the stub instead of the real Supabase project."""
+    os.environ["SUPABASE_URL"] = stub.base_url
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "bench"
+    os.environ["SUPABASE_KEY"] = "bench"
+    from config import clear_settings_cache
+    clear_settings_cache()
+
+
+def _report(label: str, elapsed: float, n: int, stub: PostgRESTStub):
+    print(
+        f"  {label:<28} {elapsed * 1000:9.1f} ms total  "
+        f"{elapsed / max(n, 1) * 1e6:8.1f} us/req  "
+        f"{stub.requests:6d} requests  {stub.connections:5d} connections"
+    )
+
+
+async def bench_pool(n_requests: int, latency_ms: float):
+    stub = PostgRESTStub(latency_ms=latency_ms)
+    await stub.start()
+    _point_settings_at(stub)
+
+    from services.supabase_client import supabase_client, close_supabase_client
+
+    url = f"{stub.base_url}/rest/v1/order_intentions"
+    params = {"status": "eq.pending", "select": "*"}
+
+    print(f"pool: {n_requests} sequential GETs, stub latency {latency_ms} ms")
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+    _report("per-call AsyncClient", time.perf_counter() - start, n_requests, stub)
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        async with supabase_client(timeout=10.0) as client:
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+    _report("shared pooled client", time.perf_counter() - start, n_requests, stub)
+
+    await close_supabase_client()
+    await stub.stop()
+
+
+def _fake_intentions(n: int, n_symbols: int = 60) -> list[dict]:
+    rng = random.Random(n)
+    intentions = []
+    for _ in range(n):
+        s = rng.randrange(n_symbols)
+        intentions.append({
+            "id": str(uuid.uuid4()),
+            "user_id": rng.randrange(1, max(n // 3, 2)),
+            "symbol": f"ETF{s:02d}",
+            "conid": 100000 + s,
+            "side": "BUY" if rng.random() < 0.8 else "SELL",
+            "quantity": rng.randint(1, 50),
+            "estimated_value": 100.0,
+        })
+    return intentions
+
+
+async def bench_aggregate(latency_ms: float):
+    stub = PostgRESTStub(latency_ms=latency_ms)
+    await stub.start()
+    _point_settings_at(stub)
+
+    from services.batch_execution_service import BatchExecutionService
+    from services.order_intention_service import OrderIntentionService
+    import services.order_intention_service as intention_module
+    from services.supabase_client import close_supabase_client
+
+    intention_module._order_intention_service = OrderIntentionService()
+    service = BatchExecutionService()
+
+    print(f"aggregate: stub latency {latency_ms} ms")
+    for n in (100, 1_000, 10_000, 50_000):
+        intentions = _fake_intentions(n)
+        groups = {(i["symbol"], i["conid"], i["side"]) for i in intentions}
+        stub.fixtures["order_intentions"] = intentions
+        stub.reset_counters()
+
+        start = time.perf_counter()
+        orders = await service.aggregate_orders(str(uuid.uuid4()))
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"  {n:>6} intentions  {len(orders):3d} orders  "
+            f"{elapsed * 1000:8.1f} ms  {stub.requests:3d} requests "
+            f"(per-row path: {n + len(groups) + 2})"
+        )
+
+    await close_supabase_client()
+    await stub.stop()
+
+
+async def bench_audit(n_requests: int, latency_ms: float, concurrency: int = 50):
+    stub = PostgRESTStub(latency_ms=latency_ms)
+    await stub.start()
+    _point_settings_at(stub)
+
+    from services.audit import AuditService
+    from services.supabase_client import supabase_client, close_supabase_client
+
+    print(f"audit: {n_requests} quote requests, {concurrency} concurrent, stub latency {latency_ms} ms")
+    tmp = tempfile.TemporaryDirectory()
+    service = AuditService(spill_path=Path(tmp.name) / "audit_spill.jsonl")
+
+    async def inline_post(customer_id: int):
+        # What log_action did on the request path: one POST per row
+        async with supabase_client(timeout=10.0) as client:
+            response = await client.post(f"{service.base_url}/trade_audit_log", headers=service.headers,
+                                         json={"customer_id": customer_id, "action": "quote_requested"})
+            response.raise_for_status()
+
+    async def run(log) -> float:
+        # Summed time the "requests" spend in the audit call
+        spent = 0.0
+        pending = iter(range(n_requests))
+
+        async def client():
+            nonlocal spent
+            for i in pending:
+                start = time.perf_counter()
+                await log(i)
+                spent += time.perf_counter() - start
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return spent
+
+    stub.reset_counters()
+    start = time.perf_counter()
+    spent = await run(inline_post)
+    print(f"  {'inline POST per row':<24} {spent / n_requests * 1e6:9.1f} us/request  "
+          f"{(time.perf_counter() - start) * 1000:8.1f} ms total  {stub.requests:5d} POSTs  {stub.rows_written} rows")
+
+    stub.reset_counters()
+    service.start()
+    start = time.perf_counter()
+    spent = await run(lambda i: service.log_quote_request(customer_id=i, symbols=["100000"], ip_address="127.0.0.1"))
+    await service.close()
+    print(f"  {'buffered writer':<24} {spent / n_requests * 1e6:9.1f} us/request  "
+          f"{(time.perf_counter() - start) * 1000:8.1f} ms to flush  {stub.requests:5d} POSTs  {stub.rows_written} rows")
+
+    # Outage: inserts fail, batches spill to disk; replayed when the database is back
+    stub.reset_counters()
+    base_url, service.base_url = service.base_url, "http://127.0.0.1:9/rest/v1"
+    service.start()
+    await run(lambda i: service.log_quote_request(customer_id=i, symbols=["100000"], ip_address="127.0.0.1"))
+    placed = await service.log_action(customer_id=0, action="order_placed", status="submitted", durable=True)
+    await service.close()
+    spilled = service.get_stats()["spilled"]
+    service.base_url = base_url
+    replayed = await service.replay()
+    print(f"  {'outage':<24} {spilled} rows spilled (durable write confirmed: {placed}), "
+          f"{replayed} replayed in {stub.requests} POSTs, {stub.rows_written} rows in the database")
+
+    tmp.cleanup()
+    await close_supabase_client()
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supabase access-pattern benchmarks")
+    parser.add_argument("scenario", choices=["pool", "aggregate", "audit"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.scenario == "pool":
+        asyncio.run(bench_pool(args.requests, args.latency_ms))
+    elif args.scenario == "aggregate":
+        asyncio.run(bench_aggregate(args.latency_ms))
+    elif args.scenario == "audit":
+        asyncio.run(bench_audit(args.requests, args.latency_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tick store benchmark: memory and read/write latency for a full trading day.
+
+Feeds a synthetic random-walk quote stream for N conids into a TickStore
+(one tick every --tick-interval seconds over --hours of session) and measures:
+- memory:  preallocated bytes and rows kept per conid
+- append:  per-tick write cost (what IBClient._on_ticker_update pays)
+- latest:  newest row view
+- bars:    1-minute and 5-minute OHLCV over the whole session, 1-minute
+           over the last hour
+- vwap:    session VWAP
+- dict copy: the old get_all_market_data() shallow copy, for reference
+
+Usage:
+    python scripts/bench_tick_store.py [--conids 100] [--hours 8.5] [--tick-interval 0.25]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.tick_store import TickStore
+
+
+def _percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+    return f"p50 {p50:>9.1f} us   p99 {p99:>9.1f} us"
+
+
+def _timed(call, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tick store benchmark")
+    parser.add_argument("--conids", type=int, default=100)
+    parser.add_argument("--hours", type=float, default=8.5)
+    parser.add_argument("--tick-interval", type=float, default=0.25, help="Seconds between ticks per conid")
+    parser.add_argument("--capacity", type=int, default=32768)
+    parser.add_argument("--min-interval", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    session_start = time.time() - args.hours * 3600
+    n_ticks = int(args.hours * 3600 / args.tick_interval)
+    conids = list(range(100_000, 100_000 + args.conids))
+
+    tracemalloc.start()
+    store = TickStore(capacity=args.capacity, min_interval=args.min_interval)
+    for conid in conids:
+        store.open(conid)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Same random walk for every conid, offset per conid; values go in as Python floats like IB's
+    prices = (100 + np.cumsum(rng.normal(0, 0.02, n_ticks))).tolist()
+    volumes = np.cumsum(rng.integers(0, 50, n_ticks)).astype(float).tolist()
+    timestamps = (session_start + np.arange(n_ticks) * args.tick_interval).tolist()
+
+    start = time.perf_counter()
+    for i in range(n_ticks):
+        ts, price, volume = timestamps[i], prices[i], volumes[i]
+        for offset, conid in enumerate(conids):
+            p = price + offset
+            store.append(conid, ts, p - 0.01, p + 0.01, p, 100.0, 120.0, volume)
+    append_us = (time.perf_counter() - start) / (n_ticks * len(conids)) * 1e6
+
+    stats = store.get_stats()
+    print(f"{args.conids} conids, {n_ticks} ticks each over {args.hours} h "
+          f"(min_interval {args.min_interval} s, capacity {args.capacity})")
+    print(f"{'rows kept':>22}: {stats['rows'] // len(conids)} per conid")
+    print(f"{'allocated':>22}: {stats['allocated_bytes'] / 1e6:>9.1f} MB (heap peak {peak / 1e6:.1f} MB)")
+    print(f"{'append':>22}: {append_us:>9.2f} us/tick")
+
+    conid = conids[0]
+    last_hour = time.time() - 3600
+    for label, call in (
+        ("latest", lambda: store.latest(conid)),
+        ("window last hour", lambda: store.window(conid, last_hour)),
+        ("bars 1m session", lambda: store.bars(conid, 60)),
+        ("bars 5m session", lambda: store.bars(conid, 300)),
+        ("bars 1m last hour", lambda: store.bars(conid, 60, start=last_hour)),
+        ("vwap session", lambda: store.vwap(conid)),
+    ):
+        print(f"{label:>22}: {_percentiles(_timed(call, args.repeat))}")
+
+    # Reference: the dict-per-conid cache copied on every get_all_market_data()
+    cache = {
+        c: {"conid": c, "symbol": "SYM", "bid": 1.0, "ask": 1.0, "last": 1.0, "bidSize": 1.0,
+            "askSize": 1.0, "volume": 1.0, "timestamp": "", "delayed": False}
+        for c in conids
+    }
+    print(f"{'dict cache copy':>22}: {_percentiles(_timed(cache.copy, args.repeat))}")
+
+
+if __name__ == "__main__":
+    main()
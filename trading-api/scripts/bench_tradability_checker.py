@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tradability checker benchmark against the in-process IB stub.
+
+Scenarios (all run in order):
+    sequential  The old loop: one ETF at a time, exchanges tried in order with
+                its fixed sleeps (0.1 s per failed exchange, 0.5 s per ETF,
+                3 s per batch of 25). Timed on --sequential-sample ETFs and
+                extrapolated.
+    pipelined   TradabilityChecker.check_etfs over all ETFs: throughput, IB
+                requests, peak requests in flight and pacing violations
+                (the stub enforces IB's 50 messages/second).
+    resume      A run cancelled halfway, then resumed from its checkpoint:
+                every ETF is checked exactly once overall.
+
+Both scenarios must classify every ETF the same way.
+
+Usage:
+    python scripts/bench_tradability_checker.py [--etfs 2000] [--latency-ms 80] [--rate 40] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ib_insync import Stock
+
+from ib_stub import FakeIB
+from check_etf_tradability import EXCHANGES_TO_TRY, TradabilityChecker
+
+
+def _classify(result: dict) -> tuple:
+    contract = result["contract"] or {}
+    return result["tradable_via_lynx"], result["reason_if_not_tradable"], contract.get("conId")
+
+
+async def sequential_check(ib: FakeIB, etf: dict) -> dict:
+    # What check_single_etf + check_batch did per ETF (sleeps included)
+    found = None
+    for exchange, currency in EXCHANGES_TO_TRY:
+        contract = Stock(symbol="", exchange=exchange, currency=currency)
+        contract.secIdType = "ISIN"
+        contract.secId = etf["isin"]
+        qualified = await ib.qualifyContractsAsync(contract)
+        if qualified:
+            found = qualified[0]
+            break
+        await asyncio.sleep(0.1)
+    result = {"isin": etf["isin"], "tradable_via_lynx": False, "reason_if_not_tradable": "no_contract", "contract": None}
+    if found:
+        details = await ib.reqContractDetailsAsync(found)
+        if details:
+            result.update(tradable_via_lynx=True, reason_if_not_tradable=None,
+                          contract={"conId": details[0].contract.conId})
+        else:
+            result["reason_if_not_tradable"] = "regulatory_restriction"
+    await asyncio.sleep(0.5)
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Tradability checker benchmark")
+    parser.add_argument("--etfs", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--rate", type=float, default=40.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sequential-sample", type=int, default=25)
+    args = parser.parse_args()
+
+    etfs = [{"isin": f"IE{i:010d}", "name": f"ETF {i}", "currency": "EUR"} for i in range(args.etfs)]
+    print(f"{args.etfs} ETFs, stub latency {args.latency_ms:.0f} ms, IB pacing limit 50 requests/s")
+
+    # sequential
+    ib = FakeIB.with_universe(args.etfs, latency_ms=args.latency_ms)
+    sample = etfs[:args.sequential_sample]
+    start = time.perf_counter()
+    expected = {}
+    for etf in sample:
+        expected[etf["isin"]] = _classify(await sequential_check(ib, etf))
+    per_etf = (time.perf_counter() - start) / len(sample) + 3.0 / 25  # plus the per-batch pause
+    print(f"  {'sequential':<12} {per_etf * args.etfs:9.0f} s  (extrapolated from {len(sample)} ETFs, "
+          f"{ib.requests / len(sample):.1f} requests/ETF)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # pipelined
+        ib = FakeIB.with_universe(args.etfs, latency_ms=args.latency_ms)
+        checker = TradabilityChecker(ib=ib, rate=args.rate, concurrency=args.concurrency,
+                                     checkpoint_path=Path(tmp) / "full.jsonl", checkpoint_every=args.etfs + 1,
+                                     verbose=False)
+        await checker.connect()
+        start = time.perf_counter()
+        results = await checker.check_etfs(etfs)
+        elapsed = time.perf_counter() - start
+        print(f"  {'pipelined':<12} {elapsed:9.1f} s  ({len(results) / elapsed:.1f} ETFs/s, {ib.requests} requests, "
+              f"peak {ib.peak_in_flight} in flight, {ib.violations} pacing violations)")
+        checker.disconnect()
+        by_isin = {r["isin"]: _classify(r) for r in results}
+        mismatches = [isin for isin, c in expected.items() if by_isin[isin] != c]
+        tradable = sum(1 for r in results if r["tradable_via_lynx"])
+        print(f"  {'':<12} {tradable} tradable, {len(mismatches)} mismatches vs sequential")
+
+        # resume
+        checkpoint = Path(tmp) / "resume.jsonl"
+        ib = FakeIB.with_universe(args.etfs, latency_ms=args.latency_ms)
+        checker = TradabilityChecker(ib=ib, rate=args.rate, concurrency=args.concurrency,
+                                     checkpoint_path=checkpoint, checkpoint_every=args.etfs + 1, verbose=False)
+        await checker.connect()
+        run = asyncio.ensure_future(checker.check_etfs(etfs))
+        while len(checker._results) < args.etfs // 2:
+            await asyncio.sleep(0.05)
+        run.cancel()
+        try:
+            await run
+        except asyncio.CancelledError:
+            pass
+        checker._close_checkpoint()
+
+        checker = TradabilityChecker(ib=ib, rate=args.rate, concurrency=args.concurrency,
+                                     checkpoint_path=checkpoint, checkpoint_every=args.etfs + 1, verbose=False)
+        await checker.connect()
+        done = checker.load_checkpoint()
+        checked = {r["isin"] for r in done}
+        resumed = await checker.check_etfs([etf for etf in etfs if etf["isin"] not in checked])
+        combined = {r["isin"]: _classify(r) for r in done + resumed}
+        print(f"  {'resume':<12} {len(done)} from checkpoint + {len(resumed)} resumed = {len(combined)} ETFs, "
+              f"{'identical' if combined == by_isin else 'DIFFERENT'} results")
+        checker.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Startup / lookup benchmark: JSON vs SQLite tradability store.
+
+Each format is measured in a fresh interpreter so module caches and the
+allocator don't leak between runs:
+- startup:   TradabilityService() construction
+- memory:    Python heap retained after startup (tracemalloc) and peak
+             during it, plus process max RSS
+- universe:  first build of the shared ETF universe index
+- lookups:   get_etf_info / is_tradable on random ISINs
+
+Build the store first if needed:
+    python scripts/check_etf_tradability.py --export-store
+
+Usage:
+    python scripts/bench_tradability_store.py [--lookups 20000]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _measure(fmt: str, n_lookups: int) -> dict:
+    import services.tradability_service as ts
+
+    if fmt == "json":
+        ts.TRADABILITY_STORE_FILE = Path(os.devnull + ".missing")
+    elif not ts.TRADABILITY_STORE_FILE.exists():
+        raise SystemExit(f"{ts.TRADABILITY_STORE_FILE} not found, run check_etf_tradability.py --export-store")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    service = ts.TradabilityService()
+    startup = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert service.source == fmt, service.source
+
+    start = time.perf_counter()
+    universe = service.universe
+    universe_build = time.perf_counter() - start
+
+    isins = [etf["isin"] for etf in universe.etfs]
+    rng = random.Random(1)
+    sample = [rng.choice(isins) for _ in range(n_lookups)]
+
+    start = time.perf_counter()
+    for isin in sample:
+        service.get_etf_info(isin)
+    info_us = (time.perf_counter() - start) / n_lookups * 1e6
+
+    start = time.perf_counter()
+    for isin in sample:
+        service.is_tradable(isin)
+    tradable_us = (time.perf_counter() - start) / n_lookups * 1e6
+
+    return {
+        "format": fmt,
+        "startup_ms": startup * 1000,
+        "retained_kb": retained / 1024,
+        "peak_kb": peak / 1024,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "universe_ms": universe_build * 1000,
+        "etf_info_us": info_us,
+        "is_tradable_us": tradable_us,
+        "tradable": len(universe),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tradability store benchmark")
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--child", choices=["json", "sqlite"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure(args.child, args.lookups)))
+        return
+
+    results = []
+    for fmt in ("json", "sqlite"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", fmt, "--lookups", str(args.lookups)],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'':>16} {'json':>12} {'sqlite':>12}")
+    rows = [
+        ("startup", "startup_ms", "ms"),
+        ("heap retained", "retained_kb", "KB"),
+        ("heap peak", "peak_kb", "KB"),
+        ("max RSS", "max_rss_kb", "KB"),
+        ("universe build", "universe_ms", "ms"),
+        ("get_etf_info", "etf_info_us", "us"),
+        ("is_tradable", "is_tradable_us", "us"),
+    ]
+    for label, key, unit in rows:
+        print(f"{label:>16} " + " ".join(f"{r[key]:>9.1f} {unit:<2}" for r in results))
+    print(f"{'tradable ETFs':>16} " + " ".join(f"{r['tradable']:>12}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
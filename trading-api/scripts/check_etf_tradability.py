@@ -10,14 +10,45 @@ For each ETF:
 3. Checks trading permissions and regulatory restrictions
 4. Classifies reason if not tradable
 
-Run: python scripts/check_etf_tradability.py [--port 4001] [--batch-size 50]
+ETFs are checked concurrently (--concurrency at a time). Every IB request
+first takes a token from a bucket refilling at --rate per second, which
+keeps the client under IB's 50 messages/second pacing limit; a pacing
+violation (error 100) pauses the bucket. The exchanges of an ISIN are
+hedged in preference order: the next exchange is tried when the previous
+one fails or hasn't answered within HEDGE_DELAY, the most preferred
+exchange that qualifies wins and the attempts still running are cancelled.
+
+Every result is appended to data/etf_tradability.checkpoint.jsonl as it
+comes in; --resume skips the ISINs recorded there after a crash or Ctrl-C.
+data/etf_tradability.temp.json (read by the report scripts) is rewritten
+every --batch-size results.
+
+Results are written to data/etf_tradability.json and to the compact SQLite
+store data/etf_tradability.db that the API loads (JSON is the fallback).
+data/etf_tradability.diff.json lists what changed since the previous
+results; POST /trading/tradability/reload applies just that.
+
+--incremental only rechecks ISINs that are new, whose name or currency
+changed in the sheet, or that were last checked more than --max-age-days
+ago; the other results are carried over. ISINs dropped from the sheet are
+removed. The parsed sheet is cached in data/etf_database.cache.npz, keyed
+by the sheet's SHA-256, so unchanged sheets aren't parsed again.
+
+Run: python scripts/check_etf_tradability.py [--port 4001] [--concurrency 16] [--rate 40] [--resume]
+     python scripts/check_etf_tradability.py --incremental [--max-age-days 30]
+     python scripts/check_etf_tradability.py --export-store   (JSON -> SQLite only)
+
+TradabilityChecker takes an `ib` object, so it can run against
+scripts/ib_stub.FakeIB (see scripts/bench_tradability_checker.py).
 """
 import asyncio
+import hashlib
 import json
+import os
 import sys
 import argparse
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 import time
 
@@ -33,6 +64,7 @@ class _Py310CompatEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
 
 asyncio.set_event_loop_policy(_Py310CompatEventLoopPolicy())
 
+import numpy as np
 import pandas as pd
 from ib_insync import IB, Stock, Contract
 
@@ -46,11 +78,41 @@ SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent.parent
 ETF_EXCEL_PATH = PROJECT_ROOT / "public" / "ETF_overzicht_met_subcategorie.xlsx"
 OUTPUT_PATH = SCRIPT_DIR.parent / "data" / "etf_tradability.json"
-
-# Rate limiting
-REQUESTS_PER_SECOND = 3  # Be conservative with IB API
-DELAY_BETWEEN_BATCHES = 3  # seconds
-DELAY_BETWEEN_REQUESTS = 0.5  # seconds
+STORE_PATH = SCRIPT_DIR.parent / "data" / "etf_tradability.db"
+CHECKPOINT_PATH = SCRIPT_DIR.parent / "data" / "etf_tradability.checkpoint.jsonl"
+DIFF_PATH = SCRIPT_DIR.parent / "data" / "etf_tradability.diff.json"
+ETF_CACHE_PATH = SCRIPT_DIR.parent / "data" / "etf_database.cache.npz"
+
+sys.path.insert(0, str(SCRIPT_DIR.parent))
+from services.rate_limiter import TokenBucket
+from services.tradability_store import tradability_diff, write_tradability_store
+
+# Rate limiting (IB disconnects clients above 50 messages/second)
+REQUESTS_PER_SECOND = 40
+REQUEST_BURST = 10
+MAX_CONCURRENT_CHECKS = 16
+HEDGE_DELAY = 0.5  # seconds before also trying the next exchange
+REQUEST_TIMEOUT = 10  # seconds
+PACING_BACKOFF = 2.0  # seconds without requests after error 100
+
+# Incremental runs: results older than this are rechecked
+RECHECK_AFTER_DAYS = 30
+
+# Sheet columns kept in the ETF database (and its cache)
+ETF_COLUMNS = ['isin', 'name', 'currency', 'category', 'subcategory']
+
+# Preferred exchanges to try (EU-focused for UCITS ETFs)
+EXCHANGES_TO_TRY = [
+    ("SMART", "EUR"),
+    ("AEB", "EUR"),      # Euronext Amsterdam
+    ("IBIS", "EUR"),     # Xetra
+    ("IBIS2", "EUR"),    # Xetra 2
+    ("EBS", "EUR"),      # SIX Swiss Exchange
+    ("BVME.ETF", "EUR"), # Borsa Italiana ETF
+    ("LSE", "GBP"),      # London Stock Exchange
+    ("SMART", "USD"),
+    ("AEB", "USD"),
+]
 
 # Reason codes for non-tradable ETFs
 REASON_NO_CONTRACT = "no_contract"
@@ -62,9 +124,25 @@ REASON_UNKNOWN = "unknown"
 class TradabilityChecker:
     """Checks ETF tradability against IB Gateway."""
 
-    def __init__(self, port: int = DEFAULT_PORT):
-        self.ib = IB()
+    def __init__(
+        self,
+        port: int = DEFAULT_PORT,
+        ib=None,
+        rate: float = REQUESTS_PER_SECOND,
+        concurrency: int = MAX_CONCURRENT_CHECKS,
+        hedge_delay: float = HEDGE_DELAY,
+        checkpoint_path: Optional[Path] = CHECKPOINT_PATH,
+        checkpoint_every: int = 250,
+        verbose: bool = True,
+    ):
+        self.ib = ib if ib is not None else IB()
         self.port = port
+        self.limiter = TokenBucket(rate, burst=min(REQUEST_BURST, rate))
+        self.concurrency = concurrency
+        self.hedge_delay = hedge_delay
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.verbose = verbose
         self.account = None
         self.results = {
             "metadata": {
@@ -77,19 +155,25 @@ class TradabilityChecker:
             },
             "etfs": {}
         }
-        # Track IB error messages for permission detection
-        self._last_error_code = None
-        self._last_error_msg = None
+        # IB error code per request contract (id), for permission detection
+        self._error_codes: dict[int, int] = {}
+        self._checkpoint = None
+        self._results: list[dict] = []
+        self._pacing_violations = 0
 
     def _on_error(self, reqId: int, errorCode: int, errorString: str, contract=None):
         """Capture IB error messages for permission detection."""
-        self._last_error_code = errorCode
-        self._last_error_msg = errorString
+        if contract is not None:
+            self._error_codes[id(contract)] = errorCode
+        if errorCode == 100:
+            # Pacing violation: back off before IB disconnects us
+            self._pacing_violations += 1
+            self.limiter.pause(PACING_BACKOFF)
         # Don't log info messages
         if errorCode not in {2104, 2106, 2158, 2119}:
             if errorCode in {200, 321, 354}:  # Contract/permission related
                 pass  # We handle these in check_single_etf
-            else:
+            elif self.verbose:
                 print(f"      [IB Error {errorCode}]: {errorString}")
 
     async def connect(self) -> bool:
@@ -100,6 +184,7 @@ class TradabilityChecker:
 
             # Set up error handler
             self.ib.errorEvent += self._on_error
+            self._pacing_violations = 0
 
             accounts = self.ib.managedAccounts()
             self.account = accounts[0] if accounts else None
@@ -119,7 +204,13 @@ class TradabilityChecker:
             print("[OK] Disconnected from IB Gateway")
 
     def load_etf_database(self) -> pd.DataFrame:
-        """Load ETFs from Excel database."""
+        """Load ETFs from Excel database (or its cache, if the sheet is unchanged)."""
+        sheet_hash = hashlib.sha256(ETF_EXCEL_PATH.read_bytes()).hexdigest()
+        etfs = _read_etf_cache(sheet_hash)
+        if etfs is not None:
+            print(f"[OK] Loaded {len(etfs)} ETFs from {ETF_CACHE_PATH.name} (sheet unchanged)")
+            return etfs
+
         print(f"Loading ETFs from {ETF_EXCEL_PATH}...")
 
         df = pd.read_excel(ETF_EXCEL_PATH)
@@ -130,13 +221,15 @@ class TradabilityChecker:
 
         # Extract relevant columns
         etfs = df[['isin', 'naam', 'fund ccy', 'categorie', 'subcategorie']].copy()
-        etfs.columns = ['isin', 'name', 'currency', 'category', 'subcategory']
+        etfs.columns = ETF_COLUMNS
 
         # Clean up
         etfs = etfs.drop_duplicates(subset=['isin'])
-        etfs = etfs.reset_index(drop=True)
+        etfs = etfs.fillna({'name': 'Unknown', 'currency': 'EUR', 'category': '', 'subcategory': ''})
+        etfs = etfs.astype(str).reset_index(drop=True)
 
         print(f"[OK] Found {len(etfs)} unique ETFs with valid ISINs")
+        _write_etf_cache(etfs, sheet_hash)
         return etfs
 
     async def check_single_etf(self, isin: str, name: str, currency: str) -> dict:
@@ -159,48 +252,7 @@ class TradabilityChecker:
             "checked_at": datetime.now().isoformat(),
         }
 
-        # Reset error tracking
-        self._last_error_code = None
-        self._last_error_msg = None
-
-        # Preferred exchanges to try (EU-focused for UCITS ETFs)
-        exchanges_to_try = [
-            ("SMART", "EUR"),
-            ("AEB", "EUR"),      # Euronext Amsterdam
-            ("IBIS", "EUR"),     # Xetra
-            ("IBIS2", "EUR"),    # Xetra 2
-            ("EBS", "EUR"),      # SIX Swiss Exchange
-            ("BVME.ETF", "EUR"), # Borsa Italiana ETF
-            ("LSE", "GBP"),      # London Stock Exchange
-            ("SMART", "USD"),
-            ("AEB", "USD"),
-        ]
-
-        found_contract = None
-
-        for exchange, curr in exchanges_to_try:
-            try:
-                # Create contract with ISIN (preferred method for EU ETFs)
-                contract = Stock(
-                    symbol="",
-                    exchange=exchange,
-                    currency=curr
-                )
-                contract.secIdType = "ISIN"
-                contract.secId = isin
-
-                # Try to qualify the contract
-                qualified = await self.ib.qualifyContractsAsync(contract)
-
-                if qualified and len(qualified) > 0:
-                    found_contract = qualified[0]
-                    break
-
-            except Exception:
-                continue
-
-            # Small delay between exchange attempts
-            await asyncio.sleep(0.1)
+        found_contract = await self._find_contract(isin)
 
         if not found_contract:
             result["reason_if_not_tradable"] = REASON_NO_CONTRACT
@@ -209,18 +261,20 @@ class TradabilityChecker:
         # We found a contract, now verify it's actually tradable
         # by requesting contract details (this also checks permissions)
         try:
-            self._last_error_code = None
-
             # Request contract details - this triggers permission checks
-            details = await self.ib.reqContractDetailsAsync(found_contract)
+            await self.limiter.acquire()
+            try:
+                details = await asyncio.wait_for(self.ib.reqContractDetailsAsync(found_contract), REQUEST_TIMEOUT)
+            finally:
+                error_code = self._error_codes.pop(id(found_contract), None)
 
             if not details:
                 # No details returned - likely no permission
-                if self._last_error_code in {200, 321}:
+                if error_code in {200, 321}:
                     result["reason_if_not_tradable"] = REASON_NO_CONTRACT
-                elif self._last_error_code in {354, 10197}:
+                elif error_code in {354, 10197}:
                     result["reason_if_not_tradable"] = REASON_REGULATORY
-                elif self._last_error_code in {162}:
+                elif error_code in {162}:
                     result["reason_if_not_tradable"] = REASON_NO_PERMISSION
                 else:
                     result["reason_if_not_tradable"] = REASON_NO_PERMISSION
@@ -247,6 +301,8 @@ class TradabilityChecker:
                 result["reason_if_not_tradable"] = REASON_REGULATORY
                 result["contract"] = None
 
+        except asyncio.TimeoutError:
+            result["reason_if_not_tradable"] = REASON_UNKNOWN
         except Exception as e:
             err_str = str(e).lower()
             if "permission" in err_str or "not allowed" in err_str:
@@ -258,53 +314,180 @@ class TradabilityChecker:
 
         return result
 
-    async def check_batch(self, etfs: list[dict], batch_num: int, total_batches: int) -> list[dict]:
-        """Check a batch of ETFs with rate limiting."""
-        results = []
-        batch_start = time.time()
-        tradable_count = 0
+    async def _qualify(self, isin: str, exchange: str, currency: str) -> Optional[Contract]:
+        """One exchange attempt: the qualified contract, or None."""
+        # Create contract with ISIN (preferred method for EU ETFs)
+        contract = Stock(
+            symbol="",
+            exchange=exchange,
+            currency=currency
+        )
+        contract.secIdType = "ISIN"
+        contract.secId = isin
+
+        await self.limiter.acquire()
+        try:
+            qualified = await asyncio.wait_for(self.ib.qualifyContractsAsync(contract), REQUEST_TIMEOUT)
+            return qualified[0] if qualified else None
+        except Exception:
+            return None
+        finally:
+            self._error_codes.pop(id(contract), None)
 
-        print(f"\n--- Batch {batch_num}/{total_batches} ({len(etfs)} ETFs) ---")
+    async def _find_contract(self, isin: str) -> Optional[Contract]:
+        """
+        Qualify the ISIN on the most preferred exchange that knows it.
+
+        Attempts are hedged: the next exchange starts when every attempt so
+        far has failed or the hedge delay passes without a decision. The
+        first exchange in EXCHANGES_TO_TRY order that qualifies wins once
+        all exchanges before it have failed; the rest are cancelled.
+        """
+        attempts: list[asyncio.Task] = []
+        try:
+            for exchange, currency in EXCHANGES_TO_TRY:
+                attempts.append(asyncio.ensure_future(self._qualify(isin, exchange, currency)))
+                contract = await self._settle(attempts, self.hedge_delay)
+                if contract is not None:
+                    return contract
+            return await self._settle(attempts, None)
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
 
-        for i, etf in enumerate(etfs):
-            isin = etf['isin']
-            name = etf.get('name', 'Unknown')
-            currency = etf.get('currency', 'EUR')
+    @staticmethod
+    async def _settle(attempts: list, timeout: Optional[float]) -> Optional[Contract]:
+        """
+        The winning contract, if decided within timeout (None: wait for a decision).
 
-            result = await self.check_single_etf(isin, name, currency)
-            results.append(result)
+        Returns None when every attempt failed or the timeout passed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            for task in attempts:
+                if not task.done():
+                    break  # A more preferred exchange is still pending
+                if task.result() is not None:
+                    return task.result()
+            else:
+                return None
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            await asyncio.wait(
+                [task for task in attempts if not task.done()],
+                timeout=remaining,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+    async def check_etfs(self, etfs: list[dict]) -> list[dict]:
+        """Check ETFs concurrently; results are checkpointed as they complete and returned in input order."""
+        order = {etf['isin']: i for i, etf in enumerate(etfs)}
+        started = time.time()
+        pending = iter(etfs)
+
+        async def worker():
+            # Workers share one iterator: each ETF is checked exactly once
+            for etf in pending:
+                result = await self.check_single_etf(
+                    etf['isin'], etf.get('name', 'Unknown'), etf.get('currency', 'EUR')
+                )
+                self._record(result)
 
+        self._open_checkpoint()
+        first = len(self._results)
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+        finally:
+            if self._checkpoint is not None:
+                self._checkpoint.flush()
+                os.fsync(self._checkpoint.fileno())
+
+        results = self._results[first:]
+        elapsed = time.time() - started
+        if self.verbose:
+            print(f"  Checked {len(results)} ETFs in {elapsed:.1f}s "
+                  f"({len(results) / elapsed if elapsed else 0:.1f}/s, "
+                  f"{self.limiter.get_stats()['acquired']} IB requests, "
+                  f"{self._pacing_violations} pacing violations)")
+        return sorted(results, key=lambda r: order.get(r['isin'], len(order)))
+
+    def _record(self, result: dict):
+        """Checkpoint and report one result."""
+        self._results.append(result)
+        if self._checkpoint is not None:
+            self._checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._checkpoint.flush()
+
+        if self.verbose:
             # Progress indicator
+            isin, name = result['isin'], result.get('name') or 'Unknown'
             if result['tradable_via_lynx']:
-                status = "OK"
-                tradable_count += 1
                 symbol = result['contract']['symbol']
                 exchange = result['contract']['primaryExchange'] or result['contract']['exchange']
-                print(f"  [{status}] {isin} | {symbol:8} | {exchange:10} | {name[:35]}")
+                print(f"  [OK] {isin} | {symbol:8} | {exchange:10} | {name[:35]}")
             else:
-                status = "X "
-                reason = result.get('reason_if_not_tradable', 'unknown')[:15]
-                print(f"  [{status}] {isin} | {reason:17} | {name[:35]}")
-
-            # Rate limiting within batch
-            await asyncio.sleep(DELAY_BETWEEN_REQUESTS)
-
-        batch_time = time.time() - batch_start
-        print(f"  Batch: {tradable_count}/{len(etfs)} tradable ({batch_time:.1f}s)")
-
-        return results
+                reason = (result.get('reason_if_not_tradable') or 'unknown')[:15]
+                print(f"  [X ] {isin} | {reason:17} | {name[:35]}")
+
+        if len(self._results) % self.checkpoint_every == 0:
+            self._save_intermediate(self._results)
+
+    def _open_checkpoint(self):
+        if self.checkpoint_path is not None and self._checkpoint is None:
+            self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            self._checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8')
+
+    def _close_checkpoint(self, remove: bool = False):
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            self._checkpoint = None
+        if remove and self.checkpoint_path is not None and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+
+    def load_checkpoint(self) -> list[dict]:
+        """Results recorded by an interrupted run (a torn last line is dropped)."""
+        results = {}
+        if self.checkpoint_path is None or not self.checkpoint_path.exists():
+            return []
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                results[result['isin']] = result
+        return list(results.values())
 
-    async def check_all_etfs(self, batch_size: int = 50, limit: Optional[int] = None, resume_from: Optional[str] = None):
+    async def check_all_etfs(self, batch_size: int = 250, limit: Optional[int] = None,
+                             resume_from: Optional[str] = None, resume: bool = False,
+                             incremental: bool = False, max_age_days: float = RECHECK_AFTER_DAYS):
         """
         Check tradability of all ETFs in the database.
 
         Args:
-            batch_size: Number of ETFs per batch
+            batch_size: Results between data/etf_tradability.temp.json checkpoints
             limit: Limit total ETFs to check (for testing)
             resume_from: ISIN to resume from (skip already checked)
+            resume: Skip ISINs recorded in the checkpoint file by an interrupted run
+            incremental: Only recheck new, changed and stale ISINs; carry over the rest
+            max_age_days: Age after which an incremental run rechecks a result
         """
         # Load ETF database
         etfs_df = self.load_etf_database()
+        previous = load_previous_results()
+
+        carried = []
+        if incremental:
+            sheet = etfs_df.to_dict('records')
+            todo, carried, counts = select_for_recheck(sheet, previous.get("etfs", {}), max_age_days)
+            removed = len(set(previous.get("etfs", {})) - {etf['isin'] for etf in sheet})
+            print(f"[INFO] Incremental: {counts['new']} new, {counts['changed']} changed, "
+                  f"{counts['stale']} older than {max_age_days:g} days, {len(carried)} carried over, "
+                  f"{removed} removed from the sheet")
+            etfs_df = pd.DataFrame(todo, columns=ETF_COLUMNS)
 
         # Resume support: skip ETFs we already checked
         if resume_from:
@@ -318,40 +501,50 @@ class TradabilityChecker:
             print(f"[INFO] Limited to {limit} ETFs")
 
         etfs_list = etfs_df.to_dict('records')
-        total = len(etfs_list)
 
-        print(f"[INFO] Will check {total} ETFs")
+        if incremental:
+            # ETFs skipped by --limit / --resume-from keep their previous result
+            kept = {etf['isin'] for etf in etfs_list}
+            carried += [previous["etfs"][etf['isin']] for etf in todo
+                        if etf['isin'] not in kept and etf['isin'] in previous.get("etfs", {})]
+
+        done = []
+        if resume:
+            wanted = {etf['isin'] for etf in etfs_list}
+            done = [r for r in self.load_checkpoint() if r['isin'] in wanted]
+            checked = {r['isin'] for r in done}
+            etfs_list = [etf for etf in etfs_list if etf['isin'] not in checked]
+            print(f"[INFO] Resuming: {len(done)} ETFs already in {self.checkpoint_path.name}")
+        else:
+            self._close_checkpoint(remove=True)
+        self._results = list(done)
+        self.checkpoint_every = batch_size
+
+        print(f"[INFO] Will check {len(etfs_list)} ETFs "
+              f"({self.concurrency} concurrent, {self.limiter.rate:g} requests/s)")
+
+        if incremental and not etfs_list and not done:
+            # Nothing to recheck, but the sheet may have dropped ISINs
+            self.results["metadata"]["account"] = previous.get("metadata", {}).get("account")
+            self.compile_results(_in_sheet_order(carried, sheet), previous)
+            return
 
         # Connect to IB
         if not await self.connect():
             return
 
         try:
-            # Process in batches
-            total_batches = (total + batch_size - 1) // batch_size
-            all_results = []
-
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min(start_idx + batch_size, total)
-                batch = etfs_list[start_idx:end_idx]
-
-                results = await self.check_batch(batch, batch_num + 1, total_batches)
-                all_results.extend(results)
-
-                # Save intermediate results (for recovery)
-                if batch_num > 0 and batch_num % 5 == 0:
-                    self._save_intermediate(all_results)
-
-                # Delay between batches to avoid overwhelming IB
-                if batch_num < total_batches - 1:
-                    print(f"  Waiting {DELAY_BETWEEN_BATCHES}s before next batch...")
-                    await asyncio.sleep(DELAY_BETWEEN_BATCHES)
+            results = await self.check_etfs(etfs_list)
 
             # Compile final results
-            self.compile_results(all_results)
+            combined = done + results
+            if incremental:
+                combined = _in_sheet_order(carried + combined, sheet)
+            self.compile_results(combined, previous)
+            self._close_checkpoint(remove=True)
 
         finally:
+            self._close_checkpoint()
             self.disconnect()
 
     def _save_intermediate(self, results: list[dict]):
@@ -373,10 +566,11 @@ class TradabilityChecker:
         }
         with open(temp_path, 'w', encoding='utf-8') as f:
             json.dump(temp_data, f, indent=2, ensure_ascii=False)
-        print(f"  [Checkpoint] Saved {len(results)} results")
+        if self.verbose:
+            print(f"  [Checkpoint] Saved {len(results)} results")
 
-    def compile_results(self, results: list[dict]):
-        """Compile and save results."""
+    def compile_results(self, results: list[dict], previous: Optional[dict] = None):
+        """Compile and save results, and the diff against the previous results."""
         tradable = [r for r in results if r['tradable_via_lynx']]
         blocked = [r for r in results if not r['tradable_via_lynx']]
 
@@ -400,6 +594,9 @@ class TradabilityChecker:
         OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
         with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
             json.dump(self.results, f, indent=2, ensure_ascii=False)
+        write_tradability_store(self.results, STORE_PATH)
+        diff = tradability_diff(previous or {}, self.results)
+        _write_json_atomic(diff, DIFF_PATH)
 
         print(f"\n{'='*70}")
         print("TRADABILITY CHECK SUMMARY")
@@ -434,30 +631,142 @@ class TradabilityChecker:
                 primary = c.get('primaryExchange') or c.get('exchange', '')
                 print(f"  {t['isin']} | {c['symbol']:8} | {primary:10} | {c['currency']} | {t['name'][:30]}")
 
+        print(f"\nCHANGES SINCE PREVIOUS RESULTS:")
+        print(f"  Newly tradable: {len(diff['newly_tradable'])}")
+        for isin in diff['newly_tradable'][:20]:
+            print(f"    {isin} | {diff['etfs'][isin]['name'][:50]}")
+        print(f"  Newly blocked:  {len(diff['newly_blocked'])}")
+        for isin in diff['newly_blocked'][:20]:
+            record = diff['etfs'][isin]
+            print(f"    {isin} | {record.get('reason_if_not_tradable') or REASON_UNKNOWN:22} | {record['name'][:40]}")
+        print(f"  Removed:        {len(diff['removed'])}")
+        print(f"  Records changed: {len(diff['etfs'])}")
+
         print(f"\n{'='*70}")
         print(f"Results saved to: {OUTPUT_PATH}")
+        print(f"Compact store:    {STORE_PATH}")
+        print(f"Diff:             {DIFF_PATH}")
         print(f"{'='*70}")
 
 
+def load_previous_results() -> dict:
+    """The results of the previous run ({} if there are none)."""
+    if not OUTPUT_PATH.exists():
+        return {}
+    with open(OUTPUT_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def select_for_recheck(etfs: list[dict], previous: dict, max_age_days: float) -> tuple[list, list, dict]:
+    """
+    Split the sheet into ETFs to recheck and previous results to carry over.
+
+    An ETF is rechecked when it has no previous result (new), its name or
+    currency differs from the one recorded (changed) or its result is older
+    than max_age_days (stale).
+
+    Returns (ETFs to recheck, carried-over results, counts per reason).
+    """
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+    todo, carried = [], []
+    counts = {"new": 0, "changed": 0, "stale": 0}
+    for etf in etfs:
+        record = previous.get(etf['isin'])
+        if record is None:
+            reason = "new"
+        elif record.get('name') != etf['name'] or record.get('input_currency') != etf['currency']:
+            reason = "changed"
+        elif (record.get('checked_at') or '') < cutoff:
+            reason = "stale"
+        else:
+            carried.append(record)
+            continue
+        counts[reason] += 1
+        todo.append(etf)
+    return todo, carried, counts
+
+
+def _in_sheet_order(results: list[dict], sheet: list[dict]) -> list[dict]:
+    order = {etf['isin']: i for i, etf in enumerate(sheet)}
+    return sorted(results, key=lambda r: order.get(r['isin'], len(order)))
+
+
+def _read_etf_cache(sheet_hash: str) -> Optional[pd.DataFrame]:
+    """The cached ETF database, if it was parsed from this sheet."""
+    if not ETF_CACHE_PATH.exists():
+        return None
+    try:
+        with np.load(ETF_CACHE_PATH, allow_pickle=False) as cache:
+            if str(cache['sheet_sha256']) != sheet_hash:
+                return None
+            return pd.DataFrame({column: cache[column].astype(object) for column in ETF_COLUMNS})
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable ETF cache: {e}")
+        return None
+
+
+def _write_etf_cache(etfs: pd.DataFrame, sheet_hash: str):
+    """Cache the parsed ETF database as one array per column."""
+    ETF_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = ETF_CACHE_PATH.with_name(ETF_CACHE_PATH.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, sheet_sha256=np.array(sheet_hash),
+                 **{column: etfs[column].to_numpy(dtype=str) for column in ETF_COLUMNS})
+    os.replace(tmp_path, ETF_CACHE_PATH)
+
+
+def _write_json_atomic(data: dict, path: Path):
+    """Write JSON through a temp file, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def export_store():
+    """Rebuild the SQLite store from the existing JSON results (no IB needed)."""
+    with open(OUTPUT_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    write_tradability_store(data, STORE_PATH)
+    print(f"Wrote {len(data.get('etfs', {}))} ETFs to {STORE_PATH} ({STORE_PATH.stat().st_size / 1024:.0f} KB)")
+
+
 async def main():
     parser = argparse.ArgumentParser(description="Check ETF tradability via IB Gateway")
     parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"IB Gateway port (default: {DEFAULT_PORT})")
-    parser.add_argument("--batch-size", type=int, default=25, help="Batch size (default: 25)")
+    parser.add_argument("--batch-size", type=int, default=250, help="Results between temp.json checkpoints (default: 250)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_CHECKS,
+                        help=f"ETFs checked at once (default: {MAX_CONCURRENT_CHECKS})")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND,
+                        help=f"IB requests per second (default: {REQUESTS_PER_SECOND}, IB limit is 50)")
     parser.add_argument("--limit", type=int, help="Limit number of ETFs to check (for testing)")
     parser.add_argument("--resume-from", type=str, help="ISIN to resume from (skip already checked)")
+    parser.add_argument("--resume", action="store_true", help="Skip ETFs recorded in the checkpoint of an interrupted run")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recheck new, changed and stale ETFs; carry over the other results")
+    parser.add_argument("--max-age-days", type=float, default=RECHECK_AFTER_DAYS,
+                        help=f"Recheck results older than this in --incremental runs (default: {RECHECK_AFTER_DAYS})")
+    parser.add_argument("--export-store", action="store_true", help="Only rebuild the SQLite store from the JSON results")
     args = parser.parse_args()
 
+    if args.export_store:
+        export_store()
+        return
+
     print("="*70)
     print("ETF TRADABILITY CHECKER FOR LYNX/IB")
     print(f"Started: {datetime.now().isoformat()}")
     print(f"Port: {args.port} ({'LIVE' if args.port == 4001 else 'PAPER' if args.port == 4002 else 'CUSTOM'})")
     print("="*70)
 
-    checker = TradabilityChecker(port=args.port)
+    checker = TradabilityChecker(port=args.port, rate=args.rate, concurrency=args.concurrency)
     await checker.check_all_etfs(
         batch_size=args.batch_size,
         limit=args.limit,
-        resume_from=args.resume_from
+        resume_from=args.resume_from,
+        resume=args.resume,
+        incremental=args.incremental,
+        max_age_days=args.max_age_days,
     )
 
     print(f"\nFinished: {datetime.now().isoformat()}")
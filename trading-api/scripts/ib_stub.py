@@ -0,0 +1,297 @@
+"""
+Minimal in-process IB Gateway stand-in.
+
+Implements the slice of ib_insync.IB that scripts/check_etf_tradability.py
+uses (connectAsync, isConnected, disconnect, managedAccounts, errorEvent,
+reqContractDetailsAsync, qualifyContractsAsync) plus what IBClient needs
+to run against it (IBClient(ib_factory=FakeIB)): connection events,
+positions, account values, streaming market data and orders.
+
+- `listings`: ISIN -> {(exchange, currency): contract fields}. A SMART
+  request matches any listing in that currency.
+- `regulatory`: ISINs whose contract details request fails with error 354
+  (as for PRIIPs-restricted ETFs)
+- every request takes `latency` seconds (plus jitter)
+- pacing: more than `max_rate` requests within one second is a violation,
+  reported as error 100 like the real gateway; counted in `violations`
+
+Also counts requests and the peak number in flight so benchmarks can
+report pacing and concurrency.
+
+Market data: every `tick_interval` seconds each streaming ticker gets a new
+quote. Tick n of a ticker carries bid = n, ask = n + 1, last = n + 0.5,
+bidSize = askSize = n and volume = 100 n, so a reader can tell a consistent
+quote from one mixing two ticks. Snapshots arrive after `latency`.
+
+Orders are acknowledged after `latency` and filled in `fill_parts` equal
+executions `fill_latency` apart at the ticker's last price (100.0 if none).
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from eventkit import Event
+from ib_insync import (
+    AccountValue, CommissionReport, Contract, ContractDetails, Execution, Fill, OrderStatus, Ticker, Trade,
+)
+
+EXCHANGES = ["AEB", "IBIS", "IBIS2", "EBS", "BVME.ETF", "LSE"]
+
+
+class FakeIB:
+    """ib_insync.IB stand-in backed by a synthetic listing table."""
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 20.0, max_rate: float = 50.0,
+                 tick_interval: float = 0.01, fill_latency_ms: float = 20.0, fill_parts: int = 2,
+                 account: str = "DU0000000"):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.max_rate = max_rate
+        self.tick_interval = tick_interval
+        self.fill_latency = fill_latency_ms / 1000.0
+        self.fill_parts = fill_parts
+        self.account = account
+        self.listings: dict[str, dict] = {}
+        self.regulatory: set[str] = set()
+        self.errorEvent = Event("errorEvent")
+        self.connectedEvent = Event("connectedEvent")
+        self.disconnectedEvent = Event("disconnectedEvent")
+        self.newOrderEvent = Event("newOrderEvent")
+        self.positionEvent = Event("positionEvent")
+        self.client = SimpleNamespace(getReqId=self._next_req_id, reqAccountUpdates=lambda *args: None)
+
+        # Market data and orders
+        self._tickers: dict[int, Ticker] = {}
+        self._ticks: dict[int, int] = {}
+        self._tick_task = None
+        self._trades: list[Trade] = []
+        self._order_id = 0
+        self._exec_id = 0
+        self.ticks_sent = 0
+        self.orders_placed = 0
+
+        self.requests = 0
+        self.violations = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._sent: deque = deque()
+        self._req_id = 0
+        self._connected = False
+        self._by_conid: dict[int, tuple] = {}
+
+    @classmethod
+    def with_universe(cls, n_etfs: int, seed: int = 1, **kwargs) -> "FakeIB":
+        """Listings for n_etfs ISINs: ~70% on SMART/EUR, some on one foreign exchange only, ~15% unknown."""
+        rng = random.Random(seed)
+        ib = cls(**kwargs)
+        for i in range(n_etfs):
+            isin = f"IE{i:010d}"
+            roll = rng.random()
+            if roll < 0.15:
+                continue
+            if roll < 0.85:
+                exchange, currency = rng.choice(["AEB", "IBIS"]), "EUR"
+                ib.add_listing(isin, "SMART", currency, primary=exchange, conid=100000 + i)
+            else:
+                exchange, currency = rng.choice([("EBS", "EUR"), ("BVME.ETF", "EUR"), ("LSE", "GBP")])
+                ib.add_listing(isin, exchange, currency, primary=exchange, conid=100000 + i)
+            if rng.random() < 0.05:
+                ib.regulatory.add(isin)
+        return ib
+
+    def add_listing(self, isin: str, exchange: str, currency: str, primary: str, conid: int):
+        fields = {
+            "conId": conid, "symbol": f"E{conid}", "secType": "STK", "exchange": exchange,
+            "primaryExchange": primary, "currency": currency, "localSymbol": f"E{conid}",
+            "tradingClass": f"E{conid}",
+        }
+        self.listings.setdefault(isin, {})[(exchange, currency)] = fields
+        if exchange == "SMART":
+            self.listings[isin][(primary, currency)] = {**fields, "exchange": primary}
+        self._by_conid[conid] = (isin, fields)
+
+    # =========================================================================
+    # ib_insync.IB surface
+    # =========================================================================
+
+    async def connectAsync(self, host: str, port: int, clientId: int = 1, timeout: float = 4,
+                           readonly: bool = False, account: str = ""):
+        self._connected = True
+        self._tick_task = asyncio.ensure_future(self._tick_loop())
+        self.connectedEvent.emit()
+        return self
+
+    def isConnected(self) -> bool:
+        return self._connected
+
+    def disconnect(self):
+        if not self._connected:
+            return
+        self._connected = False
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+        self.disconnectedEvent.emit()
+
+    def managedAccounts(self) -> list:
+        return [self.account]
+
+    def _next_req_id(self) -> int:
+        self._req_id += 1
+        return self._req_id
+
+    # Account
+
+    async def reqPositionsAsync(self) -> list:
+        return []
+
+    def reqPositions(self):
+        pass
+
+    def cancelPositions(self):
+        pass
+
+    def accountValues(self, account: str = "") -> list:
+        return [
+            AccountValue(account=self.account, tag="NetLiquidation", value="100000", currency="EUR", modelCode=""),
+            AccountValue(account=self.account, tag="TotalCashValue", value="100000", currency="EUR", modelCode=""),
+        ]
+
+    # Market data
+
+    def reqMktData(self, contract: Contract, genericTickList: str = "", snapshot: bool = False,
+                   regulatorySnapshot: bool = False, mktDataOptions=None) -> Ticker:
+        ticker = Ticker(contract=contract)
+        if snapshot:
+            asyncio.get_event_loop().call_later(self.latency, self._tick, ticker)
+        else:
+            self._tickers[contract.conId] = ticker
+        return ticker
+
+    def cancelMktData(self, contract: Contract):
+        self._tickers.pop(contract.conId, None)
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            for ticker in list(self._tickers.values()):
+                self._tick(ticker)
+
+    def _tick(self, ticker: Ticker):
+        conid = ticker.contract.conId
+        n = self._ticks.get(conid, 0) + 1
+        self._ticks[conid] = n
+        ticker.bid, ticker.ask, ticker.last = float(n), float(n + 1), n + 0.5
+        ticker.bidSize = ticker.askSize = float(n)
+        ticker.volume = 100.0 * n
+        ticker.time = datetime.now(timezone.utc)
+        self.ticks_sent += 1
+        ticker.updateEvent.emit(ticker)
+
+    # Orders
+
+    def placeOrder(self, contract: Contract, order) -> Trade:
+        self._order_id += 1
+        self.orders_placed += 1
+        order.orderId = self._order_id
+        trade = Trade(contract=contract, order=order,
+                      orderStatus=OrderStatus(orderId=order.orderId, status="PendingSubmit",
+                                              remaining=order.totalQuantity))
+        self._trades.append(trade)
+        self.newOrderEvent.emit(trade)
+        loop = asyncio.get_event_loop()
+        loop.call_later(self.latency, self._set_status, trade, "Submitted")
+        for part in range(1, self.fill_parts + 1):
+            loop.call_later(self.latency + part * self.fill_latency, self._fill, trade)
+        return trade
+
+    def cancelOrder(self, order):
+        # Like IB, the cancel is confirmed after a round trip and fills due
+        # before then still execute
+        for trade in self._trades:
+            if trade.order.orderId == order.orderId and trade.orderStatus.status not in OrderStatus.DoneStates:
+                self._set_status(trade, "PendingCancel")
+                asyncio.get_event_loop().call_later(self.latency, self._set_status, trade, "Cancelled")
+
+    def trades(self) -> list:
+        return list(self._trades)
+
+    def _set_status(self, trade: Trade, status: str):
+        if trade.orderStatus.status in OrderStatus.DoneStates:
+            return
+        trade.orderStatus.status = status
+        trade.statusEvent.emit(trade)
+
+    def _fill(self, trade: Trade):
+        status = trade.orderStatus
+        if status.status in OrderStatus.DoneStates:
+            return
+        ticker = self._tickers.get(trade.contract.conId)
+        price = ticker.last if ticker is not None and ticker.last == ticker.last else 100.0
+        if len(trade.fills) >= self.fill_parts - 1:
+            shares = status.remaining  # Last part takes the rest
+        else:
+            shares = min(status.remaining, max(1.0, trade.order.totalQuantity // self.fill_parts))
+
+        self._exec_id += 1
+        execution = Execution(execId=f"sim.{self._exec_id}", orderId=trade.order.orderId,
+                              side="BOT" if trade.order.action == "BUY" else "SLD", shares=shares, price=price,
+                              time=datetime.now(timezone.utc))
+        fill = Fill(trade.contract, execution, CommissionReport(), execution.time)
+        status.avgFillPrice = (status.avgFillPrice * status.filled + price * shares) / (status.filled + shares)
+        status.filled += shares
+        status.remaining -= shares
+        status.lastFillPrice = price
+        trade.fills.append(fill)
+        trade.fillEvent.emit(trade, fill)
+        if status.remaining <= 0:
+            status.status = "Filled"
+            trade.filledEvent.emit(trade)
+        trade.statusEvent.emit(trade)
+
+    async def qualifyContractsAsync(self, *contracts: Contract) -> list:
+        result = []
+        for contract in contracts:
+            details = await self.reqContractDetailsAsync(contract)
+            if len(details) == 1:
+                for key, value in vars(details[0].contract).items():
+                    if key != "exchange" or contract.exchange != "SMART":
+                        setattr(contract, key, value)
+                result.append(contract)
+        return result
+
+    async def reqContractDetailsAsync(self, contract: Contract) -> list:
+        self._req_id += 1
+        req_id = self._req_id
+        self._pace()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        finally:
+            self.in_flight -= 1
+
+        if contract.conId:
+            isin, fields = self._by_conid.get(contract.conId, (None, None))
+            if isin in self.regulatory:
+                self.errorEvent.emit(req_id, 354, "Requested market data is not subscribed (PRIIPs)", contract)
+                return []
+        else:
+            fields = self.listings.get(contract.secId, {}).get((contract.exchange, contract.currency))
+        if fields is None:
+            self.errorEvent.emit(req_id, 200, "No security definition has been found for the request", contract)
+            return []
+        return [ContractDetails(contract=Contract(**fields), tradingHours="20260101:0900-20260101:1730")]
+
+    def _pace(self):
+        now = time.monotonic()
+        self._sent.append(now)
+        while self._sent and self._sent[0] <= now - 1.0:
+            self._sent.popleft()
+        if len(self._sent) > self.max_rate:
+            self.violations += 1
+            self.errorEvent.emit(-1, 100, "Max rate of messages per second has been exceeded", None)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Load test for the market data push stream (/trading/marketdata/stream).
+
+Starts the marketdata router in a child uvicorn process whose IBClient is
+fed by a fake ticker source (random-walk quotes through the real
+_on_ticker_update path), then connects thousands of local WebSocket clients:
+- most subscribe to a few random symbols, --all-fraction to everything
+- --slow-fraction never read their socket (stalled clients must not slow
+  anyone else down or grow server memory)
+
+Reports ticks published vs quotes delivered (conflation), tick-to-client
+latency, and the server's event loop lag measured during the run.
+
+Usage:
+    python scripts/loadtest_market_data_stream.py [--clients 2000] [--duration 20]
+        [--symbols 100] [--tick-rate 2000] [--slow-fraction 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+# =============================================================================
+# Server (child process)
+# =============================================================================
+
+def serve(port: int, n_symbols: int, tick_rate: float, deflate: bool):
+    os.environ["LOCAL_DEV_MODE"] = "true"
+    from contextlib import asynccontextmanager
+    from types import SimpleNamespace
+    import uvicorn
+    from fastapi import FastAPI
+    from routers.marketdata import router as marketdata_router
+    from services.etf_universe import get_etf_universe
+    from services.ib_client import get_ib_client
+    from services.market_data_stream import get_market_data_broadcaster
+
+    etfs = [etf for etf in get_etf_universe().etfs if etf.get("conid")][:n_symbols]
+    ib_client = get_ib_client()
+    ib_client.get_primary_account = lambda: None
+    for etf in etfs:
+        ib_client._market_data_cache[etf["conid"]] = {
+            "conid": etf["conid"], "symbol": etf["symbol"], "bid": None, "ask": None, "last": None,
+            "bidSize": None, "askSize": None, "volume": None, "timestamp": None, "delayed": False,
+        }
+        ib_client.tick_store.open(etf["conid"])
+
+    lag_samples: list = []
+    stats = {"ticks": 0}
+
+    async def fake_ticker_source():
+        rng = random.Random(1)
+        prices = {etf["conid"]: 100.0 for etf in etfs}
+        volume = {etf["conid"]: 0 for etf in etfs}
+        batch = max(1, int(tick_rate / 100))  # 100 wakeups per second
+        while True:
+            await asyncio.sleep(batch / tick_rate)
+            for _ in range(batch):
+                etf = etfs[rng.randrange(len(etfs))]
+                conid = etf["conid"]
+                prices[conid] *= 1 + rng.gauss(0, 0.0005)
+                volume[conid] += rng.randrange(1, 100)
+                price = prices[conid]
+                ib_client._on_ticker_update(SimpleNamespace(
+                    contract=SimpleNamespace(conId=conid),
+                    bid=price - 0.01, ask=price + 0.01, last=price,
+                    bidSize=100, askSize=120, volume=volume[conid], marketDataType=1,
+                ))
+                stats["ticks"] += 1
+
+    async def loop_lag_monitor():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag_samples.append(time.perf_counter() - start - 0.01)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        get_market_data_broadcaster().start(ib_client)
+        tasks = [asyncio.create_task(fake_ticker_source()), asyncio.create_task(loop_lag_monitor())]
+        yield
+        for task in tasks:
+            task.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(marketdata_router)
+
+    @app.get("/_loadtest/stats")
+    async def _stats(reset: bool = False):
+        result = {
+            **get_market_data_broadcaster().get_stats(),
+            "ticks": stats["ticks"],
+            "symbols": [etf["symbol"] for etf in etfs],
+            "loop_lag_p50_ms": _percentile(lag_samples, 0.5) * 1000,
+            "loop_lag_p99_ms": _percentile(lag_samples, 0.99) * 1000,
+            "loop_lag_max_ms": max(lag_samples, default=0) * 1000,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        if reset:
+            lag_samples.clear()
+            stats["ticks"] = 0
+        return result
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096,
+                ws_per_message_deflate=deflate)
+
+
+# =============================================================================
+# Clients
+# =============================================================================
+
+async def run_client(url: str, slow: bool, stop: asyncio.Event, results: dict):
+    from websockets.asyncio.client import connect
+
+    try:
+        async with connect(url, additional_headers={"X-Customer-ID": "0"}, max_queue=None,
+                           open_timeout=60) as ws:
+            results["connected"] += 1
+            if slow:
+                await stop.wait()
+                return
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                results["messages"] += 1
+                results["quotes"] += message.count('"conid"')
+                # Parse a sample only, the client side shares the CPU with the server
+                if results["measure"] and results["messages"] % 20 == 0:
+                    now = datetime.now()
+                    quotes = json.loads(message)
+                    newest = max((q["timestamp"] for q in quotes if q.get("timestamp")), default=None)
+                    if newest:
+                        results["latency"].append((now - datetime.fromisoformat(newest)).total_seconds())
+    except Exception as e:
+        results["errors"] += 1
+        results["last_error"] = repr(e)
+
+
+async def run_load(args, port: int):
+    import httpx
+
+    base = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(timeout=10) as http:
+        for _ in range(100):
+            try:
+                symbols = (await http.get(f"{base}/_loadtest/stats")).json()["symbols"]
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+        else:
+            raise SystemExit("server did not start")
+
+        rng = random.Random(2)
+        stop = asyncio.Event()
+        results = {"connected": 0, "messages": 0, "quotes": 0, "errors": 0, "latency": [],
+                   "measure": False, "last_error": None}
+        tasks = []
+        start = time.perf_counter()
+        for i in range(args.clients):
+            slow = rng.random() < args.slow_fraction
+            if rng.random() < args.all_fraction:
+                url = f"ws://127.0.0.1:{port}/trading/marketdata/stream"
+            else:
+                picked = rng.sample(symbols, min(len(symbols), args.symbols_per_client))
+                url = f"ws://127.0.0.1:{port}/trading/marketdata/stream?symbols={','.join(picked)}"
+            tasks.append(asyncio.create_task(run_client(url, slow, stop, results)))
+            if i % 100 == 99:
+                await asyncio.sleep(0.05)
+        while results["connected"] + results["errors"] < args.clients and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.1)
+        connect_time = time.perf_counter() - start
+
+        await http.get(f"{base}/_loadtest/stats", params={"reset": True})
+        results.update(messages=0, quotes=0, measure=True)
+        await asyncio.sleep(args.duration)
+        server = (await http.get(f"{base}/_loadtest/stats")).json()
+        delivered, messages = results["quotes"], results["messages"]
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    print(f"{args.clients} clients ({results['connected']} connected, {results['errors']} errors) "
+          f"in {connect_time:.1f} s, {len(symbols)} symbols, {args.duration} s measured")
+    if results["last_error"]:
+        print(f"  last error: {results['last_error']}")
+    print(f"{'ticks published':>22}: {server['ticks']} ({server['ticks'] / args.duration:.0f}/s)")
+    print(f"{'quotes serialized':>22}: {server['serialized']} (max {server['max_rate']}/s per symbol)")
+    print(f"{'messages delivered':>22}: {messages} ({messages / args.duration:.0f}/s)")
+    print(f"{'quotes delivered':>22}: {delivered} ({delivered / args.duration:.0f}/s)")
+    latency = results["latency"]
+    print(f"{'tick -> client':>22}: p50 {_percentile(latency, 0.5) * 1000:.1f} ms   "
+          f"p99 {_percentile(latency, 0.99) * 1000:.1f} ms")
+    print(f"{'server loop lag':>22}: p50 {server['loop_lag_p50_ms']:.1f} ms   "
+          f"p99 {server['loop_lag_p99_ms']:.1f} ms   max {server['loop_lag_max_ms']:.1f} ms")
+    print(f"{'server max RSS':>22}: {server['max_rss_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Market data stream load test")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--symbols", type=int, default=100, help="Symbols the fake source ticks")
+    parser.add_argument("--symbols-per-client", type=int, default=5)
+    parser.add_argument("--all-fraction", type=float, default=0.1, help="Clients subscribed to every symbol")
+    parser.add_argument("--slow-fraction", type=float, default=0.05, help="Clients that never read")
+    parser.add_argument("--tick-rate", type=float, default=2000.0, help="Fake ticks per second (all symbols)")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--deflate", action="store_true", help="Enable permessage-deflate (main.py disables it)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.symbols, args.tick_rate, args.deflate)
+        return
+
+    # One socket per client on each side
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = subprocess.Popen([
+        sys.executable, __file__, "--serve", "--port", str(args.port),
+        "--symbols", str(args.symbols), "--tick-rate", str(args.tick_rate),
+        *(["--deflate"] if args.deflate else []),
+    ])
+    try:
+        asyncio.run(run_load(args, args.port))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Minimal local PostgREST stub for benchmarking Supabase access patterns.
+
+Speaks just enough HTTP/1.1 (keep-alive) to stand in for /rest/v1:
+- GET    -> rows registered in `fixtures` for the table, else []
+- POST   -> echoes the JSON body back with generated "id" fields
+            (single object or array, like Prefer: return=representation)
+- PATCH  -> []
+- DELETE -> []
+- POST /rest/v1/rpc/<fn> -> {"success": true}
+
+An optional per-request latency simulates the network round-trip to Supabase.
+Counts requests and new TCP connections so benchmarks can report both.
+
+Usage (standalone):
+    python scripts/postgrest_stub.py --port 54321 --latency-ms 5
+"""
+import asyncio
+import argparse
+import json
+import uuid
+
+
+class PostgRESTStub:
+    """In-process PostgREST stand-in used by the bench_* scripts."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.connections = 0
+        self.rows_written = 0
+        self.fixtures: dict[str, list] = {}  # table name -> rows served on GET
+        self._server: asyncio.AbstractServer = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset_counters(self):
+        self.requests = 0
+        self.connections = 0
+        self.rows_written = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                payload = self._respond(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n".encode()
+                    + b"Connection: keep-alive\r\n\r\n"
+                    + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, method: str, path: str, body: bytes):
+        if "/rpc/" in path:
+            return {"success": True}
+        if method == "GET":
+            table = path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+            return self.fixtures.get(table, [])
+        if method != "POST":
+            return []
+
+        parsed = json.loads(body) if body else {}
+        rows = parsed if isinstance(parsed, list) else [parsed]
+        self.rows_written += len(rows)
+        return [{"id": str(uuid.uuid4()), **row} for row in rows]
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Local PostgREST stub")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = PostgRESTStub(port=args.port, latency_ms=args.latency_ms)
+    await stub.start()
+    print(f"PostgREST stub listening on {stub.base_url}/rest/v1")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,145 @@
+"""
+Minimal local Yahoo Finance stub for exercising services/price_provider.py.
+
+Speaks just enough HTTP/1.1 (keep-alive) to stand in for query1.finance.yahoo.com:
+- GET /v8/finance/spark?symbols=A,B -> {"spark": {"result": [...]}} for every
+  symbol in `prices` (unknown symbols are left out, like Yahoo)
+- GET /v8/finance/chart/<symbol>    -> {"chart": {"result": [...]}}
+
+Prices random-walk a little on every request so refreshes are visible.
+An optional per-request latency simulates the round-trip to Yahoo, and
+`fail` makes every request return HTTP 500. Counts requests and the
+symbols asked for so benchmarks can report both.
+
+Usage (standalone):
+    python scripts/yahoo_stub.py --port 54322 --latency-ms 50
+"""
+import asyncio
+import argparse
+import json
+import random
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class YahooStub:
+    """In-process Yahoo Finance stand-in used by bench_price_provider.py."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.symbols_requested = 0
+        self.connections = 0
+        self.fail = False
+        self.prices: dict[str, float] = {}  # symbol -> current price
+        self._server: asyncio.AbstractServer = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset_counters(self):
+        self.requests = 0
+        self.symbols_requested = 0
+        self.connections = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                status = b"500 Internal Server Error" if self.fail else b"200 OK"
+                data = json.dumps({} if self.fail else self._respond(path)).encode()
+                writer.write(
+                    b"HTTP/1.1 " + status + b"\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n".encode()
+                    + b"Connection: keep-alive\r\n\r\n"
+                    + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _chart(self, symbol: str) -> dict:
+        previous = self.prices[symbol]
+        price = round(previous * (1 + random.gauss(0, 0.001)), 4)
+        self.prices[symbol] = price
+        now = int(time.time())
+        return {
+            "meta": {
+                "symbol": symbol,
+                "currency": "EUR",
+                "regularMarketPrice": price,
+                "chartPreviousClose": previous,
+                "currentTradingPeriod": {"regular": {"start": now - 3600, "end": now + 3600}},
+            },
+            "timestamp": [now],
+            "indicators": {"quote": [{"close": [price]}]},
+        }
+
+    def _respond(self, path: str) -> dict:
+        url = urlsplit(path)
+        if url.path.startswith("/v8/finance/chart/"):
+            symbol = unquote(url.path.rsplit("/", 1)[-1])
+            self.symbols_requested += 1
+            result = [self._chart(symbol)] if symbol in self.prices else []
+            return {"chart": {"result": result, "error": None}}
+
+        symbols = parse_qs(url.query).get("symbols", [""])[0].split(",")
+        self.symbols_requested += len(symbols)
+        result = [
+            {"symbol": symbol, "response": [self._chart(symbol)]}
+            for symbol in symbols if symbol in self.prices
+        ]
+        return {"spark": {"result": result, "error": None}}
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Local Yahoo Finance stub")
+    parser.add_argument("--port", type=int, default=54322)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--symbols", default="IWDA.AS,VWCE.DE,^AEX,^GSPC")
+    args = parser.parse_args()
+
+    stub = YahooStub(port=args.port, latency_ms=args.latency_ms)
+    stub.prices = {symbol: 100.0 for symbol in args.symbols.split(",")}
+    await stub.start()
+    print(f"Yahoo stub listening on {stub.base_url}/v8/finance/spark")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,18 +1,78 @@
-"""Audit logging service for trading activity with comprehensive logging."""
+"""
+Audit logging service for trading activity with comprehensive logging.
+
+log_action() never waits for the database on the request path. Rows go into
+a bounded in-process queue that one background writer drains, inserting
+them into trade_audit_log in bulk: a batch is sent when audit_batch_size
+rows are waiting or audit_flush_interval seconds after its first row.
+
+- Durable writes (order placement / rejection) pass durable=True: they go
+  through their own queue and writer, so they never wait behind buffered
+  rows, and the caller awaits the outcome - True once the row is in the
+  database, False if it only made it to the spill file.
+- When a bulk insert fails (database unreachable) the batch is appended to
+  data/audit_spill.jsonl (fsynced) and replayed every
+  audit_replay_interval seconds, so rows survive outages and restarts.
+  For audit_replay_interval seconds after a failure, batches go straight
+  to the spill file instead of waiting for another insert timeout; the
+  durable and buffered lanes keep separate windows.
+  Delivery is at-least-once: a timed-out insert that did reach the
+  database is inserted again on replay.
+- Only an outage (transport error, 5xx, 408, 429) spills. A batch the
+  database rejects (other 4xx) is bisected down to the offending rows,
+  which go to data/audit_rejected.jsonl with the error; the rest of the
+  batch is written.
+- When the queue is full, new rows are appended to the spill file directly
+  instead of blocking the request.
+- The spill file is shared by all workers. Appends hold a shared flock on
+  audit_spill.jsonl.lock and replay's rename an exclusive one, so no row
+  lands in a file being replayed; one process at a time replays
+  (audit_spill.jsonl.replay.lock).
+
+Lifecycle: the main.py lifespan starts the writer (start_audit_service) and
+flushes the queue on shutdown (close_audit_service). Scripts that never run
+the lifespan get the writer started lazily on their first audit row.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
 import httpx
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, one process per data directory
+    fcntl = None
+
 from config import get_settings, TradingMode
-from typing import Optional
-from datetime import datetime
-import logging
-import json
+from services.supabase_client import supabase_client
 
 logger = logging.getLogger(__name__)
 
+DATA_DIR = Path(__file__).parent.parent / "data"
+AUDIT_SPILL_FILE = DATA_DIR / "audit_spill.jsonl"
+AUDIT_REJECTED_FILE = DATA_DIR / "audit_rejected.jsonl"
+
+_STOP = object()
+
 
 class AuditService:
     """Service for logging all trading activity with full audit trail."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        spill_path: Path = AUDIT_SPILL_FILE,
+        rejected_path: Path = AUDIT_REJECTED_FILE,
+        queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        replay_interval: float = 30.0,
+    ):
         settings = get_settings()
         self.base_url = f"{settings.supabase_url}/rest/v1"
         self.headers = {
@@ -23,6 +83,32 @@ class AuditService:
         }
         self._configured = bool(settings.supabase_key)
 
+        self.spill_path = Path(spill_path)
+        self.rejected_path = Path(rejected_path)
+        self.replay_path = self.spill_path.with_suffix(self.spill_path.suffix + ".replay")
+        self.spill_lock_path = self.spill_path.with_suffix(self.spill_path.suffix + ".lock")
+        self.replay_lock_path = self.replay_path.with_suffix(self.replay_path.suffix + ".lock")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        # (row, future awaited by a durable caller or None)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Durable rows: unbounded, their callers wait anyway
+        self._durable_queue: asyncio.Queue = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+        self._durable_writer: Optional[asyncio.Task] = None
+        self._replayer: Optional[asyncio.Task] = None
+        # Loop time before which inserts are skipped after an outage, per lane (durable or not)
+        self._retry_at = {True: 0.0, False: 0.0}
+
+        self._written = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._spilled = 0
+        self._overflow = 0
+        self._replayed = 0
+        self._rejected = 0
+
     async def log_action(
         self,
         customer_id: int,
@@ -42,9 +128,16 @@ class AuditService:
         error_message: Optional[str] = None,
         ip_address: Optional[str] = None,
         user_agent: Optional[str] = None,
-        safety_warnings: Optional[list] = None
+        safety_warnings: Optional[list] = None,
+        durable: bool = False
     ) -> bool:
-        """Log a trading action to the audit log with full details."""
+        """
+        Log a trading action to the audit log with full details.
+
+        Queues the row for the background writer and returns immediately,
+        unless durable=True: then it waits for the row's batch to be written
+        and returns False if it could only be spilled to disk.
+        """
         timestamp = datetime.utcnow().isoformat()
 
         # Always log to console for immediate visibility
@@ -71,38 +164,312 @@ class AuditService:
             logger.debug("Audit service not configured - skipping database log")
             return True
 
+        row = {
+            "customer_id": customer_id,
+            "broker_account_id": broker_account_id,
+            "ib_account_id": ib_account_id,
+            "action": action,
+            "order_id": order_id,
+            "symbol": symbol,
+            "side": side,
+            "quantity": quantity,
+            "price": price,
+            "order_type": order_type,
+            "status": status,
+            "trading_mode": trading_mode,
+            "request_payload": request_payload,
+            "response_payload": response_payload,
+            "error_message": error_message,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "safety_warnings": safety_warnings
+        }
+        self.start()
+
+        if durable:
+            done = asyncio.get_running_loop().create_future()
+            self._durable_queue.put_nowait((row, done))
+            return await done
+
+        try:
+            self._queue.put_nowait((row, None))
+        except asyncio.QueueFull:
+            # Writer is far behind: keep the row, but don't make the request wait for the database
+            self._overflow += 1
+            await self._spill([row], sync=False)
+        return True
+
+    # =========================================================================
+    # Background writer
+    # =========================================================================
+
+    def start(self) -> None:
+        """Start the writer and replay tasks (idempotent)."""
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        if self._durable_writer is None or self._durable_writer.done():
+            self._durable_writer = asyncio.create_task(self._durable_write_loop())
+        if self._replayer is None or self._replayer.done():
+            self._replayer = asyncio.create_task(self._replay_loop())
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await self._queue.get()
+            if entry is _STOP:
+                return
+            batch, stop = [entry], False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                try:
+                    if self._queue.empty() and remaining > 0:
+                        entry = await asyncio.wait_for(self._queue.get(), remaining)
+                    else:
+                        entry = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            await self._write_batch(batch, durable=False)
+            if stop:
+                return
+
+    async def _durable_write_loop(self) -> None:
+        """Write durable rows as soon as they arrive, together with any others already waiting."""
+        while True:
+            entry = await self._durable_queue.get()
+            if entry is _STOP:
+                return
+            batch, stop = [entry], False
+            while len(batch) < self.batch_size and not self._durable_queue.empty():
+                entry = self._durable_queue.get_nowait()
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            await self._write_batch(batch, durable=True)
+            if stop:
+                return
+
+    async def _write_batch(self, batch: list, durable: bool) -> None:
+        """
+        Bulk insert a batch; spill it to disk during an outage, quarantine
+        rows the database rejects. Settles durable waiters.
+        """
+        rows = [row for row, _ in batch]
+        loop = asyncio.get_running_loop()
+        rejected: list[dict] = []
+        written = False
+        if loop.time() >= self._retry_at[durable]:
+            try:
+                rejected = await self._insert_valid(rows)
+                written = True
+                self._written += len(rows) - len(rejected)
+            except asyncio.CancelledError:
+                # Shutdown timed out mid-insert: keep the rows
+                self._append_spill(rows)
+                _settle(batch, False)
+                raise
+            except Exception as e:
+                self._failed_batches += 1
+                self._retry_at[durable] = loop.time() + self.replay_interval
+                logger.error(f"Error logging {len(rows)} audit actions to database, spilling to disk: {e}")
+        if not written:
+            await self._spill(rows)
+        elif rejected:
+            await self._quarantine(rejected)
+        self._batches += 1
+        if rejected:
+            rejected_ids = {id(row) for row, _ in rejected}
+            _settle([entry for entry in batch if id(entry[0]) in rejected_ids], False)
+        _settle(batch, written)
+
+    async def _insert_valid(self, rows: list[dict]) -> list[tuple[dict, str]]:
+        """
+        Insert rows, bisecting a batch the database rejects (4xx) to isolate
+        the offending rows. Returns [(row, error)] for those; raises on an outage.
+        """
+        try:
+            await self._insert(rows)
+            return []
+        except httpx.HTTPStatusError as e:
+            if not _is_rejection(e):
+                raise
+            if len(rows) == 1:
+                return [(rows[0], f"{e.response.status_code}: {e.response.text[:500]}")]
+        mid = len(rows) // 2
+        return await self._insert_valid(rows[:mid]) + await self._insert_valid(rows[mid:])
+
+    async def _quarantine(self, rejected: list[tuple[dict, str]]) -> None:
+        """Append rows the database rejected to the dead-letter file (never replayed)."""
+        self._rejected += len(rejected)
+        for row, error in rejected:
+            logger.error(f"Audit row rejected by database ({row.get('action')}), quarantined: {error}")
+        rejected_at = datetime.utcnow().isoformat()
+        data = "".join(
+            json.dumps({"rejected_at": rejected_at, "error": error, "row": row}, ensure_ascii=False) + "\n"
+            for row, error in rejected
+        )
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/trade_audit_log",
-                    headers=self.headers,
-                    json={
-                        "customer_id": customer_id,
-                        "broker_account_id": broker_account_id,
-                        "ib_account_id": ib_account_id,
-                        "action": action,
-                        "order_id": order_id,
-                        "symbol": symbol,
-                        "side": side,
-                        "quantity": quantity,
-                        "price": price,
-                        "order_type": order_type,
-                        "status": status,
-                        "trading_mode": trading_mode,
-                        "request_payload": request_payload,
-                        "response_payload": response_payload,
-                        "error_message": error_message,
-                        "ip_address": ip_address,
-                        "user_agent": user_agent,
-                        "safety_warnings": safety_warnings
-                    }
-                )
-                response.raise_for_status()
-                return True
+            await asyncio.to_thread(_append_file, self.rejected_path, data)
         except Exception as e:
-            logger.error(f"Error logging audit action to database: {e}")
-            # Still return True since we logged to console
-            return True
+            logger.error(f"Failed to quarantine {len(rejected)} rejected audit actions, dropping them: {e}")
+
+    async def _insert(self, rows: list[dict]) -> None:
+        async with supabase_client(timeout=10.0) as client:
+            response = await client.post(
+                f"{self.base_url}/trade_audit_log",
+                headers=self.headers,
+                json=rows
+            )
+            response.raise_for_status()
+
+    # =========================================================================
+    # Spill file
+    # =========================================================================
+
+    async def _spill(self, rows: list[dict], sync: bool = True) -> None:
+        """Append rows to the spill file off the event loop."""
+        try:
+            await asyncio.to_thread(self._append_spill, rows, sync)
+        except Exception as e:
+            logger.error(f"Failed to spill {len(rows)} audit actions, dropping them: {e}")
+
+    def _append_spill(self, rows: list[dict], sync: bool = True) -> None:
+        """Append rows to the spill file (fsynced unless sync=False)."""
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        with _locked(self.spill_lock_path, "shared"):
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(data)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        self._spilled += len(rows)
+
+    def _take_spill(self) -> Optional[list[dict]]:
+        """
+        Rows to replay: a replay file left by an interrupted replay, else the
+        spill file renamed to it. None if there is nothing to replay.
+        """
+        if not self.replay_path.exists():
+            if not self.spill_path.exists():
+                return None
+            # Exclusive: no append (in any process) can land in the renamed file
+            with _locked(self.spill_lock_path, "exclusive"):
+                if not self.spill_path.exists():
+                    return None
+                os.replace(self.spill_path, self.replay_path)
+        return _read_spill(self.replay_path)
+
+    async def _replay_loop(self) -> None:
+        while True:
+            try:
+                await self.replay()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Audit replay failed, retrying in {self.replay_interval:.0f}s: {e}")
+            await asyncio.sleep(self.replay_interval)
+
+    async def replay(self) -> int:
+        """
+        Insert spilled rows into the database. Returns the number replayed.
+
+        Skipped (returns 0) while another worker is replaying.
+        """
+        if not self.spill_path.exists() and not self.replay_path.exists():
+            return 0
+        self.replay_lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.replay_lock_path, "ab") as lock_file:
+            if not _flock(lock_file, "exclusive", blocking=False):
+                return 0
+            rows = await asyncio.to_thread(self._take_spill)
+            if not rows:
+                if rows is not None:
+                    self.replay_path.unlink(missing_ok=True)
+                return 0
+            done = rejected = 0
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    chunk = rows[start:start + self.batch_size]
+                    bad = await self._insert_valid(chunk)
+                    if bad:
+                        await self._quarantine(bad)
+                    done = start + len(chunk)
+                    rejected += len(bad)
+            except Exception:
+                self._retry_at[False] = asyncio.get_running_loop().time() + self.replay_interval
+                raise
+            finally:
+                self._replayed += done - rejected
+                if done == len(rows):
+                    self.replay_path.unlink()
+                elif done:
+                    await asyncio.to_thread(_write_spill, self.replay_path, rows[done:])
+        # The database is back: stop spilling new batches straight away
+        self._retry_at = {True: 0.0, False: 0.0}
+        replayed = done - rejected
+        logger.info(f"Replayed {replayed} spilled audit actions ({rejected} rejected)")
+        return replayed
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Write out queued rows (spilling what the database doesn't take) and stop."""
+        if self._replayer is not None:
+            self._replayer.cancel()
+            try:
+                await self._replayer
+            except asyncio.CancelledError:
+                pass
+            self._replayer = None
+        writers = []
+        for queue, writer in ((self._queue, self._writer), (self._durable_queue, self._durable_writer)):
+            if writer is not None and not writer.done():
+                await queue.put(_STOP)
+                writers.append(writer)
+        if writers:
+            _, pending = await asyncio.wait(writers, timeout=timeout)
+            if pending:
+                logger.warning("Audit writer did not finish in time, spilling the remaining queue")
+                for writer in pending:
+                    writer.cancel()
+                    try:
+                        await writer
+                    except asyncio.CancelledError:
+                        pass
+        self._writer = self._durable_writer = None
+
+        leftover = []
+        for queue in (self._queue, self._durable_queue):
+            while not queue.empty():
+                entry = queue.get_nowait()
+                if entry is not _STOP:
+                    leftover.append(entry)
+        if leftover:
+            await self._spill([row for row, _ in leftover])
+            _settle(leftover, False)
+
+    def get_stats(self) -> dict:
+        return {
+            "configured": self._configured,
+            "queued": self._queue.qsize(),
+            "queued_durable": self._durable_queue.qsize(),
+            "written": self._written,
+            "batches": self._batches,
+            "failed_batches": self._failed_batches,
+            "spilled": self._spilled,
+            "overflow": self._overflow,
+            "replayed": self._replayed,
+            "rejected": self._rejected,
+            "spill_pending": self.spill_path.exists() or self.replay_path.exists(),
+        }
 
     async def log_safety_block(
         self,
@@ -144,9 +511,9 @@ class AuditService:
         response_payload: dict,
         ip_address: str,
         safety_warnings: list = None
-    ):
-        """Log an order placement with full audit details."""
-        await self.log_action(
+    ) -> bool:
+        """Log an order placement with full audit details (durable: waits for the write)."""
+        return await self.log_action(
             customer_id=customer_id,
             action="order_placed",
             broker_account_id=broker_account_id,
@@ -161,7 +528,8 @@ class AuditService:
             request_payload=request_payload,
             response_payload=response_payload,
             ip_address=ip_address,
-            safety_warnings=safety_warnings
+            safety_warnings=safety_warnings,
+            durable=True
         )
 
     async def log_order_error(
@@ -177,9 +545,9 @@ class AuditService:
         error_message: str,
         request_payload: dict,
         ip_address: str
-    ):
-        """Log an order error with full audit details."""
-        await self.log_action(
+    ) -> bool:
+        """Log an order error with full audit details (durable: waits for the write)."""
+        return await self.log_action(
             customer_id=customer_id,
             action="order_rejected",
             broker_account_id=broker_account_id,
@@ -192,7 +560,40 @@ class AuditService:
             trading_mode=trading_mode,
             request_payload=request_payload,
             error_message=error_message,
-            ip_address=ip_address
+            ip_address=ip_address,
+            durable=True
+        )
+
+    async def log_order_unknown(
+        self,
+        customer_id: int,
+        broker_account_id: int,
+        ib_account_id: str,
+        symbol: str,
+        side: str,
+        quantity: float,
+        order_type: str,
+        trading_mode: str,
+        error_message: str,
+        request_payload: dict,
+        ip_address: str
+    ) -> bool:
+        """Log an order whose outcome at IB is unknown (durable: waits for the write)."""
+        return await self.log_action(
+            customer_id=customer_id,
+            action="order_unknown",
+            broker_account_id=broker_account_id,
+            ib_account_id=ib_account_id,
+            symbol=symbol,
+            side=side,
+            quantity=quantity,
+            order_type=order_type,
+            status="unknown",
+            trading_mode=trading_mode,
+            request_payload=request_payload,
+            error_message=error_message,
+            ip_address=ip_address,
+            durable=True
         )
 
     async def log_quote_request(
@@ -201,11 +602,12 @@ class AuditService:
         symbols: list[str],
         ip_address: str
     ):
-        """Log a quote request."""
+        """Log a quote request (the symbol column only fits one symbol, the list goes in the payload)."""
         await self.log_action(
             customer_id=customer_id,
             action="quote_requested",
-            symbol=",".join(symbols),
+            symbol=symbols[0] if len(symbols) == 1 else None,
+            request_payload={"symbols": symbols},
             ip_address=ip_address
         )
 
@@ -218,5 +620,89 @@ def get_audit_service() -> AuditService:
     """Get or create audit service singleton."""
     global _audit_service
     if _audit_service is None:
-        _audit_service = AuditService()
+        settings = get_settings()
+        _audit_service = AuditService(
+            queue_size=settings.audit_queue_size,
+            batch_size=settings.audit_batch_size,
+            flush_interval=settings.audit_flush_interval,
+            replay_interval=settings.audit_replay_interval,
+        )
     return _audit_service
+
+
+async def start_audit_service() -> None:
+    """Start the audit writer (main.py lifespan startup)."""
+    service = get_audit_service()
+    if service._configured:
+        service.start()
+
+
+async def close_audit_service() -> None:
+    """Flush queued audit rows and stop the writer (main.py lifespan shutdown)."""
+    global _audit_service
+    if _audit_service is not None:
+        await _audit_service.close()
+        _audit_service = None
+
+
+def _settle(batch: list, written: bool) -> None:
+    """Tell durable callers in a batch whether their row reached the database."""
+    for _, done in batch:
+        if done is not None and not done.done():
+            done.set_result(written)
+
+
+def _is_rejection(error: httpx.HTTPStatusError) -> bool:
+    """A 4xx the database will give again for the same rows (not a timeout or rate limit)."""
+    status = error.response.status_code
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+def _append_file(path: Path, data: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(data)
+
+
+def _flock(f, mode: str, blocking: bool = True) -> bool:
+    """Advisory lock (shared / exclusive) on an open file; False if busy and blocking=False."""
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_SH if mode == "shared" else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(f.fileno(), operation)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextmanager
+def _locked(path: Path, mode: str):
+    """Hold an advisory lock on `path` (created if missing) for the block."""
+    with open(path, "ab") as f:
+        _flock(f, mode)
+        yield  # Closing the file releases the lock
+
+
+def _read_spill(path: Path) -> list[dict]:
+    """Rows in a spill file (a torn last line is dropped)."""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return rows
+
+
+def _write_spill(path: Path, rows: list[dict]) -> None:
+    """Replace a spill file with `rows` (temp file + fsync + rename)."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -2,16 +2,20 @@
 
 Orchestrates batch order aggregation, execution via IB Gateway, and fill allocation.
 """
-import httpx
+import asyncio
+import time
 from decimal import Decimal
 from typing import Optional, List, Dict
 from datetime import datetime, timezone
 from collections import defaultdict
 from config import get_settings
+from services.supabase_client import supabase_client
 from services.order_intention_service import get_order_intention_service
 from services.virtual_portfolio_service import get_virtual_portfolio_service
+from services.fill_allocator import allocate_pro_rata
+from services.ib_client import order_outcome_unknown
+import numpy as np
 import logging
-import math
 
 logger = logging.getLogger(__name__)
 
@@ -26,9 +30,35 @@ class BatchExecutionError(Exception):
         super().__init__(self.message)
 
 
+class _SubmissionPacer:
+    """Spaces order submissions so IB's message-rate cap is never exceeded."""
+
+    def __init__(self, max_per_second: float):
+        self._interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Block until the next submission slot is free."""
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
 class BatchExecutionService:
     """Service for orchestrating batch order execution."""
 
+    # Max fill_allocations rows per bulk insert request
+    ALLOCATION_INSERT_CHUNK_SIZE = 5000
+
+    # Attempts (with 1s, 2s backoff) to mark intentions filled after allocation
+    INTENTION_UPDATE_ATTEMPTS = 3
+
     def __init__(self):
         settings = get_settings()
         self.base_url = f"{settings.supabase_url}/rest/v1"
@@ -69,7 +99,7 @@ class BatchExecutionService:
             scheduled_at = datetime.now(timezone.utc)
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.post(
                     f"{self.base_url}/batch_executions",
                     headers=self.headers,
@@ -94,7 +124,7 @@ class BatchExecutionService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/batch_executions",
                     headers=self.headers,
@@ -119,7 +149,7 @@ class BatchExecutionService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 update_data = {"status": status}
 
                 if status == "running":
@@ -156,8 +186,11 @@ class BatchExecutionService:
         Process:
         1. Get all pending intentions
         2. Group by (symbol, side)
-        3. Create aggregated_order records
-        4. Update intentions with batch_id and status='aggregated'
+        3. Create all aggregated_order records in one array POST
+        4. Tag all intentions with batch_id/aggregated_order_id and
+           status='aggregated' in one bulk update
+
+        Round-trips are constant in the number of intentions.
 
         Args:
             batch_id: Batch execution ID
@@ -191,52 +224,71 @@ class BatchExecutionService:
         aggregated_orders = []
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                for (symbol, conid, side), intentions in groups.items():
-                    total_quantity = sum(i["quantity"] for i in intentions)
-
-                    # Create aggregated order record
-                    response = await client.post(
-                        f"{self.base_url}/aggregated_orders",
-                        headers=self.headers,
-                        json={
+            # Create all aggregated order records in a single request
+            async with supabase_client(timeout=30.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/aggregated_orders",
+                    headers=self.headers,
+                    json=[
+                        {
                             "batch_id": batch_id,
                             "symbol": symbol,
                             "conid": conid,
                             "side": side,
-                            "total_quantity": total_quantity
+                            "total_quantity": sum(i["quantity"] for i in intentions)
                         }
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-                    agg_order = data[0] if isinstance(data, list) else data
-
-                    # Update intentions with batch_id and aggregated_order_id
-                    for intention in intentions:
-                        await intention_service.update_intention_status(
-                            intention_id=intention["id"],
-                            status="aggregated",
-                            batch_id=batch_id,
-                            aggregated_order_id=agg_order["id"]
-                        )
-
-                    agg_order["intentions"] = intentions
-                    aggregated_orders.append(agg_order)
-                    logger.info(f"Aggregated {len(intentions)} intentions for {side} {total_quantity} {symbol}")
-
-                # Update batch stats
-                total_value = sum(
-                    i.get("estimated_value", 0) or 0
-                    for intentions in groups.values()
-                    for i in intentions
+                        for (symbol, conid, side), intentions in groups.items()
+                    ]
+                )
+                response.raise_for_status()
+                created = response.json()
+
+            if len(created) != len(groups):
+                raise BatchExecutionError(
+                    f"Expected {len(groups)} aggregated orders, got {len(created)}",
+                    code="AGGREGATION_FAILED"
+                )
+
+            # Tag every intention with its aggregated order in one bulk update
+            intention_updates = []
+            for agg_order in created:
+                key = (agg_order["symbol"], agg_order["conid"], agg_order["side"])
+                intentions = groups[key]
+                intention_updates.extend(
+                    {
+                        "id": intention["id"],
+                        "status": "aggregated",
+                        "batch_id": batch_id,
+                        "aggregated_order_id": agg_order["id"]
+                    }
+                    for intention in intentions
+                )
+                agg_order["intentions"] = intentions
+                aggregated_orders.append(agg_order)
+                logger.info(
+                    f"Aggregated {len(intentions)} intentions for "
+                    f"{agg_order['side']} {agg_order['total_quantity']} {agg_order['symbol']}"
                 )
 
-                await self.update_batch_status(batch_id, "running", stats={
-                    "total_intentions": len(pending),
-                    "total_aggregated_orders": len(aggregated_orders),
-                    "total_users": len(user_ids),
-                    "total_value": total_value
-                })
+            if not await intention_service.bulk_update_intentions(intention_updates):
+                raise BatchExecutionError(
+                    "Failed to tag intentions with aggregated orders",
+                    code="AGGREGATION_FAILED"
+                )
+
+            # Update batch stats
+            total_value = sum(
+                i.get("estimated_value", 0) or 0
+                for intentions in groups.values()
+                for i in intentions
+            )
+
+            await self.update_batch_status(batch_id, "running", stats={
+                "total_intentions": len(pending),
+                "total_aggregated_orders": len(aggregated_orders),
+                "total_users": len(user_ids),
+                "total_value": total_value
+            })
 
         except Exception as e:
             logger.error(f"Error aggregating orders: {e}")
@@ -249,7 +301,7 @@ class BatchExecutionService:
     # ORDER EXECUTION
     # =========================================================================
 
-    async def execute_batch(self, batch_id: str) -> dict:
+    async def execute_batch(self, batch_id: str, concurrent: bool = None) -> dict:
         """
         Execute all aggregated orders via IB Gateway.
 
@@ -259,8 +311,15 @@ class BatchExecutionService:
         3. Record fill details
         4. Allocate fills to users
 
+        In concurrent mode (default, see settings.batch_concurrent_execution)
+        all orders are submitted in parallel, bounded by
+        settings.batch_max_concurrent_orders and paced to
+        settings.ib_max_orders_per_second. Fills are allocated as each
+        order completes.
+
         Args:
             batch_id: Batch execution ID
+            concurrent: Override settings.batch_concurrent_execution
 
         Returns:
             Execution summary
@@ -268,6 +327,9 @@ class BatchExecutionService:
         from services.ib_client import get_ib_client
 
         ib_client = get_ib_client()
+        settings = get_settings()
+        if concurrent is None:
+            concurrent = settings.batch_concurrent_execution
 
         # Check IB connection
         if not ib_client.is_connected():
@@ -286,53 +348,27 @@ class BatchExecutionService:
                 "fills": []
             }
 
-        successful = 0
-        partial = 0
-        failed = 0
-        results = []
-
-        for agg_order in aggregated_orders:
-            try:
-                result = await self._execute_single_order(ib_client, agg_order)
-
-                if result["status"] == "filled":
-                    successful += 1
-                    # Allocate fills to users
-                    await self.allocate_fills(
-                        aggregated_order_id=agg_order["id"],
-                        intentions=agg_order["intentions"],
-                        fill_price=result["fill_price"],
-                        filled_quantity=result["filled_quantity"]
-                    )
-                elif result["status"] == "partial":
-                    partial += 1
-                    await self.allocate_fills(
-                        aggregated_order_id=agg_order["id"],
-                        intentions=agg_order["intentions"],
-                        fill_price=result["fill_price"],
-                        filled_quantity=result["filled_quantity"]
-                    )
-                else:
-                    failed += 1
-                    # Mark intentions as rejected
-                    await self._reject_intentions(agg_order["intentions"], result.get("error", "Order rejected"))
-
-                results.append(result)
-
-            except Exception as e:
-                logger.error(f"Error executing order {agg_order['id']}: {e}")
-                failed += 1
-                await self._reject_intentions(agg_order["intentions"], str(e))
-                results.append({
-                    "aggregated_order_id": agg_order["id"],
-                    "status": "failed",
-                    "error": str(e)
-                })
+        counts = {"filled": 0, "partial": 0, "failed": 0, "unknown": 0, "intentions_not_updated": 0}
+        results_by_id = {}
+
+        if concurrent:
+            async for agg_order, result in self._execute_orders_concurrently(ib_client, aggregated_orders):
+                results_by_id[agg_order["id"]] = await self._process_order_result(agg_order, result, counts)
+        else:
+            for agg_order in aggregated_orders:
+                result = await self._execute_order_safe(ib_client, agg_order)
+                results_by_id[agg_order["id"]] = await self._process_order_result(agg_order, result, counts)
+
+        # Keep results in aggregation order regardless of completion order
+        results = [results_by_id[o["id"]] for o in aggregated_orders]
+        successful = counts["filled"]
+        partial = counts["partial"]
+        failed = counts["failed"]
 
         # Determine final batch status
         if failed == len(aggregated_orders):
             final_status = "failed"
-        elif failed > 0 or partial > 0:
+        elif failed > 0 or partial > 0 or counts["unknown"] > 0 or counts["intentions_not_updated"] > 0:
             final_status = "partial"
         else:
             final_status = "completed"
@@ -350,9 +386,88 @@ class BatchExecutionService:
             "successful": successful,
             "partial": partial,
             "failed": failed,
+            "unknown": counts["unknown"],
+            "intentions_not_updated": counts["intentions_not_updated"],
             "results": results
         }
 
+    async def _execute_orders_concurrently(self, ib_client, aggregated_orders: List[dict]):
+        """
+        Submit all aggregated orders in parallel and yield results as they complete.
+
+        Concurrency is bounded by a semaphore; submissions are spaced so the
+        IB message rate stays under settings.ib_max_orders_per_second.
+
+        Yields:
+            (agg_order, result) tuples in completion order
+        """
+        settings = get_settings()
+        semaphore = asyncio.Semaphore(max(1, settings.batch_max_concurrent_orders))
+        pacer = _SubmissionPacer(settings.ib_max_orders_per_second)
+
+        async def run(agg_order: dict):
+            async with semaphore:
+                await pacer.wait()
+                return agg_order, await self._execute_order_safe(ib_client, agg_order)
+
+        logger.info(
+            f"Submitting {len(aggregated_orders)} orders concurrently "
+            f"(max {settings.batch_max_concurrent_orders} in flight, "
+            f"{settings.ib_max_orders_per_second}/s)"
+        )
+        for next_done in asyncio.as_completed([run(o) for o in aggregated_orders]):
+            yield await next_done
+
+    async def _execute_order_safe(self, ib_client, agg_order: dict) -> dict:
+        """Execute a single order, converting unexpected errors into a failed result."""
+        try:
+            return await self._execute_single_order(ib_client, agg_order)
+        except Exception as e:
+            logger.error(f"Error executing order {agg_order['id']}: {e}")
+            return {
+                "aggregated_order_id": agg_order["id"],
+                "status": "failed",
+                "error": str(e)
+            }
+
+    async def _process_order_result(self, agg_order: dict, result: dict, counts: dict) -> dict:
+        """Allocate fills (or reject intentions) for one executed order and tally it."""
+        try:
+            if result["status"] in ("filled", "partial"):
+                # Allocate fills to users
+                allocations = await self.allocate_fills(
+                    aggregated_order_id=agg_order["id"],
+                    intentions=agg_order["intentions"],
+                    fill_price=result["fill_price"],
+                    filled_quantity=result["filled_quantity"]
+                )
+                counts[result["status"]] += 1
+                stale = [a["order_intention_id"] for a in allocations if not a["intention_status_updated"]]
+                if stale:
+                    # Filled at IB but still pending in order_intentions
+                    counts["intentions_not_updated"] += len(stale)
+                    result = {**result, "intentions_not_updated": stale}
+            elif result["status"] == "unknown":
+                # May be live at IB: keep the intentions' reserved cash
+                counts["unknown"] += 1
+                await self._hold_intentions(agg_order["intentions"], result["error"])
+            else:
+                counts["failed"] += 1
+                # Mark intentions as rejected
+                await self._reject_intentions(agg_order["intentions"], result.get("error", "Order rejected"))
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Error executing order {agg_order['id']}: {e}")
+            counts["failed"] += 1
+            await self._reject_intentions(agg_order["intentions"], str(e))
+            return {
+                "aggregated_order_id": agg_order["id"],
+                "status": "failed",
+                "error": str(e)
+            }
+
     async def _execute_single_order(self, ib_client, agg_order: dict) -> dict:
         """Execute a single aggregated order via IB Gateway."""
         symbol = agg_order["symbol"]
@@ -364,7 +479,7 @@ class BatchExecutionService:
 
         try:
             # Update aggregated order with submitted timestamp
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 await client.patch(
                     f"{self.base_url}/aggregated_orders",
                     headers=self.headers,
@@ -372,42 +487,91 @@ class BatchExecutionService:
                     json={"submitted_at": datetime.now(timezone.utc).isoformat()}
                 )
 
-            # Place order via IB Gateway
+            def _log_partial_fill(trade, fill):
+                logger.info(
+                    f"Fill for {side} {symbol}: {fill.execution.shares} @ {fill.execution.price} "
+                    f"({trade.orderStatus.filled}/{quantity} filled)"
+                )
+
+            # Place order via IB Gateway and wait for a terminal state
             order_result = await ib_client.place_order(
-                symbol=symbol,
+                account_id=ib_client.get_primary_account(),
                 conid=conid,
-                side=side.lower(),
+                side=side.upper(),
                 quantity=quantity,
-                order_type="MKT"
+                order_type="MKT",
+                wait_for_fill=True,
+                on_fill=_log_partial_fill
             )
 
+            if order_outcome_unknown(order_result):
+                logger.error(f"Order for {side} {quantity} {symbol} has unknown outcome: {order_result.get('message')}")
+                async with supabase_client(timeout=10.0) as client:
+                    await client.patch(
+                        f"{self.base_url}/aggregated_orders",
+                        headers=self.headers,
+                        params={"id": f"eq.{agg_order['id']}"},
+                        json={"ib_status": "unknown"}
+                    )
+                return {
+                    "aggregated_order_id": agg_order["id"],
+                    "status": "unknown",
+                    "order_ref": order_result.get("order_ref"),
+                    "error": f"Outcome unknown, reconcile IB orderRef {order_result.get('order_ref')}"
+                }
+
             if order_result.get("error"):
                 return {
                     "aggregated_order_id": agg_order["id"],
                     "status": "failed",
-                    "error": order_result["error"]
+                    "error": order_result.get("message", "Order rejected")
                 }
 
+            details = order_result.get("details", {})
             ib_order_id = order_result.get("orderId")
-            fill_price = order_result.get("avgPrice") or order_result.get("lastFillPrice")
-            filled_quantity = order_result.get("filledQuantity", quantity)
+            ib_status = order_result.get("status")
+
+            # Deadline passed with the order still working: cancel the rest and
+            # wait for IB to confirm, then allocate the final fills (including
+            # any that arrived while the cancel was in flight)
+            if ib_status not in ("Filled", "Cancelled", "ApiCancelled", "Inactive"):
+                logger.warning(f"Order {ib_order_id} for {symbol} still {ib_status} at deadline, cancelling remainder")
+                cancel_result = await ib_client.cancel_order(ib_order_id, wait_for_done=True)
+                if "filled" in cancel_result:
+                    ib_status = cancel_result["status"]
+                    details = {**details, "filled": cancel_result["filled"], "avgFillPrice": cancel_result["avgFillPrice"]}
+                if ib_status not in ("Filled", "Cancelled", "ApiCancelled", "Inactive"):
+                    logger.error(
+                        f"Order {ib_order_id} for {symbol} still {ib_status} after cancel "
+                        f"({cancel_result.get('message')}); later fills will not be allocated"
+                    )
+            fill_price = details.get("avgFillPrice") or None
+            filled_quantity = int(details.get("filled") or 0)
 
             # Update aggregated order with fill details
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 await client.patch(
                     f"{self.base_url}/aggregated_orders",
                     headers=self.headers,
                     params={"id": f"eq.{agg_order['id']}"},
                     json={
                         "ib_order_id": str(ib_order_id),
-                        "ib_status": "Filled",
+                        "ib_status": ib_status,
                         "filled_quantity": filled_quantity,
                         "avg_fill_price": fill_price,
                         "total_fill_value": fill_price * filled_quantity if fill_price else None,
-                        "filled_at": datetime.now(timezone.utc).isoformat()
+                        "filled_at": datetime.now(timezone.utc).isoformat() if filled_quantity > 0 else None
                     }
                 )
 
+            if filled_quantity <= 0 or not fill_price:
+                return {
+                    "aggregated_order_id": agg_order["id"],
+                    "status": "failed",
+                    "ib_order_id": ib_order_id,
+                    "error": f"Order not filled (IB status: {ib_status})"
+                }
+
             status = "filled" if filled_quantity >= quantity else "partial"
 
             return {
@@ -416,7 +580,7 @@ class BatchExecutionService:
                 "ib_order_id": ib_order_id,
                 "filled_quantity": filled_quantity,
                 "fill_price": fill_price,
-                "total_value": fill_price * filled_quantity if fill_price else None
+                "total_value": fill_price * filled_quantity
             }
 
         except Exception as e:
@@ -448,6 +612,17 @@ class BatchExecutionService:
                     order_id=intention["id"]
                 )
 
+    async def _hold_intentions(self, intentions: List[dict], reason: str):
+        """Mark intentions of an order with unknown outcome as submitted, keeping reserved cash."""
+        intention_service = get_order_intention_service()
+
+        for intention in intentions:
+            await intention_service.update_intention_status(
+                intention_id=intention["id"],
+                status="submitted",
+                message=reason
+            )
+
     # =========================================================================
     # FILL ALLOCATION
     # =========================================================================
@@ -463,10 +638,11 @@ class BatchExecutionService:
         Distribute fills to individual users pro-rata.
 
         Algorithm:
-        1. Calculate each user's percentage: user_qty / total_qty
-        2. Allocate filled shares proportionally
-        3. Handle rounding (favor smaller orders first)
-        4. Update user portfolios
+        1. Compute every user's share in one pass (largest-remainder,
+           see services.fill_allocator.allocate_pro_rata)
+        2. Insert all fill_allocations rows in bulk
+        3. Update all intention statuses in one bulk call
+        4. Apply all allocations to user portfolios in one transaction
 
         Args:
             aggregated_order_id: Aggregated order ID
@@ -475,89 +651,103 @@ class BatchExecutionService:
             filled_quantity: Total filled quantity
 
         Returns:
-            List of fill allocation records
+            List of fill allocation records, in intention order. Each carries
+            applied_to_portfolio and intention_status_updated (False if the
+            intention is still pending although its fill was allocated)
         """
         if not intentions or filled_quantity <= 0 or fill_price is None:
             return []
 
-        total_requested = sum(i["quantity"] for i in intentions)
-        fill_ratio = Decimal(filled_quantity) / Decimal(total_requested)
+        requested = np.fromiter((i["quantity"] for i in intentions), dtype=np.int64, count=len(intentions))
+        allocated = allocate_pro_rata(requested, filled_quantity)
+        total_requested = int(requested.sum())
 
-        # Sort by quantity ascending (smaller orders get rounding favor)
-        sorted_intentions = sorted(intentions, key=lambda x: x["quantity"])
-
-        allocations = []
-        remaining = filled_quantity
-        fill_price_decimal = Decimal(str(fill_price))
+        price = float(fill_price)
+        pct = allocated / total_requested
+        cost = allocated * price
 
         intention_service = get_order_intention_service()
-        portfolio_service = get_virtual_portfolio_service()
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                for i, intention in enumerate(sorted_intentions):
-                    user_id = intention["user_id"]
-                    requested = intention["quantity"]
-
-                    # Calculate allocation
-                    if i == len(sorted_intentions) - 1:
-                        # Last user gets remainder
-                        allocated = remaining
-                    else:
-                        # Pro-rata with floor rounding
-                        allocated = int(math.floor(Decimal(requested) * fill_ratio))
-
-                    remaining -= allocated
-                    allocation_pct = Decimal(allocated) / Decimal(total_requested)
-                    total_cost = fill_price_decimal * Decimal(allocated)
-
-                    # Create fill allocation record
+            # Bulk insert allocation records (chunked to bound request size)
+            rows = [
+                {
+                    "aggregated_order_id": aggregated_order_id,
+                    "order_intention_id": intention["id"],
+                    "user_id": intention["user_id"],
+                    "requested_quantity": intention["quantity"],
+                    "allocated_quantity": int(allocated[idx]),
+                    "allocation_percentage": float(pct[idx]),
+                    "fill_price": price,
+                    "total_cost": float(cost[idx]),
+                    "applied_to_portfolio": False
+                }
+                for idx, intention in enumerate(intentions)
+            ]
+
+            inserted = []
+            async with supabase_client(timeout=60.0) as client:
+                for start in range(0, len(rows), self.ALLOCATION_INSERT_CHUNK_SIZE):
                     response = await client.post(
                         f"{self.base_url}/fill_allocations",
                         headers=self.headers,
-                        json={
-                            "aggregated_order_id": aggregated_order_id,
-                            "order_intention_id": intention["id"],
-                            "user_id": user_id,
-                            "requested_quantity": requested,
-                            "allocated_quantity": allocated,
-                            "allocation_percentage": float(allocation_pct),
-                            "fill_price": float(fill_price_decimal),
-                            "total_cost": float(total_cost),
-                            "applied_to_portfolio": False
-                        }
+                        json=rows[start:start + self.ALLOCATION_INSERT_CHUNK_SIZE]
                     )
                     response.raise_for_status()
-                    data = response.json()
-                    allocation = data[0] if isinstance(data, list) else data
-
-                    # Update intention with fill details
-                    status = "filled" if allocated >= requested else "partially_filled"
-                    await intention_service.update_intention_status(
-                        intention_id=intention["id"],
-                        status=status,
-                        filled_quantity=allocated,
-                        fill_price=float(fill_price_decimal),
-                        fill_value=float(total_cost)
-                    )
-
-                    # Apply to portfolio
-                    await self._apply_allocation_to_portfolio(
-                        user_id=user_id,
-                        intention=intention,
-                        allocated_quantity=allocated,
-                        fill_price=fill_price_decimal,
-                        total_cost=total_cost,
-                        allocation_id=allocation["id"]
-                    )
-
-                    allocation["applied_to_portfolio"] = True
-                    allocations.append(allocation)
+                    inserted.extend(response.json())
+
+            # PostgREST does not promise response rows in request order
+            by_intention = {row["order_intention_id"]: row for row in inserted}
+            missing = [i["id"] for i in intentions if i["id"] not in by_intention]
+            if missing:
+                raise BatchExecutionError(
+                    f"Expected {len(rows)} fill allocations, got {len(inserted)} (missing {len(missing)})",
+                    code="ALLOCATION_FAILED"
+                )
+            allocations = [by_intention[i["id"]] for i in intentions]
+
+            # Update all intentions with their fill details in one call
+            status_updates = [
+                {
+                    "id": intention["id"],
+                    "status": "filled" if allocated[idx] >= intention["quantity"] else "partially_filled",
+                    "filled_quantity": int(allocated[idx]),
+                    "fill_price": price,
+                    "fill_value": float(cost[idx])
+                }
+                for idx, intention in enumerate(intentions)
+            ]
+            updated = False
+            for attempt in range(1, self.INTENTION_UPDATE_ATTEMPTS + 1):
+                if await intention_service.bulk_update_intentions(status_updates):
+                    updated = True
+                    break
+                if attempt < self.INTENTION_UPDATE_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+            if not updated:
+                logger.error(
+                    f"Failed to update intention fill status for aggregated order {aggregated_order_id} "
+                    f"after {self.INTENTION_UPDATE_ATTEMPTS} attempts"
+                )
+            for allocation in allocations:
+                allocation["intention_status_updated"] = updated
+
+            # Apply to portfolios: one transactional RPC for the whole order
+            result = await get_virtual_portfolio_service().apply_fill_allocations(aggregated_order_id)
+            if result.get("success"):
+                skipped = {row.get("allocation_id") for row in result.get("skipped") or []}
+                for allocation in allocations:
+                    allocation["applied_to_portfolio"] = allocation["id"] not in skipped
+            else:
+                logger.error(
+                    f"Fill allocations for aggregated order {aggregated_order_id} not applied to portfolios: "
+                    f"{result.get('error')}"
+                )
 
-                    logger.info(
-                        f"Allocated {allocated}/{requested} shares of {intention['symbol']} "
-                        f"to user {user_id} at {fill_price}"
-                    )
+            logger.info(
+                f"Allocated {int(allocated.sum())}/{total_requested} shares of {intentions[0]['symbol']} "
+                f"to {len(intentions)} intentions at {fill_price}"
+            )
 
         except Exception as e:
             logger.error(f"Error allocating fills: {e}")
@@ -565,84 +755,6 @@ class BatchExecutionService:
 
         return allocations
 
-    async def _apply_allocation_to_portfolio(
-        self,
-        user_id: int,
-        intention: dict,
-        allocated_quantity: int,
-        fill_price: Decimal,
-        total_cost: Decimal,
-        allocation_id: str
-    ):
-        """Apply a fill allocation to a user's virtual portfolio."""
-        portfolio_service = get_virtual_portfolio_service()
-
-        symbol = intention["symbol"]
-        conid = intention["conid"]
-        side = intention["side"]
-        reserved = Decimal(str(intention.get("reserved_amount", 0)))
-
-        if side == "BUY":
-            # Deduct cost from cash (from reserved)
-            await portfolio_service.deduct_cash(
-                user_id=user_id,
-                amount=total_cost,
-                from_reserved=True,
-                order_id=intention["id"],
-                description=f"Buy {allocated_quantity} {symbol} @ {fill_price}"
-            )
-
-            # Release excess reserved cash
-            excess = reserved - total_cost
-            if excess > 0:
-                await portfolio_service.release_reserved_cash(
-                    user_id=user_id,
-                    amount=excess,
-                    order_id=intention["id"]
-                )
-
-            # Add shares to holdings
-            await portfolio_service.add_holding(
-                user_id=user_id,
-                symbol=symbol,
-                conid=conid,
-                quantity=Decimal(allocated_quantity),
-                cost_basis=fill_price,
-                isin=intention.get("isin"),
-                name=intention.get("name")
-            )
-
-        elif side == "SELL":
-            # Remove shares from holdings
-            cost_basis = await portfolio_service.remove_holding(
-                user_id=user_id,
-                symbol=symbol,
-                quantity=Decimal(allocated_quantity)
-            )
-
-            # Credit cash to portfolio
-            await portfolio_service.credit_cash(
-                user_id=user_id,
-                amount=total_cost,
-                order_id=intention["id"],
-                description=f"Sell {allocated_quantity} {symbol} @ {fill_price}"
-            )
-
-        # Mark allocation as applied
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                await client.patch(
-                    f"{self.base_url}/fill_allocations",
-                    headers=self.headers,
-                    params={"id": f"eq.{allocation_id}"},
-                    json={
-                        "applied_to_portfolio": True,
-                        "applied_at": datetime.now(timezone.utc).isoformat()
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Error updating allocation applied status: {e}")
-
     # =========================================================================
     # BATCH HISTORY
     # =========================================================================
@@ -653,7 +765,7 @@ class BatchExecutionService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/batch_executions",
                     headers=self.headers,
@@ -4,10 +4,10 @@ All cash mutations go through PostgreSQL stored procedures for atomicity
 and row-level locking. This replaces the non-transactional cash methods
 in virtual_portfolio_service.py.
 """
-import httpx
 from decimal import Decimal
 from typing import Optional
 from config import get_settings
+from services.supabase_client import supabase_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -50,7 +50,7 @@ class CashAllocationService:
         if not self._configured:
             raise CashAllocationError("Service not configured", code="NOT_CONFIGURED")
 
-        async with httpx.AsyncClient(timeout=15.0) as client:
+        async with supabase_client(timeout=15.0) as client:
             response = await client.post(
                 f"{self.rpc_url}/{function_name}",
                 headers=self.headers,
@@ -239,7 +239,7 @@ class CashAllocationService:
         if not self._configured:
             return None
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{self.rest_url}/virtual_accounts",
                 headers=self.headers,
@@ -257,7 +257,7 @@ class CashAllocationService:
         if not self._configured:
             return {"total_assigned": 0, "total_reserved": 0, "total_available": 0}
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{self.rest_url}/virtual_accounts",
                 headers=self.headers,
@@ -282,7 +282,7 @@ class CashAllocationService:
         if not self._configured:
             return []
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.get(
                 f"{self.rest_url}/cash_allocation_log",
                 headers=self.headers,
@@ -0,0 +1,1020 @@
+"""
+Community Repository.
+
+Single in-memory store for the community data that the portfolios,
+community, competitions and notifications routers share:
+
+- portfolios     (data/community_portfolios.json)
+- follows        (data/portfolio_follows.json)
+- snapshots      (data/performance_snapshots.json)
+- competitions   (data/competitions.json)
+- notifications  (data/notifications.json)
+
+The JSON files are read once at startup. Reads are served from dicts with
+secondary indexes (public portfolios, portfolios per creator, follows per
+user / per portfolio, snapshots per portfolio sorted by timestamp,
+notifications per user sorted by created_at, with unread counters), so
+no request parses or rewrites a whole file. Leaderboards over the public
+portfolios (services/leaderboards.py) are maintained the same way: writes
+mark the portfolios they touch, and each mutation re-ranks only those.
+
+Durability:
+- Every mutation is appended as one JSON line to data/community.wal
+  *before* it is applied in memory. A line holds all ops of one mutation
+  (e.g. follow record + follower count), so replay is all-or-nothing per
+  mutation; a torn last line from a crash is dropped.
+- fsync policy (settings.community_wal_fsync):
+    always   - fsync after every mutation
+    interval - fsync from the maintenance task every
+               community_wal_fsync_interval seconds (default)
+    never    - leave flushing to the OS
+- Compaction rotates the WAL to a numbered segment, writes the JSON files
+  of the changed collections (compact JSON) from a shallow copy in a
+  worker thread, then renames them into place and deletes the segment. It
+  runs when the WAL reaches community_compact_wal_entries lines, every
+  community_compact_interval seconds if anything changed, and on shutdown.
+  Startup replays leftover segments and the WAL on top of the JSON files;
+  ops are full-record puts/deletes, so replaying twice is harmless.
+
+Several processes (uvicorn workers, scripts/generate_snapshots.py) can
+share one data directory. The WAL is the shared log: each process keeps
+its own in-memory copy and tails the WAL for entries the others append
+(a stat() at most every community_wal_poll_interval on reads, and from the
+maintenance task; writes always catch up first).
+Advisory locks on community.wal.lock order the processes:
+- shared:    loading (JSON files + segments + WAL)
+- exclusive: appending a mutation (after catching up, so checks such as
+             "already following" see every process's writes), rotating
+             the WAL, and renaming compacted files into place
+Readers never take it. Only one process compacts at a time
+(community.wal.compact.lock); the others notice the rotation and follow
+the new WAL.
+
+Stored records are never modified in place - every write replaces the
+record - which is what lets compaction serialize a shallow copy while
+requests keep writing. Callers must treat returned dicts as read-only and
+write through the repository methods.
+
+Lifecycle:
+- Startup: get_community_repository() + start() (main.py lifespan)
+- Shutdown: close() - final fsync and compaction
+Scripts that never run the lifespan get a repository loaded lazily on first
+use and should call close_sync() when done.
+"""
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from services.leaderboards import Leaderboards
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, one process per data directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+PORTFOLIOS = "portfolios"
+FOLLOWS = "follows"
+SNAPSHOTS = "snapshots"
+COMPETITIONS = "competitions"
+NOTIFICATIONS = "notifications"
+
+COLLECTION_FILES = {
+    PORTFOLIOS: "community_portfolios.json",
+    FOLLOWS: "portfolio_follows.json",
+    SNAPSHOTS: "performance_snapshots.json",
+    COMPETITIONS: "competitions.json",
+    NOTIFICATIONS: "notifications.json",
+}
+
+WAL_FILE = "community.wal"
+WRITE_LOCK_FILE = f"{WAL_FILE}.lock"
+COMPACT_LOCK_FILE = f"{WAL_FILE}.compact.lock"
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def _utc_now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _snapshot_type(snapshot: dict) -> Optional[str]:
+    # community.py / generate_snapshots.py write period_type, portfolios.py snapshot_type
+    return snapshot.get("period_type") or snapshot.get("snapshot_type")
+
+
+class CommunityRepository:
+    """Indexed in-memory community data persisted through a write-ahead log."""
+
+    def __init__(
+        self,
+        data_dir: Path = DATA_DIR,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        compact_wal_entries: int = 10_000,
+        compact_interval: float = 300.0,
+        poll_interval: float = 0.02,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown WAL fsync policy: {fsync}")
+
+        self.data_dir = Path(data_dir)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_wal_entries = compact_wal_entries
+        self.compact_interval = compact_interval
+        self.poll_interval = poll_interval
+
+        # Primary tables: collection -> {id: record}
+        self._tables: dict[str, dict] = {name: {} for name in COLLECTION_FILES}
+        self._portfolios = self._tables[PORTFOLIOS]
+        self._follows = self._tables[FOLLOWS]
+        self._snapshots = self._tables[SNAPSHOTS]
+        self._competitions = self._tables[COMPETITIONS]
+        self._notifications = self._tables[NOTIFICATIONS]
+
+        # Secondary indexes
+        self._public: dict[str, dict] = {}                # portfolio_id -> portfolio
+        self._by_creator: dict[str, dict] = {}            # creator_id -> {portfolio_id: None}
+        self._following: dict[str, dict] = {}             # user_id -> {portfolio_id: follow_id}
+        self._followers: dict[str, dict] = {}             # portfolio_id -> {user_id: follow_id}
+        self._snapshot_keys: dict[str, list] = {}         # portfolio_id -> sorted [(timestamp, snapshot_id)]
+        self._inbox: dict[str, list] = {}                 # user_id -> sorted [(created_at, notification_id)]
+        self._unread: dict[str, int] = {}                 # user_id -> unread notifications
+        self._leaderboards = Leaderboards(self._portfolios.get)
+
+        # Top-level keys of the JSON files we don't manage (last_updated, ...)
+        self._file_extras: dict[str, dict] = {name: {} for name in COLLECTION_FILES}
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._write_lock_file = None      # community.wal.lock (cross-process)
+        self._compact_lock_file = None    # community.wal.compact.lock
+        self._write_depth = 0
+        self._wal = None                  # Append handle
+        self._tail = None                 # Read handle, follows other processes' appends
+        self._tail_ino = None
+        self._tail_offset = 0             # End of the last complete line applied
+        self._tail_size = 0               # Bytes seen (incl. a partial line being written)
+        self._next_poll = 0.0
+        self._wal_entries = 0
+        self._unsynced = False
+        self._dirty: set[str] = set()
+        self._last_compaction = time.monotonic()
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._loaded = False
+
+    # =========================================================================
+    # LOADING
+    # =========================================================================
+
+    @property
+    def wal_path(self) -> Path:
+        return self.data_dir / WAL_FILE
+
+    def _segments(self) -> list[tuple[int, Path]]:
+        """Rotated WAL segments waiting for compaction, oldest first."""
+        segments = []
+        for path in self.data_dir.glob(f"{WAL_FILE}.*"):
+            suffix = path.name[len(WAL_FILE) + 1:]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def load(self) -> None:
+        """Load the JSON files, replay the WAL and open it for appending."""
+        with self._lock:
+            if self._loaded:
+                return
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
+
+            self._write_lock_file = open(self.data_dir / WRITE_LOCK_FILE, "ab")
+            self._compact_lock_file = open(self.data_dir / COMPACT_LOCK_FILE, "ab")
+            # Shared: no other process appends, rotates or publishes while we read
+            _flock(self._write_lock_file, "shared")
+            try:
+                for collection in COLLECTION_FILES:
+                    self._load_collection(collection)
+                # Loading the files is not a change; only replayed entries are
+                self._dirty.clear()
+
+                replayed = 0
+                for _, path in self._segments():
+                    replayed += self._replay(path)
+                self._open_wal()
+                replayed += self._catch_up()
+            finally:
+                _flock(self._write_lock_file, "unlock")
+
+            self._wal_entries = replayed
+            self._leaderboards.refresh()
+            self._loaded = True
+
+            logger.info(
+                f"Community store loaded in {(time.perf_counter() - start) * 1000:.0f} ms: "
+                f"{len(self._portfolios)} portfolios, {len(self._follows)} follows, "
+                f"{len(self._snapshots)} snapshots, {len(self._competitions)} competitions, "
+                f"{len(self._notifications)} notifications ({replayed} WAL entries replayed)"
+            )
+
+    def _load_collection(self, collection: str) -> None:
+        path = self.data_dir / COLLECTION_FILES[collection]
+        if not path.exists():
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Could not load {path}: {e}")
+            return
+
+        records = data.get(collection) or {}
+        if isinstance(records, list):
+            # notifications.json stores a list
+            records = {record["id"]: record for record in records if record.get("id")}
+        for key, record in records.items():
+            self._apply("put", collection, key, record)
+
+        # Derived indexes are rebuilt on write; keep everything else
+        derived = {collection, "by_user", "by_portfolio", "by_type", "last_updated"}
+        self._file_extras[collection] = {k: v for k, v in data.items() if k not in derived}
+
+    def _replay(self, path: Path) -> int:
+        """Apply a rotated WAL segment (no longer appended to)."""
+        if not path.exists():
+            return 0
+        with open(path, "rb") as f:
+            count, good_end = self._apply_lines(f.read(), path.name)
+        if good_end < path.stat().st_size:
+            # Cut the torn tail so the segment stays replayable
+            os.truncate(path, good_end)
+        return count
+
+    def _apply_lines(self, data: bytes, source: str) -> tuple[int, int]:
+        """Apply the complete WAL lines in `data`. Returns (entries, bytes consumed)."""
+        count = 0
+        good_end = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # Being written by another process, or torn by a crash
+            try:
+                ops = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Dropping unreadable WAL entry at byte {good_end} of {source}")
+            else:
+                for op, collection, key, record in ops:
+                    self._apply(op, collection, key, record)
+                count += 1
+            good_end += len(line)
+        return count, good_end
+
+    # =========================================================================
+    # WAL TAILING (entries appended by other processes)
+    # =========================================================================
+
+    def _open_wal(self) -> None:
+        """(Re)open the current WAL for appending and tail it from the start."""
+        for handle in (self._wal, self._tail):
+            if handle is not None:
+                handle.close()
+        self._wal = open(self.wal_path, "ab")
+        self._tail = open(self.wal_path, "rb")
+        self._tail_ino = os.fstat(self._tail.fileno()).st_ino
+        self._tail_offset = 0
+        self._tail_size = 0
+
+    def _read_tail(self, writer: bool) -> int:
+        self._tail.seek(self._tail_offset)
+        data = self._tail.read()
+        count, consumed = self._apply_lines(data, WAL_FILE)
+        self._tail_offset += consumed
+        self._tail_size = self._tail_offset + (len(data) - consumed)
+        if writer and self._tail_size > self._tail_offset:
+            # We hold the write lock, so nobody is mid-append: a process died mid-line
+            logger.warning(f"Dropping incomplete WAL entry at byte {self._tail_offset} of {WAL_FILE}")
+            os.truncate(self.wal_path, self._tail_offset)
+            self._tail_size = self._tail_offset
+        return count
+
+    def _catch_up(self, writer: bool = False) -> int:
+        """
+        Apply WAL entries appended by other processes. Caller holds the lock.
+
+        If another process compacted meanwhile, finish the rotated file
+        (nothing is appended to it after the rotation) and follow the new
+        WAL. The compacting process folds the old entries into the JSON
+        files, so our changed collections are reset.
+        """
+        count = self._read_tail(writer)
+        while True:
+            try:
+                ino = os.stat(self.wal_path).st_ino
+            except FileNotFoundError:
+                break  # Mid-rotation; the next read picks up the new WAL
+            if ino == self._tail_ino:
+                break
+            count += self._read_tail(writer)
+            self._open_wal()
+            self._dirty.clear()
+            self._wal_entries = 0
+            self._last_compaction = time.monotonic()
+            count += self._read_tail(writer)
+        if count:
+            self._wal_entries += count
+            self._leaderboards.refresh()
+        return count
+
+    def _poll(self) -> None:
+        """Catch up if the WAL changed since we last looked (one stat() per poll_interval)."""
+        if not self._loaded:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        try:
+            st = os.stat(self.wal_path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._tail_ino or st.st_size != self._tail_size:
+            with self._lock:
+                if self._loaded:
+                    self._catch_up()
+
+    # =========================================================================
+    # WRITE PATH
+    # =========================================================================
+
+    @contextmanager
+    def _write(self):
+        """
+        Hold the store for one mutation: the in-process lock, the exclusive
+        cross-process lock, and every entry other processes appended before.
+        With fsync=always the WAL is fsynced after both locks are released.
+        """
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            outer = self._write_depth == 0
+            if outer:
+                _flock(self._write_lock_file, "exclusive")
+            self._write_depth += 1
+            try:
+                if outer:
+                    self._catch_up(writer=True)
+                yield
+            finally:
+                self._write_depth -= 1
+                if outer:
+                    _flock(self._write_lock_file, "unlock")
+        if outer and self.fsync == "always":
+            self.sync()
+
+    def _commit(self, ops: list) -> None:
+        """Append one mutation to the WAL, then apply it. Caller is inside _write()."""
+        if not ops:
+            return
+        line = (json.dumps(ops, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        self._wal.write(line)
+        self._wal.flush()
+        self._tail_offset += len(line)
+        self._tail_size = self._tail_offset
+        self._unsynced = True
+        self._wal_entries += 1
+
+        for op, collection, key, record in ops:
+            self._apply(op, collection, key, record)
+        self._leaderboards.refresh()
+
+    def _apply(self, op: str, collection: str, key: str, record: Optional[dict]) -> None:
+        table = self._tables[collection]
+        old = table.get(key)
+        if old is not None:
+            self._unindex(collection, key, old)
+        if op == "put":
+            table[key] = record
+            self._index(collection, key, record)
+        else:
+            table.pop(key, None)
+            if collection == PORTFOLIOS:
+                self._leaderboards.portfolio_changed(key)
+        self._dirty.add(collection)
+
+    def _index(self, collection: str, key: str, record: dict) -> None:
+        if collection == PORTFOLIOS:
+            if record.get("visibility") == "public":
+                self._public[key] = record
+            self._by_creator.setdefault(record.get("creator_id"), {})[key] = None
+            self._leaderboards.portfolio_changed(key)
+        elif collection == FOLLOWS:
+            user_id, portfolio_id = record.get("follower_user_id"), record.get("portfolio_id")
+            self._following.setdefault(user_id, {})[portfolio_id] = key
+            self._followers.setdefault(portfolio_id, {})[user_id] = key
+        elif collection == SNAPSHOTS:
+            keys = self._snapshot_keys.setdefault(record.get("portfolio_id"), [])
+            bisect.insort(keys, (record.get("timestamp") or "", key))
+            self._leaderboards.snapshot_added(record, _snapshot_type(record))
+        elif collection == NOTIFICATIONS:
+            user_id = record.get("user_id")
+            inbox = self._inbox.setdefault(user_id, [])
+            entry = (record.get("created_at") or "", key)
+            if not inbox or inbox[-1] < entry:
+                inbox.append(entry)  # New notifications arrive in order
+            else:
+                bisect.insort(inbox, entry)
+            if not record.get("read", False):
+                self._unread[user_id] = self._unread.get(user_id, 0) + 1
+
+    def _unindex(self, collection: str, key: str, record: dict) -> None:
+        if collection == PORTFOLIOS:
+            self._public.pop(key, None)
+            _discard(self._by_creator, record.get("creator_id"), key)
+        elif collection == FOLLOWS:
+            _discard(self._following, record.get("follower_user_id"), record.get("portfolio_id"))
+            _discard(self._followers, record.get("portfolio_id"), record.get("follower_user_id"))
+        elif collection == SNAPSHOTS:
+            keys = self._snapshot_keys.get(record.get("portfolio_id"))
+            if keys is not None:
+                entry = (record.get("timestamp") or "", key)
+                i = bisect.bisect_left(keys, entry)
+                if i < len(keys) and keys[i] == entry:
+                    keys.pop(i)
+                if not keys:
+                    del self._snapshot_keys[record.get("portfolio_id")]
+            self._leaderboards.snapshot_removed(record)
+        elif collection == NOTIFICATIONS:
+            user_id = record.get("user_id")
+            inbox = self._inbox.get(user_id)
+            if inbox is not None:
+                entry = (record.get("created_at") or "", key)
+                i = bisect.bisect_left(inbox, entry)
+                if i < len(inbox) and inbox[i] == entry:
+                    inbox.pop(i)
+                if not inbox:
+                    del self._inbox[user_id]
+            if not record.get("read", False):
+                unread = self._unread.get(user_id, 0) - 1
+                if unread > 0:
+                    self._unread[user_id] = unread
+                else:
+                    self._unread.pop(user_id, None)
+
+    # =========================================================================
+    # PORTFOLIOS
+    # =========================================================================
+
+    def get_portfolio(self, portfolio_id: str) -> Optional[dict]:
+        self._poll()
+        return self._portfolios.get(portfolio_id)
+
+    def list_portfolios(self) -> list[dict]:
+        self._poll()
+        return list(self._portfolios.values())
+
+    def public_portfolios(self) -> list[dict]:
+        self._poll()
+        return list(self._public.values())
+
+    def portfolios_by_creator(self, creator_id: str) -> list[dict]:
+        self._poll()
+        ids = self._by_creator.get(creator_id, ())
+        return [self._portfolios[pid] for pid in ids]
+
+    def put_portfolio(self, portfolio: dict) -> dict:
+        with self._write():
+            self._commit([["put", PORTFOLIOS, portfolio["id"], portfolio]])
+        return portfolio
+
+    def update_portfolio(self, portfolio_id: str, changes: dict) -> Optional[dict]:
+        """Replace a portfolio with `changes` merged in. Returns the new record."""
+        with self._write():
+            current = self._portfolios.get(portfolio_id)
+            if current is None:
+                return None
+            updated = {**current, **changes}
+            self._commit([["put", PORTFOLIOS, portfolio_id, updated]])
+        return updated
+
+    def delete_portfolio(self, portfolio_id: str) -> bool:
+        with self._write():
+            if portfolio_id not in self._portfolios:
+                return False
+            self._commit([["del", PORTFOLIOS, portfolio_id, None]])
+        return True
+
+    # =========================================================================
+    # FOLLOWS
+    # =========================================================================
+
+    def is_following(self, user_id: str, portfolio_id: str) -> bool:
+        self._poll()
+        return portfolio_id in self._following.get(user_id, ())
+
+    def get_follow(self, user_id: str, portfolio_id: str) -> Optional[dict]:
+        self._poll()
+        follow_id = self._following.get(user_id, {}).get(portfolio_id)
+        return self._follows.get(follow_id) if follow_id else None
+
+    def followed_portfolio_ids(self, user_id: str) -> list[str]:
+        self._poll()
+        return list(self._following.get(user_id, ()))
+
+    def follower_ids(self, portfolio_id: str) -> list[str]:
+        self._poll()
+        return list(self._followers.get(portfolio_id, ()))
+
+    def iter_follows(self) -> Iterator[dict]:
+        self._poll()
+        return iter(list(self._follows.values()))
+
+    def follow(self, user_id: str, portfolio_id: str, follow: dict) -> tuple[bool, Optional[dict]]:
+        """
+        Add `follow` and increment the portfolio's follower count in one
+        mutation. Idempotent: returns (False, portfolio) if already following.
+        """
+        with self._write():
+            portfolio = self._portfolios.get(portfolio_id)
+            if portfolio is None:
+                return False, None
+            if self.is_following(user_id, portfolio_id):
+                return False, portfolio
+            portfolio = {**portfolio, "followers": portfolio.get("followers", 0) + 1}
+            self._commit([
+                ["put", FOLLOWS, follow["id"], follow],
+                ["put", PORTFOLIOS, portfolio_id, portfolio],
+            ])
+        return True, portfolio
+
+    def unfollow(self, user_id: str, portfolio_id: str) -> tuple[bool, Optional[dict]]:
+        """Remove the follow and decrement the follower count in one mutation."""
+        with self._write():
+            portfolio = self._portfolios.get(portfolio_id)
+            if portfolio is None:
+                return False, None
+            follow_id = self._following.get(user_id, {}).get(portfolio_id)
+            if follow_id is None:
+                return False, portfolio
+            portfolio = {**portfolio, "followers": max(0, portfolio.get("followers", 0) - 1)}
+            self._commit([
+                ["del", FOLLOWS, follow_id, None],
+                ["put", PORTFOLIOS, portfolio_id, portfolio],
+            ])
+        return True, portfolio
+
+    # =========================================================================
+    # SNAPSHOTS
+    # =========================================================================
+
+    def get_snapshot(self, snapshot_id: str) -> Optional[dict]:
+        self._poll()
+        return self._snapshots.get(snapshot_id)
+
+    def snapshots_for(self, portfolio_id: str, snapshot_type: Optional[str] = None) -> list[dict]:
+        """Snapshots of a portfolio, oldest first."""
+        self._poll()
+        snapshots = [self._snapshots[sid] for _, sid in self._snapshot_keys.get(portfolio_id, ())]
+        if snapshot_type is not None:
+            snapshots = [s for s in snapshots if _snapshot_type(s) == snapshot_type]
+        return snapshots
+
+    def latest_snapshot(self, portfolio_id: str, snapshot_type: Optional[str] = None) -> Optional[dict]:
+        """Newest snapshot of a portfolio (of the given type), without copying its history."""
+        self._poll()
+        for _, sid in reversed(self._snapshot_keys.get(portfolio_id, ())):
+            snapshot = self._snapshots[sid]
+            if snapshot_type is None or _snapshot_type(snapshot) == snapshot_type:
+                return snapshot
+        return None
+
+    def first_snapshot(self, portfolio_id: str) -> Optional[dict]:
+        self._poll()
+        keys = self._snapshot_keys.get(portfolio_id)
+        return self._snapshots[keys[0][1]] if keys else None
+
+    def add_snapshots(self, snapshots: Iterable[dict]) -> int:
+        """Store a batch of (immutable) snapshots as a single mutation."""
+        ops = [["put", SNAPSHOTS, s["id"], s] for s in snapshots]
+        with self._write():
+            self._commit(ops)
+        return len(ops)
+
+    # =========================================================================
+    # LEADERBOARDS
+    # =========================================================================
+
+    def leaderboard(self, board: str, limit: int, cursor: Optional[str] = None) -> dict:
+        """
+        One page of a materialized leaderboard (see services/leaderboards.py).
+
+        Returns {"entries": [(rank, portfolio, stats)], "total", "next_cursor"}.
+        Raises KeyError for an unknown board, ValueError for a bad cursor.
+        """
+        self._poll()
+        with self._lock:
+            page, total, next_cursor = self._leaderboards.page(board, limit, cursor)
+            entries = [(rank, self._portfolios[pid], stats) for rank, pid, stats in page]
+        return {"entries": entries, "total": total, "next_cursor": next_cursor}
+
+    def leaderboard_stats(self, portfolio_id: str) -> dict:
+        """Materialized period returns / volatility of a public portfolio ({} if none)."""
+        self._poll()
+        with self._lock:
+            return self._leaderboards.stats(portfolio_id)
+
+    # =========================================================================
+    # COMPETITIONS
+    # =========================================================================
+
+    def get_competition(self, competition_id: str) -> Optional[dict]:
+        self._poll()
+        return self._competitions.get(competition_id)
+
+    def list_competitions(self) -> list[dict]:
+        self._poll()
+        return list(self._competitions.values())
+
+    def put_competition(self, competition: dict) -> dict:
+        with self._write():
+            self._commit([["put", COMPETITIONS, competition["id"], competition]])
+        return competition
+
+    # =========================================================================
+    # NOTIFICATIONS
+    # =========================================================================
+
+    def get_notification(self, notification_id: str) -> Optional[dict]:
+        self._poll()
+        return self._notifications.get(notification_id)
+
+    def notifications_for(self, user_id: str) -> list[dict]:
+        """All notifications of a user, oldest first."""
+        self._poll()
+        return [self._notifications[nid] for _, nid in self._inbox.get(user_id, ())]
+
+    def notifications_page(self, user_id: str, limit: int, offset: int = 0,
+                           unread_only: bool = False) -> tuple[list[dict], int]:
+        """
+        One page of a user's notifications, newest first, and the total count.
+
+        Walks the inbox from the newest end, so a page costs offset + limit
+        (plus skipped read ones when unread_only), not the whole inbox.
+        """
+        self._poll()
+        inbox = self._inbox.get(user_id, ())
+        newest_first = (self._notifications[nid] for _, nid in reversed(inbox))
+        if unread_only:
+            newest_first = (n for n in newest_first if not n.get("read", False))
+            total = self.unread_count(user_id)
+        else:
+            total = len(inbox)
+        return list(itertools.islice(newest_first, offset, offset + limit)), total
+
+    def unread_count(self, user_id: str) -> int:
+        self._poll()
+        return self._unread.get(user_id, 0)
+
+    def add_notifications(self, notifications: Iterable[dict]) -> int:
+        """Store a batch of notifications (e.g. a fan-out to all followers) as a single mutation."""
+        ops = [["put", NOTIFICATIONS, n["id"], n] for n in notifications]
+        with self._write():
+            self._commit(ops)
+        return len(ops)
+
+    def update_notification(self, notification_id: str, changes: dict) -> Optional[dict]:
+        with self._write():
+            current = self._notifications.get(notification_id)
+            if current is None:
+                return None
+            updated = {**current, **changes}
+            self._commit([["put", NOTIFICATIONS, notification_id, updated]])
+        return updated
+
+    def delete_notification(self, notification_id: str) -> bool:
+        with self._write():
+            if notification_id not in self._notifications:
+                return False
+            self._commit([["del", NOTIFICATIONS, notification_id, None]])
+        return True
+
+    def mark_all_notifications_read(self, user_id: str) -> int:
+        with self._write():
+            if not self.unread_count(user_id):
+                return 0
+            ops = [
+                ["put", NOTIFICATIONS, n["id"], {**n, "read": True}]
+                for n in self.notifications_for(user_id)
+                if not n.get("read", False)
+            ]
+            self._commit(ops)
+        return len(ops)
+
+    # =========================================================================
+    # FSYNC / COMPACTION
+    # =========================================================================
+
+    def sync(self) -> None:
+        """fsync the WAL if there are unsynced entries (without holding the store lock)."""
+        with self._lock:
+            if self._wal is None or not self._unsynced:
+                return
+            # A dup survives a concurrent rotation closing self._wal
+            fd = os.dup(self._wal.fileno())
+            self._unsynced = False
+        try:
+            os.fsync(fd)
+        except OSError:
+            self._unsynced = True
+            raise
+        finally:
+            os.close(fd)
+
+    def needs_compaction(self) -> bool:
+        if not self._dirty:
+            return False
+        if self._wal_entries >= self.compact_wal_entries:
+            return True
+        return time.monotonic() - self._last_compaction >= self.compact_interval
+
+    def compact(self) -> bool:
+        """
+        Rewrite the changed JSON files and drop the WAL entries they contain.
+
+        Blocking; scripts and close_sync() use it. The maintenance task uses
+        compact_async(), which writes the files in a worker thread.
+        """
+        rotation = self._rotate()
+        if rotation is None:
+            return False
+        try:
+            self._publish(*rotation)
+        finally:
+            self._end_compaction()
+        return True
+
+    async def compact_async(self) -> bool:
+        """
+        compact() for the event loop.
+
+        The rotation (which applies other processes' entries) runs on the
+        loop like every other mutation; only serialization and the file
+        writes go to a worker thread.
+        """
+        rotation = self._rotate()
+        if rotation is None:
+            return False
+        try:
+            await asyncio.to_thread(self._publish, *rotation)
+        finally:
+            self._end_compaction()
+        return True
+
+    def _rotate(self) -> Optional[tuple]:
+        """
+        Start a compaction: take the compaction locks, move the WAL to a
+        numbered segment and copy the changed tables. Returns None if there
+        is nothing to compact or another thread/process is compacting.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return None
+        locked = False
+        try:
+            with self._lock:
+                if not self._loaded or not self._dirty:
+                    return None
+                if not _flock(self._compact_lock_file, "exclusive", blocking=False):
+                    return None
+                locked = True
+                with self._write():
+                    # Segments left by a failed compaction hold changes to any collection
+                    collections = sorted(COLLECTION_FILES if self._segments() else self._dirty)
+                    segment_no = time.time_ns()
+                    segment = self.data_dir / f"{WAL_FILE}.{segment_no}"
+                    os.replace(self.wal_path, segment)
+                    self._open_wal()
+
+                    tables = {name: dict(self._tables[name]) for name in collections}
+                    self._dirty.clear()
+                    self._wal_entries = 0
+                    self._last_compaction = time.monotonic()
+            return segment_no, segment, collections, tables
+        except BaseException:
+            if locked:
+                _flock(self._compact_lock_file, "unlock")
+            locked = False
+            raise
+        finally:
+            if not locked:
+                self._compact_lock.release()
+
+    def _end_compaction(self) -> None:
+        _flock(self._compact_lock_file, "unlock")
+        self._compact_lock.release()
+
+    def _publish(self, segment_no: int, segment: Path, collections: list, tables: dict) -> None:
+        """Write the compacted files, rename them into place and drop the folded segments."""
+        start = time.perf_counter()
+        try:
+            with open(segment, "rb") as f:
+                os.fsync(f.fileno())
+            written = [self._write_collection(name, tables[name]) for name in collections]
+
+            # Exclusive: a process loading now sees either old files + segments or new files
+            with self._lock:
+                _flock(self._write_lock_file, "exclusive")
+                try:
+                    for tmp_path, path in written:
+                        os.replace(tmp_path, path)
+                    # Everything up to this segment is now in the JSON files
+                    for number, path in self._segments():
+                        if number <= segment_no:
+                            path.unlink(missing_ok=True)
+                finally:
+                    _flock(self._write_lock_file, "unlock")
+        except Exception:
+            with self._lock:
+                self._dirty.update(collections)
+            raise
+
+        logger.info(
+            f"Community store compacted {', '.join(collections)} "
+            f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def _write_collection(self, collection: str, records: dict) -> tuple[Path, Path]:
+        """Write one collection in its original JSON file format to a temp file. Returns (temp, final) paths."""
+        data: dict = {}
+        if collection == NOTIFICATIONS:
+            data[NOTIFICATIONS] = list(records.values())
+        else:
+            data[collection] = records
+
+        if collection == FOLLOWS:
+            by_user: dict = {}
+            by_portfolio: dict = {}
+            for follow in records.values():
+                by_user.setdefault(follow.get("follower_user_id"), []).append(follow.get("portfolio_id"))
+                by_portfolio.setdefault(follow.get("portfolio_id"), []).append(follow.get("follower_user_id"))
+            data["by_user"] = by_user
+            data["by_portfolio"] = by_portfolio
+        elif collection == SNAPSHOTS:
+            by_portfolio = {}
+            by_type: dict = {}
+            for sid, snapshot in records.items():
+                by_portfolio.setdefault(snapshot.get("portfolio_id"), []).append(sid)
+                by_type.setdefault(_snapshot_type(snapshot), []).append(sid)
+            data["by_portfolio"] = by_portfolio
+            data["by_type"] = by_type
+
+        data.update(self._file_extras[collection])
+        if collection in (PORTFOLIOS, FOLLOWS, SNAPSHOTS):
+            data["last_updated"] = _utc_now()
+
+        path = self.data_dir / COLLECTION_FILES[collection]
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # No indent: lets json use its C encoder (about 2x faster on large files)
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path, path
+
+    # =========================================================================
+    # LIFECYCLE
+    # =========================================================================
+
+    async def start(self) -> None:
+        """Load (off the event loop) and start the fsync/compaction task."""
+        await asyncio.to_thread(self.load)
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                # Follow other processes' writes even while nobody reads
+                self._poll()
+                if self.fsync == "interval":
+                    await asyncio.to_thread(self.sync)
+                if self.needs_compaction():
+                    await self.compact_async()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Community store maintenance failed: {e}")
+
+    async def close(self) -> None:
+        """Stop the maintenance task, compact and close the WAL."""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        try:
+            await self.compact_async()
+        except Exception as e:
+            logger.error(f"Community store final compaction failed, WAL kept for replay: {e}")
+        await asyncio.to_thread(self.close_sync)
+
+    def close_sync(self) -> None:
+        """Compact and close the WAL (for scripts without an event loop)."""
+        if not self._loaded:
+            return
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Community store final compaction failed, WAL kept for replay: {e}")
+        with self._lock:
+            if self._wal is not None:
+                self._wal.flush()
+                os.fsync(self._wal.fileno())
+            for handle in (self._wal, self._tail, self._write_lock_file, self._compact_lock_file):
+                if handle is not None:
+                    handle.close()
+            self._wal = self._tail = self._write_lock_file = self._compact_lock_file = None
+            self._loaded = False
+
+    def get_stats(self) -> dict:
+        return {
+            "portfolios": len(self._portfolios),
+            "public_portfolios": len(self._public),
+            "follows": len(self._follows),
+            "snapshots": len(self._snapshots),
+            "competitions": len(self._competitions),
+            "notifications": len(self._notifications),
+            "unread_notifications": sum(self._unread.values()),
+            "wal_entries": self._wal_entries,
+            "fsync": self.fsync,
+        }
+
+
+def _flock(f, mode: str, blocking: bool = True) -> bool:
+    """
+    Advisory lock on `f` (mode: shared / exclusive / unlock).
+
+    Returns False if blocking=False and another process holds it. A no-op
+    without fcntl (Windows), where only one process may use a data directory.
+    """
+    if fcntl is None:
+        return True
+    operation = {"shared": fcntl.LOCK_SH, "exclusive": fcntl.LOCK_EX, "unlock": fcntl.LOCK_UN}[mode]
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(f.fileno(), operation)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _discard(index: dict, key, member) -> None:
+    """Remove `member` from index[key], dropping the key when it's empty."""
+    members = index.get(key)
+    if members is not None:
+        members.pop(member, None)
+        if not members:
+            del index[key]
+
+
+# Singleton instance
+_community_repository: Optional[CommunityRepository] = None
+
+
+def get_community_repository() -> CommunityRepository:
+    """Get the singleton community repository, loading it on first use."""
+    global _community_repository
+    if _community_repository is None:
+        from config import get_settings
+        settings = get_settings()
+        repository = CommunityRepository(
+            fsync=settings.community_wal_fsync,
+            fsync_interval=settings.community_wal_fsync_interval,
+            compact_wal_entries=settings.community_compact_wal_entries,
+            compact_interval=settings.community_compact_interval,
+            poll_interval=settings.community_wal_poll_interval,
+        )
+        repository.load()
+        _community_repository = repository
+    return _community_repository
+
+
+async def close_community_repository() -> None:
+    """Flush and close the singleton repository (main.py lifespan shutdown)."""
+    global _community_repository
+    if _community_repository is not None:
+        await _community_repository.close()
+        _community_repository = None
@@ -0,0 +1,146 @@
+"""
+Customer Cache.
+
+Every authenticated request resolves its customer (and broker link) in
+middleware/auth.get_current_user, so this sits on the hot path for all
+traffic. The cache is:
+
+- bounded: LRU over customer_cache_max_entries customers
+- TTL'd: entries expire after customer_cache_ttl seconds; unknown IDs
+  (loader returned None) are remembered for customer_cache_negative_ttl
+- single-flight: concurrent misses for one customer share one load
+- invalidated explicitly: SupabaseService calls invalidate_customer()
+  after trading status and broker link writes, so changes apply on the
+  next request instead of after the TTL
+
+Load errors are not cached; every waiter of that load gets the exception.
+Hit rate and load latency are exposed through get_stats()
+(GET /status/auth-cache).
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerCache:
+    """Bounded LRU/TTL cache with single-flight loading."""
+
+    def __init__(self, ttl: float = 60.0, negative_ttl: float = 5.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[int, tuple[Any, float]] = OrderedDict()  # id -> (value, expires)
+        self._inflight: dict[int, asyncio.Task] = {}
+        self._load_ms: deque = deque(maxlen=1024)  # Recent load latencies
+
+        self._metrics = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    async def get(self, customer_id: int, loader: Callable[[int], Awaitable[Any]]) -> Any:
+        """Cached value for customer_id, calling loader(customer_id) on a miss."""
+        entry = self._entries.get(customer_id)
+        if entry is not None:
+            value, expires = entry
+            if time.monotonic() < expires:
+                self._entries.move_to_end(customer_id)
+                self._metrics["hits" if value is not None else "negative_hits"] += 1
+                return value
+            del self._entries[customer_id]
+
+        task = self._inflight.get(customer_id)
+        if task is not None:
+            self._metrics["coalesced"] += 1
+        else:
+            self._metrics["misses"] += 1
+            task = asyncio.ensure_future(self._load(customer_id, loader))
+            self._inflight[customer_id] = task
+        # shield: a cancelled request must not cancel a load others wait on
+        return await asyncio.shield(task)
+
+    async def _load(self, customer_id: int, loader: Callable[[int], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            value = await loader(customer_id)
+        except Exception:
+            self._metrics["load_errors"] += 1
+            raise
+        finally:
+            self._load_ms.append((time.perf_counter() - started) * 1000)
+            self._metrics["loads"] += 1
+            current = self._inflight.get(customer_id) is asyncio.current_task()
+            if current:
+                del self._inflight[customer_id]
+        # If invalidated while loading, the waiters still get the value but it isn't kept
+        if current:
+            self.set(customer_id, value)
+        return value
+
+    def set(self, customer_id: int, value: Any) -> None:
+        """Store a value (None = unknown customer, kept for negative_ttl)."""
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[customer_id] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(customer_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._metrics["evictions"] += 1
+
+    def invalidate(self, customer_id: int) -> None:
+        """Drop a customer's entry and detach any load in flight."""
+        self._metrics["invalidations"] += 1
+        self._entries.pop(customer_id, None)
+        self._inflight.pop(customer_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self._metrics["hits"] + self._metrics["negative_hits"] + self._metrics["misses"] + self._metrics["coalesced"]
+        hits = self._metrics["hits"] + self._metrics["negative_hits"]
+        load_ms = sorted(self._load_ms)
+        return {
+            **self._metrics,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "load_ms_p50": round(load_ms[len(load_ms) // 2], 2) if load_ms else None,
+            "load_ms_p99": round(load_ms[min(len(load_ms) - 1, int(len(load_ms) * 0.99))], 2) if load_ms else None,
+        }
+
+
+# Singleton instance
+_cache: Optional[CustomerCache] = None
+
+
+def get_customer_cache() -> CustomerCache:
+    """Get the customer cache singleton."""
+    global _cache
+    if _cache is None:
+        from config import get_settings
+        settings = get_settings()
+        _cache = CustomerCache(
+            ttl=settings.customer_cache_ttl,
+            negative_ttl=settings.customer_cache_negative_ttl,
+            max_entries=settings.customer_cache_max_entries,
+        )
+    return _cache
+
+
+def invalidate_customer(customer_id: int) -> None:
+    """Drop a customer from the auth cache after its trading status or broker link changed."""
+    if _cache is not None:
+        _cache.invalidate(customer_id)
@@ -0,0 +1,165 @@
+"""
+ETF Universe Index.
+
+Immutable lookup index over the tradability data, built once per load of
+etf_tradability.json and shared by IBClient, TradabilityService, the
+community router and the virtual-account pricing helpers.
+
+Every lookup is a dict hit:
+- by_conid:           IB conid -> ETF
+- by_isin:            ISIN -> ETF (tradable only)
+- by_symbol:          upper-case symbol -> ETF (first listing wins)
+- by_symbol_exchange: (upper-case symbol, exchange) -> ETF, for both the
+                      routing exchange and the primary exchange
+
+TradabilityService owns the current universe and replaces it with a single
+attribute assignment on reload, so readers always see either the old or
+the new index, never a half-built one. When a check run's diff is applied,
+the next universe is derived from the current one (with_changes) instead
+of being rebuilt from the record store. Full tradability records (blocked
+ETFs, check timestamps, ...) stay in the service's record store.
+"""
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_mapping() -> Mapping:
+    return MappingProxyType({})
+
+
+@dataclass(frozen=True)
+class ETFUniverse:
+    """Read-only view of the tradable ETF universe with O(1) indexes."""
+
+    # Tradable ETFs: {symbol, name, conid, exchange, primaryExchange, currency, isin}
+    etfs: tuple = ()
+    metadata: Mapping = field(default_factory=_empty_mapping)
+
+    by_conid: Mapping[int, dict] = field(default_factory=_empty_mapping)
+    by_isin: Mapping[str, dict] = field(default_factory=_empty_mapping)
+    by_symbol: Mapping[str, dict] = field(default_factory=_empty_mapping)
+    by_symbol_exchange: Mapping[tuple, dict] = field(default_factory=_empty_mapping)
+
+    @classmethod
+    def from_tradability(cls, data: dict) -> "ETFUniverse":
+        """Build the universe from parsed etf_tradability.json content."""
+        etfs = [
+            etf_from_record(record, isin)
+            for isin, record in (data.get("etfs", {}) or {}).items()
+            if record.get("tradable_via_lynx", False)
+        ]
+        return cls.from_etfs(etfs, metadata=data.get("metadata", {}) or {})
+
+    @classmethod
+    def from_etfs(cls, etfs: list[dict], metadata: Optional[dict] = None) -> "ETFUniverse":
+        """Build the universe from a list of ETFs in IBClient format."""
+        by_conid: dict = {}
+        by_isin: dict = {}
+        by_symbol: dict = {}
+        by_symbol_exchange: dict = {}
+
+        # setdefault: first listing wins, matching the old linear scans
+        for etf in etfs:
+            if etf.get("conid"):
+                by_conid.setdefault(etf["conid"], etf)
+            if etf.get("isin"):
+                by_isin.setdefault(etf["isin"], etf)
+            symbol = (etf.get("symbol") or "").upper()
+            if symbol:
+                by_symbol.setdefault(symbol, etf)
+                for exchange in (etf.get("exchange"), etf.get("primaryExchange")):
+                    if exchange:
+                        by_symbol_exchange.setdefault((symbol, exchange), etf)
+
+        return cls(
+            etfs=tuple(etfs),
+            metadata=MappingProxyType(dict(metadata or {})),
+            by_conid=MappingProxyType(by_conid),
+            by_isin=MappingProxyType(by_isin),
+            by_symbol=MappingProxyType(by_symbol),
+            by_symbol_exchange=MappingProxyType(by_symbol_exchange),
+        )
+
+    def with_changes(self, changes: Mapping[str, Optional[dict]], metadata: Optional[dict] = None) -> "ETFUniverse":
+        """
+        New universe with tradability records applied (ISIN -> record, None to remove).
+
+        Changed ETFs keep their position, so first-listing-wins lookups are
+        unaffected; newly tradable ones are appended.
+        """
+        etfs = []
+        for etf in self.etfs:
+            isin = etf.get("isin")
+            if isin not in changes:
+                etfs.append(etf)
+                continue
+            record = changes[isin]
+            if record and record.get("tradable_via_lynx", False):
+                etfs.append(etf_from_record(record, isin))
+        present = {etf.get("isin") for etf in self.etfs}
+        for isin, record in changes.items():
+            if isin not in present and record and record.get("tradable_via_lynx", False):
+                etfs.append(etf_from_record(record, isin))
+        return ETFUniverse.from_etfs(etfs, metadata=self.metadata if metadata is None else metadata)
+
+    def __len__(self) -> int:
+        return len(self.etfs)
+
+    def get_by_conid(self, conid) -> Optional[dict]:
+        """ETF for an IB conid (int or numeric string)."""
+        try:
+            return self.by_conid.get(int(conid))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_isin(self, isin: str) -> Optional[dict]:
+        return self.by_isin.get(isin)
+
+    def get_by_symbol(self, symbol: str, exchange: Optional[str] = None) -> Optional[dict]:
+        """ETF for a symbol, optionally on a specific (routing or primary) exchange."""
+        if not symbol:
+            return None
+        if exchange:
+            return self.by_symbol_exchange.get((symbol.upper(), exchange))
+        return self.by_symbol.get(symbol.upper())
+
+
+def etf_from_record(record: dict, isin: str = None) -> dict:
+    """Flatten a tradability record into the IBClient ETF format."""
+    contract = record.get("contract") or {}
+    return {
+        "symbol": contract.get("symbol", ""),
+        "name": record.get("name", ""),
+        "conid": contract.get("conId", 0),
+        "exchange": contract.get("exchange", "SMART"),
+        "primaryExchange": contract.get("primaryExchange", ""),
+        "currency": contract.get("currency", "EUR"),
+        "isin": record.get("isin", isin),
+    }
+
+
+# Used when the tradability service itself can't be loaded
+FALLBACK_ETFS = [
+    {"symbol": "VUSA", "name": "Vanguard S&P 500 UCITS ETF", "conid": 128884495, "exchange": "AEB", "currency": "EUR", "isin": "IE00B3XXRP09"},
+    {"symbol": "IWDA", "name": "iShares Core MSCI World UCITS ETF", "conid": 100292038, "exchange": "AEB", "currency": "EUR", "isin": "IE00B4L5Y983"},
+]
+
+
+def get_etf_universe() -> ETFUniverse:
+    """
+    Get the current ETF universe.
+
+    Returns the index owned by the tradability service (rebuilt on
+    /tradability/reload). Falls back to a minimal hardcoded universe if the
+    service is unavailable.
+    """
+    try:
+        from services.tradability_service import get_tradability_service
+        return get_tradability_service().universe
+    except Exception as e:
+        logger.warning(f"Could not load ETF universe from tradability service: {e}")
+        return ETFUniverse.from_etfs(FALLBACK_ETFS)
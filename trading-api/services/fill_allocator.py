@@ -0,0 +1,59 @@
+"""Pro-rata fill allocation for aggregated batch orders.
+
+Pure, vectorized (NumPy) largest-remainder allocator: given every user's
+requested quantity and the aggregated order's filled quantity, computes all
+users' shares in one pass.
+
+Guarantees:
+- Exact integer totals: allocations always sum to min(filled, requested total)
+- Nobody receives more than they requested
+- Deterministic: leftover shares go to the largest fractional remainders,
+  ties favor smaller orders, then earlier intentions (input order)
+
+No I/O - persistence is done by BatchExecutionService.
+"""
+from typing import Sequence
+
+import numpy as np
+
+
+def allocate_pro_rata(requested: Sequence[int], filled_quantity: int) -> np.ndarray:
+    """
+    Split filled_quantity across requested quantities pro-rata.
+
+    Each user first gets floor(requested * filled / total). The remaining
+    shares (fewer than the number of users) go one each to the users with
+    the largest fractional remainder.
+
+    Args:
+        requested: Requested quantity per intention (non-negative integers)
+        filled_quantity: Total shares filled for the aggregated order
+
+    Returns:
+        int64 array of allocated quantities, aligned with `requested`
+    """
+    req = np.asarray(requested, dtype=np.int64)
+    if req.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if (req < 0).any():
+        raise ValueError("Requested quantities must be non-negative")
+
+    total = int(req.sum())
+    filled = min(max(int(filled_quantity), 0), total)
+    if filled == 0:
+        return np.zeros(req.size, dtype=np.int64)
+    if filled == total:
+        return req.copy()
+
+    # Integer arithmetic only: share = (req * filled) / total
+    scaled = req * filled
+    alloc = scaled // total
+    remainder = scaled - alloc * total
+
+    leftover = filled - int(alloc.sum())
+    if leftover:
+        # Sort keys (last key is primary): remainder desc, quantity asc, position asc
+        order = np.lexsort((np.arange(req.size), req, -remainder))
+        alloc[order[:leftover]] += 1
+
+    return alloc
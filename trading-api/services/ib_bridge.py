@@ -0,0 +1,979 @@
+"""
+IB Bridge.
+
+Lets several uvicorn workers share one IB Gateway connection (one clientId,
+one set of market data lines) instead of each worker opening its own.
+
+Bridge process (IBBridge, started with `python -m services.ib_bridge`):
+- owns the IBClient: connection and auto-reconnect, market data lines,
+  positions and order routing (all IBClient safety checks run here)
+- writes every ticker update into the shared-memory QuoteBoard
+  (services/quote_board.py), and the connection status plus a heartbeat
+  into its header every ib_bridge_status_interval seconds; slots of
+  dropped lines are released on the same beat
+- owns the market data cache file (MarketDataPersister); workers reload
+  it when its mtime changes
+- serves requests on a unix socket, one JSON object per line:
+      request  {"id": 7, "method": "place_order", "params": {...}}
+      reply    {"id": 7, "result": ...}  or  {"id": 7, "error": "..."}
+      event    {"id": 7, "fill": {...}}  (each fill while place_order waits)
+  A request without an id is a notification and gets no reply. Every
+  request runs in its own task, so a long fill wait never holds up others.
+
+Workers (IBBridgeClient, returned by get_ib_client() when
+ib_bridge_enabled):
+- quotes come straight from the board: get_market_data and
+  get_all_market_data first apply the slots whose version changed to a
+  local cache (one vectorized compare of the version array), so reads cost
+  microseconds and never block on the bridge
+- a watch task applies board changes every ib_bridge_poll_interval, which
+  feeds market data listeners (stream broadcaster) and the local tick
+  store, and every ib_bridge_status_interval refreshes status details,
+  reopening the socket or reattaching a restarted bridge's board
+- connection state (is_connected, is_ready_for_orders, account) comes from
+  the board header; a heartbeat older than ib_bridge_stale_after means the
+  bridge is down
+- everything else is a request to the bridge. Methods keep IBClient's
+  contract: they never raise, failures return error dicts or empty results.
+"""
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import signal
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType, SimpleNamespace
+from typing import Any, Callable, Mapping, Optional
+import logging
+
+import numpy as np
+from ib_insync import Contract, util
+
+from services.ib_client import ConnectionState, ConnectionStatus, IBClient, ORDER_STATUS_UNKNOWN
+from services.quote_board import QuoteBoard
+from services.tick_store import TickStore
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+IB_BRIDGE_SOCKET_FILE = DATA_DIR / "ib_bridge.sock"
+
+# Lookups of an order whose place_order reply was lost (the bridge may still be placing it)
+ORDER_RECONCILE_ATTEMPTS = 3
+ORDER_RECONCILE_DELAY = 1.0
+
+# Replies like get_orders can be large; asyncio's default line limit is 64 KiB
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class IBBridgeError(Exception):
+    """The bridge answered a request with an error."""
+
+
+def bridge_socket_path(settings) -> Path:
+    return Path(settings.ib_bridge_socket) if settings.ib_bridge_socket else IB_BRIDGE_SOCKET_FILE
+
+
+def _fill_event(trade, fill) -> dict:
+    return {
+        "order_id": trade.order.orderId,
+        "action": trade.order.action,
+        "total_quantity": trade.order.totalQuantity,
+        "status": trade.orderStatus.status,
+        "filled": trade.orderStatus.filled,
+        "remaining": trade.orderStatus.remaining,
+        "avg_fill_price": trade.orderStatus.avgFillPrice,
+        "exec_id": fill.execution.execId,
+        "shares": fill.execution.shares,
+        "price": fill.execution.price,
+        "time": str(fill.time),
+    }
+
+
+def _fill_objects(event: dict) -> tuple:
+    """(trade, fill) stand-ins with the attributes on_fill callbacks read."""
+    trade = SimpleNamespace(
+        order=SimpleNamespace(orderId=event["order_id"], action=event["action"], totalQuantity=event["total_quantity"]),
+        orderStatus=SimpleNamespace(status=event["status"], filled=event["filled"],
+                                    remaining=event["remaining"], avgFillPrice=event["avg_fill_price"]),
+    )
+    fill = SimpleNamespace(
+        execution=SimpleNamespace(execId=event["exec_id"], shares=event["shares"], price=event["price"]),
+        time=event["time"],
+    )
+    return trade, fill
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+# =============================================================================
+# Bridge (owns the IB connection)
+# =============================================================================
+
+class IBBridge:
+    """Publishes an IBClient's quotes to the board and serves worker requests."""
+
+    def __init__(self, client: IBClient, socket_path: Path, board_name: str, board_slots: int = 1024,
+                 status_interval: float = 1.0):
+        self._client = client
+        self.socket_path = Path(socket_path)
+        self.board_name = board_name
+        self.board_slots = board_slots
+        self.status_interval = status_interval
+
+        self._board: Optional[QuoteBoard] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._status_task: Optional[asyncio.Task] = None
+        self._clients = 0
+
+        lines = client.market_data_lines
+        self._handlers: dict[str, Callable] = {
+            "get_status": self._get_status,
+            "reconnect": self._reconnect,
+            "check_auth_status": client.check_auth_status,
+            "get_accounts": client.get_accounts,
+            "place_order": client.place_order,
+            "cancel_order": client.cancel_order,
+            "get_orders": client.get_orders,
+            "get_positions": client.get_positions,
+            "get_account_values": client.get_account_values,
+            "refresh_positions": client.refresh_positions,
+            "qualify_contract": self._qualify_contract,
+            "get_market_data_snapshot": client.get_market_data_snapshot,
+            "get_market_data_for_symbol": client.get_market_data_for_symbol,
+            "subscribe_market_data": client.subscribe_market_data,
+            "unsubscribe_market_data": client.unsubscribe_market_data,
+            "subscribe_all_etfs": client.subscribe_all_etfs,
+            "record_request": lines.record_request,
+            "acquire_line": lines.acquire,
+        }
+
+        # Stats
+        self._requests = 0
+        self._errors = 0
+        self._published = 0
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def start(self) -> None:
+        """Create the board and start serving workers."""
+        self._board = QuoteBoard.create(self.board_name, self.board_slots)
+        for conid, entry in self._client.get_all_market_data().items():
+            if entry.get("timestamp"):
+                self._board.publish(conid, entry)
+        self._client.add_market_data_listener(self._publish)
+        self._write_status()
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)  # Left behind by a crashed bridge
+        self._server = await asyncio.start_unix_server(self._serve, path=str(self.socket_path), limit=STREAM_LIMIT)
+        os.chmod(self.socket_path, 0o600)
+        self._status_task = asyncio.create_task(self._status_loop())
+        logger.info(f"IB bridge serving on {self.socket_path}, quote board {self.board_name}")
+
+    async def close(self) -> None:
+        if self._status_task is not None:
+            self._status_task.cancel()
+            try:
+                await self._status_task
+            except asyncio.CancelledError:
+                pass
+            self._status_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self.socket_path.unlink(missing_ok=True)
+        self._client.remove_market_data_listener(self._publish)
+        if self._board is not None:
+            self._board.set_status(ConnectionState.DISCONNECTED.value, False, False, False, None)
+            self._board.close()
+            self._board = None
+        logger.info("IB bridge closed")
+
+    # =========================================================================
+    # Quote board
+    # =========================================================================
+
+    def _publish(self, conid: int, entry: dict) -> None:
+        """IBClient market data listener: copy the tick into the board."""
+        if self._board.publish(conid, entry):
+            self._published += 1
+
+    def _write_status(self) -> None:
+        status = self._client.get_status()
+        self._board.set_status(
+            status.state.value, status.connected, status.ready_for_orders,
+            self._client.has_account_type_mismatch(), status.account,
+        )
+
+    async def _status_loop(self) -> None:
+        while True:
+            try:
+                self._write_status()
+                live = self._client.get_all_market_data()
+                for conid in self._board.published_conids():
+                    if conid not in live:
+                        self._board.release(conid)
+            except Exception as e:
+                logger.warning(f"IB bridge status update failed: {e}")
+            await asyncio.sleep(self.status_interval)
+
+    # =========================================================================
+    # Requests
+    # =========================================================================
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """One worker connection: dispatch each request line in its own task."""
+        self._clients += 1
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    logger.warning(f"IB bridge: malformed request {line[:200]!r}")
+                    continue
+                task = asyncio.create_task(self._dispatch(request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning(f"IB bridge: worker connection lost: {e}")
+        finally:
+            # Requests already in flight (an order being placed) run to the end;
+            # only their replies are lost
+            self._clients -= 1
+            writer.close()
+
+    async def _dispatch(self, request: dict, writer: asyncio.StreamWriter) -> None:
+        req_id = request.get("id")
+        method = request.get("method")
+        params = dict(request.get("params") or {})
+        self._requests += 1
+        try:
+            handler = self._handlers.get(method)
+            if handler is None:
+                raise IBBridgeError(f"Unknown method: {method}")
+            if method == "place_order" and params.pop("stream_fills", False) and req_id is not None:
+                params["on_fill"] = lambda trade, fill: self._send(writer, {"id": req_id, "fill": _fill_event(trade, fill)})
+            result = handler(**params)
+            if inspect.isawaitable(result):
+                result = await result
+            reply = {"id": req_id, "result": result}
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"IB bridge request {method} failed: {type(e).__name__}: {e}")
+            reply = {"id": req_id, "error": f"{type(e).__name__}: {e}"}
+        if req_id is not None:
+            self._send(writer, reply)
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+        if not writer.is_closing():
+            writer.write((json.dumps(message, default=str) + "\n").encode())
+
+    async def _get_status(self) -> dict:
+        return {
+            **self._client.get_status().to_dict(),
+            "lines": self._client.market_data_lines.get_stats(),
+            "bridge": self.get_stats(),
+        }
+
+    async def _qualify_contract(self, contract: dict) -> Optional[dict]:
+        """Qualify a contract sent as its non-default fields; the qualified fields, or None."""
+        qualified = Contract.create(**contract)
+        if not await self._client.qualify_contract(qualified):
+            return None
+        return util.dataclassNonDefaults(qualified)
+
+    async def _reconnect(self) -> bool:
+        """Reconnect to IB Gateway (admin reconnect from any worker)."""
+        client = self._client
+        await client.disconnect()
+        await asyncio.sleep(1)
+        connected = await client.connect()
+        if connected:
+            await client.subscribe_all_etfs()
+        await client.start_auto_reconnect()
+        self._write_status()
+        return connected
+
+    def get_stats(self) -> dict:
+        return {
+            "socket": str(self.socket_path),
+            "workers": self._clients,
+            "requests": self._requests,
+            "errors": self._errors,
+            "quotes_published": self._published,
+            "board": self._board.get_stats() if self._board is not None else None,
+        }
+
+
+async def run_bridge(ib_factory: Optional[Callable] = None, stop: Optional[asyncio.Event] = None) -> None:
+    """
+    Run the bridge process until SIGTERM/SIGINT (or until stop is set).
+
+    Mirrors the IB part of the main.py lifespan: connect, fill the market
+    data lines, rebalance them, auto-reconnect, persist the cache.
+    """
+    import services.ib_client as ib_client_module
+    from config import get_settings
+    from services.supabase_client import init_supabase_client, close_supabase_client
+    from services.market_data_persistence import get_market_data_persister, close_market_data_persister
+
+    settings = get_settings()
+    client = IBClient(settings) if ib_factory is None else IBClient(settings, ib_factory=ib_factory)
+    # Code in this process (line demand, persister) must see the real client
+    ib_client_module._ib_client = client
+
+    bridge = IBBridge(
+        client,
+        socket_path=bridge_socket_path(settings),
+        board_name=settings.ib_bridge_board_name,
+        board_slots=settings.ib_bridge_board_slots,
+        status_interval=settings.ib_bridge_status_interval,
+    )
+
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+    # Market data line demand is loaded from Supabase
+    await init_supabase_client()
+    await bridge.start()
+    await get_market_data_persister().start(client)
+
+    logger.info(f"IB bridge connecting to {settings.ib_gateway_host}:{settings.ib_gateway_port} "
+                f"(client ID {settings.ib_client_id})")
+    if await client.connect():
+        if client.has_account_type_mismatch():
+            logger.critical("IB bridge: account type does not match trading mode, all orders will be rejected")
+        try:
+            count = await client.subscribe_all_etfs()
+            logger.info(f"Market data: subscribed to {count} ETFs")
+        except Exception as e:
+            logger.warning(f"Market data subscription failed (will retry on demand): {e}")
+    else:
+        logger.warning(f"IB bridge could not connect: {client.get_status().last_error}")
+
+    await client.market_data_lines.start()
+    await client.start_auto_reconnect()
+
+    await stop.wait()
+
+    logger.info("IB bridge shutting down...")
+    await client.market_data_lines.close()
+    await close_market_data_persister()
+    await bridge.close()
+    await client.disconnect()
+    ib_client_module._ib_client = None
+    await close_supabase_client()
+
+
+# =============================================================================
+# Worker client
+# =============================================================================
+
+class _BridgeLines:
+    """Worker view of the bridge's MarketDataLineManager (lines are assigned in the bridge)."""
+
+    def __init__(self, client: "IBBridgeClient"):
+        self._client = client
+
+    def record_request(self, conid: int) -> bool:
+        """Count a request for conid in the bridge. Returns True if it has a live line."""
+        self._client._notify("record_request", conid=conid)
+        return self.is_subscribed(conid)
+
+    def is_subscribed(self, conid: int) -> bool:
+        return self._client.get_market_data(conid) is not None
+
+    async def acquire(self, conid: int) -> bool:
+        return bool(await self._client._call("acquire_line", False, conid=conid))
+
+    async def fill(self) -> int:
+        return await self._client.subscribe_all_etfs()
+
+    async def start(self) -> None:
+        """Rebalancing runs in the bridge."""
+
+    async def close(self) -> None:
+        pass
+
+    def get_stats(self) -> dict:
+        """Line stats as of the last status refresh."""
+        return dict(self._client._remote_status.get("lines") or {})
+
+
+class IBBridgeClient:
+    """IBClient stand-in for API workers, backed by the IB bridge process."""
+
+    MODEL_PORTFOLIO_CONIDS = IBClient.MODEL_PORTFOLIO_CONIDS
+    MAX_SUBSCRIPTIONS = IBClient.MAX_SUBSCRIPTIONS
+
+    # No IB round-trip involved
+    get_mvp_etfs = IBClient.get_mvp_etfs
+    parse_quote = IBClient.parse_quote
+    create_etf_contract = IBClient.create_etf_contract
+    confirm_order = IBClient.confirm_order
+
+    def __init__(self, settings=None):
+        if settings is None:
+            from config import get_settings
+            settings = get_settings()
+
+        self._settings = settings
+        self.socket_path = bridge_socket_path(settings)
+
+        # Socket
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: dict[int, tuple[asyncio.Future, Optional[Callable]]] = {}
+        self._ids = itertools.count(1)
+        self._socket_lock = asyncio.Lock()
+        self._bridge_reachable: Optional[bool] = None
+        self._last_error: Optional[str] = None
+        self._remote_status: dict = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+        # Local mirror of the quote board
+        self._board: Optional[QuoteBoard] = None
+        self._versions = np.zeros(0, dtype=np.uint64)
+        self._slot_conid: dict[int, int] = {}
+        self._market_data_cache: dict[int, dict] = {}
+        self._tick_store = TickStore(
+            capacity=settings.tick_store_capacity,
+            min_interval=settings.tick_store_min_interval,
+        )
+        self._lines = _BridgeLines(self)
+        self._market_data_listeners: list[Callable[[int, dict], None]] = []
+
+        # Stats
+        self._requests = 0
+        self._failed_requests = 0
+
+        logger.info(f"IBBridgeClient initialized (not attached): socket={self.socket_path}, "
+                    f"board={settings.ib_bridge_board_name}")
+
+    # =========================================================================
+    # Connection Lifecycle
+    # =========================================================================
+
+    async def connect(self) -> bool:
+        """
+        Attach to the bridge (quote board + socket) and start the watch task.
+
+        Returns True if the bridge is connected to IB Gateway. Connecting to
+        IB (and reconnecting) is the bridge's job.
+        """
+        self._attach_board()
+        await self._open_socket()
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch_loop())
+        await self._refresh_status()
+        return self.is_connected()
+
+    async def disconnect(self):
+        """Detach from the bridge (its IB connection stays up)."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        self._close_socket("Detached from IB bridge")
+        self._detach_board()
+        logger.info("Detached from IB bridge")
+
+    async def reconnect(self) -> bool:
+        """Have the bridge reconnect to IB Gateway."""
+        connected = bool(await self._call(
+            "reconnect", False,
+            timeout=self._settings.ib_connection_timeout + self._settings.ib_bridge_request_timeout,
+        ))
+        await self._refresh_status()
+        return connected
+
+    async def start_auto_reconnect(self):
+        """The bridge reconnects to IB; the watch task (started by connect) reattaches to the bridge."""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch_loop())
+
+    async def stop_auto_reconnect(self):
+        pass
+
+    async def _watch_loop(self):
+        """Apply board changes every poll interval; check on the bridge every status interval."""
+        poll_interval = self._settings.ib_bridge_poll_interval
+        status_interval = self._settings.ib_bridge_status_interval
+        next_status = time.monotonic() + status_interval
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                self._sync_board()
+                if time.monotonic() >= next_status:
+                    next_status = time.monotonic() + status_interval
+                    if self._board_status() is None:
+                        self._reattach_board()
+                    await self._open_socket()
+                    await self._refresh_status()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"IB bridge watch error: {e}")
+
+    # =========================================================================
+    # Quote board
+    # =========================================================================
+
+    def _attach_board(self) -> bool:
+        if self._board is not None:
+            return True
+        try:
+            board = QuoteBoard.attach(self._settings.ib_bridge_board_name)
+        except (FileNotFoundError, ValueError) as e:
+            self._last_error = f"IB bridge quote board unavailable: {e}"
+            return False
+        self._use_board(board)
+        return True
+
+    def _reattach_board(self) -> None:
+        """Switch to a restarted bridge's board (the old one stops beating)."""
+        try:
+            board = QuoteBoard.attach(self._settings.ib_bridge_board_name)
+        except (FileNotFoundError, ValueError):
+            return
+        if self._board is not None and board.created == self._board.created:
+            board.close()  # Same bridge, just late
+            return
+        logger.info("Attached to a new IB bridge quote board")
+        self._detach_board()
+        self._use_board(board)
+
+    def _use_board(self, board: QuoteBoard) -> None:
+        self._board = board
+        self._versions = np.zeros(board.capacity, dtype=np.uint64)
+        self._sync_board()
+
+    def _detach_board(self) -> None:
+        for conid in self._market_data_cache:
+            self._tick_store.close(conid)
+        self._market_data_cache.clear()
+        self._slot_conid.clear()
+        if self._board is not None:
+            self._board.close()
+            self._board = None
+
+    def _sync_board(self) -> None:
+        """Apply slots whose version moved to the local cache, tick store and listeners."""
+        board = self._board
+        if board is None:
+            return
+        changed = np.flatnonzero(board.versions() != self._versions)
+        for slot in changed.tolist():
+            read = board.read_slot(slot)
+            if read is None:
+                continue
+            version, row = read
+            self._versions[slot] = version
+            conid = row[0]
+
+            previous = self._slot_conid.get(slot)
+            if previous is not None and previous != conid:
+                del self._slot_conid[slot]
+                self._market_data_cache.pop(previous, None)
+                self._tick_store.close(previous)
+            if conid == 0:
+                continue
+
+            entry = QuoteBoard.entry(row)
+            cached = self._market_data_cache.get(conid)
+            if cached is None:
+                self._market_data_cache[conid] = cached = entry
+                self._slot_conid[slot] = conid
+                self._tick_store.open(conid)
+            else:
+                cached.update(entry)
+
+            self._tick_store.append(
+                conid, row[7],
+                cached["bid"], cached["ask"], cached["last"],
+                cached["bidSize"], cached["askSize"], cached["volume"],
+            )
+            for listener in self._market_data_listeners:
+                try:
+                    listener(conid, cached)
+                except Exception as e:
+                    logger.warning(f"Market data listener error: {e}")
+
+    def _board_status(self) -> Optional[dict]:
+        """Header status if the bridge's heartbeat is fresh, else None."""
+        if self._board is None:
+            return None
+        status = self._board.status()
+        if status is None or time.time() - status["heartbeat"] > self._settings.ib_bridge_stale_after:
+            return None
+        return status
+
+    # =========================================================================
+    # Socket
+    # =========================================================================
+
+    async def _open_socket(self) -> bool:
+        async with self._socket_lock:
+            if self._writer is not None:
+                return True
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(self.socket_path), limit=STREAM_LIMIT)
+            except OSError as e:
+                self._last_error = f"IB bridge not reachable at {self.socket_path}: {e}"
+                if self._bridge_reachable is not False:
+                    logger.warning(self._last_error)
+                self._bridge_reachable = False
+                return False
+            self._writer = writer
+            self._reader_task = asyncio.create_task(self._read_replies(reader))
+            if not self._bridge_reachable:
+                logger.info(f"Connected to IB bridge at {self.socket_path}")
+            self._bridge_reachable = True
+            return True
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                pending = self._pending.get(message.get("id"))
+                if pending is None:
+                    continue  # Caller timed out
+                future, on_fill = pending
+                if "fill" in message:
+                    if on_fill is not None:
+                        try:
+                            on_fill(*_fill_objects(message["fill"]))
+                        except Exception as e:
+                            logger.warning(f"Fill callback error for order {message['fill'].get('order_id')}: {e}")
+                elif future.done():
+                    continue
+                elif "error" in message:
+                    future.set_exception(IBBridgeError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"IB bridge connection error: {e}")
+        self._close_socket("IB bridge connection closed")
+
+    def _close_socket(self, reason: str) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+
+    async def _call(self, method: str, default: Any, timeout: Optional[float] = None,
+                    on_fill: Optional[Callable] = None, **params) -> Any:
+        """Send a request and await the reply; default on any failure (logged, never raised)."""
+        self._requests += 1
+        if not await self._open_socket():
+            self._failed_requests += 1
+            return default
+        req_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = (future, on_fill)
+        try:
+            self._writer.write((json.dumps({"id": req_id, "method": method, "params": params}) + "\n").encode())
+            return await asyncio.wait_for(future, timeout or self._settings.ib_bridge_request_timeout)
+        except Exception as e:
+            self._failed_requests += 1
+            self._last_error = f"IB bridge {method} failed: {type(e).__name__}: {e}"
+            logger.warning(self._last_error)
+            return default
+        finally:
+            del self._pending[req_id]
+
+    def _notify(self, method: str, **params) -> None:
+        """Fire-and-forget request (no reply) if the socket is open."""
+        if self._writer is not None:
+            self._writer.write((json.dumps({"method": method, "params": params}) + "\n").encode())
+
+    async def _refresh_status(self) -> None:
+        status = await self._call("get_status", None)
+        if status is not None:
+            self._remote_status = status
+
+    # =========================================================================
+    # Status Methods
+    # =========================================================================
+
+    def is_connected(self) -> bool:
+        status = self._board_status()
+        return status is not None and status["connected"]
+
+    def is_ready_for_orders(self) -> bool:
+        status = self._board_status()
+        return status is not None and status["ready"]
+
+    def has_account_type_mismatch(self) -> bool:
+        status = self._board_status()
+        return status is not None and status["mismatch"]
+
+    def get_primary_account(self) -> Optional[str]:
+        status = self._board_status()
+        return status["account"] if status else None
+
+    def get_status(self) -> ConnectionStatus:
+        status = self._board_status()
+        if status is None:
+            return ConnectionStatus(
+                state=ConnectionState.DISCONNECTED,
+                connected=False,
+                ready_for_orders=False,
+                account=None,
+                last_connected=None,
+                last_error=self._last_error or "IB bridge not running",
+                reconnect_attempts=0,
+                next_reconnect_at=None,
+            )
+        remote = self._remote_status
+        return ConnectionStatus(
+            state=ConnectionState(status["state"]),
+            connected=status["connected"],
+            ready_for_orders=status["ready"],
+            account=status["account"],
+            last_connected=_parse_datetime(remote.get("last_connected")),
+            last_error=remote.get("last_error"),
+            reconnect_attempts=remote.get("reconnect_attempts", 0),
+            next_reconnect_at=_parse_datetime(remote.get("next_reconnect_at")),
+        )
+
+    async def get_accounts(self) -> list[str]:
+        return await self._call("get_accounts", [])
+
+    async def check_auth_status(self) -> dict:
+        default = {
+            "authenticated": False,
+            "connected": False,
+            "competing": False,
+            "message": self._last_error or "IB bridge not reachable",
+        }
+        return await self._call("check_auth_status", default)
+
+    def get_stats(self) -> dict:
+        status = self._board_status()
+        return {
+            "socket": str(self.socket_path),
+            "socket_connected": self._writer is not None,
+            "heartbeat_age": round(time.time() - status["heartbeat"], 3) if status else None,
+            "requests": self._requests,
+            "failed_requests": self._failed_requests,
+            "pending_requests": len(self._pending),
+            "last_error": self._last_error,
+            "board": self._board.get_stats() if self._board is not None else None,
+            "bridge": self._remote_status.get("bridge"),
+        }
+
+    # =========================================================================
+    # Trading Methods
+    # =========================================================================
+
+    async def place_order(
+        self,
+        account_id: str,
+        conid: int,
+        side: str,
+        quantity: int,
+        order_type: str = "MKT",
+        limit_price: Optional[float] = None,
+        stop_price: Optional[float] = None,
+        wait_for_fill: bool = False,
+        fill_timeout: Optional[float] = None,
+        on_fill: Optional[Callable[[Any, Any], Any]] = None,
+        order_ref: Optional[str] = None
+    ) -> dict:
+        """
+        Place an order through the bridge (see IBClient.place_order).
+
+        on_fill gets (trade, fill) stand-ins carrying order, orderStatus and
+        execution fields, relayed from the bridge as fills arrive.
+
+        The bridge keeps placing an order after a worker times out or loses
+        the socket, so a lost reply is not a rejection: the order is looked
+        up by its orderRef, and if that fails too the result is an error with
+        status ORDER_STATUS_UNKNOWN.
+        """
+        settings = self._settings
+        if not await self._open_socket():
+            return {"error": True, "message": self._last_error}  # Never sent: a plain failure
+        order_ref = order_ref or f"api-{uuid.uuid4().hex[:16]}"
+        wait = (fill_timeout or settings.ib_fill_timeout) if wait_for_fill else settings.ib_order_ack_timeout
+        result = await self._call(
+            "place_order", None,
+            timeout=wait + settings.ib_bridge_request_timeout,
+            on_fill=on_fill,
+            account_id=account_id,
+            conid=conid,
+            side=side,
+            quantity=quantity,
+            order_type=order_type,
+            limit_price=limit_price,
+            stop_price=stop_price,
+            wait_for_fill=wait_for_fill,
+            fill_timeout=fill_timeout,
+            stream_fills=on_fill is not None,
+            order_ref=order_ref,
+        )
+        if result is None:
+            return await self._reconcile_order(order_ref)
+        return result
+
+    async def _reconcile_order(self, order_ref: str) -> dict:
+        """place_order result for an order whose reply was lost, from the bridge's order list."""
+        error = self._last_error
+        for attempt in range(ORDER_RECONCILE_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(ORDER_RECONCILE_DELAY)
+            orders = await self._call("get_orders", None)
+            match = next((o for o in orders or () if o.get("orderRef") == order_ref), None)
+            if match is None:
+                continue
+            order_id, status = match["orderId"], match["status"]
+            logger.warning(f"place_order reply lost ({error}); found order {order_id} ({status}) by orderRef {order_ref}")
+            details = {"filled": match.get("filled"), "avgFillPrice": match.get("avgPrice"), "order_ref": order_ref}
+            if status in ("Cancelled", "ApiCancelled", "Inactive") and not match.get("filled"):
+                return {"error": True, "status": status, "message": f"Order {order_id} {status} at IB", "details": details}
+            return {
+                "error": False,
+                "order_id": order_id,
+                "orderId": order_id,
+                "status": status,
+                "message": f"Order {order_id} submitted",
+                "details": details,
+            }
+        logger.error(f"place_order reply lost ({error}) and order {order_ref} not found: outcome unknown")
+        return {
+            "error": True,
+            "status": ORDER_STATUS_UNKNOWN,
+            "order_ref": order_ref,
+            "message": f"{error}: the order may still have reached IB (orderRef {order_ref})",
+        }
+
+    async def cancel_order(self, order_id: int, wait_for_done: bool = False) -> dict:
+        settings = self._settings
+        wait = settings.ib_cancel_timeout if wait_for_done else 0.5
+        result = await self._call(
+            "cancel_order", None,
+            timeout=wait + settings.ib_bridge_request_timeout,
+            order_id=order_id,
+            wait_for_done=wait_for_done,
+        )
+        return result if result is not None else {"error": True, "message": self._last_error}
+
+    async def get_orders(self, filters: Optional[dict] = None) -> list[dict]:
+        return await self._call("get_orders", [], filters=filters)
+
+    async def get_positions(self, account_id: str) -> list[dict]:
+        return await self._call("get_positions", [], account_id=account_id)
+
+    async def get_account_values(self, account_id: str) -> dict:
+        return await self._call("get_account_values", {}, account_id=account_id)
+
+    def refresh_positions(self) -> bool:
+        """Ask the bridge to refresh its positions cache (no reply awaited)."""
+        self._notify("refresh_positions")
+        return self.is_connected()
+
+    async def qualify_contract(self, contract) -> bool:
+        """Qualify a contract through the bridge, filling in its fields (conId, ...) like IBClient."""
+        fields = await self._call("qualify_contract", None, contract=util.dataclassNonDefaults(contract))
+        if not fields:
+            return False
+        for name, value in fields.items():
+            setattr(contract, name, value)
+        return True
+
+    # =========================================================================
+    # Market Data
+    # =========================================================================
+
+    async def get_market_data_snapshot(self, conids: list[int]) -> list[dict]:
+        settings = self._settings
+        return await self._call(
+            "get_market_data_snapshot", [],
+            timeout=settings.ib_snapshot_timeout + settings.ib_bridge_request_timeout,
+            conids=list(conids),
+        )
+
+    async def get_market_data_for_symbol(self, symbol: str) -> Optional[dict]:
+        return await self._call("get_market_data_for_symbol", None, symbol=symbol)
+
+    async def subscribe_market_data(self, conid: int) -> bool:
+        return bool(await self._call("subscribe_market_data", False, conid=conid))
+
+    async def unsubscribe_market_data(self, conid: int) -> bool:
+        return bool(await self._call("unsubscribe_market_data", False, conid=conid))
+
+    async def subscribe_all_etfs(self) -> int:
+        return await self._call("subscribe_all_etfs", len(self.get_all_market_data()))
+
+    def unsubscribe_all_market_data(self):
+        """Lines belong to the bridge; a worker never drops them all."""
+
+    def add_market_data_listener(self, listener: Callable[[int, dict], None]):
+        """Call listener(conid, cache entry) for every board change. Must not block."""
+        if listener not in self._market_data_listeners:
+            self._market_data_listeners.append(listener)
+
+    def remove_market_data_listener(self, listener: Callable[[int, dict], None]):
+        if listener in self._market_data_listeners:
+            self._market_data_listeners.remove(listener)
+
+    def get_market_data(self, conid: int) -> Optional[dict]:
+        """Latest quote for a contract from the board."""
+        self._sync_board()
+        return self._market_data_cache.get(conid)
+
+    def get_all_market_data(self) -> Mapping[int, dict]:
+        """All quotes on the board as a read-only live view (no copy)."""
+        self._sync_board()
+        return MappingProxyType(self._market_data_cache)
+
+    @property
+    def market_data_lines(self) -> _BridgeLines:
+        return self._lines
+
+    @property
+    def tick_store(self) -> TickStore:
+        """Tick history built from board changes (conflated to the poll interval)."""
+        return self._tick_store
+
+
+if __name__ == "__main__":
+    from config import get_settings
+
+    logging.basicConfig(
+        level=get_settings().log_level.upper(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logging.getLogger("ib_insync").setLevel(logging.WARNING)
+    logging.getLogger("eventkit").setLevel(logging.WARNING)
+    asyncio.run(run_bridge())
@@ -10,16 +10,31 @@ Singleton IB client with:
 """
 import asyncio
 import logging
-from typing import Optional, Callable, Any
+import time
+from types import MappingProxyType
+from typing import Mapping, Optional, Callable, Any
 from datetime import datetime
 from enum import Enum
 from dataclasses import dataclass, field
 
-from ib_insync import IB, Stock, MarketOrder, LimitOrder, StopOrder, Order, Contract, Trade
+from ib_insync import IB, Stock, MarketOrder, LimitOrder, StopOrder, Order, Contract, Trade, Fill, OrderStatus
 import eventkit
 
+from services.etf_universe import get_etf_universe
+from services.tick_store import TickStore
+from services.market_data_lines import MarketDataLineManager
+
 logger = logging.getLogger(__name__)
 
+# place_order result status when it is not known whether IB received the
+# order (IB bridge reply lost); callers must not treat it as a rejection
+ORDER_STATUS_UNKNOWN = "unknown"
+
+
+def order_outcome_unknown(result: dict) -> bool:
+    """True if a place_order result is an outcome-unknown error (see ORDER_STATUS_UNKNOWN)."""
+    return bool(result.get("error")) and result.get("status") == ORDER_STATUS_UNKNOWN
+
 
 # =============================================================================
 # Connection State Machine
@@ -69,62 +84,22 @@ def get_tradable_etfs() -> list[dict]:
     """
     Get list of ETFs that are tradable via LYNX.
 
-    Returns ETFs from the tradability service (dynamically loaded from JSON).
-    Falls back to a minimal hardcoded list if service unavailable.
+    Returns ETFs from the shared ETF universe index (built once per
+    tradability load). Falls back to a minimal hardcoded list if the
+    tradability service is unavailable.
     """
-    try:
-        from services.tradability_service import get_tradability_service
-        service = get_tradability_service()
-        tradable = service.get_all_tradable()
-
-        # Convert to the expected format
-        result = []
-        for etf in tradable:
-            contract = etf.get("contract", {})
-            result.append({
-                "symbol": contract.get("symbol", ""),
-                "name": etf.get("name", ""),
-                "conid": contract.get("conId", 0),
-                "exchange": contract.get("exchange", "SMART"),
-                "primaryExchange": contract.get("primaryExchange", ""),
-                "currency": contract.get("currency", "EUR"),
-                "isin": etf.get("isin", ""),
-            })
-        return result
-    except Exception as e:
-        logger.warning(f"Could not load tradable ETFs from service: {e}")
-        # Minimal fallback
-        return [
-            {"symbol": "VUSA", "name": "Vanguard S&P 500 UCITS ETF", "conid": 128884495, "exchange": "AEB", "currency": "EUR", "isin": "IE00B3XXRP09"},
-            {"symbol": "IWDA", "name": "iShares Core MSCI World UCITS ETF", "conid": 100292038, "exchange": "AEB", "currency": "EUR", "isin": "IE00B4L5Y983"},
-        ]
-
-
-# Cache for tradable ETFs (refreshed on demand)
-_tradable_etfs_cache: list[dict] = []
-_tradable_etfs_loaded: bool = False
-
-
-def _load_tradable_etfs():
-    """Load tradable ETFs into cache."""
-    global _tradable_etfs_cache, _tradable_etfs_loaded
-    _tradable_etfs_cache = get_tradable_etfs()
-    _tradable_etfs_loaded = True
-    logger.info(f"Loaded {len(_tradable_etfs_cache)} tradable ETFs")
-
-
-def get_cached_tradable_etfs() -> list[dict]:
-    """Get cached tradable ETFs, loading if needed."""
-    global _tradable_etfs_loaded
-    if not _tradable_etfs_loaded:
-        _load_tradable_etfs()
-    return _tradable_etfs_cache
+    return list(get_etf_universe().etfs)
+
+
+def get_cached_tradable_etfs() -> tuple[dict, ...]:
+    """Get tradable ETFs from the current universe (no copy, no rebuild)."""
+    return get_etf_universe().etfs
 
 
 def refresh_tradable_etfs():
-    """Force refresh of tradable ETFs cache."""
-    global _tradable_etfs_loaded
-    _tradable_etfs_loaded = False
+    """Force refresh of tradable ETFs (reloads the tradability service)."""
+    from services.tradability_service import get_tradability_service
+    get_tradability_service().reload()
     return get_cached_tradable_etfs()
 
 
@@ -144,14 +119,19 @@ class IBClient:
     - Real connectivity detection
     """
 
-    def __init__(self, settings=None):
-        """Initialize client without connecting."""
+    def __init__(self, settings=None, ib_factory: Callable[[], IB] = IB):
+        """Initialize client without connecting.
+
+        ib_factory builds the IB instance on every connect (a simulated
+        gateway in benchmarks, see scripts/ib_stub.py).
+        """
         # Lazy import to avoid connection at module load
         if settings is None:
             from config import get_settings
             settings = get_settings()
 
         self._settings = settings
+        self._ib_factory = ib_factory
         self._ib: Optional[IB] = None
 
         # Connection state
@@ -178,6 +158,24 @@ class IBClient:
         self._market_data_cache: dict[int, dict] = {}
         self._market_data_tickers: dict[int, Any] = {}  # Track active ticker subscriptions
         self._market_data_contracts: dict[int, Contract] = {}
+        self._snapshot_requests: dict[int, asyncio.Task] = {}  # In-flight snapshot per conid
+        # Tick history per subscribed conid (bounded ring buffers)
+        self._tick_store = TickStore(
+            capacity=settings.tick_store_capacity,
+            min_interval=settings.tick_store_min_interval,
+        )
+
+        # Assigns the MAX_SUBSCRIPTIONS line budget by demand
+        self._lines = MarketDataLineManager(
+            self,
+            max_lines=self.MAX_SUBSCRIPTIONS,
+            rebalance_interval=settings.market_data_rebalance_interval,
+            demand_refresh_interval=settings.market_data_demand_refresh_interval,
+            hit_half_life=settings.market_data_hit_half_life,
+            hysteresis=settings.market_data_line_hysteresis,
+            min_dwell=settings.market_data_line_min_dwell,
+            max_evictions_per_minute=settings.market_data_max_evictions_per_minute,
+        )
 
         # Account type safety
         self._account_type_mismatch = False  # True if trading mode doesn't match account type
@@ -185,6 +183,7 @@ class IBClient:
         # Callbacks
         self._on_connect_callbacks: list[Callable] = []
         self._on_disconnect_callbacks: list[Callable] = []
+        self._market_data_listeners: list[Callable[[int, dict], None]] = []  # (conid, cache entry)
 
         logger.info(f"IBClient initialized (not connected): host={settings.ib_gateway_host}, port={settings.ib_gateway_port}")
 
@@ -219,7 +218,7 @@ class IBClient:
                     pass
 
             # Create fresh IB instance
-            self._ib = IB()
+            self._ib = self._ib_factory()
             self._setup_event_handlers()
 
             # Reset state
@@ -628,9 +627,21 @@ class IBClient:
         quantity: int,
         order_type: str = "MKT",
         limit_price: Optional[float] = None,
-        stop_price: Optional[float] = None
+        stop_price: Optional[float] = None,
+        wait_for_fill: bool = False,
+        fill_timeout: Optional[float] = None,
+        on_fill: Optional[Callable[[Trade, Fill], Any]] = None,
+        order_ref: Optional[str] = None
     ) -> dict:
-        """Place an order via IB Gateway."""
+        """
+        Place an order via IB Gateway.
+
+        By default returns as soon as IB acknowledges the order (or after
+        ib_order_ack_timeout). With wait_for_fill=True it waits until the
+        order reaches a terminal state or fill_timeout passes, streaming
+        partial fills to on_fill. order_ref is set as the order's orderRef
+        (shown by get_orders) so the caller can find the order again.
+        """
         from config import get_settings, TradingMode
         settings = get_settings()
 
@@ -680,8 +691,7 @@ class IBClient:
             return {"error": True, "message": f"Account {account_id} not found. Available: {accounts}"}
 
         # Find ETF in tradable list
-        tradable_etfs = get_cached_tradable_etfs()
-        etf_info = next((e for e in tradable_etfs if e["conid"] == conid), None)
+        etf_info = get_etf_universe().get_by_conid(conid)
         if not etf_info:
             return {"error": True, "message": f"Contract ID {conid} not in tradable ETF list"}
 
@@ -718,9 +728,15 @@ class IBClient:
             else:
                 return {"error": True, "message": f"Unsupported order type: {order_type}"}
 
+            if order_ref:
+                order.orderRef = order_ref
+
             # Place order
             trade = self._ib.placeOrder(contract, order)
-            await asyncio.sleep(0.5)
+            if wait_for_fill:
+                await self.wait_for_fill(trade, timeout=fill_timeout, on_fill=on_fill)
+            else:
+                await self.wait_for_ack(trade)
 
             status = trade.orderStatus.status
             order_id = trade.order.orderId
@@ -755,15 +771,107 @@ class IBClient:
             logger.error(error_msg)
             return {"error": True, "message": error_msg}
 
-    async def cancel_order(self, order_id: int) -> dict:
+    async def wait_for_ack(self, trade: Trade, timeout: Optional[float] = None) -> Trade:
+        """
+        Wait until IB acknowledges an order (leaves PendingSubmit/ApiPending).
+
+        Returns immediately once the first status update arrives instead of
+        sleeping a fixed interval.
+
+        Args:
+            trade: Trade returned by placeOrder
+            timeout: Max seconds to wait (default: settings.ib_order_ack_timeout)
+        """
+        if timeout is None:
+            timeout = self._settings.ib_order_ack_timeout
+        return await self._wait_for_trade(
+            trade,
+            lambda t: t.orderStatus.status not in ("PendingSubmit", "ApiPending"),
+            timeout,
+        )
+
+    async def wait_for_fill(
+        self,
+        trade: Trade,
+        timeout: Optional[float] = None,
+        on_fill: Optional[Callable[[Trade, Fill], Any]] = None
+    ) -> Trade:
+        """
+        Wait until an order is done (filled, cancelled or inactive).
+
+        Built on the trade's statusEvent/filledEvent, so it returns as soon
+        as the order reaches a terminal state. If the deadline passes first
+        the trade is returned as-is (check trade.orderStatus).
+
+        Args:
+            trade: Trade returned by placeOrder
+            timeout: Max seconds to wait (default: settings.ib_fill_timeout)
+            on_fill: Called with (trade, fill) for every (partial) execution
+
+        Returns:
+            The same Trade, with orderStatus.filled/avgFillPrice up to date
+        """
+        if timeout is None:
+            timeout = self._settings.ib_fill_timeout
+        return await self._wait_for_trade(trade, self._is_trade_done, timeout, on_fill)
+
+    @staticmethod
+    def _is_trade_done(trade: Trade) -> bool:
+        """Terminal order states (Inactive = rejected/not working at IB)."""
+        return trade.orderStatus.status in OrderStatus.DoneStates or trade.orderStatus.status == "Inactive"
+
+    async def _wait_for_trade(
+        self,
+        trade: Trade,
+        predicate: Callable[[Trade], bool],
+        timeout: float,
+        on_fill: Optional[Callable[[Trade, Fill], Any]] = None
+    ) -> Trade:
+        """Wait for predicate(trade) via trade events, bounded by timeout."""
+        done = asyncio.Event()
+
+        def _on_status(t: Trade):
+            if predicate(t):
+                done.set()
+
+        def _on_fill(t: Trade, fill: Fill):
+            if on_fill is not None:
+                try:
+                    on_fill(t, fill)
+                except Exception as e:
+                    logger.warning(f"Fill callback error for order {t.order.orderId}: {e}")
+            _on_status(t)
+
+        trade.statusEvent += _on_status
+        trade.filledEvent += _on_status
+        trade.fillEvent += _on_fill
+        try:
+            if not predicate(trade):
+                await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.info(
+                f"Order {trade.order.orderId} still {trade.orderStatus.status} after {timeout:.1f}s "
+                f"(filled {trade.orderStatus.filled}/{trade.order.totalQuantity})"
+            )
+        finally:
+            trade.statusEvent -= _on_status
+            trade.filledEvent -= _on_status
+            trade.fillEvent -= _on_fill
+
+        return trade
+
+    async def cancel_order(self, order_id: int, wait_for_done: bool = False) -> dict:
         """
         Cancel an order via IB Gateway.
 
         Args:
             order_id: The IB order ID to cancel
+            wait_for_done: Wait (up to ib_cancel_timeout) until the order is
+                cancelled or filled, so filled/avgFillPrice include every
+                fill that arrived before the cancel took effect
 
         Returns:
-            dict with success/error status
+            dict with success/error status and the order's filled quantity
         """
         if not self.is_connected():
             return {"error": True, "message": "Not connected to IB Gateway"}
@@ -780,13 +888,28 @@ class IBClient:
             if not target_trade:
                 return {"error": True, "message": f"Order {order_id} not found in active trades"}
 
+            fill_details = {
+                "filled": target_trade.orderStatus.filled,
+                "remaining": target_trade.orderStatus.remaining,
+                "avgFillPrice": target_trade.orderStatus.avgFillPrice,
+            }
+
             # Check if already filled
             if target_trade.orderStatus.status == "Filled":
-                return {"error": True, "message": f"Order {order_id} already filled, cannot cancel"}
+                return {
+                    "error": True,
+                    "order_id": order_id,
+                    "status": "Filled",
+                    "message": f"Order {order_id} already filled, cannot cancel",
+                    **fill_details,
+                }
 
             # Cancel the order
             self._ib.cancelOrder(target_trade.order)
-            await asyncio.sleep(0.5)
+            if wait_for_done:
+                await self._wait_for_trade(target_trade, self._is_trade_done, self._settings.ib_cancel_timeout)
+            else:
+                await asyncio.sleep(0.5)
 
             logger.info(f"Cancel request sent for order {order_id}, status: {target_trade.orderStatus.status}")
 
@@ -794,7 +917,10 @@ class IBClient:
                 "error": False,
                 "order_id": order_id,
                 "status": target_trade.orderStatus.status,
-                "message": f"Cancel request sent for order {order_id}"
+                "message": f"Cancel request sent for order {order_id}",
+                "filled": target_trade.orderStatus.filled,
+                "remaining": target_trade.orderStatus.remaining,
+                "avgFillPrice": target_trade.orderStatus.avgFillPrice,
             }
 
         except Exception as e:
@@ -821,6 +947,7 @@ class IBClient:
                 "filled": t.orderStatus.filled,
                 "status": t.orderStatus.status,
                 "avgPrice": t.orderStatus.avgFillPrice,
+                "orderRef": t.order.orderRef,
                 "lastExecutionTime": str(t.log[-1].time) if t.log else None
             } for t in trades]
         except Exception as e:
@@ -894,40 +1021,110 @@ class IBClient:
             return {}
 
     async def get_market_data_snapshot(self, conids: list[int]) -> list[dict]:
-        """Get market data snapshot."""
+        """
+        Get market data snapshot.
+
+        Conids with a fresh streaming tick are served from the market data
+        cache. All others get a snapshot request fired at once, awaited
+        together under one deadline (ib_snapshot_timeout). Concurrent callers
+        asking for the same conid share the in-flight IB request.
+        """
         if not self.is_connected():
             return []
 
-        results = []
-        tradable_etfs = get_cached_tradable_etfs()
-        etf_map = {e["conid"]: e for e in tradable_etfs}
+        universe = get_etf_universe()
+        max_age = self._settings.ib_snapshot_max_age
+
+        quotes: dict[int, dict] = {}
+        pending: dict[int, asyncio.Task] = {}
+        for conid in dict.fromkeys(conids):
+            cached = self._get_fresh_market_data(conid, max_age)
+            if cached:
+                quotes[conid] = self._snapshot_row(
+                    conid, cached.get("symbol", "UNKNOWN"),
+                    cached.get("last"), cached.get("bid"), cached.get("ask"),
+                    cached.get("bidSize"), cached.get("askSize"), cached.get("volume"),
+                )
+                continue
+
+            task = self._snapshot_requests.get(conid)
+            if task is None:
+                task = asyncio.ensure_future(self._request_snapshot(conid, universe.get_by_conid(conid) or {}))
+                self._snapshot_requests[conid] = task
+                task.add_done_callback(lambda _, c=conid: self._snapshot_requests.pop(c, None))
+            pending[conid] = task
+
+        if pending:
+            # shield: one caller going away must not cancel a request others share
+            rows = await asyncio.gather(*(asyncio.shield(t) for t in pending.values()))
+            quotes.update(zip(pending.keys(), rows))
+
+        return [quotes[conid] for conid in dict.fromkeys(conids)]
+
+    def _get_fresh_market_data(self, conid: int, max_age: float) -> Optional[dict]:
+        """Streaming cache entry for conid if it has a price no older than max_age seconds."""
+        cached = self._market_data_cache.get(conid)
+        if not cached or not cached.get("timestamp"):
+            return None
+        if not (cached.get("last") or cached.get("bid") or cached.get("ask")):
+            return None
+        age = (datetime.now() - datetime.fromisoformat(cached["timestamp"])).total_seconds()
+        return cached if age <= max_age else None
 
-        for conid in conids:
-            etf_info = etf_map.get(conid, {})
-            symbol = etf_info.get("symbol", "UNKNOWN")
+    async def _request_snapshot(self, conid: int, etf_info: dict) -> dict:
+        """Request one IB snapshot and wait for a full quote or the snapshot deadline."""
+        symbol = etf_info.get("symbol", "UNKNOWN")
+        try:
+            contract = Stock(symbol, "SMART", etf_info.get("currency", "USD"))
+            contract.conId = conid
+            ticker = self._ib.reqMktData(contract, snapshot=True)
 
-            try:
-                contract = Stock(symbol, "SMART", etf_info.get("currency", "USD"))
-                contract.conId = conid
-                ticker = self._ib.reqMktData(contract, snapshot=True)
-                await asyncio.sleep(0.5)
+            if not self._has_full_quote(ticker):
+                complete = asyncio.Event()
 
-                results.append({
-                    "conid": conid,
-                    "55": symbol,
-                    "31": ticker.last if ticker.last and ticker.last > 0 else None,
-                    "84": ticker.bid if ticker.bid and ticker.bid > 0 else None,
-                    "86": ticker.ask if ticker.ask and ticker.ask > 0 else None,
-                    "88": ticker.bidSize if ticker.bidSize else None,
-                    "85": ticker.askSize if ticker.askSize else None,
-                    "87": ticker.volume if ticker.volume else None,
-                })
-                self._ib.cancelMktData(contract)
-            except Exception as e:
-                logger.warning(f"Market data error for {symbol}: {e}")
-                results.append({"conid": conid, "55": symbol, "31": None, "84": None, "86": None, "88": None, "85": None, "87": None})
+                def _on_update(t):
+                    if self._has_full_quote(t):
+                        complete.set()
 
-        return results
+                ticker.updateEvent += _on_update
+                try:
+                    await asyncio.wait_for(complete.wait(), self._settings.ib_snapshot_timeout)
+                except asyncio.TimeoutError:
+                    pass  # Use whatever arrived before the deadline
+                finally:
+                    ticker.updateEvent -= _on_update
+
+            self._ib.cancelMktData(contract)
+            return self._snapshot_row(
+                conid, symbol,
+                self._positive(ticker.last), self._positive(ticker.bid), self._positive(ticker.ask),
+                ticker.bidSize or None, ticker.askSize or None, ticker.volume or None,
+            )
+        except Exception as e:
+            logger.warning(f"Market data error for {symbol}: {e}")
+            return self._snapshot_row(conid, symbol, None, None, None, None, None, None)
+
+    @staticmethod
+    def _positive(value) -> Optional[float]:
+        return value if value and value > 0 else None
+
+    @classmethod
+    def _has_full_quote(cls, ticker) -> bool:
+        return all(cls._positive(v) for v in (ticker.last, ticker.bid, ticker.ask))
+
+    @staticmethod
+    def _snapshot_row(conid, symbol, last, bid, ask, bid_size, ask_size, volume) -> dict:
+        """Snapshot in the IB field-code format parse_quote understands."""
+        return {
+            "conid": conid,
+            "55": symbol,
+            "31": last,
+            "84": bid,
+            "86": ask,
+            "88": bid_size,
+            "85": ask_size,
+            "87": volume,
+        }
 
     # =========================================================================
     # Streaming Market Data
@@ -945,17 +1142,43 @@ class IBClient:
         # Check if data is delayed (marketDataType 3 = delayed, 4 = delayed-frozen)
         delayed = getattr(ticker, 'marketDataType', 1) in (3, 4)
 
-        # Update cache with latest values
-        self._market_data_cache[conid].update({
-            "bid": ticker.bid if ticker.bid and ticker.bid > 0 else self._market_data_cache[conid].get("bid"),
-            "ask": ticker.ask if ticker.ask and ticker.ask > 0 else self._market_data_cache[conid].get("ask"),
-            "last": ticker.last if ticker.last and ticker.last > 0 else self._market_data_cache[conid].get("last"),
-            "bidSize": ticker.bidSize if ticker.bidSize else self._market_data_cache[conid].get("bidSize"),
-            "askSize": ticker.askSize if ticker.askSize else self._market_data_cache[conid].get("askSize"),
-            "volume": ticker.volume if ticker.volume else self._market_data_cache[conid].get("volume"),
-            "timestamp": datetime.now().isoformat(),
-            "delayed": delayed,
-        })
+        # Update cache in place with latest values, keeping the previous ones IB didn't send
+        cached = self._market_data_cache[conid]
+        if ticker.bid and ticker.bid > 0:
+            cached["bid"] = ticker.bid
+        if ticker.ask and ticker.ask > 0:
+            cached["ask"] = ticker.ask
+        if ticker.last and ticker.last > 0:
+            cached["last"] = ticker.last
+        if ticker.bidSize:
+            cached["bidSize"] = ticker.bidSize
+        if ticker.askSize:
+            cached["askSize"] = ticker.askSize
+        if ticker.volume:
+            cached["volume"] = ticker.volume
+        cached["timestamp"] = datetime.now().isoformat()
+        cached["delayed"] = delayed
+
+        self._tick_store.append(
+            conid, time.time(),
+            cached["bid"], cached["ask"], cached["last"],
+            cached["bidSize"], cached["askSize"], cached["volume"],
+        )
+
+        for listener in self._market_data_listeners:
+            try:
+                listener(conid, cached)
+            except Exception as e:
+                logger.warning(f"Market data listener error: {e}")
+
+    def add_market_data_listener(self, listener: Callable[[int, dict], None]):
+        """Call listener(conid, cache entry) after every ticker update. Must not block."""
+        if listener not in self._market_data_listeners:
+            self._market_data_listeners.append(listener)
+
+    def remove_market_data_listener(self, listener: Callable[[int, dict], None]):
+        if listener in self._market_data_listeners:
+            self._market_data_listeners.remove(listener)
 
     async def subscribe_market_data(self, conid: int) -> bool:
         """Subscribe to streaming market data for a contract.
@@ -971,8 +1194,7 @@ class IBClient:
             return True
 
         # Find ETF info from tradable list
-        tradable_etfs = get_cached_tradable_etfs()
-        etf_info = next((e for e in tradable_etfs if e["conid"] == conid), None)
+        etf_info = get_etf_universe().get_by_conid(conid)
         if not etf_info:
             logger.warning(f"Cannot subscribe to unknown conid: {conid}")
             return False
@@ -995,6 +1217,7 @@ class IBClient:
                 "timestamp": None,
                 "delayed": False,
             }
+            self._tick_store.open(conid)
 
             # Request streaming market data (empty string = default tick types)
             ticker = self._ib.reqMktData(contract, genericTickList="", snapshot=False, regulatorySnapshot=False)
@@ -1013,6 +1236,7 @@ class IBClient:
             logger.warning(f"Non-fatal: failed to subscribe market data for {etf_info['symbol']} (conid {conid}): {e}")
             # Clean up partial cache entry on failure
             self._market_data_cache.pop(conid, None)
+            self._tick_store.close(conid)
             return False
 
     async def unsubscribe_market_data(self, conid: int) -> bool:
@@ -1033,6 +1257,7 @@ class IBClient:
                 del self._market_data_contracts[conid]
             if conid in self._market_data_cache:
                 del self._market_data_cache[conid]
+            self._tick_store.close(conid)
 
             logger.info(f"Unsubscribed from market data for conid: {conid}")
             return True
@@ -1081,56 +1306,18 @@ class IBClient:
     MAX_SUBSCRIPTIONS = 100
 
     async def subscribe_all_etfs(self) -> int:
-        """Subscribe to market data, prioritizing model portfolio ETFs.
-
-        IB limits concurrent market data subscriptions. We subscribe to
-        model portfolio ETFs first, then fill remaining slots with others.
+        """Fill the market data line budget by demand (see MarketDataLineManager).
 
-        Never raises exceptions - logs warnings for individual failures
-        and returns the count of successful subscriptions.
+        Pending orders, held ETFs, model portfolio ETFs and recently
+        requested symbols get lines first; spare lines follow the tradable
+        list. Never raises exceptions - returns the number of lines in use.
         """
-        count = 0
-        failures = 0
-        subscribed_conids = set(self._market_data_tickers.keys())
-
-        # Phase 1: Subscribe to model portfolio ETFs first
-        for conid in self.MODEL_PORTFOLIO_CONIDS:
-            if count >= self.MAX_SUBSCRIPTIONS:
-                break
-            if conid not in subscribed_conids:
-                try:
-                    if await self.subscribe_market_data(conid):
-                        count += 1
-                        subscribed_conids.add(conid)
-                    else:
-                        failures += 1
-                except Exception as e:
-                    logger.warning(f"Non-fatal: subscribe failed for conid {conid}: {e}")
-                    failures += 1
-                await asyncio.sleep(0.05)
-
-        logger.info(f"Subscribed to {count} model portfolio ETFs ({failures} failures)")
-
-        # Phase 2: Fill remaining slots with other tradable ETFs
-        tradable_etfs = get_cached_tradable_etfs()
-        priority_set = set(self.MODEL_PORTFOLIO_CONIDS)
-        for etf in tradable_etfs:
-            if count >= self.MAX_SUBSCRIPTIONS:
-                break
-            conid = etf["conid"]
-            if conid not in subscribed_conids and conid not in priority_set:
-                try:
-                    if await self.subscribe_market_data(conid):
-                        count += 1
-                        subscribed_conids.add(conid)
-                    else:
-                        failures += 1
-                except Exception as e:
-                    logger.warning(f"Non-fatal: subscribe failed for {etf.get('symbol', conid)}: {e}")
-                    failures += 1
-                await asyncio.sleep(0.05)
-
-        logger.info(f"Total market data subscriptions: {count} ({failures} total failures)")
+        try:
+            count = await self._lines.fill()
+        except Exception as e:
+            logger.warning(f"Non-fatal: market data line fill failed: {e}")
+            count = len(self._market_data_tickers)
+        logger.info(f"Total market data subscriptions: {count}")
         return count
 
     def unsubscribe_all_market_data(self):
@@ -1146,32 +1333,41 @@ class IBClient:
         self._market_data_tickers.clear()
         self._market_data_contracts.clear()
         self._market_data_cache.clear()
+        self._tick_store.clear()
         logger.info("Unsubscribed from all market data")
 
     def get_market_data(self, conid: int) -> Optional[dict]:
         """Get cached market data for a contract."""
         return self._market_data_cache.get(conid)
 
-    def get_all_market_data(self) -> dict[int, dict]:
-        """Get all cached market data."""
-        return self._market_data_cache.copy()
+    def get_all_market_data(self) -> Mapping[int, dict]:
+        """Get all cached market data as a read-only live view (no copy)."""
+        return MappingProxyType(self._market_data_cache)
+
+    @property
+    def market_data_lines(self) -> MarketDataLineManager:
+        """Demand-driven assignment of the market data line budget."""
+        return self._lines
+
+    @property
+    def tick_store(self) -> TickStore:
+        """Tick history for subscribed conids (latest tick, OHLC bars, VWAP)."""
+        return self._tick_store
 
     async def get_market_data_for_symbol(self, symbol: str) -> Optional[dict]:
         """Get market data by symbol. Subscribes if not already subscribed.
 
         Never raises exceptions - returns None if data is unavailable.
         """
-        tradable_etfs = get_cached_tradable_etfs()
-        etf_info = next((e for e in tradable_etfs if e["symbol"].upper() == symbol.upper()), None)
+        etf_info = get_etf_universe().get_by_symbol(symbol)
         if not etf_info:
             return None
 
         conid = etf_info["conid"]
 
-        # Subscribe if not already
+        # Subscribe if not already and the line budget allows
         try:
-            if conid not in self._market_data_tickers:
-                await self.subscribe_market_data(conid)
+            if not self._lines.record_request(conid) and await self._lines.acquire(conid):
                 await asyncio.sleep(0.5)  # Wait for initial data
         except Exception as e:
             logger.warning(f"Non-fatal: market data subscription failed for {symbol}: {e}")
@@ -1200,7 +1396,7 @@ class IBClient:
 
     def get_mvp_etfs(self) -> list[dict]:
         """Get list of tradable ETFs."""
-        return get_cached_tradable_etfs().copy()
+        return list(get_cached_tradable_etfs())
 
     def parse_quote(self, raw: dict) -> dict:
         """Parse raw quote data into standardized format."""
@@ -1239,10 +1435,21 @@ _ib_client: Optional[IBClient] = None
 
 
 def get_ib_client() -> IBClient:
-    """Get or create IB client singleton (does NOT connect)."""
+    """
+    Get or create IB client singleton (does NOT connect).
+
+    With ib_bridge_enabled, API workers get an IBBridgeClient backed by the
+    IB bridge process (services/ib_bridge.py), which installs its own
+    IBClient here.
+    """
     global _ib_client
     if _ib_client is None:
-        _ib_client = IBClient()
+        from config import get_settings
+        if get_settings().ib_bridge_enabled:
+            from services.ib_bridge import IBBridgeClient
+            _ib_client = IBBridgeClient()
+        else:
+            _ib_client = IBClient()
     return _ib_client
 
 
@@ -1257,6 +1464,8 @@ async def shutdown_ib_client():
 async def reconnect_ib_client() -> bool:
     """Reconnect IB client."""
     client = get_ib_client()
+    if not isinstance(client, IBClient):
+        return await client.reconnect()  # The bridge process owns the connection
     await client.disconnect()
     await asyncio.sleep(1)
     return await client.connect()
@@ -0,0 +1,274 @@
+"""
+Materialized Leaderboards.
+
+Ranked lists of public portfolios, kept up to date by CommunityRepository
+as snapshots and portfolios are written, so leaderboard requests don't
+walk every portfolio's snapshot history:
+
+- return:<1M|3M|1Y|ALL>        /community/leaderboard - return between the
+                                latest snapshot and the oldest one within
+                                the period (ALL: cumulative_return_pct);
+                                portfolios with snapshots only
+- performance:<month|quarter|year|all_time>
+                                /portfolios/leaderboard - stored
+                                portfolio["performance"][period]
+- enhanced:<month|quarter|year|all_time>
+                                /portfolios/leaderboard/enhanced - same
+                                performance, volatility of daily return_pct
+                                as tiebreaker (lower first)
+
+Per portfolio the index keeps its snapshots as a time-sorted series with
+parsed timestamps, so a new snapshot is one insort plus a bisect per
+period. Period windows are anchored at the portfolio's latest snapshot
+(snapshots are created by the daily/monthly jobs, so that is "now").
+
+Each board is a sorted list of (sort key..., portfolio_id). Pages are
+slices after a cursor - the opaque encoded key of the last entry - so a
+page costs O(log n + limit) and stays consistent while entries move.
+"""
+import base64
+import bisect
+import json
+import math
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+
+RETURN_PERIODS = {"1M": 30, "3M": 90, "1Y": 365, "ALL": None}
+PERFORMANCE_PERIODS = {"month": 30, "quarter": 90, "year": 365, "all_time": None}
+
+DAY = 86400.0
+
+# Boards are re-sorted in one go when a refresh touches more than this share
+# of their entries (startup, bulk imports) instead of one insort each
+BULK_FRACTION = 0.125
+
+
+def _volatility(returns: list) -> float:
+    """Population std of daily returns (numpy for the long windows)."""
+    n = len(returns)
+    if n < 2:
+        return 0.0
+    if n > 64:
+        return float(np.std(returns))
+    mean = sum(returns) / n
+    return math.sqrt(sum((r - mean) ** 2 for r in returns) / n)
+
+
+def _epoch(timestamp: str) -> float:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str, arity: int) -> tuple:
+    """
+    Inverse of encode_cursor for a board whose keys are `arity` long
+    (numbers, then the portfolio id). Raises ValueError on a malformed
+    cursor or one from a board with a different key shape.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if (
+        not isinstance(key, list)
+        or len(key) != arity
+        or not isinstance(key[-1], str)
+        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in key[:-1])
+    ):
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+class _Board:
+    """Sorted (key..., portfolio_id) tuples with O(log n) lookup of a member's position."""
+
+    __slots__ = ("arity", "_keys", "_key_of")
+
+    def __init__(self, arity: int):
+        self.arity = arity  # Length of every key, portfolio_id included
+        self._keys: list[tuple] = []
+        self._key_of: dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def put(self, portfolio_id: str, key: tuple) -> None:
+        old = self._key_of.get(portfolio_id)
+        if old == key:
+            return
+        if old is not None:
+            self._keys.pop(bisect.bisect_left(self._keys, old))
+        bisect.insort(self._keys, key)
+        self._key_of[portfolio_id] = key
+
+    def discard(self, portfolio_id: str) -> None:
+        old = self._key_of.pop(portfolio_id, None)
+        if old is not None:
+            self._keys.pop(bisect.bisect_left(self._keys, old))
+
+    def update(self, keys: dict) -> None:
+        """Apply {portfolio_id: key or None (remove)}."""
+        if len(keys) > 64 and len(keys) > len(self._keys) * BULK_FRACTION:
+            for portfolio_id, key in keys.items():
+                if key is None:
+                    self._key_of.pop(portfolio_id, None)
+                else:
+                    self._key_of[portfolio_id] = key
+            self._keys = sorted(self._key_of.values())
+            return
+        for portfolio_id, key in keys.items():
+            if key is None:
+                self.discard(portfolio_id)
+            else:
+                self.put(portfolio_id, key)
+
+    def page(self, limit: int, after: Optional[tuple] = None) -> tuple[int, list[tuple]]:
+        """(index of the first entry, entries) after the cursor key."""
+        start = bisect.bisect_right(self._keys, after) if after is not None else 0
+        return start, self._keys[start:start + limit]
+
+
+class Leaderboards:
+    """Incrementally maintained leaderboards over the community repository."""
+
+    def __init__(self, get_portfolio: Callable[[str], Optional[dict]]):
+        self._get_portfolio = get_portfolio
+
+        # portfolio_id -> time-sorted snapshot series
+        self._times: dict[str, list[float]] = {}
+        self._points: dict[str, list[tuple]] = {}  # (total_value, cumulative_return_pct, daily return_pct or None, timestamp)
+
+        # portfolio_id -> {"returns": {period: (return_pct, total_value, snapshot_date)}, "volatility": {period: float}}
+        self._stats: dict[str, dict] = {}
+
+        self._boards: dict[str, _Board] = {}
+        for period in RETURN_PERIODS:
+            self._boards[f"return:{period}"] = _Board(2)
+        for period in PERFORMANCE_PERIODS:
+            self._boards[f"performance:{period}"] = _Board(2)
+            self._boards[f"enhanced:{period}"] = _Board(3)
+
+        self._dirty: set[str] = set()
+
+    # =========================================================================
+    # Updates (called by CommunityRepository under its lock)
+    # =========================================================================
+
+    def snapshot_added(self, snapshot: dict, snapshot_type: Optional[str]) -> None:
+        portfolio_id = snapshot.get("portfolio_id")
+        timestamp = snapshot.get("timestamp")
+        if not portfolio_id or not timestamp:
+            return
+        times = self._times.setdefault(portfolio_id, [])
+        points = self._points.setdefault(portfolio_id, [])
+        t = _epoch(timestamp)
+        i = bisect.bisect_right(times, t)
+        times.insert(i, t)
+        # Present-but-null fields count as 0, like missing ones
+        points.insert(i, (
+            snapshot.get("total_value") or 0,
+            snapshot.get("cumulative_return_pct") or 0,
+            (snapshot.get("return_pct") or 0) if snapshot_type == "daily" else None,
+            timestamp,
+        ))
+        self._dirty.add(portfolio_id)
+
+    def snapshot_removed(self, snapshot: dict) -> None:
+        portfolio_id = snapshot.get("portfolio_id")
+        times = self._times.get(portfolio_id)
+        if not times or not snapshot.get("timestamp"):
+            return
+        t = _epoch(snapshot["timestamp"])
+        points = self._points[portfolio_id]
+        for i in range(bisect.bisect_left(times, t), bisect.bisect_right(times, t)):
+            if points[i][3] == snapshot["timestamp"]:
+                del times[i], points[i]
+                break
+        if not times:
+            del self._times[portfolio_id], self._points[portfolio_id]
+        self._dirty.add(portfolio_id)
+
+    def portfolio_changed(self, portfolio_id: str) -> None:
+        self._dirty.add(portfolio_id)
+
+    def refresh(self) -> None:
+        """Re-rank the portfolios changed since the last refresh."""
+        if not self._dirty:
+            return
+        # Cleared only once the boards are updated, so a failure loses no changes
+        dirty = set(self._dirty)
+        updates: dict[str, dict] = {name: {} for name in self._boards}
+        for portfolio_id in dirty:
+            portfolio = self._get_portfolio(portfolio_id)
+            if portfolio is None or portfolio.get("visibility") != "public":
+                self._stats.pop(portfolio_id, None)
+                for keys in updates.values():
+                    keys[portfolio_id] = None
+            else:
+                self._rank(portfolio_id, portfolio, updates)
+        for name, keys in updates.items():
+            self._boards[name].update(keys)
+        self._dirty -= dirty
+
+    def _rank(self, portfolio_id: str, portfolio: dict, updates: dict) -> None:
+        times = self._times.get(portfolio_id)
+        points = self._points.get(portfolio_id)
+        returns, volatility = {}, {}
+
+        if times:
+            latest_t = times[-1]
+            latest_value, latest_cumulative, _, latest_ts = points[-1]
+            for period, days in RETURN_PERIODS.items():
+                if days is None:
+                    return_pct = latest_cumulative
+                else:
+                    # Oldest snapshot within the period
+                    start_value = points[bisect.bisect_left(times, latest_t - days * DAY)][0]
+                    return_pct = ((latest_value - start_value) / start_value) * 100 if start_value > 0 else 0.0
+                returns[period] = (return_pct, latest_value, latest_ts)
+                updates[f"return:{period}"][portfolio_id] = (-return_pct, portfolio_id)
+
+            for period, days in PERFORMANCE_PERIODS.items():
+                start = 0 if days is None else bisect.bisect_left(times, latest_t - days * DAY)
+                volatility[period] = _volatility([p[2] for p in points[start:] if p[2] is not None])
+        else:
+            for period in RETURN_PERIODS:
+                updates[f"return:{period}"][portfolio_id] = None
+
+        performance = portfolio.get("performance") or {}
+        for period in PERFORMANCE_PERIODS:
+            perf = performance.get(period, 0) or 0
+            if isinstance(perf, float) and math.isnan(perf):
+                perf = 0
+            updates[f"performance:{period}"][portfolio_id] = (-perf, portfolio_id)
+            updates[f"enhanced:{period}"][portfolio_id] = (-perf, volatility.get(period, 0.0), portfolio_id)
+
+        self._stats[portfolio_id] = {"returns": returns, "volatility": volatility}
+
+    # =========================================================================
+    # Reads
+    # =========================================================================
+
+    def page(self, board: str, limit: int, cursor: Optional[str] = None) -> tuple[list[tuple], int, Optional[str]]:
+        """
+        One page of a board: ([(rank, portfolio_id, stats)], total, next_cursor).
+
+        Raises KeyError for an unknown board, ValueError for a bad cursor.
+        """
+        self.refresh()
+        entries = self._boards[board]
+        start, keys = entries.page(limit, decode_cursor(cursor, entries.arity) if cursor else None)
+        page = [(start + i + 1, key[-1], self._stats.get(key[-1], {})) for i, key in enumerate(keys)]
+        more = start + len(keys) < len(entries)
+        next_cursor = encode_cursor(keys[-1]) if keys and more else None
+        return page, len(entries), next_cursor
+
+    def stats(self, portfolio_id: str) -> dict:
+        """{"returns": {period: (return_pct, total_value, snapshot_date)}, "volatility": {period: float}}."""
+        self.refresh()
+        return self._stats.get(portfolio_id, {})
@@ -0,0 +1,382 @@
+"""
+Market Data Line Manager.
+
+IB allows ~100 concurrent streaming market data lines (IBClient.MAX_SUBSCRIPTIONS).
+Instead of filling them once at startup, the manager keeps them on the ETFs
+with the most live demand. Demand score per conid:
+
+- pending order intentions  (price needed for batch execution)
+- held in virtual_holdings   (+ log of the number of holders)
+- model portfolio ETF
+- recent /marketdata/{symbol} requests, decaying with a half-life
+
+Every rebalance the highest-scoring conids without a line take over lines
+from the lowest-scoring ones (least recently used first on ties), with:
+- hysteresis: a challenger must beat the victim's score by a margin
+- minimum dwell: a freshly subscribed line can't be evicted right away
+- rate limit: a token bucket caps evictions per minute
+
+A request for an unsubscribed conid takes a free line immediately, or
+evicts one right away if it clears the same bar; otherwise it waits for
+the next rebalance. Lines nobody asks for are filled in tradable-list
+order so they still stream prices until something better comes along.
+Hit/miss counters show how often requests find a live line.
+"""
+import asyncio
+import math
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Demand weights
+WEIGHT_PENDING = 8.0
+WEIGHT_HELD = 4.0
+WEIGHT_MODEL = 2.0
+WEIGHT_HIT = 1.0  # Per request, before decay
+
+# A challenger needs score > victim * (1 + hysteresis) + MIN_GAIN
+MIN_GAIN = 0.5
+
+
+class MarketDataLineManager:
+    """Assigns the IB market data line budget by demand."""
+
+    def __init__(
+        self,
+        ib_client,
+        max_lines: int = 100,
+        rebalance_interval: float = 30.0,
+        demand_refresh_interval: float = 60.0,
+        hit_half_life: float = 900.0,
+        hysteresis: float = 0.25,
+        min_dwell: float = 120.0,
+        max_evictions_per_minute: int = 10,
+    ):
+        self._ib = ib_client
+        self.max_lines = max_lines
+        self.rebalance_interval = rebalance_interval
+        self.demand_refresh_interval = demand_refresh_interval
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.max_evictions_per_minute = max_evictions_per_minute
+        self._decay = math.log(2) / hit_half_life
+
+        # Demand
+        self._model = frozenset(ib_client.MODEL_PORTFOLIO_CONIDS)
+        self._held: dict[int, int] = {}  # conid -> holders
+        self._pending: frozenset = frozenset()
+        self._hits: dict[int, tuple[float, float]] = {}  # conid -> (decayed hits, as of)
+        self._demand_refreshed = 0.0
+
+        # Line state (subscribed set itself lives in IBClient)
+        self._subscribed_at: dict[int, float] = {}
+        self._last_used: dict[int, float] = {}
+
+        # Eviction token bucket
+        self._tokens = float(max_evictions_per_minute)
+        self._tokens_at = time.monotonic()
+
+        # _lock guards line state and is never held across a rebalance's paced
+        # IB calls; _rebalance_lock keeps rebalances from overlapping
+        self._lock = asyncio.Lock()
+        self._rebalance_lock = asyncio.Lock()
+        self._planned: set[int] = set()  # Conids a running rebalance will subscribe
+        self._evicting: set[int] = set()  # Lines a running rebalance will evict
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "subscribes": 0,
+            "evictions": 0,
+            "evictions_deferred": 0,
+            "rebalances": 0,
+        }
+
+    # =========================================================================
+    # Demand
+    # =========================================================================
+
+    def score(self, conid: int, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        score = 0.0
+        if conid in self._pending:
+            score += WEIGHT_PENDING
+        holders = self._held.get(conid)
+        if holders:
+            score += WEIGHT_HELD + math.log(holders)
+        if conid in self._model:
+            score += WEIGHT_MODEL
+        hit = self._hits.get(conid)
+        if hit:
+            score += hit[0] * math.exp(-self._decay * (now - hit[1]))
+        return score
+
+    def record_request(self, conid: int) -> bool:
+        """Count a market data request for conid. Returns True if it has a live line."""
+        now = time.monotonic()
+        hits, at = self._hits.get(conid, (0.0, now))
+        self._hits[conid] = (hits * math.exp(-self._decay * (now - at)) + WEIGHT_HIT, now)
+        self._last_used[conid] = now
+        if self.is_subscribed(conid):
+            self._metrics["hits"] += 1
+            return True
+        self._metrics["misses"] += 1
+        return False
+
+    def set_demand(self, held: Optional[dict] = None, pending=None) -> None:
+        """Replace holdings (conid -> holders) and/or pending intention conids."""
+        if held is not None:
+            self._held = dict(held)
+        if pending is not None:
+            self._pending = frozenset(pending)
+
+    async def refresh_demand(self) -> None:
+        """Reload held and pending conids from Supabase."""
+        from services.virtual_portfolio_service import get_virtual_portfolio_service
+        from services.order_intention_service import get_order_intention_service
+
+        held, pending = await asyncio.gather(
+            get_virtual_portfolio_service().get_held_conid_counts(),
+            get_order_intention_service().get_pending_intentions(),
+        )
+        self.set_demand(held=held, pending={i["conid"] for i in pending if i.get("conid")})
+        self._demand_refreshed = time.monotonic()
+
+    def _prune_hits(self, now: float) -> None:
+        # Forget requests that have decayed to nothing
+        for conid, (hits, at) in list(self._hits.items()):
+            if hits * math.exp(-self._decay * (now - at)) < 0.01:
+                del self._hits[conid]
+
+    # =========================================================================
+    # Lines
+    # =========================================================================
+
+    def is_subscribed(self, conid: int) -> bool:
+        return conid in self._ib._market_data_tickers
+
+    def _subscribed(self) -> set:
+        return set(self._ib._market_data_tickers)
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.max_evictions_per_minute),
+            self._tokens + (now - self._tokens_at) * self.max_evictions_per_minute / 60.0,
+        )
+        self._tokens_at = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def _eviction_order(self, subscribed: set, now: float) -> list:
+        """Evictable lines, weakest first (lowest score, then least recently used)."""
+        evictable = [
+            conid for conid in subscribed
+            if conid not in self._evicting and now - self._subscribed_at.get(conid, 0.0) >= self.min_dwell
+        ]
+        evictable.sort(key=lambda c: (self.score(c, now), self._last_used.get(c, 0.0)))
+        return evictable
+
+    def _beats(self, challenger_score: float, victim_score: float) -> bool:
+        return challenger_score > victim_score * (1 + self.hysteresis) + MIN_GAIN
+
+    def _subscribed_line(self, conid: int) -> None:
+        now = time.monotonic()
+        self._subscribed_at[conid] = now
+        self._last_used.setdefault(conid, now)
+        self._metrics["subscribes"] += 1
+
+    def _evicted_line(self, conid: int) -> None:
+        self._subscribed_at.pop(conid, None)
+        self._metrics["evictions"] += 1
+        logger.info(f"Market data line evicted: conid {conid} (score {self.score(conid):.2f})")
+
+    async def _subscribe(self, conid: int) -> bool:
+        if not await self._ib.subscribe_market_data(conid):
+            return False
+        self._subscribed_line(conid)
+        return True
+
+    async def _evict(self, conid: int) -> None:
+        await self._ib.unsubscribe_market_data(conid)
+        self._evicted_line(conid)
+
+    async def acquire(self, conid: int) -> bool:
+        """
+        Get a line for conid now if the budget allows.
+
+        Takes a free line, or evicts the weakest line if conid clears the
+        hysteresis bar and the eviction rate limit has a token. Otherwise the
+        request is left to the next rebalance.
+        """
+        if self.is_subscribed(conid):
+            return True
+        if not self._ib.is_connected():
+            return False
+        async with self._lock:
+            subscribed = self._subscribed()
+            # Lines a running rebalance is about to subscribe are taken
+            if conid in self._planned or len(subscribed | self._planned) < self.max_lines:
+                return await self._subscribe(conid)
+
+            now = time.monotonic()
+            victims = self._eviction_order(subscribed, now)
+            if not victims or not self._beats(self.score(conid, now), self.score(victims[0], now)):
+                return False
+            if not self._take_token():
+                self._metrics["evictions_deferred"] += 1
+                return False
+            await self._evict(victims[0])
+            return await self._subscribe(conid)
+
+    async def fill(self) -> int:
+        """Load demand if it was never loaded, then rebalance (startup, reconnect)."""
+        if not self._demand_refreshed:
+            try:
+                await self.refresh_demand()
+            except Exception as e:
+                logger.warning(f"Market data demand refresh failed: {e}")
+        return await self.rebalance()
+
+    async def rebalance(self, fill_idle: bool = True) -> int:
+        """
+        Move lines to the highest-demand conids. Returns the number of lines in use.
+
+        fill_idle: subscribe spare lines in tradable-list order (zero demand,
+        first to be evicted).
+        """
+        if not self._ib.is_connected():
+            return 0
+        from services.etf_universe import get_etf_universe
+        universe = get_etf_universe()
+
+        async with self._rebalance_lock:
+            async with self._lock:
+                self._metrics["rebalances"] += 1
+                plan = self._plan(universe, fill_idle)
+                self._planned = {conid for _, conid in plan}
+                self._evicting = {victim for victim, _ in plan if victim is not None}
+
+            # The paced IB calls run without the lock, so acquire() on the
+            # request path never waits for them; each line's state is
+            # committed under the lock as soon as its call returns
+            try:
+                for victim, conid in plan:
+                    if victim is not None:
+                        await self._ib.unsubscribe_market_data(victim)
+                        async with self._lock:
+                            self._evicting.discard(victim)
+                            self._evicted_line(victim)
+                    if self.is_subscribed(conid):
+                        # Taken by acquire() meanwhile
+                        self._planned.discard(conid)
+                        continue
+                    subscribed = await self._ib.subscribe_market_data(conid)
+                    async with self._lock:
+                        self._planned.discard(conid)
+                        if subscribed:
+                            self._subscribed_line(conid)
+                    await asyncio.sleep(0.05)  # IB pacing
+            finally:
+                self._planned.clear()
+                self._evicting.clear()
+
+            async with self._lock:
+                # Forget lines IBClient dropped (reconnect, unsubscribe_all)
+                subscribed = self._subscribed()
+                for conid in list(self._subscribed_at):
+                    if conid not in subscribed:
+                        del self._subscribed_at[conid]
+                return len(subscribed)
+
+    def _plan(self, universe, fill_idle: bool) -> list[tuple[Optional[int], int]]:
+        """
+        Rebalance steps as (victim or None, conid) pairs, in order: free
+        lines for the strongest demand, then swaps (strongest challenger
+        against weakest line), then idle fill. Called under the lock.
+        """
+        now = time.monotonic()
+        self._prune_hits(now)
+        subscribed = self._subscribed()
+
+        demand = set(self._pending) | set(self._held) | set(self._model) | set(self._hits)
+        scores = {c: self.score(c, now) for c in demand - subscribed if universe.get_by_conid(c)}
+        ranked = sorted((c for c, score in scores.items() if score > 0), key=scores.get, reverse=True)
+        free = max(0, self.max_lines - len(subscribed))
+
+        # Free lines first
+        plan = [(None, conid) for conid in ranked[:free]]
+
+        # Then swaps
+        victims = self._eviction_order(subscribed, now)
+        for conid in ranked[free:]:
+            if not victims or not self._beats(scores[conid], self.score(victims[0], now)):
+                break
+            if not self._take_token():
+                self._metrics["evictions_deferred"] += 1
+                break
+            plan.append((victims.pop(0), conid))
+
+        lines = len(subscribed) + min(free, len(ranked))
+        if fill_idle and lines < self.max_lines:
+            planned = {conid for _, conid in plan}
+            for etf in universe.etfs:
+                if lines >= self.max_lines:
+                    break
+                conid = etf.get("conid")
+                if conid and conid not in subscribed and conid not in planned:
+                    plan.append((None, conid))
+                    lines += 1
+        return plan
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._rebalance_loop())
+
+    async def _rebalance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            try:
+                if time.monotonic() - self._demand_refreshed >= self.demand_refresh_interval:
+                    await self.refresh_demand()
+                await self.rebalance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Market data line rebalance failed: {e}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        subscribed = self._subscribed()
+        requests = self._metrics["hits"] + self._metrics["misses"]
+        scores = [self.score(c, now) for c in subscribed]
+        return {
+            **self._metrics,
+            "hit_rate": round(self._metrics["hits"] / requests, 4) if requests else None,
+            "lines_used": len(subscribed),
+            "max_lines": self.max_lines,
+            "demand_conids": len(set(self._pending) | set(self._held) | set(self._model) | set(self._hits)),
+            "pending_conids": len(self._pending),
+            "held_conids": len(self._held),
+            "idle_lines": sum(1 for s in scores if s == 0),
+            "eviction_tokens": round(self._tokens, 2),
+        }
@@ -0,0 +1,228 @@
+"""
+Market Data Persistence.
+
+Keeps data/market_data_cache.json (the offline fallback for the market data
+endpoints and the community price lookups) up to date without any file I/O
+in request handlers.
+
+One task, started by the main.py lifespan, owns the file:
+- IBClient ticker updates only set a dirty flag (market data listener)
+- every market_data_persist_interval seconds, if dirty, the streaming cache
+  is copied on the event loop into a new immutable snapshot
+  {"timestamp", "data": {conid (str): entry}}, which becomes the in-memory
+  snapshot readers see
+- the snapshot is written off the event loop as compact JSON to a temp file,
+  fsynced and renamed over the cache file, so a crash never leaves a
+  half-written cache
+
+Readers call get_market_data_snapshot(); the snapshot is loaded from the
+file at startup, so cached prices survive a restart while IB is down.
+
+In IB bridge mode the bridge process owns the file and API workers follow
+it instead (follow()): every market_data_persist_interval seconds a
+background task stats the file and, when its mtime changed, reads it off
+the event loop and swaps in the new snapshot.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+MARKET_DATA_CACHE_FILE = DATA_DIR / "market_data_cache.json"
+
+_EMPTY_SNAPSHOT = {"timestamp": None, "data": {}}
+
+
+class MarketDataPersister:
+    """Owns the market data cache file and the last persisted snapshot."""
+
+    def __init__(self, path: Path = MARKET_DATA_CACHE_FILE, interval: float = 5.0):
+        self.path = Path(path)
+        self.interval = interval
+        self._snapshot: dict = _EMPTY_SNAPSHOT
+        self._dirty = False
+        self._ib_client = None
+        self._task: Optional[asyncio.Task] = None
+        self._mtime_ns: Optional[int] = None  # Of the file the snapshot was read from
+        self._writes = 0
+        self._last_write: Optional[str] = None
+        self._reloads = 0
+
+    # =========================================================================
+    # Snapshot
+    # =========================================================================
+
+    @property
+    def snapshot(self) -> dict:
+        """Last snapshot: {"timestamp": iso str, "data": {conid (str): entry}}. Do not mutate."""
+        return self._snapshot
+
+    def load(self) -> None:
+        """Load the persisted snapshot from disk (missing or corrupt file = empty)."""
+        try:
+            snapshot = self._read()
+            if snapshot is not None:
+                self._snapshot = snapshot
+                logger.info(f"Loaded market data cache: {len(snapshot['data'])} conids from {snapshot.get('timestamp')}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to load market data cache: {e}")
+
+    def _read(self) -> Optional[dict]:
+        """Read the cache file, remembering its mtime. None if it isn't a snapshot."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            # The writer renames a complete file into place: fstat and contents match
+            self._mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            snapshot = json.load(f)
+        if isinstance(snapshot, dict) and isinstance(snapshot.get("data"), dict):
+            return snapshot
+        return None
+
+    def read_if_changed(self) -> Optional[dict]:
+        """The cache file's snapshot if it changed since the last read, else None."""
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime_ns:
+                return None
+            return self._read()
+        except FileNotFoundError:
+            return None
+
+    def mark_dirty(self, conid: int = None, data: dict = None) -> None:
+        """IBClient market data listener: the streaming cache changed."""
+        self._dirty = True
+
+    def take_snapshot(self) -> Optional[dict]:
+        """Copy the streaming cache into a new snapshot if it changed (event loop only)."""
+        if not self._dirty or self._ib_client is None:
+            return None
+        self._dirty = False
+        cache = self._ib_client.get_all_market_data()
+        if not cache:
+            return None
+        snapshot = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": {str(conid): dict(entry) for conid, entry in cache.items()},
+        }
+        self._snapshot = snapshot
+        return snapshot
+
+    def write(self, snapshot: dict) -> None:
+        """Write a snapshot atomically (temp file + fsync + rename)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._writes += 1
+        self._last_write = snapshot["timestamp"]
+
+    async def flush(self) -> None:
+        """Persist the streaming cache now if it changed."""
+        snapshot = self.take_snapshot()
+        if snapshot is not None:
+            await asyncio.to_thread(self.write, snapshot)
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def start(self, ib_client) -> None:
+        """Start tracking ticker updates and the persistence task."""
+        if self._ib_client is None:
+            ib_client.add_market_data_listener(self.mark_dirty)
+            self._ib_client = ib_client
+        if self._task is None:
+            self._task = asyncio.create_task(self._persist_loop())
+
+    async def follow(self) -> None:
+        """Start reloading the snapshot whenever another process rewrites the file."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow_loop())
+
+    async def _follow_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                snapshot = await asyncio.to_thread(self.read_if_changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to reload market data cache: {e}")
+                continue
+            if snapshot is not None:
+                self._snapshot = snapshot
+                self._reloads += 1
+
+    async def _persist_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to save market data cache: {e}")
+
+    async def close(self) -> None:
+        """Stop the task and write pending changes (if this process owns the file)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Failed to save market data cache on shutdown: {e}")
+        if self._ib_client is not None:
+            self._ib_client.remove_market_data_listener(self.mark_dirty)
+            self._ib_client = None
+
+    def get_stats(self) -> dict:
+        return {
+            "conids": len(self._snapshot.get("data", {})),
+            "snapshot_timestamp": self._snapshot.get("timestamp"),
+            "writes": self._writes,
+            "last_write": self._last_write,
+            "reloads": self._reloads,
+            "dirty": self._dirty,
+        }
+
+
+# Singleton instance
+_persister: Optional[MarketDataPersister] = None
+
+
+def get_market_data_persister() -> MarketDataPersister:
+    """Get the market data persister singleton, loading the last snapshot on first use."""
+    global _persister
+    if _persister is None:
+        from config import get_settings
+        persister = MarketDataPersister(interval=get_settings().market_data_persist_interval)
+        persister.load()
+        _persister = persister
+    return _persister
+
+
+def get_market_data_snapshot() -> dict:
+    """Last market data snapshot: {"timestamp", "data": {conid (str): entry}}. Do not mutate."""
+    return get_market_data_persister().snapshot
+
+
+async def close_market_data_persister() -> None:
+    """Write pending changes and stop the persister (main.py lifespan shutdown)."""
+    global _persister
+    if _persister is not None:
+        await _persister.close()
+        _persister = None
@@ -0,0 +1,310 @@
+"""
+Market Data Stream.
+
+Pushes streaming quotes to WebSocket / SSE clients instead of having them
+poll /trading/marketdata.
+
+IBClient calls publish() from _on_ticker_update; that only marks the conid
+dirty, so the IB event loop never waits on a client. A flush runs at most
+market_data_stream_max_rate times per second and, for every conid that
+changed since the last flush:
+
+1. serializes the quote once to JSON (same fields as MarketDataResponse)
+2. offers that string to every subscriber whose filter matches
+
+Each subscriber keeps only the latest payload per conid until its sender
+task picks them up (conflation), so a slow client holds at most one
+pending quote per symbol and simply skips intermediate ticks. Clients can
+lower their own rate further with max_rate.
+"""
+import asyncio
+import json
+import math
+import time
+from typing import AsyncIterator, Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSubscriber:
+    """One connected client: symbol filter plus its conflated pending quotes."""
+
+    __slots__ = ("conids", "min_interval", "pending", "wakeup", "sent", "conflated")
+
+    def __init__(self, conids: Optional[frozenset] = None, max_rate: float = 0.0):
+        self.conids = conids  # None = all subscribed conids
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.pending: dict[int, str] = {}
+        self.wakeup = asyncio.Event()
+        self.sent = 0
+        self.conflated = 0
+
+    def offer(self, conid: int, payload: str):
+        if conid in self.pending:
+            self.conflated += 1
+        self.pending[conid] = payload
+        self.wakeup.set()
+
+    def take(self) -> list[str]:
+        batch = list(self.pending.values())
+        self.pending.clear()
+        self.wakeup.clear()
+        self.sent += len(batch)
+        return batch
+
+
+class MarketDataBroadcaster:
+    """Fans ticker updates out to stream subscribers with per-symbol conflation."""
+
+    def __init__(self, max_rate: float = 4.0, max_clients: int = 5000):
+        self.max_rate = max_rate
+        self.max_clients = max_clients
+        self._flush_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+
+        self._dirty: dict[int, dict] = {}  # conid -> live cache entry
+        self._clients: set[StreamSubscriber] = set()
+        self._all: set[StreamSubscriber] = set()  # Subscribers without a filter
+        self._by_conid: dict[int, set[StreamSubscriber]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_flush = 0.0
+        self._ib_client = None
+
+        # Stats
+        self._published = 0
+        self._serialized = 0
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    def start(self, ib_client):
+        """Start receiving ticker updates from the IB client."""
+        if self._ib_client is None:
+            ib_client.add_market_data_listener(self.publish)
+            self._ib_client = ib_client
+            logger.info(f"Market data stream started (max {self.max_rate}/s per symbol)")
+
+    def close(self):
+        """Stop receiving updates and wake all subscribers so their streams end."""
+        if self._ib_client is not None:
+            self._ib_client.remove_market_data_listener(self.publish)
+            self._ib_client = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        subscribers = list(self._clients)
+        self._clients.clear()
+        self._all.clear()
+        self._by_conid.clear()
+        self._dirty.clear()
+        for subscriber in subscribers:
+            subscriber.wakeup.set()
+
+    # =========================================================================
+    # Subscribers
+    # =========================================================================
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def subscribe(self, conids: Optional[Iterable[int]] = None, max_rate: float = 0.0,
+                  snapshot: Optional[dict] = None) -> StreamSubscriber:
+        """
+        Register a subscriber for conids (None = all).
+
+        snapshot (conid -> cache entry) is queued immediately so the client
+        starts with the current quotes instead of waiting for the next tick.
+        """
+        if self.client_count >= self.max_clients:
+            raise RuntimeError(f"Market data stream is full ({self.max_clients} clients)")
+        subscriber = StreamSubscriber(frozenset(conids) if conids is not None else None, max_rate)
+        self._clients.add(subscriber)
+        self._register(subscriber)
+        for conid, data in (snapshot or {}).items():
+            if subscriber.conids is None or conid in subscriber.conids:
+                payload = encode_quote(data)
+                if payload:
+                    subscriber.offer(conid, payload)
+        return subscriber
+
+    def update_filter(self, subscriber: StreamSubscriber, conids: Optional[Iterable[int]]):
+        """Replace a subscriber's symbol filter."""
+        self._unregister(subscriber)
+        subscriber.conids = frozenset(conids) if conids is not None else None
+        subscriber.pending = {
+            conid: payload for conid, payload in subscriber.pending.items()
+            if subscriber.conids is None or conid in subscriber.conids
+        }
+        self._register(subscriber)
+
+    def unsubscribe(self, subscriber: StreamSubscriber):
+        if subscriber in self._clients:
+            self._clients.discard(subscriber)
+            self._unregister(subscriber)
+        subscriber.wakeup.set()
+
+    def _register(self, subscriber: StreamSubscriber):
+        if subscriber.conids is None:
+            self._all.add(subscriber)
+        else:
+            for conid in subscriber.conids:
+                self._by_conid.setdefault(conid, set()).add(subscriber)
+
+    def _unregister(self, subscriber: StreamSubscriber):
+        if subscriber.conids is None:
+            self._all.discard(subscriber)
+            return
+        for conid in subscriber.conids:
+            subscribers = self._by_conid.get(conid)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_conid[conid]
+
+    async def stream(self, subscriber: StreamSubscriber) -> AsyncIterator[list[str]]:
+        """
+        Yield batches of JSON payloads (latest quote per conid) for a subscriber.
+
+        Honors the subscriber's own max_rate; ends once it is unsubscribed or
+        the broadcaster closes.
+        """
+        while True:
+            await subscriber.wakeup.wait()
+            if subscriber not in self._clients:
+                return
+            if not subscriber.pending:
+                subscriber.wakeup.clear()
+                continue
+            started = time.monotonic()
+            yield subscriber.take()
+            if subscriber.min_interval:
+                remaining = subscriber.min_interval - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+
+    # =========================================================================
+    # Publishing
+    # =========================================================================
+
+    def publish(self, conid: int, data: dict):
+        """Mark a conid as updated (called from IBClient._on_ticker_update)."""
+        self._published += 1
+        if not self._all and conid not in self._by_conid:
+            return
+        self._dirty[conid] = data
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self._last_flush + self._flush_interval - loop.time())
+            self._flush_handle = loop.call_later(delay, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        self._last_flush = asyncio.get_running_loop().time()
+        dirty, self._dirty = self._dirty, {}
+        for conid, data in dirty.items():
+            targets = self._by_conid.get(conid)
+            if not targets and not self._all:
+                continue
+            payload = encode_quote(data)
+            if not payload:
+                continue
+            self._serialized += 1
+            for subscriber in self._all:
+                subscriber.offer(conid, payload)
+            for subscriber in targets or ():
+                subscriber.offer(conid, payload)
+
+    def get_stats(self) -> dict:
+        return {
+            "clients": self.client_count,
+            "filtered_conids": len(self._by_conid),
+            "max_rate": self.max_rate,
+            "published": self._published,
+            "serialized": self._serialized,
+        }
+
+
+def safe_number(value, as_int: bool = False):
+    """Return None if value is None, NaN, or Inf; otherwise return the value."""
+    if value is None:
+        return None
+    try:
+        if math.isnan(value) or math.isinf(value):
+            return None
+    except (TypeError, ValueError):
+        return None
+    return int(value) if as_int else value
+
+
+def format_quote(data: Optional[dict], subscribed: bool = True) -> Optional[dict]:
+    """
+    MarketDataResponse fields for a market data cache entry (None if empty).
+
+    Shared by the stream and the /trading/marketdata endpoints so both
+    serve the same quote.
+    """
+    if not data:
+        return None
+    bid = safe_number(data.get("bid"))
+    ask = safe_number(data.get("ask"))
+    last = safe_number(data.get("last"))
+
+    # Spread and mid price; fall back to last price without bid/ask
+    spread = None
+    mid_price = None
+    if bid and ask and bid > 0 and ask > 0:
+        spread = round(ask - bid, 4)
+        mid_price = round((bid + ask) / 2, 4)
+    elif last and last > 0:
+        mid_price = last
+
+    return {
+        "conid": data.get("conid", 0),
+        "symbol": data.get("symbol", ""),
+        "bid": bid,
+        "ask": ask,
+        "last": last,
+        "bidSize": safe_number(data.get("bidSize"), as_int=True),
+        "askSize": safe_number(data.get("askSize"), as_int=True),
+        "volume": safe_number(data.get("volume"), as_int=True),
+        "spread": spread,
+        "midPrice": mid_price,
+        "timestamp": data.get("timestamp"),
+        "delayed": data.get("delayed", False),
+        "subscribed": subscribed,
+    }
+
+
+def encode_quote(data: Optional[dict]) -> Optional[str]:
+    """Serialize a market data cache entry to MarketDataResponse JSON."""
+    quote = format_quote(data)
+    if quote is None:
+        return None
+    return json.dumps(quote, separators=(",", ":"))
+
+
+# Singleton instance
+_broadcaster: Optional[MarketDataBroadcaster] = None
+
+
+def get_market_data_broadcaster() -> MarketDataBroadcaster:
+    """Get the market data broadcaster singleton."""
+    global _broadcaster
+    if _broadcaster is None:
+        from config import get_settings
+        settings = get_settings()
+        _broadcaster = MarketDataBroadcaster(
+            max_rate=settings.market_data_stream_max_rate,
+            max_clients=settings.market_data_stream_max_clients,
+        )
+    return _broadcaster
+
+
+def close_market_data_broadcaster():
+    """Stop the broadcaster and end all client streams."""
+    global _broadcaster
+    if _broadcaster is not None:
+        _broadcaster.close()
+        _broadcaster = None
@@ -0,0 +1,207 @@
+"""
+Market Indices Refresher.
+
+GET /trading/indices used to refetch every index when its 30 s cache
+expired, so the first request after expiry paid the upstream latency and a
+burst at expiry all missed together. Now one task, started by the main.py
+lifespan, keeps an immutable snapshot up to date and the endpoint just
+returns it:
+
+- every index has its own next-due time: indices_refresh_interval while
+  its market is open, indices_closed_refresh_interval while closed
+- due indices are fetched together (one batched price provider request)
+- an index whose fetch fails keeps its last good value and is retried at
+  the open interval; one that never loaded is a zero placeholder
+
+Snapshot: {"indices": tuple of IndexData dicts, "timestamp": iso str}.
+Neither the snapshot nor the dicts in it are ever mutated; each refresh
+builds a new one and swaps the reference.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+import logging
+
+from services.price_provider import get_price_provider
+
+logger = logging.getLogger(__name__)
+
+# Market indices configuration with Yahoo Finance symbols
+MARKET_INDICES = [
+    {"symbol": "^AEX", "name": "AEX", "display": "AEX", "currency": "EUR"},
+    {"symbol": "^GDAXI", "name": "DAX", "display": "DAX", "currency": "EUR"},
+    {"symbol": "^GSPC", "name": "S&P 500", "display": "S&P 500", "currency": "USD"},
+    {"symbol": "^N225", "name": "Nikkei 225", "display": "Japan", "currency": "JPY"},
+    {"symbol": "000001.SS", "name": "Shanghai Composite", "display": "China", "currency": "CNY"},
+    {"symbol": "^STOXX50E", "name": "EURO STOXX 50", "display": "STOXX 50", "currency": "EUR"},
+    {"symbol": "EURUSD=X", "name": "EUR/USD", "display": "EUR/USD", "currency": "USD"},
+    {"symbol": "BTC-EUR", "name": "Bitcoin", "display": "BTC/EUR", "currency": "EUR"},
+]
+
+
+def _placeholder(idx: dict) -> dict:
+    """N/A values for an index that has never loaded."""
+    return {
+        "symbol": idx["display"],
+        "name": idx["name"],
+        "price": 0,
+        "change": 0,
+        "change_percent": 0,
+        "currency": idx["currency"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "is_open": False,
+    }
+
+
+def _from_quote(idx: dict, quote: dict) -> dict:
+    """IndexData fields from a price provider quote."""
+    current_price = quote["price"]
+    previous_close = quote["previous_close"] or current_price
+
+    # Calculate change vs previous trading day close
+    change = current_price - previous_close
+    change_percent = (change / previous_close * 100) if previous_close else 0
+
+    return {
+        "symbol": idx["display"],
+        "name": idx["name"],
+        "price": round(current_price, 2),
+        "change": round(change, 2),
+        "change_percent": round(change_percent, 2),
+        "currency": idx["currency"],
+        "timestamp": datetime.utcfromtimestamp(quote["fetched_at"]).isoformat(),
+        "is_open": quote["market_open"],
+    }
+
+
+class IndicesRefresher:
+    """Keeps the market indices snapshot fresh from a background task."""
+
+    def __init__(self, open_interval: float = 30.0, closed_interval: float = 300.0,
+                 indices: Optional[list] = None):
+        self.open_interval = open_interval
+        self.closed_interval = closed_interval
+        self.indices = indices or MARKET_INDICES
+
+        self._entries: dict[str, dict] = {}  # Yahoo symbol -> last good IndexData dict
+        self._due: dict[str, float] = {idx["symbol"]: 0.0 for idx in self.indices}
+        self._snapshot: Optional[dict] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self._refreshes = 0
+        self._failures = 0
+
+    @property
+    def snapshot(self) -> Optional[dict]:
+        """Last published snapshot (None until the first refresh). Do not mutate."""
+        return self._snapshot
+
+    async def get_snapshot(self) -> dict:
+        """Current snapshot, loading it first if the task hasn't yet."""
+        if self._snapshot is None:
+            async with self._lock:
+                if self._snapshot is None:
+                    await self._refresh(self.indices)
+        return self._snapshot
+
+    async def refresh(self, due_only: bool = False) -> None:
+        """Fetch indices (all, or only those due) and publish a new snapshot."""
+        async with self._lock:
+            now = time.monotonic()
+            indices = [idx for idx in self.indices if not due_only or self._due[idx["symbol"]] <= now]
+            if indices:
+                await self._refresh(indices)
+
+    async def _refresh(self, indices: list) -> None:
+        started = time.time()
+        try:
+            quotes = await get_price_provider().get_quotes(
+                [idx["symbol"] for idx in indices], max_age=0, stale_ok=False
+            )
+        except Exception as e:
+            logger.warning(f"Indices refresh failed: {e}")
+            quotes = {}
+
+        now = time.monotonic()
+        for idx in indices:
+            symbol = idx["symbol"]
+            quote = quotes.get(symbol)
+            if quote is None or quote["fetched_at"] < started:
+                # Failed (or the provider fell back to an old quote): keep last good
+                self._failures += 1
+                self._due[symbol] = now + self.open_interval
+                continue
+            entry = _from_quote(idx, quote)
+            self._entries[symbol] = entry
+            self._due[symbol] = now + (self.open_interval if entry["is_open"] else self.closed_interval)
+
+        self._refreshes += 1
+        self._snapshot = {
+            "indices": tuple(self._entries.get(idx["symbol"]) or _placeholder(idx) for idx in self.indices),
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh(due_only=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Indices refresh failed: {e}")
+            next_due = min(self._due.values())
+            await asyncio.sleep(max(1.0, next_due - time.monotonic()))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "refreshes": self._refreshes,
+            "failures": self._failures,
+            "loaded": len(self._entries),
+            "snapshot_timestamp": self._snapshot["timestamp"] if self._snapshot else None,
+            "next_due_seconds": {s: round(max(0.0, due - now), 1) for s, due in self._due.items()},
+        }
+
+
+# Singleton instance
+_refresher: Optional[IndicesRefresher] = None
+
+
+def get_indices_refresher() -> IndicesRefresher:
+    """Get the market indices refresher singleton."""
+    global _refresher
+    if _refresher is None:
+        from config import get_settings
+        settings = get_settings()
+        _refresher = IndicesRefresher(
+            open_interval=settings.indices_refresh_interval,
+            closed_interval=settings.indices_closed_refresh_interval,
+        )
+    return _refresher
+
+
+async def close_indices_refresher() -> None:
+    """Stop the refresh task (main.py lifespan shutdown)."""
+    global _refresher
+    if _refresher is not None:
+        await _refresher.close()
+        _refresher = None
@@ -8,6 +8,7 @@ from typing import Optional, List
 from datetime import datetime, timezone
 from uuid import UUID
 from config import get_settings
+from services.supabase_client import supabase_client
 from services.virtual_portfolio_service import get_virtual_portfolio_service
 import logging
 
@@ -30,6 +31,9 @@ class OrderIntentionService:
     # Cash buffer for BUY orders (to account for price movement)
     PRICE_BUFFER_PERCENT = Decimal("0.02")  # 2%
 
+    # Max ids per `id=in.(...)` PATCH (keeps URLs under gateway limits)
+    BULK_UPDATE_CHUNK_SIZE = 200
+
     def __init__(self):
         settings = get_settings()
         self.base_url = f"{settings.supabase_url}/rest/v1"
@@ -172,7 +176,7 @@ class OrderIntentionService:
 
         # Create the intention record
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.post(
                     f"{self.base_url}/order_intentions",
                     headers=self.headers,
@@ -240,7 +244,7 @@ class OrderIntentionService:
             raise OrderIntentionError("Service not configured", code="NOT_CONFIGURED")
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 # Get the intention
                 response = await client.get(
                     f"{self.base_url}/order_intentions",
@@ -306,7 +310,7 @@ class OrderIntentionService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/order_intentions",
                     headers=self.headers,
@@ -346,7 +350,7 @@ class OrderIntentionService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {
                     "user_id": f"eq.{user_id}",
                     "select": "*",
@@ -382,7 +386,7 @@ class OrderIntentionService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 response = await client.get(
                     f"{self.base_url}/order_intentions",
                     headers=self.headers,
@@ -429,7 +433,7 @@ class OrderIntentionService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 update_data = {"status": status}
 
                 if message:
@@ -459,6 +463,88 @@ class OrderIntentionService:
             logger.error(f"Error updating intention status: {e}")
             return False
 
+    async def bulk_update_intentions(self, updates: List[dict]) -> bool:
+        """
+        Update many intentions in one set-based call.
+
+        Uses the bulk_update_order_intentions RPC (single round-trip for any
+        number of rows). If the RPC is unavailable, falls back to PATCH with
+        `id=in.(...)`, one call per chunk of intentions sharing the same fields.
+
+        Args:
+            updates: One dict per intention with "id" plus any of: status,
+                status_message, batch_id, aggregated_order_id,
+                filled_quantity, fill_price, fill_value
+
+        Returns:
+            True if every row was updated
+        """
+        if not self._configured:
+            return False
+        if not updates:
+            return True
+
+        try:
+            async with supabase_client(timeout=30.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/rpc/bulk_update_order_intentions",
+                    headers=self.headers,
+                    json={"p_updates": updates}
+                )
+                if response.status_code < 400:
+                    expected = len({update["id"] for update in updates})
+                    updated = (response.json() or {}).get("updated")
+                    if updated != expected:
+                        logger.error(
+                            f"bulk_update_order_intentions updated {updated} of {expected} intentions"
+                        )
+                        return False
+                    return True
+                logger.warning(
+                    f"bulk_update_order_intentions RPC failed ({response.status_code}), "
+                    f"falling back to chunked PATCH: {response.text}"
+                )
+        except Exception as e:
+            logger.warning(f"bulk_update_order_intentions RPC error, falling back to chunked PATCH: {e}")
+
+        return await self._bulk_patch_intentions(updates)
+
+    async def _bulk_patch_intentions(self, updates: List[dict]) -> bool:
+        """Fallback for bulk_update_intentions: PATCH id=in.(...) per shared payload."""
+        # Group intentions that receive identical fields
+        groups: dict = {}
+        executed_at = datetime.now(timezone.utc).isoformat()
+        for update in updates:
+            fields = {k: v for k, v in update.items() if k != "id" and v is not None}
+            if fields.get("status") in ("filled", "partially_filled"):
+                fields["executed_at"] = executed_at
+            key = tuple(sorted(fields.items()))
+            groups.setdefault(key, []).append(update["id"])
+
+        expected = sum(len(set(ids)) for ids in groups.values())
+        updated = 0
+        try:
+            async with supabase_client(timeout=30.0) as client:
+                for key, ids in groups.items():
+                    fields = dict(key)
+                    for start in range(0, len(ids), self.BULK_UPDATE_CHUNK_SIZE):
+                        chunk = ids[start:start + self.BULK_UPDATE_CHUNK_SIZE]
+                        response = await client.patch(
+                            f"{self.base_url}/order_intentions",
+                            headers=self.headers,
+                            params={"id": f"in.({','.join(str(i) for i in chunk)})", "select": "id"},
+                            json=fields
+                        )
+                        response.raise_for_status()
+                        updated += len(response.json())
+            if updated != expected:
+                logger.error(f"Bulk intention PATCH updated {updated} of {expected} intentions")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Error bulk updating intentions: {e}")
+            return False
+
     async def get_pending_summary(self) -> dict:
         """
         Get summary of all pending orders for next batch.
@@ -6,9 +6,9 @@ Provides a centralized view of:
 - assigned_cash_total: sum of all virtual account allocations
 - unassigned_cash: broker_available_cash - assigned_cash_total
 """
-import httpx
 import logging
 from config import get_settings
+from services.supabase_client import supabase_client
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +45,7 @@ class PlatformCapitalService:
             return {}
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.post(
                     f"{self.rpc_url}/sync_platform_capital",
                     headers=self.headers,
@@ -71,7 +71,7 @@ class PlatformCapitalService:
             return {}
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.rest_url}/platform_capital",
                     headers=self.headers,
@@ -0,0 +1,331 @@
+"""
+Fallback Price Provider.
+
+Prices from Yahoo Finance for when IB has no data (virtual account
+valuation) and for the market indices. Replaces the per-router
+one-symbol-per-request fetches:
+
+- batching: symbols requested within price_batch_window seconds go out
+  together in one spark request (up to price_batch_size symbols each)
+- single-flight: concurrent callers for the same symbol share one fetch
+- stale-while-revalidate: an entry older than max_age but younger than
+  price_cache_stale_ttl is returned immediately while a background fetch
+  refreshes it
+- bounded: the cache is an LRU of price_cache_max_entries symbols
+
+Quotes are dicts: {"symbol", "price", "previous_close", "currency",
+"market_open", "fetched_at"}. A symbol Yahoo doesn't know is cached as
+missing for a short while so it isn't re-requested on every call.
+
+base_url is configurable so the provider can run against a local stub
+(see scripts/bench_price_provider.py).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+YAHOO_BASE_URL = "https://query1.finance.yahoo.com"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Mapping: IB symbol -> Yahoo Finance symbol (for ETFs where they differ)
+YAHOO_SYMBOL_MAP = {
+    "VUAA": "VUAA.DE",
+    "CAC": "CAC.PA",
+    "IWDA": "IWDA.AS",
+    "EMIM": "EMIM.AS",
+    "SXRS": "SXRS.DE",
+    "IWDP": "IWDP.AS",
+    "VWCE": "VWCE.DE",
+    "SXR8": "SXR8.DE",
+    "VFEM": "VFEM.AS",
+    "IMEU": "IMEU.AS",
+}
+
+
+def yahoo_symbol(etf_symbol: str) -> str:
+    """Yahoo Finance symbol for an ETF (Euronext Amsterdam unless mapped)."""
+    return YAHOO_SYMBOL_MAP.get(etf_symbol, f"{etf_symbol}.AS")
+
+
+def _parse_meta(symbol: str, meta: dict, closes: list) -> Optional[dict]:
+    """Build a quote from a chart/spark meta block."""
+    price = meta.get("regularMarketPrice")
+    if not price or price <= 0:
+        return None
+
+    previous_close = meta.get("previousClose") or meta.get("chartPreviousClose")
+    if not previous_close and len(closes) >= 2 and closes[0] is not None:
+        previous_close = closes[0]
+
+    state = meta.get("marketState")
+    if state:
+        market_open = state in ("REGULAR", "PRE", "POST")
+    else:
+        # Spark responses carry the trading periods instead of marketState
+        periods = meta.get("currentTradingPeriod") or {}
+        start = (periods.get("pre") or periods.get("regular") or {}).get("start")
+        end = (periods.get("post") or periods.get("regular") or {}).get("end")
+        market_open = bool(start and end and start <= time.time() < end)
+
+    return {
+        "symbol": symbol,
+        "price": price,
+        "previous_close": previous_close or price,
+        "currency": meta.get("currency"),
+        "market_open": market_open,
+        "fetched_at": time.time(),
+    }
+
+
+class _Entry:
+    __slots__ = ("quote", "fetched")
+
+    def __init__(self, quote: Optional[dict], fetched: float):
+        self.quote = quote  # None = symbol unknown upstream
+        self.fetched = fetched
+
+
+class PriceProvider:
+    """Batched, single-flight, stale-while-revalidate Yahoo Finance quotes."""
+
+    def __init__(
+        self,
+        base_url: str = YAHOO_BASE_URL,
+        ttl: float = 300.0,
+        stale_ttl: float = 3600.0,
+        missing_ttl: float = 60.0,
+        max_entries: int = 2048,
+        batch_size: int = 20,
+        batch_window: float = 0.02,
+        timeout: float = 5.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.missing_ttl = missing_ttl
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+
+        self._client = client
+        self._owns_client = client is None
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._queued: list[str] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self._metrics = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_requests": 0,
+            "upstream_errors": 0,
+            "evictions": 0,
+        }
+
+    # =========================================================================
+    # Public API
+    # =========================================================================
+
+    async def get_quotes(self, symbols: Iterable[str], max_age: Optional[float] = None,
+                         stale_ok: bool = True) -> dict[str, dict]:
+        """
+        Quotes for Yahoo symbols; symbols without a price are left out.
+
+        max_age: freshness for this call (default: ttl). Older entries
+        within stale_ttl are returned as-is and refreshed in the background,
+        unless stale_ok is False (then the caller waits for the refresh, and
+        gets the old quote only if the refresh fails).
+        """
+        max_age = self.ttl if max_age is None else max_age
+        now = time.time()
+        result: dict[str, dict] = {}
+        waiting: dict[str, asyncio.Future] = {}
+
+        for symbol in dict.fromkeys(symbols):
+            entry = self._cache.get(symbol)
+            if entry is not None:
+                self._cache.move_to_end(symbol)
+                age = now - entry.fetched
+                if entry.quote is None:
+                    if age < self.missing_ttl:
+                        self._metrics["hits"] += 1
+                        continue
+                elif age < max_age:
+                    self._metrics["hits"] += 1
+                    result[symbol] = entry.quote
+                    continue
+                elif stale_ok and age < self.stale_ttl:
+                    self._metrics["stale_hits"] += 1
+                    result[symbol] = entry.quote
+                    self._request(symbol)  # Revalidate, don't wait
+                    continue
+            self._metrics["misses"] += 1
+            waiting[symbol] = self._request(symbol)
+
+        if waiting:
+            # shield: a cancelled caller must not cancel a fetch others share
+            quotes = await asyncio.gather(*(asyncio.shield(f) for f in waiting.values()))
+            for symbol, quote in zip(waiting, quotes):
+                if quote is not None:
+                    result[symbol] = quote
+        return result
+
+    async def get_quote(self, symbol: str, max_age: Optional[float] = None) -> Optional[dict]:
+        return (await self.get_quotes([symbol], max_age)).get(symbol)
+
+    async def get_prices(self, symbols: Iterable[str], max_age: Optional[float] = None) -> dict[str, float]:
+        """Last price per Yahoo symbol."""
+        quotes = await self.get_quotes(symbols, max_age)
+        return {symbol: quote["price"] for symbol, quote in quotes.items()}
+
+    # =========================================================================
+    # Batching
+    # =========================================================================
+
+    def _request(self, symbol: str) -> asyncio.Future:
+        """In-flight future for symbol, queueing a fetch if there is none."""
+        future = self._inflight.get(symbol)
+        if future is not None:
+            self._metrics["coalesced"] += 1
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[symbol] = future
+        self._queued.append(symbol)
+
+        if len(self._queued) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        queued, self._queued = self._queued, []
+        for i in range(0, len(queued), self.batch_size):
+            task = asyncio.create_task(self._fetch_batch(queued[i:i + self.batch_size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_batch(self, symbols: list[str]):
+        quotes: dict[str, Optional[dict]] = {}
+        try:
+            quotes = await self._fetch(symbols)
+            now = time.time()
+            for symbol in symbols:
+                self._store(symbol, _Entry(quotes.get(symbol), now))
+        except Exception as e:
+            # Keep whatever is cached; callers get the stale quote or None
+            self._metrics["upstream_errors"] += 1
+            logger.debug(f"Price fetch failed for {','.join(symbols)}: {e}")
+        finally:
+            for symbol in symbols:
+                future = self._inflight.pop(symbol, None)
+                if future is not None and not future.done():
+                    entry = self._cache.get(symbol)
+                    future.set_result(quotes.get(symbol) or (entry.quote if entry else None))
+
+    async def _fetch(self, symbols: list[str]) -> dict[str, dict]:
+        """One spark request for up to batch_size symbols."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, headers={"User-Agent": USER_AGENT})
+            self._owns_client = True
+        self._metrics["upstream_requests"] += 1
+
+        response = await self._client.get(
+            f"{self.base_url}/v8/finance/spark",
+            params={"symbols": ",".join(symbols), "range": "1d", "interval": "1d"},
+        )
+        response.raise_for_status()
+
+        quotes = {}
+        for item in (response.json().get("spark") or {}).get("result") or []:
+            symbol = item.get("symbol")
+            for chart in item.get("response") or []:
+                closes = ((chart.get("indicators") or {}).get("quote") or [{}])[0].get("close") or []
+                quote = _parse_meta(symbol, chart.get("meta") or {}, closes)
+                if quote:
+                    quotes[symbol] = quote
+        return quotes
+
+    def _store(self, symbol: str, entry: _Entry):
+        if entry.quote is None and symbol in self._cache and self._cache[symbol].quote is not None:
+            # Upstream dropped a symbol it knew: keep serving the last price
+            entry = _Entry(self._cache[symbol].quote, self._cache[symbol].fetched)
+        self._cache[symbol] = entry
+        self._cache.move_to_end(symbol)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self._metrics["evictions"] += 1
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for future in self._inflight.values():
+            if not future.done():
+                future.set_result(None)
+        self._inflight.clear()
+        self._queued.clear()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    def get_stats(self) -> dict:
+        return {
+            **self._metrics,
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+        }
+
+
+# Singleton instance
+_provider: Optional[PriceProvider] = None
+
+
+def get_price_provider() -> PriceProvider:
+    """Get the price provider singleton."""
+    global _provider
+    if _provider is None:
+        from config import get_settings
+        settings = get_settings()
+        _provider = PriceProvider(
+            base_url=settings.price_provider_base_url,
+            ttl=settings.price_cache_ttl,
+            stale_ttl=settings.price_cache_stale_ttl,
+            max_entries=settings.price_cache_max_entries,
+            batch_size=settings.price_batch_size,
+            batch_window=settings.price_batch_window,
+            timeout=settings.price_provider_timeout,
+        )
+    return _provider
+
+
+async def close_price_provider():
+    """Close the provider's HTTP client (main.py lifespan shutdown)."""
+    global _provider
+    if _provider is not None:
+        await _provider.close()
+        _provider = None
@@ -0,0 +1,332 @@
+"""
+Quote Board.
+
+Fixed-layout shared-memory table of the latest quote per subscribed conid,
+written by the IB bridge process (services/ib_bridge.py) and read by every
+API worker on the host without locks or IPC round-trips.
+
+Layout (one multiprocessing.shared_memory segment):
+
+    header   128 B     magic, capacity, creation time, bridge heartbeat and
+                       connection status (connected, ready, account, ...)
+    seq      8 B/slot  per-slot sequence number (seqlock)
+    slots    128 B/slot SLOT_DTYPE row: conid, quote, sizes, volume, tick time
+
+A slot belongs to one conid until the bridge releases it (conid 0 = free).
+There is exactly one writer. It bumps a slot's seq to odd, writes the row,
+then bumps it back to even. Readers copy seq, the row, and seq again and
+retry if the two differ or are odd, so they never see a half-written quote
+and never block the writer. The header status uses the same scheme.
+
+Readers poll for changes by comparing the seq array against the versions
+they last saw (one vectorized compare for the whole board), then decode
+only the slots that moved.
+
+The seqlock relies on aligned 8-byte stores being atomic and on stores
+becoming visible in program order, which holds on x86-64 (the deployment
+target).
+"""
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BOARD_MAGIC = 0x5155_4F54_4542_0001  # "QUOTEB" + layout version
+
+HEADER_DTYPE = np.dtype({
+    "names": ["magic", "capacity", "created", "heartbeat", "seq",
+              "connected", "ready", "mismatch", "state", "account"],
+    "formats": ["u8", "u8", "f8", "f8", "u8", "u1", "u1", "u1", "u1", "S24"],
+    "offsets": [0, 8, 16, 24, 32, 40, 41, 42, 43, 44],
+    "itemsize": 128,
+})
+
+# ts (epoch seconds) feeds tick stores; timestamp is the same instant as the
+# ISO string cache entries carry, stored so readers don't format it per read
+SLOT_DTYPE = np.dtype({
+    "names": ["conid", "bid", "ask", "last", "bid_size", "ask_size", "volume", "ts", "delayed",
+              "symbol", "timestamp"],
+    "formats": ["i8", "f8", "f8", "f8", "f8", "f8", "f8", "f8", "u1", "S23", "S32"],
+    "offsets": [0, 8, 16, 24, 32, 40, 48, 56, 64, 65, 88],
+    "itemsize": 128,
+})
+
+# Connection states in the header (index = ConnectionState order in ib_client)
+STATES = ("disconnected", "connecting", "connected", "reconnecting", "failed")
+
+# A writer holds a slot odd for a few microseconds. Readers spin briefly,
+# then yield the CPU (the writer may have been preempted mid-write), and
+# give up after MAX_READ_RETRIES (e.g. the bridge died mid-write)
+SPIN_RETRIES = 100
+MAX_READ_RETRIES = 1000
+
+_EMPTY_ROW = (0, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, 0.0, 0, b"", b"")
+
+
+def board_size(capacity: int) -> int:
+    return HEADER_DTYPE.itemsize + capacity * (8 + SLOT_DTYPE.itemsize)
+
+
+def _num(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _opt(value: float) -> Optional[float]:
+    return None if value != value else value  # NaN -> None
+
+
+class QuoteBoard:
+    """Seqlocked quote slots in shared memory (one writer, many readers)."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.capacity = capacity
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+        self._seq = np.ndarray((capacity,), dtype=np.uint64, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+        self._slots = np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=shm.buf,
+                                 offset=HEADER_DTYPE.itemsize + capacity * 8)
+
+        # Writer state (bridge only)
+        self._slot_of: dict[int, int] = {}
+        self._free: list[int] = []
+        self._next_slot = 0
+        self._full_warned = False
+
+        # Reader stats
+        self.retries = 0
+        self.failed_reads = 0
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    @classmethod
+    def create(cls, name: str, capacity: int = 1024) -> "QuoteBoard":
+        """Create the board (bridge). A segment left behind by a crashed bridge is replaced."""
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=board_size(capacity))
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            logger.warning(f"Replaced stale quote board {name}")
+            shm = shared_memory.SharedMemory(name=name, create=True, size=board_size(capacity))
+
+        board = cls(shm, capacity, owner=True)
+        board._seq[:] = 0
+        board._slots[:] = _EMPTY_ROW
+        header = board._header
+        header["capacity"] = capacity
+        header["created"] = time.time()
+        header["heartbeat"] = 0.0
+        header["seq"] = 0
+        header["magic"] = BOARD_MAGIC  # Last: readers reject a board without it
+        logger.info(f"Quote board {name} created: {capacity} slots, {board_size(capacity) / 1024:.0f} KB")
+        return board
+
+    @classmethod
+    def attach(cls, name: str) -> "QuoteBoard":
+        """Attach to the bridge's board (worker). Raises FileNotFoundError if there is none."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 registers attached segments with the resource tracker,
+        # which would unlink the bridge's board when this worker exits
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+        magic, capacity = int(header["magic"]), int(header["capacity"])
+        del header  # No exported views may remain when the segment is closed
+        if magic != BOARD_MAGIC or shm.size < board_size(capacity):
+            shm.close()
+            raise ValueError(f"Shared memory {name} is not a quote board (or not initialized yet)")
+        return cls(shm, capacity, owner=False)
+
+    @property
+    def created(self) -> float:
+        return float(self._header["created"])
+
+    def close(self):
+        """Detach; the bridge also removes the segment."""
+        self._header = self._seq = self._slots = None
+        self._shm.close()
+        if self.owner:
+            # A reader in the same process tree shares our resource tracker and
+            # dropped the registration in attach(); unlink() expects it
+            resource_tracker.register(self._shm._name, "shared_memory")
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # =========================================================================
+    # Writer (bridge)
+    # =========================================================================
+
+    def publish(self, conid: int, entry: dict) -> bool:
+        """Write the latest quote for conid (an IBClient market data cache entry)."""
+        slot = self._slot_of.get(conid)
+        if slot is None:
+            slot = self._assign(conid)
+            if slot is None:
+                return False
+
+        timestamp = entry.get("timestamp")
+        row = (
+            conid,
+            _num(entry.get("bid")), _num(entry.get("ask")), _num(entry.get("last")),
+            _num(entry.get("bidSize")), _num(entry.get("askSize")), _num(entry.get("volume")),
+            datetime.fromisoformat(timestamp).timestamp() if timestamp else 0.0,
+            1 if entry.get("delayed") else 0,
+            (entry.get("symbol") or "").encode()[:23],
+            timestamp.encode() if timestamp else b"",
+        )
+        seq = self._seq
+        seq[slot] += 1  # odd: write in progress
+        self._slots[slot] = row
+        seq[slot] += 1  # even: row consistent
+        return True
+
+    def release(self, conid: int) -> None:
+        """Free conid's slot (market data line dropped)."""
+        slot = self._slot_of.pop(conid, None)
+        if slot is None:
+            return
+        seq = self._seq
+        seq[slot] += 1
+        self._slots[slot] = _EMPTY_ROW
+        seq[slot] += 1
+        self._free.append(slot)
+
+    def _assign(self, conid: int) -> Optional[int]:
+        if self._free:
+            slot = self._free.pop()
+        elif self._next_slot < self.capacity:
+            slot = self._next_slot
+            self._next_slot += 1
+        else:
+            if not self._full_warned:
+                logger.warning(f"Quote board full ({self.capacity} slots), conid {conid} not published")
+                self._full_warned = True
+            return None
+        self._slot_of[conid] = slot
+        return slot
+
+    def published_conids(self) -> list[int]:
+        return list(self._slot_of)
+
+    def set_status(self, state: str, connected: bool, ready: bool, mismatch: bool, account: Optional[str]) -> None:
+        """Write the connection status and heartbeat into the header."""
+        header = self._header
+        header["seq"] += 1
+        header["connected"] = connected
+        header["ready"] = ready
+        header["mismatch"] = mismatch
+        header["state"] = STATES.index(state) if state in STATES else 0
+        header["account"] = (account or "").encode()[:24]
+        header["heartbeat"] = time.time()
+        header["seq"] += 1
+
+    # =========================================================================
+    # Readers (workers)
+    # =========================================================================
+
+    def status(self) -> Optional[dict]:
+        """Connection status and heartbeat written by the bridge (None if unreadable)."""
+        header = self._header
+        for attempt in range(MAX_READ_RETRIES):
+            if attempt >= SPIN_RETRIES:
+                time.sleep(0)
+            before = int(header["seq"])
+            if before & 1 == 0:
+                values = header[["heartbeat", "connected", "ready", "mismatch", "state", "account"]].item()
+                if int(header["seq"]) == before:
+                    heartbeat, connected, ready, mismatch, state, account = values
+                    return {
+                        "heartbeat": heartbeat,
+                        "connected": bool(connected),
+                        "ready": bool(ready),
+                        "mismatch": bool(mismatch),
+                        "state": STATES[state] if state < len(STATES) else STATES[0],
+                        "account": account.decode() or None,
+                    }
+            self.retries += 1
+        self.failed_reads += 1
+        return None
+
+    def versions(self) -> np.ndarray:
+        """Copy of every slot's sequence number (compare against an earlier copy to find changes)."""
+        return self._seq.copy()
+
+    def read_slot(self, slot: int) -> Optional[tuple]:
+        """(version, row tuple) for one slot, consistent; None if the writer never let go."""
+        seq = self._seq
+        slots = self._slots
+        for attempt in range(MAX_READ_RETRIES):
+            if attempt >= SPIN_RETRIES:
+                time.sleep(0)
+            before = int(seq[slot])
+            if before & 1 == 0:
+                row = slots[slot].item()
+                if int(seq[slot]) == before:
+                    return before, row
+            self.retries += 1
+        self.failed_reads += 1
+        return None
+
+    def read(self, conid: int) -> Optional[dict]:
+        """Latest quote for conid as a market data cache entry, or None if not on the board."""
+        for slot in np.flatnonzero(self._slots["conid"] == conid):
+            read = self.read_slot(int(slot))
+            if read is not None and read[1][0] == conid:
+                return self.entry(read[1])
+        return None
+
+    def read_all(self) -> dict[int, dict]:
+        """Every published quote: {conid: cache entry}."""
+        # One bulk copy; only slots that changed during it are re-read one by one
+        before = self._seq.copy()
+        rows = self._slots.copy()
+        after = self._seq.copy()
+        torn = np.flatnonzero((before != after) | (before & 1 == 1))
+        self.retries += len(torn)
+
+        for slot in torn:
+            read = self.read_slot(int(slot))
+            rows[slot] = read[1] if read is not None else _EMPTY_ROW
+        return {row[0]: self.entry(row) for row in rows[rows["conid"] != 0].tolist()}
+
+    @staticmethod
+    def entry(row: tuple) -> dict:
+        """SLOT_DTYPE row tuple -> dict in the IBClient market data cache format."""
+        conid, bid, ask, last, bid_size, ask_size, volume, ts, delayed, symbol, timestamp = row
+        return {
+            "conid": conid,
+            "symbol": symbol.decode(),
+            "bid": _opt(bid),
+            "ask": _opt(ask),
+            "last": _opt(last),
+            "bidSize": _opt(bid_size),
+            "askSize": _opt(ask_size),
+            "volume": _opt(volume),
+            "timestamp": timestamp.decode() or None,
+            "delayed": bool(delayed),
+        }
+
+    def get_stats(self) -> dict:
+        used = int(np.count_nonzero(self._slots["conid"]))
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "slots_used": used,
+            "bytes": board_size(self.capacity),
+            "read_retries": self.retries,
+            "failed_reads": self.failed_reads,
+        }
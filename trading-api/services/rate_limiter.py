@@ -0,0 +1,89 @@
+"""
+Async Token Bucket.
+
+Paces requests to IB: TWS/Gateway disconnects API clients that send more
+than ~50 messages per second (error 100, "Max rate of messages per second
+has been exceeded"). Callers await acquire() before each request; tokens
+refill continuously at `rate` per second up to `burst`.
+
+Waiters are served in FIFO order, so one slow caller can't be starved by a
+stream of newcomers. pause() stops handing out tokens for a while, for
+backing off after a pacing violation.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class TokenBucket:
+    """FIFO async token bucket."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: deque = deque()
+        self._acquired = 0
+        self._waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:  # Not while paused
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available right now (and nobody is queued)."""
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiters or now < self._paused_until or self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        self._acquired += 1
+        return True
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available and take them."""
+        if self.try_acquire(tokens):
+            return
+        started = time.monotonic()
+        ticket = object()
+        self._waiters.append(ticket)
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiters[0] is ticket and now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    delay = max(tokens - self._tokens, 0.0) / self.rate
+                await asyncio.sleep(max(delay, 0.001))
+        finally:
+            self._waiters.remove(ticket)
+        self._acquired += 1
+        self._waited += time.monotonic() - started
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` and start from an empty bucket."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    def get_stats(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(max(self._tokens, 0.0), 2),
+            "waiting": len(self._waiters),
+            "acquired": self._acquired,
+            "wait_seconds": round(self._waited, 2),
+        }
@@ -1,7 +1,26 @@
-"""Trading safety service with per-user limits and double-submission prevention."""
+"""
+Trading safety service with per-user limits and double-submission prevention.
+
+Limits, daily stats and pending orders live in a state backend
+(services/safety_state.py): process memory by default, or a SQLite file
+shared by all uvicorn workers (safety_state_backend = "sqlite").
+
+Order flow: check_order_safety() is a read-only pre-check (limits,
+duplicates, confirmation requirements). claim_order() repeats the checks
+and, if they pass, marks the order pending and reserves its count and value
+in the daily stats as one atomic backend operation, so concurrent requests -
+in this worker or another one sharing the SQLite state - can't both pass.
+release_order() returns the reservation if the order isn't placed;
+record_order_executed() keeps it and clears the pending mark.
+
+A customer's calls in this process are ordered by the customer's lock
+stripe (customer_id % safety_lock_stripes), so customers don't wait on each
+other. The stripes are process-local; across workers only the backend's
+atomicity counts. All SQLite calls run off the event loop.
+"""
 import asyncio
-from datetime import datetime, date
-from typing import Optional, Dict, Set
+from datetime import date
+from typing import Optional, Set
 from dataclasses import dataclass, field
 from config import get_settings, TradingMode
 import logging
@@ -51,30 +70,31 @@ class SafetyCheckResult:
 class SafetyService:
     """Service for enforcing trading safety limits."""
 
-    def __init__(self):
-        self._user_stats: Dict[int, UserDailyStats] = {}
-        self._pending_orders: Dict[str, datetime] = {}  # order_hash -> timestamp
-        self._pending_order_ttl = 30  # Seconds before pending order expires
-        self._user_limits: Dict[int, UserSafetyLimits] = {}
-        self._lock = asyncio.Lock()
-
-    def get_user_limits(self, customer_id: int) -> UserSafetyLimits:
+    def __init__(self, state=None, lock_stripes: int = 64):
+        if state is None:
+            from services.safety_state import MemorySafetyState
+            state = MemorySafetyState()
+        self._state = state
+        self._pending_order_ttl = state.pending_ttl  # Seconds before pending order expires
+        self._locks = [asyncio.Lock() for _ in range(max(1, lock_stripes))]
+
+    def _lock_for(self, customer_id: int) -> asyncio.Lock:
+        """The lock stripe serializing a customer's checks and updates."""
+        return self._locks[hash(customer_id) % len(self._locks)]
+
+    async def _call(self, fn, *args):
+        """Call a state backend method, off the event loop if it does I/O."""
+        if self._state.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get_user_limits(self, customer_id: int) -> UserSafetyLimits:
         """Get safety limits for a user. Can be customized per user."""
-        if customer_id not in self._user_limits:
-            self._user_limits[customer_id] = UserSafetyLimits()
-        return self._user_limits[customer_id]
+        return await self._call(self._state.get_limits, customer_id)
 
-    def set_user_limits(self, customer_id: int, limits: UserSafetyLimits):
+    async def set_user_limits(self, customer_id: int, limits: UserSafetyLimits):
         """Set custom limits for a user."""
-        self._user_limits[customer_id] = limits
-
-    def _get_user_stats(self, customer_id: int) -> UserDailyStats:
-        """Get or create daily stats for a user."""
-        if customer_id not in self._user_stats:
-            self._user_stats[customer_id] = UserDailyStats()
-        stats = self._user_stats[customer_id]
-        stats.reset_if_new_day()
-        return stats
+        await self._call(self._state.set_limits, customer_id, limits)
 
     def _generate_order_hash(
         self,
@@ -104,75 +124,121 @@ class SafetyService:
 
         Returns SafetyCheckResult with allowed=True/False and any warnings.
         """
-        async with self._lock:
-            limits = self.get_user_limits(customer_id)
-            stats = self._get_user_stats(customer_id)
-            warnings = []
-
-            # Check 1: Order size limit
-            if quantity > limits.max_order_size:
-                return SafetyCheckResult(
-                    allowed=False,
-                    reason=f"Order size {quantity} exceeds maximum allowed {limits.max_order_size}"
-                )
-
-            # Check 2: Order value limit
-            if estimated_value > limits.max_order_value:
-                return SafetyCheckResult(
-                    allowed=False,
-                    reason=f"Order value {estimated_value:.2f} EUR exceeds maximum {limits.max_order_value:.2f} EUR"
-                )
-
-            # Check 3: Daily order count
-            if stats.order_count >= limits.max_daily_orders:
-                return SafetyCheckResult(
-                    allowed=False,
-                    reason=f"Daily order limit reached ({limits.max_daily_orders} orders)"
-                )
-
-            # Check 4: Daily exposure limit
-            if stats.total_exposure + estimated_value > limits.max_daily_exposure:
-                return SafetyCheckResult(
-                    allowed=False,
-                    reason=f"Order would exceed daily exposure limit of {limits.max_daily_exposure:.2f} EUR"
-                )
-
-            # Check 5: Double submission prevention
-            order_hash = self._generate_order_hash(
-                customer_id, ib_account_id, symbol, side, quantity, order_type
+        order_hash = self._generate_order_hash(
+            customer_id, ib_account_id, symbol, side, quantity, order_type
+        )
+        async with self._lock_for(customer_id):
+            limits, stats, pending_age = await self._call(self._check_state, customer_id, order_hash)
+        return self._evaluate(limits, stats, pending_age, quantity, estimated_value, is_live_mode)
+
+    async def claim_order(
+        self,
+        customer_id: int,
+        ib_account_id: str,
+        symbol: str,
+        side: str,
+        quantity: int,
+        order_type: str,
+        estimated_value: float,
+        is_live_mode: bool
+    ) -> SafetyCheckResult:
+        """
+        Run the safety checks again and, if they pass, claim the order.
+
+        Atomically marks the order pending (double-submission prevention) and
+        reserves it in the daily order count and exposure. Call
+        release_order() if the order is then not placed.
+        """
+        order_hash = self._generate_order_hash(
+            customer_id, ib_account_id, symbol, side, quantity, order_type
+        )
+
+        def decide(limits: UserSafetyLimits, stats: UserDailyStats, pending_age: Optional[float]) -> SafetyCheckResult:
+            return self._evaluate(limits, stats, pending_age, quantity, estimated_value, is_live_mode)
+
+        async with self._lock_for(customer_id):
+            return await self._call(self._state.claim_order, customer_id, order_hash, estimated_value, decide)
+
+    async def release_order(self, customer_id: int, estimated_value: float):
+        """
+        Give back a claimed order's daily count and exposure (order not placed).
+
+        The pending mark stays until it expires: the broker may still have
+        received the order.
+        """
+        async with self._lock_for(customer_id):
+            await self._call(self._state.release_order, customer_id, estimated_value)
+
+    def _evaluate(
+        self,
+        limits: UserSafetyLimits,
+        stats: UserDailyStats,
+        pending_age: Optional[float],
+        quantity: int,
+        estimated_value: float,
+        is_live_mode: bool
+    ) -> SafetyCheckResult:
+        """The safety checks of one order against a customer's limits, daily stats and pending mark."""
+        warnings = []
+
+        # Check 1: Order size limit
+        if quantity > limits.max_order_size:
+            return SafetyCheckResult(
+                allowed=False,
+                reason=f"Order size {quantity} exceeds maximum allowed {limits.max_order_size}"
+            )
+
+        # Check 2: Order value limit
+        if estimated_value > limits.max_order_value:
+            return SafetyCheckResult(
+                allowed=False,
+                reason=f"Order value {estimated_value:.2f} EUR exceeds maximum {limits.max_order_value:.2f} EUR"
             )
-            if order_hash in self._pending_orders:
-                pending_time = self._pending_orders[order_hash]
-                age = (datetime.now() - pending_time).total_seconds()
-                if age < self._pending_order_ttl:
-                    return SafetyCheckResult(
-                        allowed=False,
-                        reason=f"Duplicate order detected. Please wait {int(self._pending_order_ttl - age)} seconds."
-                    )
-
-            # Check for confirmation requirements
-            requires_confirmation = False
-            confirmation_type = None
-
-            # Large order confirmation
-            if quantity >= limits.large_order_threshold:
-                requires_confirmation = True
-                confirmation_type = "large_order"
-                warnings.append(f"Large order: {quantity} shares")
-
-            # Live trading confirmation
-            if is_live_mode:
-                requires_confirmation = True
-                confirmation_type = "live_trading"
-                warnings.append("LIVE TRADING: Real money will be used")
 
+        # Check 3: Daily order count
+        if stats.order_count >= limits.max_daily_orders:
             return SafetyCheckResult(
-                allowed=True,
-                requires_confirmation=requires_confirmation,
-                confirmation_type=confirmation_type,
-                warnings=warnings
+                allowed=False,
+                reason=f"Daily order limit reached ({limits.max_daily_orders} orders)"
             )
 
+        # Check 4: Daily exposure limit
+        if stats.total_exposure + estimated_value > limits.max_daily_exposure:
+            return SafetyCheckResult(
+                allowed=False,
+                reason=f"Order would exceed daily exposure limit of {limits.max_daily_exposure:.2f} EUR"
+            )
+
+        # Check 5: Double submission prevention
+        if pending_age is not None:
+            return SafetyCheckResult(
+                allowed=False,
+                reason=f"Duplicate order detected. Please wait {int(self._pending_order_ttl - pending_age)} seconds."
+            )
+
+        # Check for confirmation requirements
+        requires_confirmation = False
+        confirmation_type = None
+
+        # Large order confirmation
+        if quantity >= limits.large_order_threshold:
+            requires_confirmation = True
+            confirmation_type = "large_order"
+            warnings.append(f"Large order: {quantity} shares")
+
+        # Live trading confirmation
+        if is_live_mode:
+            requires_confirmation = True
+            confirmation_type = "live_trading"
+            warnings.append("LIVE TRADING: Real money will be used")
+
+        return SafetyCheckResult(
+            allowed=True,
+            requires_confirmation=requires_confirmation,
+            confirmation_type=confirmation_type,
+            warnings=warnings
+        )
+
     async def check_basket_safety(
         self,
         customer_id: int,
@@ -183,8 +249,7 @@ class SafetyService:
         """
         Check if a basket of orders passes safety checks.
         """
-        limits = self.get_user_limits(customer_id)
-        stats = self._get_user_stats(customer_id)
+        limits, stats = await self._call(self._limits_and_stats, customer_id)
         warnings = []
         total_value = 0.0
 
@@ -243,31 +308,6 @@ class SafetyService:
             warnings=warnings
         )
 
-    async def mark_order_pending(
-        self,
-        customer_id: int,
-        ib_account_id: str,
-        symbol: str,
-        side: str,
-        quantity: int,
-        order_type: str
-    ):
-        """Mark an order as pending to prevent double submission."""
-        async with self._lock:
-            order_hash = self._generate_order_hash(
-                customer_id, ib_account_id, symbol, side, quantity, order_type
-            )
-            self._pending_orders[order_hash] = datetime.now()
-
-            # Cleanup old pending orders
-            now = datetime.now()
-            expired = [
-                h for h, t in self._pending_orders.items()
-                if (now - t).total_seconds() > self._pending_order_ttl
-            ]
-            for h in expired:
-                del self._pending_orders[h]
-
     async def record_order_executed(
         self,
         customer_id: int,
@@ -279,28 +319,29 @@ class SafetyService:
         order_id: str,
         estimated_value: float
     ):
-        """Record that an order was successfully executed."""
-        async with self._lock:
-            stats = self._get_user_stats(customer_id)
-            stats.order_count += 1
-            stats.total_exposure += estimated_value
-            stats.order_ids.add(order_id)
-
-            # Remove from pending
-            order_hash = self._generate_order_hash(
-                customer_id, ib_account_id, symbol, side, quantity, order_type
-            )
-            self._pending_orders.pop(order_hash, None)
+        """Record that a claimed order was placed: keep its reservation, clear the pending mark."""
+        order_hash = self._generate_order_hash(
+            customer_id, ib_account_id, symbol, side, quantity, order_type
+        )
+        async with self._lock_for(customer_id):
+            stats = await self._call(self._state.complete_order, customer_id, order_id, order_hash)
 
             logger.info(
                 f"Order recorded for user {customer_id}: "
                 f"daily_count={stats.order_count}, daily_exposure={stats.total_exposure:.2f}"
             )
 
-    def get_user_daily_stats(self, customer_id: int) -> dict:
+    # One backend round-trip (thread hop for SQLite) per step of the order flow
+
+    def _limits_and_stats(self, customer_id: int) -> tuple[UserSafetyLimits, UserDailyStats]:
+        return self._state.get_limits(customer_id), self._state.get_daily_stats(customer_id)
+
+    def _check_state(self, customer_id: int, order_hash: str) -> tuple:
+        return (*self._limits_and_stats(customer_id), self._state.pending_age(order_hash))
+
+    async def get_user_daily_stats(self, customer_id: int) -> dict:
         """Get current daily stats for a user."""
-        stats = self._get_user_stats(customer_id)
-        limits = self.get_user_limits(customer_id)
+        limits, stats = await self._call(self._limits_and_stats, customer_id)
         return {
             "date": stats.date.isoformat(),
             "order_count": stats.order_count,
@@ -320,5 +361,11 @@ def get_safety_service() -> SafetyService:
     """Get or create safety service singleton."""
     global _safety_service
     if _safety_service is None:
-        _safety_service = SafetyService()
+        from services.safety_state import MemorySafetyState, SQLiteSafetyState, SAFETY_STATE_FILE
+        settings = get_settings()
+        if settings.safety_state_backend == "sqlite":
+            state = SQLiteSafetyState(settings.safety_state_path or SAFETY_STATE_FILE)
+        else:
+            state = MemorySafetyState()
+        _safety_service = SafetyService(state=state, lock_stripes=settings.safety_lock_stripes)
     return _safety_service
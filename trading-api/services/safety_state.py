@@ -0,0 +1,274 @@
+"""
+Safety State Backends.
+
+Where SafetyService keeps per-customer limits, daily order stats and the
+recently submitted orders used for double-submission prevention:
+
+- MemorySafetyState (default): process memory. Fine for a single uvicorn
+  worker; every worker would otherwise enforce its own daily limits.
+- SQLiteSafetyState: one SQLite file (WAL mode) shared by all worker
+  processes on the host, so they enforce the same daily limits and see
+  each other's pending orders. Point it at /dev/shm to keep it in shared
+  memory.
+
+claim_order() is the one step that must be atomic across workers: it
+checks the customer's limits, daily stats and pending orders, and if the
+order passes marks it pending and reserves its count and value in the
+daily stats - in memory without yielding, in SQLite in one BEGIN
+IMMEDIATE transaction. Two workers submitting the same order, or a
+customer's last allowed orders, can't both pass. release_order() gives
+the reservation back when the order isn't placed; complete_order() keeps
+it and clears the pending mark.
+
+Pending orders expire `pending_ttl` seconds after they were marked. Both
+backends prune them oldest first, costing O(1) amortized per claim: an
+OrderedDict in memory, an index on the mark time in SQLite.
+
+Backends are synchronous. `blocking` tells SafetyService whether to call
+them off the event loop.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from services.safety import SafetyCheckResult, UserDailyStats, UserSafetyLimits
+
+# decide(limits, stats, pending_age) -> SafetyCheckResult, evaluated inside claim_order
+ClaimDecision = Callable[[UserSafetyLimits, UserDailyStats, Optional[float]], SafetyCheckResult]
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+SAFETY_STATE_FILE = DATA_DIR / "safety_state.db"
+
+
+class ExpiringSet:
+    """Keys that expire `ttl` seconds after they were last added."""
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._added: OrderedDict = OrderedDict()  # key -> time added, oldest first
+
+    def add(self, key: str) -> None:
+        now = self._clock()
+        self._added[key] = now
+        self._added.move_to_end(key)
+        self.prune(now)
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since `key` was added, or None if it isn't present (or expired)."""
+        added = self._added.get(key)
+        if added is None:
+            return None
+        age = self._clock() - added
+        return age if age < self.ttl else None
+
+    def discard(self, key: str) -> None:
+        self._added.pop(key, None)
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Drop expired keys; stops at the first live one."""
+        now = self._clock() if now is None else now
+        while self._added:
+            key, added = next(iter(self._added.items()))
+            if now - added < self.ttl:
+                break
+            del self._added[key]
+
+    def __len__(self) -> int:
+        return len(self._added)
+
+
+class MemorySafetyState:
+    """Safety state in process memory (single worker)."""
+
+    blocking = False
+
+    def __init__(self, pending_ttl: float = 30.0):
+        self.pending_ttl = pending_ttl
+        self._limits: Dict[int, UserSafetyLimits] = {}
+        self._stats: Dict[int, UserDailyStats] = {}
+        self._pending = ExpiringSet(pending_ttl)
+
+    def get_limits(self, customer_id: int) -> UserSafetyLimits:
+        if customer_id not in self._limits:
+            self._limits[customer_id] = UserSafetyLimits()
+        return self._limits[customer_id]
+
+    def set_limits(self, customer_id: int, limits: UserSafetyLimits) -> None:
+        self._limits[customer_id] = limits
+
+    def get_daily_stats(self, customer_id: int) -> UserDailyStats:
+        if customer_id not in self._stats:
+            self._stats[customer_id] = UserDailyStats()
+        stats = self._stats[customer_id]
+        stats.reset_if_new_day()
+        return stats
+
+    def claim_order(self, customer_id: int, order_hash: str, value: float, decide: ClaimDecision) -> SafetyCheckResult:
+        # No await in here, so nothing else on the event loop runs in between
+        stats = self.get_daily_stats(customer_id)
+        result = decide(self.get_limits(customer_id), stats, self._pending.age(order_hash))
+        if result.allowed:
+            self._pending.add(order_hash)
+            stats.order_count += 1
+            stats.total_exposure += value
+        return result
+
+    def release_order(self, customer_id: int, value: float) -> None:
+        stats = self.get_daily_stats(customer_id)
+        stats.order_count = max(stats.order_count - 1, 0)
+        stats.total_exposure = max(stats.total_exposure - value, 0.0)
+
+    def complete_order(self, customer_id: int, order_id: str, order_hash: str) -> UserDailyStats:
+        self._pending.discard(order_hash)
+        stats = self.get_daily_stats(customer_id)
+        stats.order_ids.add(order_id)
+        return stats
+
+    def pending_age(self, order_hash: str) -> Optional[float]:
+        return self._pending.age(order_hash)
+
+    def get_stats(self) -> dict:
+        return {"backend": "memory", "customers": len(self._stats), "pending_orders": len(self._pending)}
+
+
+class SQLiteSafetyState:
+    """Safety state in a SQLite file shared by the worker processes on a host."""
+
+    blocking = True
+
+    def __init__(self, path: Path = SAFETY_STATE_FILE, pending_ttl: float = 30.0, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.pending_ttl = pending_ttl
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()  # One connection per thread
+        self._pruned_day: Optional[str] = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS user_limits (
+                customer_id INTEGER PRIMARY KEY,
+                limits TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                customer_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                order_count INTEGER NOT NULL,
+                total_exposure REAL NOT NULL,
+                PRIMARY KEY (customer_id, day)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pending_orders (
+                order_hash TEXT PRIMARY KEY,
+                marked_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_pending_marked_at ON pending_orders (marked_at);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit: every statement is its own transaction
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_limits(self, customer_id: int) -> UserSafetyLimits:
+        row = self._conn().execute(
+            "SELECT limits FROM user_limits WHERE customer_id = ?", (customer_id,)
+        ).fetchone()
+        return UserSafetyLimits(**json.loads(row[0])) if row else UserSafetyLimits()
+
+    def set_limits(self, customer_id: int, limits: UserSafetyLimits) -> None:
+        self._conn().execute(
+            "INSERT INTO user_limits (customer_id, limits) VALUES (?, ?) "
+            "ON CONFLICT (customer_id) DO UPDATE SET limits = excluded.limits",
+            (customer_id, json.dumps(asdict(limits))),
+        )
+
+    def get_daily_stats(self, customer_id: int) -> UserDailyStats:
+        today = date.today()
+        row = self._conn().execute(
+            "SELECT order_count, total_exposure FROM daily_stats WHERE customer_id = ? AND day = ?",
+            (customer_id, today.isoformat()),
+        ).fetchone()
+        order_count, total_exposure = row if row else (0, 0.0)
+        return UserDailyStats(date=today, order_count=order_count, total_exposure=total_exposure)
+
+    def claim_order(self, customer_id: int, order_hash: str, value: float, decide: ClaimDecision) -> SafetyCheckResult:
+        now = time.time()
+        today = date.today().isoformat()
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front: no other worker can claim between our reads and writes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            limits, stats = self.get_limits(customer_id), self.get_daily_stats(customer_id)
+            result = decide(limits, stats, self.pending_age(order_hash, now))
+            if result.allowed:
+                # Claims the order unless a live mark exists (changes() == 0)
+                conn.execute(
+                    "INSERT INTO pending_orders (order_hash, marked_at) VALUES (?, ?) "
+                    "ON CONFLICT (order_hash) DO UPDATE SET marked_at = excluded.marked_at "
+                    "WHERE marked_at <= ?",
+                    (order_hash, now, now - self.pending_ttl),
+                )
+                if conn.execute("SELECT changes()").fetchone()[0] == 0:
+                    conn.execute("ROLLBACK")
+                    return decide(limits, stats, self.pending_age(order_hash, now))
+                conn.execute(
+                    "INSERT INTO daily_stats (customer_id, day, order_count, total_exposure) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT (customer_id, day) DO UPDATE SET "
+                    "order_count = order_count + 1, total_exposure = total_exposure + excluded.total_exposure",
+                    (customer_id, today, value),
+                )
+                conn.execute("DELETE FROM pending_orders WHERE marked_at <= ?", (now - self.pending_ttl,))
+                if self._pruned_day != today:
+                    conn.execute("DELETE FROM daily_stats WHERE day < ?", (today,))
+                    self._pruned_day = today
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def release_order(self, customer_id: int, value: float) -> None:
+        self._conn().execute(
+            "UPDATE daily_stats SET order_count = MAX(order_count - 1, 0), "
+            "total_exposure = MAX(total_exposure - ?, 0.0) WHERE customer_id = ? AND day = ?",
+            (value, customer_id, date.today().isoformat()),
+        )
+
+    def complete_order(self, customer_id: int, order_id: str, order_hash: str) -> UserDailyStats:
+        self._conn().execute("DELETE FROM pending_orders WHERE order_hash = ?", (order_hash,))
+        stats = self.get_daily_stats(customer_id)
+        stats.order_ids = {order_id}
+        return stats
+
+    def pending_age(self, order_hash: str, now: Optional[float] = None) -> Optional[float]:
+        row = self._conn().execute(
+            "SELECT marked_at FROM pending_orders WHERE order_hash = ?", (order_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        age = (time.time() if now is None else now) - row[0]
+        return age if age < self.pending_ttl else None
+
+    def get_stats(self) -> dict:
+        conn = self._conn()
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "customers": conn.execute(
+                "SELECT COUNT(*) FROM daily_stats WHERE day = ?", (date.today().isoformat(),)
+            ).fetchone()[0],
+            "pending_orders": conn.execute("SELECT COUNT(*) FROM pending_orders").fetchone()[0],
+        }
@@ -0,0 +1,173 @@
+"""Vectorized valuation of community portfolios for performance snapshots.
+
+POST /portfolios/snapshots/create and scripts/generate_snapshots.py value
+every public portfolio at once: the holdings of all portfolios become flat
+arrays (row per holding, instrument column, weight), prices are looked up
+once per distinct ISIN into a price vector, and NAVs, period returns and
+cumulative returns come out of a handful of NumPy operations over those
+arrays instead of a Python loop per holding.
+
+Valuation model (unchanged from the snapshot jobs): a portfolio is
+BASE_INVESTMENT spread by weight, so a holding is worth
+BASE_INVESTMENT * weight / 100 and the NAV is the sum over its holdings.
+Prices are recorded per holding in holdings_snapshot; 0.0 if unknown.
+
+Returns against earlier snapshots:
+- return_pct / return_abs: vs the previous snapshot of the same type
+- cumulative_return_pct:   vs the portfolio's first snapshot
+Both are 0 when the reference snapshot is missing or has no value.
+
+No I/O - callers pass the portfolios, market data and reference values.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+# Base investment value for calculating returns
+BASE_INVESTMENT = 10000.0
+
+
+def quote_price(md: dict) -> float:
+    """Last price of a market data entry, falling back to mid, bid or ask."""
+    price = md.get("last")
+    if price is None or price == 0:
+        bid = md.get("bid")
+        ask = md.get("ask")
+        if bid and ask:
+            price = (bid + ask) / 2
+        elif bid:
+            price = bid
+        elif ask:
+            price = ask
+        else:
+            price = 0.0
+    return price or 0.0
+
+
+@dataclass(frozen=True)
+class Valuation:
+    """NAVs of a batch of portfolios; row i is portfolio_ids[i]."""
+
+    portfolio_ids: list
+    isins: list                 # Instrument axis
+    instrument: np.ndarray      # Column (index into isins) per holding
+    weights: np.ndarray         # Weight (%) per holding
+    prices: np.ndarray          # Price per instrument
+    values: np.ndarray          # Value per holding
+    nav: np.ndarray             # Total value per portfolio
+
+    def holdings_snapshots(self, portfolios: Sequence[dict], with_value: bool = True) -> list[list]:
+        """
+        holdings_snapshot entries per portfolio, in row order.
+
+        with_value=True:  {isin, name, weight, price, value} (generate_snapshots.py)
+        with_value=False: {isin, weight, price, name} (POST /portfolios/snapshots/create)
+        """
+        isins = self.isins
+        prices = self.prices.tolist()
+        instrument = self.instrument.tolist()
+        values = self.values.tolist()
+        result = []
+        i = 0
+        for portfolio in portfolios:
+            holdings = []
+            for holding in portfolio.get("holdings") or ():
+                col = instrument[i]
+                if with_value:
+                    holdings.append({
+                        "isin": isins[col],
+                        "name": holding.get("name", ""),
+                        "weight": holding.get("weight", 0),
+                        "price": prices[col],
+                        "value": round(values[i], 2),
+                    })
+                else:
+                    holdings.append({
+                        "isin": isins[col],
+                        "weight": holding.get("weight", 0),
+                        "price": prices[col],
+                        "name": holding.get("name", ""),
+                    })
+                i += 1
+            result.append(holdings)
+        return result
+
+
+def value_portfolios(
+    portfolios: Sequence[dict],
+    conid_for_isin: Callable[[str], Optional[object]],
+    market_data: dict,
+    base_value: float = BASE_INVESTMENT,
+) -> Valuation:
+    """
+    Value all portfolios in one pass.
+
+    Args:
+        portfolios: Portfolio records with holdings [{isin, weight, name}]
+        conid_for_isin: IB conid of an ISIN (None if unknown)
+        market_data: {conid (str): market data entry}
+        base_value: Investment a portfolio's weights are applied to
+    """
+    column: dict[str, int] = {}
+    counts = np.zeros(len(portfolios), dtype=np.int64)
+    instrument: list[int] = []
+    weights: list[float] = []
+
+    for row, portfolio in enumerate(portfolios):
+        holdings = portfolio.get("holdings") or ()
+        counts[row] = len(holdings)
+        for holding in holdings:
+            isin = holding.get("isin", "")
+            col = column.get(isin)
+            if col is None:
+                col = column[isin] = len(column)
+            instrument.append(col)
+            weights.append(holding.get("weight", 0) or 0)
+
+    isins = list(column)
+    prices = np.zeros(len(isins), dtype=np.float64)
+    for col, isin in enumerate(isins):
+        conid = conid_for_isin(isin) if isin else None
+        if conid:
+            prices[col] = quote_price(market_data.get(str(conid)) or {})
+
+    instrument_arr = np.asarray(instrument, dtype=np.int64)
+    weights_arr = np.asarray(weights, dtype=np.float64)
+    values = weights_arr * (base_value / 100)
+    rows = np.repeat(np.arange(len(portfolios)), counts)
+    nav = np.bincount(rows, weights=values, minlength=len(portfolios))
+
+    return Valuation(
+        portfolio_ids=[p["id"] for p in portfolios],
+        isins=isins,
+        instrument=instrument_arr,
+        weights=weights_arr,
+        prices=prices,
+        values=values,
+        nav=nav,
+    )
+
+
+def snapshot_returns(nav: np.ndarray, previous: np.ndarray, first: np.ndarray) -> tuple:
+    """
+    (return_pct, return_abs, cumulative_return_pct) arrays.
+
+    previous / first: value of the reference snapshot per portfolio, NaN
+    where there is none.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        has_previous = previous > 0
+        return_abs = np.where(has_previous, nav - previous, 0.0)
+        return_pct = np.where(has_previous, return_abs / previous * 100, 0.0)
+        cumulative = np.where(first > 0, (nav - first) / first * 100, 0.0)
+    return return_pct, return_abs, cumulative
+
+
+def reference_values(snapshots: Sequence[Optional[dict]]) -> np.ndarray:
+    """total_value of each reference snapshot as a float array (NaN for None)."""
+    return np.fromiter(
+        (s.get("total_value", BASE_INVESTMENT) if s is not None else np.nan for s in snapshots),
+        dtype=np.float64,
+        count=len(snapshots),
+    )
@@ -0,0 +1,135 @@
+"""Shared pooled HTTP client for Supabase/PostgREST.
+
+One process-wide httpx.AsyncClient with keep-alive connection pooling and
+HTTP/2 multiplexing, so PostgREST calls reuse TCP+TLS connections instead of
+paying connection setup on every request.
+
+Lifecycle:
+- Startup: init_supabase_client() (called from main.py lifespan)
+- Runtime: services use `async with supabase_client(timeout=...) as client`
+- Shutdown: close_supabase_client()
+
+Scripts and ad-hoc callers that never run the lifespan get a client created
+lazily on first use.
+"""
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledClient:
+    """Thin view over the shared client that applies a per-call timeout.
+
+    Exposes the same request methods the services already use
+    (get/post/patch/delete/request), so call sites stay unchanged apart
+    from how the client is obtained.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, timeout: Optional[float] = None):
+        self._client = client
+        self._timeout = timeout
+
+    def _with_timeout(self, kwargs: dict) -> dict:
+        if self._timeout is not None and "timeout" not in kwargs:
+            kwargs["timeout"] = self._timeout
+        return kwargs
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._client.request(method, url, **self._with_timeout(kwargs))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self._client.get(url, **self._with_timeout(kwargs))
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self._client.post(url, **self._with_timeout(kwargs))
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self._client.patch(url, **self._with_timeout(kwargs))
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self._client.put(url, **self._with_timeout(kwargs))
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self._client.delete(url, **self._with_timeout(kwargs))
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Create the shared client from settings."""
+    settings = get_settings()
+
+    http2 = settings.supabase_http2
+    if http2 and not _http2_available():
+        logger.warning("Supabase HTTP/2 requested but 'h2' is not installed - falling back to HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.supabase_pool_max_connections,
+        max_keepalive_connections=settings.supabase_pool_max_keepalive,
+        keepalive_expiry=settings.supabase_pool_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        settings.supabase_default_timeout,
+        connect=settings.supabase_connect_timeout,
+    )
+
+    logger.info(
+        f"Supabase HTTP client: http2={http2}, "
+        f"max_connections={settings.supabase_pool_max_connections}, "
+        f"max_keepalive={settings.supabase_pool_max_keepalive}"
+    )
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+# Singleton instance
+_shared_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """Get or create the process-wide Supabase HTTP client."""
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = _build_client()
+    return _shared_client
+
+
+@asynccontextmanager
+async def supabase_client(timeout: Optional[float] = None):
+    """
+    Borrow the shared client for a block of PostgREST calls.
+
+    Drop-in replacement for `httpx.AsyncClient(timeout=...)` in services:
+    the pooled connection is NOT closed when the block exits.
+
+    Args:
+        timeout: Per-call timeout in seconds (default: client default)
+    """
+    yield PooledClient(get_shared_client(), timeout)
+
+
+async def init_supabase_client() -> httpx.AsyncClient:
+    """Create the shared client at startup (lifespan)."""
+    return get_shared_client()
+
+
+async def close_supabase_client():
+    """Close the shared client and release pooled connections (lifespan)."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
+        logger.info("Supabase HTTP client closed")
@@ -1,6 +1,8 @@
 """Supabase database service using direct HTTP calls."""
 import httpx
 from config import get_settings
+from services.supabase_client import supabase_client
+from services.customer_cache import invalidate_customer
 from typing import Optional
 import logging
 
@@ -41,14 +43,14 @@ class SupabaseService:
         """Check if Supabase service is properly configured."""
         return self._configured
 
-    async def get_customer_by_id(self, customer_id: int) -> Optional[dict]:
-        """Get customer by ID."""
+    async def get_customer_by_id(self, customer_id: int, raise_errors: bool = False) -> Optional[dict]:
+        """Get customer by ID. raise_errors: raise on failures instead of returning None."""
         if not self._configured:
             logger.debug("Supabase not configured, returning None for customer lookup")
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/customers",
                     headers=self.headers,
@@ -59,12 +61,18 @@ class SupabaseService:
                 return data[0] if data else None
         except httpx.TimeoutException:
             logger.error(f"Timeout fetching customer {customer_id}")
+            if raise_errors:
+                raise
             return None
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error fetching customer {customer_id}: {e.response.status_code} - {e.response.text}")
+            if raise_errors:
+                raise
             return None
         except Exception as e:
             logger.error(f"Error fetching customer {customer_id}: {type(e).__name__}: {e}")
+            if raise_errors:
+                raise
             return None
 
     async def get_broker_account(self, customer_id: int, broker: str = "LYNX") -> Optional[dict]:
@@ -74,7 +82,7 @@ class SupabaseService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/broker_accounts",
                     headers=self.headers,
@@ -132,7 +140,7 @@ class SupabaseService:
             }
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 # First check if account exists for this customer
                 existing = await self.get_broker_account(customer_id, broker)
 
@@ -164,6 +172,8 @@ class SupabaseService:
                         }
                     )
 
+                invalidate_customer(customer_id)
+
                 # Check response status
                 if response.status_code >= 400:
                     error_text = response.text
@@ -244,13 +254,14 @@ class SupabaseService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.patch(
                     f"{self.base_url}/customers",
                     headers=self.headers,
                     params={"id": f"eq.{customer_id}"},
                     json={"trading_status": status}
                 )
+                invalidate_customer(customer_id)
                 response.raise_for_status()
                 return True
         except httpx.TimeoutException:
@@ -270,7 +281,7 @@ class SupabaseService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 response = await client.get(
                     f"{self.base_url}/customers",
                     headers=self.headers,
@@ -311,7 +322,7 @@ class SupabaseService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -334,13 +345,15 @@ class SupabaseService:
             logger.error(f"Error getting broker link: {type(e).__name__}: {e}")
             return None
 
-    async def get_active_broker_link(self, user_id: int, broker: str = "LYNX") -> Optional[dict]:
+    async def get_active_broker_link(self, user_id: int, broker: str = "LYNX",
+                                     raise_errors: bool = False) -> Optional[dict]:
         """
         Get the active (linked) broker link for a user.
 
         Args:
             user_id: The user's database ID
             broker: The broker name (default: "LYNX")
+            raise_errors: Raise on failures instead of returning None
 
         Returns:
             The broker link record if status is 'linked', None otherwise
@@ -349,7 +362,7 @@ class SupabaseService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -365,6 +378,8 @@ class SupabaseService:
                 return data[0] if data else None
         except Exception as e:
             logger.error(f"Error getting active broker link: {type(e).__name__}: {e}")
+            if raise_errors:
+                raise
             return None
 
     async def create_broker_link(
@@ -402,7 +417,7 @@ class SupabaseService:
             }
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 response = await client.post(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -413,6 +428,7 @@ class SupabaseService:
                         "status": status
                     }
                 )
+                invalidate_customer(user_id)
 
                 if response.status_code == 409 or (response.status_code >= 400 and "duplicate" in response.text.lower()):
                     raise SupabaseServiceError(
@@ -473,7 +489,7 @@ class SupabaseService:
             return await self.get_broker_link(user_id, broker)
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 response = await client.patch(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -483,6 +499,7 @@ class SupabaseService:
                     },
                     json=update_data
                 )
+                invalidate_customer(user_id)
                 response.raise_for_status()
                 data = response.json()
 
@@ -571,7 +588,7 @@ class SupabaseService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
+            async with supabase_client(timeout=15.0) as client:
                 response = await client.patch(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -584,6 +601,7 @@ class SupabaseService:
                         "status": "unlinked"
                     }
                 )
+                invalidate_customer(user_id)
                 response.raise_for_status()
                 logger.info(f"Unlinked broker for user {user_id}")
                 return True
@@ -606,7 +624,7 @@ class SupabaseService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/broker_links",
                     headers=self.headers,
@@ -0,0 +1,233 @@
+"""
+Tick Store.
+
+Bounded in-memory tick history for streaming market data. Every subscribed
+conid gets one preallocated NumPy ring buffer of TICK_DTYPE rows (36 bytes
+each), written from IBClient._on_ticker_update:
+
+- ts:                  epoch seconds of the latest tick folded into the row
+- bid / ask / last:    quote, carried forward when IB sends no new value
+                       (NaN until the first one arrives)
+- bid_size / ask_size: sizes at the quote
+- volume:              IB's cumulative day volume
+
+Ticks arriving within min_interval seconds of the row's first tick
+overwrite that row instead of appending, so a row is the closing quote of
+a min_interval slot. With the defaults (32768 rows, 1 s) a buffer holds a
+full trading day and 100 subscriptions stay around 118 MB preallocated.
+
+Reads never build dicts:
+- latest():  zero-copy view of the newest row
+- window():  rows in [start, end); a view unless the range wraps around
+             the end of the ring, then one contiguous copy
+- bars():    OHLCV bars over arbitrary intervals
+- vwap():    volume-weighted average of the last price
+
+Views alias the ring and are overwritten once it wraps, so copy() anything
+kept across awaits. All writes happen on the event loop thread.
+"""
+from typing import Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TICK_DTYPE = np.dtype([
+    ("ts", "f8"),
+    ("bid", "f4"),
+    ("ask", "f4"),
+    ("last", "f4"),
+    ("bid_size", "f4"),
+    ("ask_size", "f4"),
+    ("volume", "f8"),
+])
+
+BAR_DTYPE = np.dtype([
+    ("ts", "f8"),  # Bar start, epoch seconds
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+    ("ticks", "i4"),
+])
+
+_EMPTY_TICKS = np.empty(0, dtype=TICK_DTYPE)
+_EMPTY_TICKS.flags.writeable = False
+
+
+class TickBuffer:
+    """Fixed-capacity ring of TICK_DTYPE rows for one conid."""
+
+    __slots__ = ("data", "capacity", "count", "head", "slot_start")
+
+    def __init__(self, capacity: int):
+        self.data = np.empty(capacity, dtype=TICK_DTYPE)
+        self.capacity = capacity
+        self.count = 0  # Valid rows (<= capacity)
+        self.head = 0  # Next row to write
+        self.slot_start = -np.inf  # ts of the first tick folded into the newest row
+
+    def append(self, ts: float, bid, ask, last, bid_size, ask_size, volume, min_interval: float):
+        if self.count and ts < self.slot_start + min_interval:
+            row = (self.head - 1) % self.capacity
+        else:
+            row = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.slot_start = ts
+        self.data[row] = (ts, bid, ask, last, bid_size, ask_size, volume)
+
+    def latest(self) -> Optional[np.void]:
+        if not self.count:
+            return None
+        return self.data[(self.head - 1) % self.capacity]
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Rows with start <= ts < end, oldest first."""
+        if self.count < self.capacity:
+            segments = (self.data[:self.count],)
+        elif self.head == 0:
+            segments = (self.data,)
+        else:
+            segments = (self.data[self.head:], self.data[:self.head])
+
+        parts = []
+        for segment in segments:
+            lo = 0 if start is None else int(np.searchsorted(segment["ts"], start, side="left"))
+            hi = len(segment) if end is None else int(np.searchsorted(segment["ts"], end, side="left"))
+            if hi > lo:
+                parts.append(segment[lo:hi])
+        if not parts:
+            return _EMPTY_TICKS
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+class TickStore:
+    """Per-conid tick ring buffers with bar and VWAP aggregation."""
+
+    def __init__(self, capacity: int = 32768, min_interval: float = 1.0):
+        self.capacity = capacity
+        self.min_interval = min_interval
+        self._buffers: dict[int, TickBuffer] = {}
+
+    # =========================================================================
+    # Lifecycle
+    # =========================================================================
+
+    def open(self, conid: int) -> TickBuffer:
+        """Allocate the buffer for conid (kept if it already exists)."""
+        buffer = self._buffers.get(conid)
+        if buffer is None:
+            buffer = self._buffers[conid] = TickBuffer(self.capacity)
+        return buffer
+
+    def close(self, conid: int):
+        """Free the buffer for conid."""
+        self._buffers.pop(conid, None)
+
+    def clear(self):
+        self._buffers.clear()
+
+    def __contains__(self, conid: int) -> bool:
+        return conid in self._buffers
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    # =========================================================================
+    # Writes
+    # =========================================================================
+
+    def append(self, conid: int, ts: float, bid=None, ask=None, last=None,
+               bid_size=None, ask_size=None, volume=None) -> bool:
+        """Record a tick for conid. Missing values are stored as NaN."""
+        buffer = self._buffers.get(conid)
+        if buffer is None:
+            return False
+        nan = np.nan
+        buffer.append(
+            ts,
+            nan if bid is None else bid,
+            nan if ask is None else ask,
+            nan if last is None else last,
+            nan if bid_size is None else bid_size,
+            nan if ask_size is None else ask_size,
+            nan if volume is None else volume,
+            self.min_interval,
+        )
+        return True
+
+    # =========================================================================
+    # Reads
+    # =========================================================================
+
+    def latest(self, conid: int) -> Optional[np.void]:
+        """Newest row for conid as a view into the ring (None if no ticks)."""
+        buffer = self._buffers.get(conid)
+        return buffer.latest() if buffer else None
+
+    def window(self, conid: int, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Rows for conid with start <= ts < end, oldest first."""
+        buffer = self._buffers.get(conid)
+        return buffer.window(start, end) if buffer else _EMPTY_TICKS
+
+    def bars(self, conid: int, interval: float, start: Optional[float] = None,
+             end: Optional[float] = None) -> np.ndarray:
+        """
+        OHLCV bars of the last price, aligned to multiples of interval seconds.
+
+        Bar volume is the increase of IB's cumulative volume within the bar;
+        a drop (new trading day) counts from zero. Bars without any trade
+        price are omitted.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        ticks = self.window(conid, start, end)
+        ticks = ticks[np.isfinite(ticks["last"])]
+        if not len(ticks):
+            return np.empty(0, dtype=BAR_DTYPE)
+
+        price = ticks["last"].astype(np.float64)
+        buckets = np.floor(ticks["ts"] / interval).astype(np.int64)
+        keys, starts = np.unique(buckets, return_index=True)
+        ends = np.append(starts[1:], len(ticks))
+
+        bars = np.empty(len(keys), dtype=BAR_DTYPE)
+        bars["ts"] = keys * interval
+        bars["open"] = price[starts]
+        bars["high"] = np.maximum.reduceat(price, starts)
+        bars["low"] = np.minimum.reduceat(price, starts)
+        bars["close"] = price[ends - 1]
+        bars["volume"] = np.add.reduceat(_volume_deltas(ticks["volume"]), starts)
+        bars["ticks"] = ends - starts
+        return bars
+
+    def vwap(self, conid: int, start: Optional[float] = None, end: Optional[float] = None) -> Optional[float]:
+        """Volume-weighted average last price over [start, end), None without traded volume."""
+        ticks = self.window(conid, start, end)
+        ticks = ticks[np.isfinite(ticks["last"])]
+        if len(ticks) < 2:
+            return None
+        deltas = _volume_deltas(ticks["volume"])[1:]
+        traded = deltas.sum()
+        if traded <= 0:
+            return None
+        return float(np.dot(ticks["last"][1:].astype(np.float64), deltas) / traded)
+
+    def get_stats(self) -> dict:
+        return {
+            "conids": len(self._buffers),
+            "capacity": self.capacity,
+            "min_interval": self.min_interval,
+            "rows": sum(b.count for b in self._buffers.values()),
+            "allocated_bytes": sum(b.data.nbytes for b in self._buffers.values()),
+        }
+
+
+def _volume_deltas(volume: np.ndarray) -> np.ndarray:
+    """Per-row increase of a cumulative volume series (first row and NaNs count as 0)."""
+    deltas = np.diff(volume, prepend=volume[:1])
+    # Volume resets on a new trading day: the row's volume is the increase
+    return np.nan_to_num(np.where(deltas < 0, volume, deltas), nan=0.0)
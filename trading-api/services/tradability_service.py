@@ -1,80 +1,198 @@
 """
 ETF Tradability Service.
 
-Reads tradability data from the pre-checked JSON file.
-This is the single source of truth for ETF tradability.
+Reads tradability data from the pre-checked results written by
+scripts/check_etf_tradability.py. This is the single source of truth for
+ETF tradability.
+
+Prefers the compact SQLite store (data/etf_tradability.db): opening it only
+reads the metadata, records are fetched per lookup. Falls back to parsing
+etf_tradability.json when the store is missing, unreadable or older than
+the JSON.
+
+The immutable ETFUniverse index (services/etf_universe.py) that the rest of
+the API shares for conid/ISIN/symbol lookups is built on first use after
+each load.
+
+Every check run also writes etf_tradability.diff.json (the records it
+added, changed or removed). refresh() applies it when it starts from the
+data currently loaded: the new store is opened (metadata only) and the
+universe is patched instead of rebuilt. Anything else gets a full reload.
 """
 import json
 import logging
 from pathlib import Path
-from typing import Optional
-from functools import lru_cache
+from typing import Optional, Union
+
+from services.etf_universe import ETFUniverse, etf_from_record
+from services.tradability_store import JSONTradabilityRecords, SQLiteTradabilityStore
 
 logger = logging.getLogger(__name__)
 
 # Path to tradability data
 DATA_DIR = Path(__file__).parent.parent / "data"
 TRADABILITY_FILE = DATA_DIR / "etf_tradability.json"
+TRADABILITY_STORE_FILE = DATA_DIR / "etf_tradability.db"
+TRADABILITY_DIFF_FILE = DATA_DIR / "etf_tradability.diff.json"
+
+TradabilityRecords = Union[SQLiteTradabilityStore, JSONTradabilityRecords]
 
 
 class TradabilityService:
     """Service for ETF tradability lookups."""
 
     def __init__(self):
-        self._data: Optional[dict] = None
+        self._records: TradabilityRecords = JSONTradabilityRecords({})
+        self._universe: Optional[ETFUniverse] = None
         self._load_data()
 
     def _load_data(self):
-        """Load tradability data from JSON file."""
+        """Open the tradability records and reset the ETF universe index."""
+        records = self._open_store() or self._load_json()
+
+        # Single assignment: readers see the old or the new data, never a mix.
+        # The old store isn't closed explicitly: in-flight readers may still hold it.
+        self._records, self._universe = records, None
+
+        logger.info(
+            f"Loaded tradability data ({records.source}): "
+            f"{records.metadata.get('total_tradable', 0)} tradable ETFs"
+        )
+
+    def _open_store(self) -> Optional[SQLiteTradabilityStore]:
+        """Open the SQLite store if it exists and is not older than the JSON."""
+        if not TRADABILITY_STORE_FILE.exists():
+            return None
+        if TRADABILITY_FILE.exists() and TRADABILITY_STORE_FILE.stat().st_mtime < TRADABILITY_FILE.stat().st_mtime:
+            logger.warning(f"Tradability store is older than {TRADABILITY_FILE.name}, using JSON")
+            return None
+        try:
+            return SQLiteTradabilityStore(TRADABILITY_STORE_FILE)
+        except Exception as e:
+            logger.error(f"Failed to open tradability store, using JSON: {e}")
+            return None
+
+    def _load_json(self) -> JSONTradabilityRecords:
+        """Parse the JSON results (fallback)."""
         if not TRADABILITY_FILE.exists():
             logger.warning(f"Tradability file not found: {TRADABILITY_FILE}")
-            self._data = {"metadata": {}, "etfs": {}}
-            return
+            return JSONTradabilityRecords({})
 
         try:
             with open(TRADABILITY_FILE, 'r', encoding='utf-8') as f:
-                self._data = json.load(f)
-            logger.info(f"Loaded tradability data: {self._data['metadata'].get('total_tradable', 0)} tradable ETFs")
+                return JSONTradabilityRecords(json.load(f))
         except Exception as e:
             logger.error(f"Failed to load tradability data: {e}")
-            self._data = {"metadata": {}, "etfs": {}}
+            return JSONTradabilityRecords({})
 
     def reload(self):
         """Reload tradability data from file."""
         self._load_data()
 
+    def refresh(self) -> str:
+        """
+        Pick up the latest check run, through its diff when possible.
+
+        Returns "current" when that run is already loaded, "diff" when its
+        diff was applied and "full" after a full reload.
+        """
+        diff = self._read_diff()
+        if diff is not None:
+            if diff["metadata"].get("checked_at") == self._records.metadata.get("checked_at"):
+                return "current"
+            if self.apply_diff(diff):
+                return "diff"
+        self._load_data()
+        return "full"
+
+    def apply_diff(self, diff: dict) -> bool:
+        """
+        Apply a check run's diff (tradability_diff output) to the loaded data.
+
+        Returns False, changing nothing, when the diff doesn't start from
+        the loaded run or the store on disk is not the run it describes.
+        """
+        current = self._records
+        metadata = diff.get("metadata") or {}
+        if not diff.get("base_checked_at") or diff["base_checked_at"] != current.metadata.get("checked_at"):
+            return False
+
+        changes = {**diff.get("etfs", {}), **{isin: None for isin in diff.get("removed", [])}}
+        if isinstance(current, SQLiteTradabilityStore):
+            records = self._open_store()
+            if records is None or records.metadata.get("checked_at") != metadata.get("checked_at"):
+                return False
+        else:
+            records = current.with_changes(changes, metadata)
+
+        universe = self._universe
+        if universe is not None:
+            universe = universe.with_changes(changes, metadata=records.metadata)
+        self._records, self._universe = records, universe
+
+        logger.info(
+            f"Applied tradability diff ({records.source}): {len(diff.get('newly_tradable', []))} newly tradable, "
+            f"{len(diff.get('newly_blocked', []))} newly blocked, {len(diff.get('removed', []))} removed, "
+            f"{records.metadata.get('total_tradable', 0)} tradable ETFs"
+        )
+        return True
+
+    def _read_diff(self) -> Optional[dict]:
+        """The last check run's diff, if there is a readable one."""
+        if not TRADABILITY_DIFF_FILE.exists():
+            return None
+        try:
+            with open(TRADABILITY_DIFF_FILE, 'r', encoding='utf-8') as f:
+                diff = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read tradability diff: {e}")
+            return None
+        return diff if isinstance(diff.get("metadata"), dict) else None
+
+    @property
+    def source(self) -> str:
+        """Backend the records are served from: "sqlite" or "json"."""
+        return self._records.source
+
+    @property
+    def universe(self) -> ETFUniverse:
+        """Current immutable ETF universe index (built on first use)."""
+        universe = self._universe
+        if universe is None:
+            records = self._records
+            if isinstance(records, SQLiteTradabilityStore):
+                etfs = records.tradable_etfs()
+            else:
+                etfs = [etf_from_record(r) for r in records.iter_records(tradable=True)]
+            universe = ETFUniverse.from_etfs(etfs, metadata=records.metadata)
+            # Don't publish an index built from records a reload has replaced
+            if self._records is records:
+                self._universe = universe
+        return universe
+
     def get_metadata(self) -> dict:
         """Get metadata about the tradability check."""
-        return self._data.get("metadata", {})
+        return dict(self._records.metadata)
 
     def is_tradable(self, isin: str) -> bool:
         """Check if an ETF is tradable by ISIN."""
-        etf = self._data.get("etfs", {}).get(isin)
-        return etf.get("tradable_via_lynx", False) if etf else False
+        return isin in self.universe.by_isin
 
     def get_etf_info(self, isin: str) -> Optional[dict]:
         """Get full tradability info for an ETF."""
-        return self._data.get("etfs", {}).get(isin)
+        return self._records.get(isin)
 
     def get_all_tradable(self) -> list[dict]:
         """Get all tradable ETFs."""
-        etfs = self._data.get("etfs", {})
-        return [
-            etf for etf in etfs.values()
-            if etf.get("tradable_via_lynx", False)
-        ]
+        return list(self._records.iter_records(tradable=True))
 
     def get_all_blocked(self) -> list[dict]:
         """Get all blocked (non-tradable) ETFs."""
-        etfs = self._data.get("etfs", {})
-        return [
-            etf for etf in etfs.values()
-            if not etf.get("tradable_via_lynx", False)
-        ]
+        return list(self._records.iter_records(tradable=False))
 
     def get_contract(self, isin: str) -> Optional[dict]:
         """Get IB contract details for a tradable ETF."""
-        etf = self._data.get("etfs", {}).get(isin)
+        etf = self._records.get(isin)
         if etf and etf.get("tradable_via_lynx"):
             return etf.get("contract")
         return None
@@ -85,14 +203,11 @@ class TradabilityService:
 
     def get_tradable_isins(self) -> list[str]:
         """Get list of all tradable ISINs."""
-        return [
-            isin for isin, etf in self._data.get("etfs", {}).items()
-            if etf.get("tradable_via_lynx", False)
-        ]
+        return list(self.universe.by_isin.keys())
 
     def get_stats(self) -> dict:
         """Get tradability statistics."""
-        metadata = self._data.get("metadata", {})
+        metadata = self._records.metadata
         return {
             "total_checked": metadata.get("total_checked", 0),
             "total_tradable": metadata.get("total_tradable", 0),
@@ -101,17 +216,13 @@ class TradabilityService:
             "checked_at": metadata.get("checked_at"),
             "account": metadata.get("account"),
             "ib_port": metadata.get("ib_port"),
-            "data_available": TRADABILITY_FILE.exists(),
+            "data_available": TRADABILITY_FILE.exists() or TRADABILITY_STORE_FILE.exists(),
+            "source": self.source,
         }
 
     def get_blocked_etfs_by_reason(self, reason: str) -> list[dict]:
         """Get all blocked ETFs with a specific reason."""
-        etfs = self._data.get("etfs", {})
-        return [
-            etf for etf in etfs.values()
-            if not etf.get("tradable_via_lynx", False)
-            and etf.get("reason_if_not_tradable") == reason
-        ]
+        return list(self._records.iter_records(tradable=False, reason=reason))
 
     def enrich_etf_with_tradability(self, etf: dict) -> dict:
         """
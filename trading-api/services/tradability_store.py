@@ -0,0 +1,267 @@
+"""
+Tradability record stores.
+
+Two interchangeable read backends for the tradability check results used by
+TradabilityService:
+
+- SQLiteTradabilityStore: compact SQLite file (data/etf_tradability.db) with
+  the ISIN as primary key and indexes on conid/symbol. Opening it reads only
+  the metadata table; records are fetched on demand through SQLite's
+  memory-mapped pages, so nothing close to the 1.4 MB JSON is parsed or kept
+  resident.
+- JSONTradabilityRecords: the parsed etf_tradability.json dict (fallback
+  when the SQLite file is missing or older than the JSON).
+
+write_tradability_store() converts the JSON structure into the SQLite file.
+It is called by scripts/check_etf_tradability.py after every run, together
+with tradability_diff(), whose output lets a running API apply the changes
+of a run instead of reloading everything.
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterator, Optional
+
+SCHEMA_VERSION = 1
+
+# record["contract"] key -> etfs column
+_CONTRACT_COLUMNS = {
+    "conId": "con_id",
+    "symbol": "symbol",
+    "exchange": "exchange",
+    "primaryExchange": "primary_exchange",
+    "currency": "currency",
+    "secType": "sec_type",
+    "localSymbol": "local_symbol",
+    "tradingClass": "trading_class",
+}
+_RECORD_COLUMNS = ("isin", "name", "input_currency", "tradable", "reason", "checked_at")
+_COLUMNS = _RECORD_COLUMNS + ("has_contract",) + tuple(_CONTRACT_COLUMNS.values()) + ("extra",)
+_KNOWN_KEYS = {"isin", "name", "input_currency", "tradable_via_lynx", "reason_if_not_tradable", "contract", "checked_at"}
+
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM etfs"
+
+
+class JSONTradabilityRecords:
+    """Tradability records backed by the parsed JSON document."""
+
+    source = "json"
+
+    def __init__(self, data: dict):
+        self._etfs: dict = data.get("etfs", {}) or {}
+        self.metadata: dict = data.get("metadata", {}) or {}
+
+    def get(self, isin: str) -> Optional[dict]:
+        return self._etfs.get(isin)
+
+    def iter_records(self, tradable: Optional[bool] = None, reason: Optional[str] = None) -> Iterator[dict]:
+        for record in self._etfs.values():
+            if tradable is not None and bool(record.get("tradable_via_lynx", False)) != tradable:
+                continue
+            if reason is not None and record.get("reason_if_not_tradable") != reason:
+                continue
+            yield record
+
+    def with_changes(self, changes: dict, metadata: dict) -> "JSONTradabilityRecords":
+        """New records with `changes` (ISIN -> record, None to remove) applied."""
+        etfs = dict(self._etfs)
+        for isin, record in changes.items():
+            if record is None:
+                etfs.pop(isin, None)
+            else:
+                etfs[isin] = record
+        return JSONTradabilityRecords({"metadata": metadata, "etfs": etfs})
+
+
+class SQLiteTradabilityStore:
+    """Read-only tradability records backed by the compact SQLite file."""
+
+    source = "sqlite"
+
+    def __init__(self, path: Path, mmap_size: int = 8 * 1024 * 1024):
+        self.path = Path(path)
+        # Read-only, shared between the event loop and worker threads
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+
+        rows = self._conn.execute("SELECT key, value FROM metadata").fetchall()
+        meta = {key: json.loads(value) for key, value in rows}
+        if meta.pop("_schema_version", None) != SCHEMA_VERSION:
+            self._conn.close()
+            raise ValueError(f"Unsupported tradability store schema in {self.path}")
+        self.metadata: dict = meta
+
+    def get(self, isin: str) -> Optional[dict]:
+        row = self._conn.execute(f"{_SELECT} WHERE isin = ?", (isin,)).fetchone()
+        return _row_to_record(row) if row else None
+
+    def iter_records(self, tradable: Optional[bool] = None, reason: Optional[str] = None) -> Iterator[dict]:
+        clauses, params = [], []
+        if tradable is not None:
+            clauses.append("tradable = ?")
+            params.append(int(tradable))
+        if reason is not None:
+            clauses.append("reason = ?")
+            params.append(reason)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        for row in self._conn.execute(f"{_SELECT}{where} ORDER BY seq", params):
+            yield _row_to_record(row)
+
+    def tradable_etfs(self) -> list[dict]:
+        """Tradable ETFs in IBClient format, without materializing full records."""
+        rows = self._conn.execute(
+            "SELECT symbol, name, con_id, exchange, primary_exchange, currency, isin "
+            "FROM etfs WHERE tradable = 1 ORDER BY seq"
+        )
+        return [
+            {
+                "symbol": symbol or "",
+                "name": name or "",
+                "conid": con_id or 0,
+                "exchange": exchange or "SMART",
+                "primaryExchange": primary or "",
+                "currency": currency or "EUR",
+                "isin": isin,
+            }
+            for symbol, name, con_id, exchange, primary, currency, isin in rows
+        ]
+
+
+def _row_to_record(row: tuple) -> dict:
+    values = dict(zip(_COLUMNS, row))
+    record = {
+        "isin": values["isin"],
+        "name": values["name"],
+        "input_currency": values["input_currency"],
+        "tradable_via_lynx": bool(values["tradable"]),
+        "reason_if_not_tradable": values["reason"],
+        "contract": (
+            {key: values[column] for key, column in _CONTRACT_COLUMNS.items()}
+            if values["has_contract"] else None
+        ),
+        "checked_at": values["checked_at"],
+    }
+    if values["extra"]:
+        record.update(json.loads(values["extra"]))
+    return record
+
+
+def write_tradability_store(data: dict, path: Path) -> Path:
+    """
+    Write tradability data (etf_tradability.json structure) to a SQLite store.
+
+    Writes to a temp file and renames it over `path`, so a running API never
+    opens a half-written store.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(
+            """
+            PRAGMA journal_mode = OFF;
+            PRAGMA page_size = 4096;
+            CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+            CREATE TABLE etfs (
+                isin TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                name TEXT,
+                input_currency TEXT,
+                tradable INTEGER NOT NULL,
+                reason TEXT,
+                checked_at TEXT,
+                has_contract INTEGER NOT NULL,
+                con_id INTEGER,
+                symbol TEXT,
+                exchange TEXT,
+                primary_exchange TEXT,
+                currency TEXT,
+                sec_type TEXT,
+                local_symbol TEXT,
+                trading_class TEXT,
+                extra TEXT
+            ) WITHOUT ROWID;
+            """
+        )
+
+        metadata = {**(data.get("metadata") or {}), "_schema_version": SCHEMA_VERSION}
+        conn.executemany(
+            "INSERT INTO metadata (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in metadata.items()],
+        )
+
+        rows = []
+        for seq, (isin, record) in enumerate((data.get("etfs") or {}).items()):
+            contract = record.get("contract")
+            extra = {k: v for k, v in record.items() if k not in _KNOWN_KEYS}
+            rows.append((
+                record.get("isin", isin),
+                seq,
+                record.get("name"),
+                record.get("input_currency"),
+                int(bool(record.get("tradable_via_lynx", False))),
+                record.get("reason_if_not_tradable"),
+                record.get("checked_at"),
+                int(contract is not None),
+                *((contract or {}).get(key) for key in _CONTRACT_COLUMNS),
+                json.dumps(extra, ensure_ascii=False) if extra else None,
+            ))
+        conn.executemany(
+            "INSERT INTO etfs (isin, seq, name, input_currency, tradable, reason, checked_at, has_contract, "
+            f"{', '.join(_CONTRACT_COLUMNS.values())}, extra) "
+            f"VALUES ({', '.join('?' * 17)})",
+            rows,
+        )
+        conn.executescript(
+            """
+            CREATE INDEX idx_etfs_tradable ON etfs (tradable, seq);
+            CREATE INDEX idx_etfs_con_id ON etfs (con_id);
+            CREATE INDEX idx_etfs_symbol ON etfs (symbol);
+            """
+        )
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def tradability_diff(previous: dict, current: dict) -> dict:
+    """
+    Changes between two tradability documents (etf_tradability.json structure).
+
+    - etfs:            records added or changed (a recheck changes checked_at)
+    - removed:         ISINs no longer present
+    - newly_tradable / newly_blocked: ISINs whose tradability flipped, or
+                       that were added as tradable / blocked
+    - base_checked_at: checked_at of `previous`, so a reader can tell whether
+                       the diff applies to the data it has loaded
+    """
+    old_etfs = previous.get("etfs") or {}
+    new_etfs = current.get("etfs") or {}
+
+    changed, newly_tradable, newly_blocked = {}, [], []
+    for isin, record in new_etfs.items():
+        old = old_etfs.get(isin)
+        if record == old:
+            continue
+        changed[isin] = record
+        tradable = bool(record.get("tradable_via_lynx", False))
+        if old is None or bool(old.get("tradable_via_lynx", False)) != tradable:
+            (newly_tradable if tradable else newly_blocked).append(isin)
+
+    return {
+        "base_checked_at": (previous.get("metadata") or {}).get("checked_at"),
+        "metadata": current.get("metadata") or {},
+        "newly_tradable": newly_tradable,
+        "newly_blocked": newly_blocked,
+        "removed": [isin for isin in old_etfs if isin not in new_etfs],
+        "etfs": changed,
+    }
@@ -8,6 +8,7 @@ import asyncio
 import httpx
 from typing import Optional, List
 from config import get_settings
+from services.supabase_client import supabase_client
 from services.virtual_portfolio_service import get_virtual_portfolio_service
 import logging
 
@@ -64,7 +65,7 @@ class VirtualAccountService:
             raise VirtualAccountError("Service not configured", code="NOT_CONFIGURED")
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.post(
                     f"{self.base_url}/virtual_accounts",
                     headers=self.headers,
@@ -136,7 +137,7 @@ class VirtualAccountService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"id": f"eq.{account_id}", "select": "*"}
                 if owner_id is not None:
                     params["owner_id"] = f"eq.{owner_id}"
@@ -173,7 +174,7 @@ class VirtualAccountService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/virtual_accounts",
                     headers=self.headers,
@@ -221,7 +222,7 @@ class VirtualAccountService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/virtual_accounts",
                     headers=self.headers,
@@ -290,7 +291,7 @@ class VirtualAccountService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.patch(
                     f"{self.base_url}/virtual_accounts",
                     headers=self.headers,
@@ -319,7 +320,7 @@ class VirtualAccountService:
             return 0.0
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/virtual_accounts",
                     headers=self.headers,
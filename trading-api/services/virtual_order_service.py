@@ -8,15 +8,15 @@ Flow:
 5. On success: update virtual portfolio (deduct/credit, add/remove holding)
 6. On failure: release reserved cash, record failed order
 """
-import httpx
 from decimal import Decimal
 from typing import Optional
 from datetime import datetime, timezone
 from config import get_settings, TradingMode
+from services.supabase_client import supabase_client
 from services.virtual_account_service import get_virtual_account_service, VirtualAccountError
 from services.virtual_portfolio_service import get_virtual_portfolio_service
 from services.cash_allocation_service import get_cash_allocation_service, CashAllocationError
-from services.ib_client import get_ib_client
+from services.ib_client import get_ib_client, order_outcome_unknown
 from services.safety import get_safety_service
 from services.audit import get_audit_service
 from models.schemas import UserContext
@@ -268,7 +268,8 @@ class VirtualOrderService:
                 details={"error": "LIVE_TRADING_BLOCKED"}
             )
 
-        safety_result = await safety.check_order_safety(
+        # Checks and claims the order (pending mark + daily limit reservation) atomically
+        safety_result = await safety.claim_order(
             customer_id=user.customer_id,
             ib_account_id=user.ib_account_id,
             symbol=symbol,
@@ -303,6 +304,7 @@ class VirtualOrderService:
         # ======================================================================
         # CRITICAL SAFETY: Block if account type doesn't match trading mode
         if ib_client.has_account_type_mismatch():
+            await safety.release_order(user.customer_id, float(estimated_value))
             await self._fail_intention(intention_id, "Account type mismatch: trading blocked")
             if side == "BUY" and reserved_amount > 0:
                 try:
@@ -322,6 +324,7 @@ class VirtualOrderService:
             )
 
         if not ib_client.is_connected():
+            await safety.release_order(user.customer_id, float(estimated_value))
             await self._fail_intention(intention_id, "IB Gateway not connected")
             if side == "BUY" and reserved_amount > 0:
                 try:
@@ -351,12 +354,18 @@ class VirtualOrderService:
                 stop_price=stop_price
             )
 
+            if order_outcome_unknown(result):
+                return await self._hold_unknown_order(
+                    result, user, intention_id, virtual_account_id, account_name,
+                    symbol, side, quantity, order_type, trading_mode, client_ip
+                )
             if result.get("error"):
                 raise Exception(result.get("message", "IB order failed"))
 
         except Exception as e:
             error_msg = str(e)
             logger.error(f"IB order failed for virtual account {virtual_account_id}: {error_msg}")
+            await safety.release_order(user.customer_id, float(estimated_value))
             await self._fail_intention(intention_id, error_msg)
             if side == "BUY" and reserved_amount > 0:
                 try:
@@ -513,7 +522,7 @@ class VirtualOrderService:
         reserved_amount: float = 0
     ) -> str:
         """Create an order intention record. Returns intention ID."""
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with supabase_client(timeout=10.0) as client:
             response = await client.post(
                 f"{self.base_url}/order_intentions",
                 headers=self.headers,
@@ -538,10 +547,67 @@ class VirtualOrderService:
             result = data[0] if isinstance(data, list) else data
             return result["id"]
 
+    async def _hold_unknown_order(
+        self,
+        result: dict,
+        user: UserContext,
+        intention_id: str,
+        virtual_account_id: str,
+        account_name: str,
+        symbol: str,
+        side: str,
+        quantity: int,
+        order_type: str,
+        trading_mode: str,
+        client_ip: str
+    ) -> VirtualOrderResult:
+        """
+        The IB order's outcome is unknown (reply lost): it may be live.
+
+        Keeps the cash and safety reservations and moves the intention out of
+        "pending" (so no batch executes it again) to "submitted", to be
+        reconciled against IB's orders by its orderRef.
+        """
+        error_msg = result.get("message", "Order outcome unknown")
+        logger.error(f"IB order outcome unknown for virtual account {virtual_account_id}: {error_msg}")
+        try:
+            async with supabase_client(timeout=10.0) as client:
+                await client.patch(
+                    f"{self.base_url}/order_intentions",
+                    headers=self.headers,
+                    params={"id": f"eq.{intention_id}"},
+                    json={
+                        "status": "submitted",
+                        "status_message": f"Outcome unknown, reconcile IB orderRef {result.get('order_ref')}"
+                    }
+                )
+        except Exception as e:
+            logger.error(f"Failed to update intention {intention_id}: {e}")
+        await get_audit_service().log_order_unknown(
+            customer_id=user.customer_id,
+            broker_account_id=user.broker_account_id,
+            ib_account_id=user.ib_account_id,
+            symbol=symbol,
+            side=side,
+            quantity=quantity,
+            order_type=order_type,
+            trading_mode=trading_mode,
+            error_message=f"[Virtual:{account_name}] {error_msg}",
+            request_payload={"virtual_account_id": virtual_account_id, "order_ref": result.get("order_ref")},
+            ip_address=client_ip
+        )
+        return VirtualOrderResult(
+            success=False,
+            virtual_account_id=virtual_account_id,
+            virtual_account_name=account_name,
+            message="Order status unknown - it may have been placed. Check your orders before retrying.",
+            details={"error": "ORDER_STATUS_UNKNOWN", "order_ref": result.get("order_ref")}
+        )
+
     async def _fail_intention(self, intention_id: str, reason: str):
         """Mark an order intention as rejected."""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 await client.patch(
                     f"{self.base_url}/order_intentions",
                     headers=self.headers,
@@ -565,7 +631,7 @@ class VirtualOrderService:
     ):
         """Mark an order intention as filled."""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 update = {
                     "status": "filled",
                     "executed_at": datetime.now(timezone.utc).isoformat()
@@ -597,7 +663,7 @@ class VirtualOrderService:
     ) -> list[dict]:
         """Get order history for a virtual account."""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 response = await client.get(
                     f"{self.base_url}/order_intentions",
                     headers=self.headers,
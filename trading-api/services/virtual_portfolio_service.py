@@ -4,10 +4,12 @@ Manages user virtual portfolios (cash balances and share holdings) with complete
 Supports optional virtual_account_id for multi-account trading.
 """
 import httpx
+from collections import Counter
 from decimal import Decimal
 from typing import Optional
 from datetime import datetime
 from config import get_settings
+from services.supabase_client import supabase_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,9 @@ class VirtualPortfolioError(Exception):
 class VirtualPortfolioService:
     """Service for managing user virtual portfolios."""
 
+    # Rows per page for reads over all users' holdings (PostgREST caps responses at max-rows)
+    HOLDINGS_PAGE_SIZE = 1000
+
     def __init__(self):
         settings = get_settings()
         self.base_url = f"{settings.supabase_url}/rest/v1"
@@ -74,7 +79,7 @@ class VirtualPortfolioService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 # Ensure virtual_portfolios row exists (for holdings linkage)
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
@@ -151,7 +156,7 @@ class VirtualPortfolioService:
     async def _create_portfolio(self, user_id: int, virtual_account_id: str = None) -> dict:
         """Create a new virtual portfolio for a user."""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 payload = {
                     "user_id": user_id,
                     "cash_balance": 0,
@@ -199,7 +204,7 @@ class VirtualPortfolioService:
     async def _get_portfolio_raw(self, user_id: int, virtual_account_id: str = None) -> Optional[dict]:
         """Get portfolio without creating if it doesn't exist."""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
                 response = await client.get(
@@ -232,7 +237,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -281,7 +286,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -331,7 +336,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -402,7 +407,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -456,7 +461,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -519,7 +524,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {"user_id": f"eq.{user_id}", "select": "*"}
                 params.update(self._account_filter(virtual_account_id))
 
@@ -586,7 +591,7 @@ class VirtualPortfolioService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {
                     "user_id": f"eq.{user_id}",
                     "select": "*",
@@ -606,13 +611,52 @@ class VirtualPortfolioService:
             logger.error(f"Error getting holdings for user {user_id}: {e}")
             return []
 
+    async def get_held_conid_counts(self) -> dict[int, int]:
+        """
+        Number of open holdings per conid across all users (market data demand).
+
+        Reads every page: a single select would be cut off at the server's
+        max-rows and under-count.
+        """
+        if not self._configured:
+            return {}
+
+        try:
+            counts: Counter = Counter()
+            offset = 0
+            async with supabase_client(timeout=15.0) as client:
+                while True:
+                    response = await client.get(
+                        f"{self.base_url}/virtual_holdings",
+                        headers=self.headers,
+                        params={
+                            "select": "conid",
+                            "quantity": "gt.0",
+                            "order": "id",
+                            "limit": self.HOLDINGS_PAGE_SIZE,
+                            "offset": offset,
+                        }
+                    )
+                    response.raise_for_status()
+                    rows = response.json() or []
+                    if not rows:
+                        break
+                    counts.update(row["conid"] for row in rows if row.get("conid"))
+                    # Advance by what came back, in case max-rows is below the page size
+                    offset += len(rows)
+            return dict(counts)
+
+        except Exception as e:
+            logger.error(f"Error getting held conids: {e}")
+            return {}
+
     async def get_holding(self, user_id: int, symbol: str, virtual_account_id: str = None) -> Optional[dict]:
         """Get a specific holding for a user."""
         if not self._configured:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {
                     "user_id": f"eq.{user_id}",
                     "symbol": f"eq.{symbol}",
@@ -654,7 +698,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 existing = await self.get_holding(user_id, symbol, virtual_account_id)
 
                 if existing:
@@ -716,7 +760,7 @@ class VirtualPortfolioService:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 existing = await self.get_holding(user_id, symbol, virtual_account_id)
 
                 if not existing:
@@ -754,6 +798,50 @@ class VirtualPortfolioService:
             logger.error(f"Error removing holding for user {user_id}: {e}")
             return None
 
+    # =========================================================================
+    # FILL APPLICATION
+    # =========================================================================
+
+    async def apply_fill_allocations(self, aggregated_order_id: str) -> dict:
+        """
+        Apply all fill allocations of an aggregated order to user portfolios.
+
+        Runs the apply_fill_allocations RPC: cash, reserved cash, holdings
+        (weighted average cost), transaction rows and the applied flag are
+        updated for every allocation in one call and one transaction.
+        Allocations that can't be applied (insufficient cash/shares) are
+        skipped and stay unapplied.
+
+        Returns:
+            {"success": bool, "applied": int, "skipped": [{allocation_id, user_id, error}]}
+        """
+        if not self._configured:
+            return {"success": False, "applied": 0, "skipped": [], "error": "Not configured"}
+
+        try:
+            async with supabase_client(timeout=60.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/rpc/apply_fill_allocations",
+                    headers=self.headers,
+                    json={"p_aggregated_order_id": aggregated_order_id}
+                )
+                response.raise_for_status()
+                result = response.json() or {}
+
+            for skipped in result.get("skipped") or []:
+                logger.error(
+                    f"Fill allocation {skipped.get('allocation_id')} for user {skipped.get('user_id')} "
+                    f"not applied: {skipped.get('error')}"
+                )
+            logger.info(
+                f"Applied {result.get('applied', 0)} fill allocations for aggregated order {aggregated_order_id}"
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"Error applying fill allocations for aggregated order {aggregated_order_id}: {e}")
+            return {"success": False, "applied": 0, "skipped": [], "error": str(e)}
+
     # =========================================================================
     # TRANSACTION METHODS
     # =========================================================================
@@ -777,7 +865,7 @@ class VirtualPortfolioService:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 payload = {
                     "user_id": user_id,
                     "type": type,
@@ -817,7 +905,7 @@ class VirtualPortfolioService:
             return []
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with supabase_client(timeout=10.0) as client:
                 params = {
                     "user_id": f"eq.{user_id}",
                     "select": "*",